@@ -0,0 +1,93 @@
+# bench_activity.py
+# Posts N synthetic activity events for 10,000 users to /api/activity/events
+# in requests of 1,000, with the flush running as it does in the worker, and
+# reports the sustained rate against a temporary SQLite file. Then checks
+# that the per-day summaries and user totals match a recount from
+# user_activities.
+# Run: python bench_activity.py [events]   (default 200,000)
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+from datetime import date, timedelta
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import sessionmaker
+
+import main
+import models
+from services.activity_ingest_service import ActivityIngestService, activity_buffer
+from test_helpers import make_test_engine, make_test_client
+
+USERS = 10000
+REQUEST_SIZE = 1000
+TYPES = ["study", "study", "test", "login"]
+
+
+def bench_activity(events: int = 200_000, seed: int = 9):
+    path = os.path.join(tempfile.mkdtemp(), "bench_activity.db")
+    engine = make_test_engine(f"sqlite:///{path}")
+    client, TestSession = make_test_client(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User.__table__), [
+            {"id": f"user-{i}", "name": "", "email": f"user-{i}@example.com"} for i in range(USERS)])
+
+    rng = random.Random(seed)
+    first = date(2026, 1, 1)
+    bodies = []
+    for offset in range(0, events, REQUEST_SIZE):
+        bodies.append([{
+            "user_id": f"user-{rng.randrange(USERS)}", "activity_type": rng.choice(TYPES),
+            "activity_date": (first + timedelta(days=rng.randrange(90))).isoformat(),
+            "duration_minutes": rng.randrange(60), "score": rng.randrange(101),
+        } for _ in range(min(REQUEST_SIZE, events - offset))])
+
+    # Stand-in for ActivityBuffer.run: flush whenever a batch is waiting
+    done = threading.Event()
+
+    def flusher():
+        while not done.is_set() or len(activity_buffer):
+            if len(activity_buffer) >= activity_buffer.batch_size or done.is_set():
+                ActivityIngestService.flush_in_new_session(TestSession)
+            else:
+                time.sleep(0.001)
+
+    worker = threading.Thread(target=flusher)
+    start = time.perf_counter()
+    worker.start()
+    for body in bodies:
+        response = client.post("/api/activity/events", json=body)
+        assert response.status_code == 202, response.text
+    accepted = time.perf_counter() - start
+    done.set()
+    worker.join()
+    elapsed = time.perf_counter() - start
+    print(f"accepted {events:,} events in {accepted:.2f}s, written in {elapsed:.2f}s "
+          f"({events / elapsed:,.0f} events/s sustained)")
+    stats = activity_buffer.stats()
+    assert stats["rejected"] == 0 and stats["written"] == events
+
+    db = sessionmaker(bind=engine)()
+    activity = models.UserActivity
+    recount = {
+        (user_id, day): (n, minutes)
+        for user_id, day, n, minutes in db.query(
+            activity.user_id, activity.activity_date, func.count(), func.sum(activity.duration_minutes)
+        ).group_by(activity.user_id, activity.activity_date)
+    }
+    summaries = {(row.user_id, row.day): (row.events, row.study_minutes) for row in db.query(models.UserActivityDay)}
+    assert summaries == recount
+    minutes = dict(db.query(activity.user_id, func.sum(activity.duration_minutes)).group_by(activity.user_id).all())
+    for user_id, total_minutes, total_hours in db.query(
+            models.User.id, models.User.total_study_minutes, models.User.total_study_hours):
+        assert (total_minutes, total_hours) == (minutes.get(user_id, 0), minutes.get(user_id, 0) // 60)
+    db.close()
+    main.app.dependency_overrides.clear()
+    os.remove(path)
+    print("✓ Daily summaries and user totals match a recount from user_activities")
+
+
+if __name__ == "__main__":
+    bench_activity(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,63 @@
+# bench_auth_cache.py
+# Measures per-request overhead of authenticated endpoints with and
+# without the principal cache.  Run: python bench_auth_cache.py [requests]
+import sys
+import time
+import uuid
+from datetime import timedelta
+
+import models
+from routers.auth import create_access_token, get_password_hash
+from services.auth_cache import principal_cache
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def bench_auth_cache(requests: int = 2000):
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+
+    db = TestSession()
+    employee = models.Employee(
+        id=str(uuid.uuid4()),
+        first_name="Bench",
+        last_name="Mark",
+        email="bench@example.com",
+        password_hash=get_password_hash("benchmark-password"),
+        is_active=True,
+    )
+    db.add(employee)
+    db.commit()
+    token = create_access_token(
+        {"sub": employee.email, "employee_id": employee.id},
+        expires_delta=timedelta(minutes=30),
+    )
+    db.close()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    results = {}
+    for enabled in (False, True):
+        principal_cache.clear()
+        principal_cache.enabled = enabled
+        client.get("/api/auth/me", headers=headers)  # warm up
+
+        with count_queries(engine) as statements:
+            start = time.perf_counter()
+            for _ in range(requests):
+                response = client.get("/api/auth/me", headers=headers)
+                assert response.status_code == 200, response.text
+            elapsed = time.perf_counter() - start
+
+        label = "cache on " if enabled else "cache off"
+        results[enabled] = elapsed
+        print(
+            f"{label}: {elapsed / requests * 1e6:8.1f} µs/request, "
+            f"{len(statements) / requests:.2f} queries/request"
+        )
+
+    principal_cache.enabled = True
+    saved = (results[False] - results[True]) / requests * 1e6
+    print(f"✓ Cache saves {saved:.1f} µs per authenticated request")
+
+
+if __name__ == "__main__":
+    bench_auth_cache(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,50 @@
+# bench_autocomplete.py
+# Builds the user autocomplete index over N synthetic users and reports
+# build time, memory footprint and query latency.
+# Run: python bench_autocomplete.py [users]
+import sys
+import time
+import random
+import statistics
+
+from services.autocomplete_service import PrefixIndex, _user_keys
+
+FIRST = ["Aarav", "Priya", "Rohan", "Ananya", "Vikram", "Sneha", "Karan", "Divya", "Arjun", "Meera",
+         "Ishaan", "Kavya", "Aditya", "Pooja", "Rahul", "Nisha", "Siddharth", "Tanvi", "Varun", "Zoya"]
+LAST = ["Sharma", "Iyer", "Patel", "Reddy", "Gupta", "Nair", "Singh", "Das", "Menon", "Joshi",
+        "Kulkarni", "Bose", "Chopra", "Mehta", "Rao", "Pillai", "Kapoor", "Verma", "Shah", "Ghosh"]
+
+
+def bench_autocomplete(users: int = 1_000_000):
+    rng = random.Random(7)
+    records = [
+        (f"{i:08x}-user", f"{rng.choice(FIRST)} {rng.choice(LAST)}", f"student{i}@example.com")
+        for i in range(users)
+    ]
+
+    index = PrefixIndex("user", _user_keys)
+    start = time.perf_counter()
+    index.build(records)
+    build_seconds = time.perf_counter() - start
+    report = index.memory_report()
+    print(f"Built {report['items']:,} users / {report['keys']:,} keys in {build_seconds:.1f}s")
+    print(f"Index footprint {report['total_bytes'] / 2**20:.1f} MiB")
+    for part, size in report["bytes"].items():
+        print(f"  {part:15} {size / 2**20:8.1f} MiB")
+
+    for i in range(2000):
+        index.upsert((f"{i:08x}-user", f"Renamed {rng.choice(LAST)}", f"student{i}@example.com"))
+
+    for q in ["p", "pri", "priya sh", "student12345", "kul", "renamed", "zoya ghosh", "xyz"]:
+        timings = []
+        for _ in range(200):
+            t0 = time.perf_counter()
+            results = index.search(q, 10)
+            timings.append((time.perf_counter() - t0) * 1000)
+        timings.sort()
+        print(f"  {q!r:15} {len(results):>2} results  median {statistics.median(timings):.3f} ms  "
+              f"p99 {timings[int(len(timings) * 0.99) - 1]:.3f} ms")
+
+
+if __name__ == "__main__":
+    bench_autocomplete(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,55 @@
+# bench_duplicates.py
+# Signs N synthetic tickets into the LSH index, then times the per-insert
+# duplicate check (signature + candidate lookup) and a reload of the
+# persisted signatures.
+# Run: python bench_duplicates.py [rows]
+import sys
+import time
+import random
+import statistics
+from array import array
+
+from services.duplicate_service import LshIndex, signature
+
+WORDS = ("video audio payment refund login quiz certificate mock test lecture buffering invoice "
+         "upgrade physics chemistry biology syllabus download slow error app crash notes pdf "
+         "teacher doubt session schedule exam result rank batch live class recording").split()
+
+
+def synthetic_ticket(rng: random.Random) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(15, 60)))
+
+
+def bench_duplicates(rows: int = 200_000):
+    rng = random.Random(3)
+    index = LshIndex()
+    texts = [synthetic_ticket(rng) for _ in range(rows)]
+
+    start = time.perf_counter()
+    signatures = [signature(text) for text in texts]
+    for item_id, sig in enumerate(signatures):
+        index.add(item_id, sig)
+    print(f"Signed and indexed {rows:,} tickets in {time.perf_counter() - start:.1f}s")
+
+    timings = []
+    hits = 0
+    for i in range(2000):
+        text = texts[rng.randrange(rows)] if i % 4 == 0 else synthetic_ticket(rng)
+        t0 = time.perf_counter()
+        match = index.best_match(signature(text))
+        timings.append((time.perf_counter() - t0) * 1000)
+        hits += match is not None
+    timings.sort()
+    print(f"Duplicate check: median {statistics.median(timings):.3f} ms  "
+          f"p99 {timings[int(len(timings) * 0.99)]:.3f} ms  ({hits} of 2000 flagged)")
+
+    raw = [sig.tobytes() for sig in signatures]
+    start = time.perf_counter()
+    reloaded = LshIndex()
+    for item_id, blob in enumerate(raw):
+        reloaded.add(item_id, array("I", blob))
+    print(f"Reloaded {rows:,} persisted signatures in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    bench_duplicates(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,82 @@
+# bench_mrr.py
+# Generates N synthetic transactions in a temporary SQLite file, then times
+# the streaming MRR rebuild, a series read, and the incremental snapshot
+# update for a single new transaction (checked against the rebuild).
+# Run: python bench_mrr.py [transactions]   (default 10,000,000)
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+import models
+from services.mrr_service import MrrService
+from test_helpers import make_test_engine
+
+PLANS = [(1, 999), (3, 2699), (6, 4999), (12, 8999)]
+INSERT_BATCH = 50000
+
+
+def populate(engine, transactions: int, seed: int = 11):
+    rng = random.Random(seed)
+    users = max(transactions // 5, 1)
+    start = datetime(2022, 1, 1)
+    span = (datetime(2026, 10, 1) - start).days
+    table = models.Transaction.__table__
+    with engine.begin() as connection:
+        for offset in range(0, transactions, INSERT_BATCH):
+            rows = []
+            for i in range(offset, min(offset + INSERT_BATCH, transactions)):
+                months, price = rng.choice(PLANS)
+                rows.append({
+                    "user_id": f"user-{rng.randrange(users)}", "user_name": "", "plan_name": f"Plan {months}",
+                    "type": "razorpay", "amount": price, "status": "captured" if rng.random() < 0.93 else "failed",
+                    "date": start + timedelta(days=rng.randrange(span)), "order_id": f"order-{i}",
+                    "duration_months": months, "courses": [],
+                })
+            connection.execute(insert(table), rows)
+
+
+def bench_mrr(transactions: int = 10_000_000):
+    path = os.path.join(tempfile.mkdtemp(), "bench_mrr.db")
+    engine = make_test_engine(f"sqlite:///{path}")
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    start = time.perf_counter()
+    populate(engine, transactions)
+    print(f"populated {transactions:,} transactions in {time.perf_counter() - start:.1f}s")
+
+    db = Session()
+    start = time.perf_counter()
+    months = MrrService.rebuild(db)
+    elapsed = time.perf_counter() - start
+    print(f"rebuild: {elapsed:.1f}s for {months} months ({transactions / elapsed:,.0f} transactions/s)")
+
+    start = time.perf_counter()
+    series = MrrService.series(db)
+    print(f"series read: {(time.perf_counter() - start) * 1000:.1f} ms, current MRR {series[-1]['mrr']:,}")
+
+    timings = []
+    for i in range(20):
+        db.add(models.Transaction(user_id=f"user-{i}", user_name="", plan_name="Plan 12", type="razorpay",
+                                  amount=8999, status="captured", date=datetime(2026, 1, 1),
+                                  order_id=f"bench-{i}", duration_months=12, courses=[]))
+        start = time.perf_counter()
+        db.commit()
+        timings.append(time.perf_counter() - start)
+    print(f"incremental update: {sorted(timings)[len(timings) // 2] * 1000:.1f} ms per committed transaction")
+
+    incremental = MrrService.series(db)
+    MrrService.rebuild(db)
+    assert MrrService.series(db) == incremental
+    db.close()
+    os.remove(path)
+    print("✓ Incremental snapshots match the rebuild")
+
+
+if __name__ == "__main__":
+    bench_mrr(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000)
@@ -0,0 +1,98 @@
+# bench_retention.py
+# Times the vectorized retention matrix for N synthetic users joining over a
+# year, each active on a random set of days in the 365 days after joining,
+# for weekly and monthly periods. Then runs the service end to end against a
+# temporary SQLite file with a slice of the same users and checks that the
+# matrix matches a plain Python count.
+# Run: python bench_retention.py [users] [active days per user]   (default 1,000,000 x 30)
+import os
+import sys
+import time
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+import models
+from services.retention_service import (
+    MAX_PERIODS, RetentionService, _months, month_number, period_offsets, retention_counts,
+)
+from test_helpers import make_test_engine
+
+FIRST_DAY = np.datetime64("2025-01-01").astype(np.int64)
+DB_USERS = 20000
+
+
+def synthetic(users: int, active_days: int, seed: int = 5):
+    """Activity rows sorted by (user, day), as read from the (user_id, activity_date) index"""
+    rng = np.random.default_rng(seed)
+    join_days = FIRST_DAY + rng.integers(0, 365, users)
+    per_user = rng.poisson(active_days, users)
+    user_codes = np.repeat(np.arange(users), per_user)
+    days = join_days[user_codes] + rng.integers(0, 365, user_codes.size)
+    order = np.lexsort((days, user_codes))
+    return join_days, user_codes[order], days[order]
+
+
+def bench_arrays(users: int, active_days: int):
+    start = time.perf_counter()
+    join_days, user_codes, days = synthetic(users, active_days)
+    print(f"generated {days.size:,} activity rows for {users:,} users in {time.perf_counter() - start:.1f}s")
+    first = int(_months(join_days).min())
+    n_cohorts = int(_months(join_days).max()) - first + 1
+    for granularity in ("week", "month"):
+        start = time.perf_counter()
+        joined = join_days[user_codes]
+        offsets = period_offsets(days, joined, granularity)
+        counts = retention_counts(user_codes, _months(joined) - first, offsets, n_cohorts, MAX_PERIODS[granularity])
+        elapsed = time.perf_counter() - start
+        print(f"{granularity} matrix: {elapsed:.2f}s ({days.size / elapsed:,.0f} rows/s), "
+              f"period 0 retains {counts[:, 0].sum():,} users")
+        assert counts[:, 0].sum() <= users
+
+
+def bench_service(active_days: int):
+    join_days, user_codes, days = synthetic(DB_USERS, active_days, seed=6)
+    path = os.path.join(tempfile.mkdtemp(), "bench_retention.db")
+    engine = make_test_engine(f"sqlite:///{path}")
+    epoch = date(1970, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User.__table__), [
+            {"id": f"user-{i:06d}", "name": "", "email": f"user-{i}@example.com",
+             "join_date": epoch + timedelta(days=int(day))} for i, day in enumerate(join_days)])
+        connection.execute(insert(models.UserActivity.__table__), [
+            {"user_id": f"user-{user:06d}", "activity_date": epoch + timedelta(days=int(day)), "activity_type": "study"}
+            for user, day in zip(user_codes, days)])
+
+    db = sessionmaker(bind=engine)()
+    start = time.perf_counter()
+    matrix = RetentionService.matrix(db, date(2025, 1, 1), date(2025, 12, 1), "month", today=date(2026, 12, 31))
+    print(f"service: {(time.perf_counter() - start) * 1000:.0f} ms for {days.size:,} rows from SQLite")
+    start = time.perf_counter()
+    RetentionService.matrix(db, date(2025, 1, 1), date(2025, 12, 1), "month", today=date(2026, 12, 31))
+    print(f"cached read: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    expected = {}
+    seen = set()
+    for user, day in zip(user_codes, days):
+        joined = epoch + timedelta(days=int(join_days[user]))
+        offset = month_number(epoch + timedelta(days=int(day))) - month_number(joined)
+        if (user, offset) not in seen:
+            seen.add((user, offset))
+            key = (month_number(joined), offset)
+            expected[key] = expected.get(key, 0) + 1
+    for row in matrix["cohorts"]:
+        cohort = month_number(date.fromisoformat(row["cohort"] + "-01"))
+        assert row["active"] == [expected.get((cohort, i), 0) for i in range(len(row["active"]))]
+    db.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    active_days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    bench_arrays(users, active_days)
+    bench_service(active_days)
+    print("✓ Service matrix matches a per-row count")
@@ -0,0 +1,66 @@
+# bench_search.py
+# Builds a search index over N synthetic users/tickets in a temporary
+# SQLite file and times /api/search style queries against it.
+# Run: python bench_search.py [rows]
+import os
+import sys
+import time
+import random
+import tempfile
+import statistics
+
+from sqlalchemy.orm import Session
+
+import models
+from services.search_service import SearchService
+from test_helpers import make_test_engine
+
+FIRST = ["Aarav", "Priya", "Rohan", "Ananya", "Vikram", "Sneha", "Karan", "Divya", "Arjun", "Meera"]
+LAST = ["Sharma", "Iyer", "Patel", "Reddy", "Gupta", "Nair", "Singh", "Das", "Menon", "Joshi"]
+WORDS = ("video audio payment refund login quiz certificate mock test lecture buffering "
+         "invoice upgrade physics chemistry biology syllabus download slow error").split()
+
+
+def bench_search(rows: int = 1_000_000):
+    path = os.path.join(tempfile.mkdtemp(), "search_bench.db")
+    engine = make_test_engine(f"sqlite:///{path}")
+    rng = random.Random(42)
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, rows, 50_000):
+            batch = range(offset, min(rows, offset + 50_000))
+            conn.execute(models.User.__table__.insert(), [
+                {"id": f"user-{i}", "name": f"{rng.choice(FIRST)} {rng.choice(LAST)} {i}",
+                 "email": f"student{i}@example.com", "phone": f"+91 9{i:09d}"}
+                for i in batch
+            ])
+        conn.execute(models.SupportTicket.__table__.insert(), [
+            {"title": " ".join(rng.sample(WORDS, 3)), "student": "x", "student_email": "x",
+             "course": "x", "category": "technical",
+             "description": " ".join(rng.choices(WORDS, k=20))}
+            for _ in range(rows // 10)
+        ])
+    print(f"Inserted {rows:,} users and {rows // 10:,} tickets in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    counts = SearchService.rebuild(engine)
+    print(f"Rebuilt index {counts} in {time.perf_counter() - start:.1f}s")
+
+    queries = ["priya", "student12345", "sharma 9000", "refund invoice", "vik", "9000001234", "men jo"]
+    with Session(engine) as db:
+        for q in queries:
+            timings = []
+            for _ in range(20):
+                t0 = time.perf_counter()
+                result = SearchService.search(db, q, limit=20)
+                timings.append((time.perf_counter() - t0) * 1000)
+            print(f"  {q!r:18} {result['total']:>8,} hits  median {statistics.median(timings):7.2f} ms  "
+                  f"max {max(timings):7.2f} ms")
+
+    engine.dispose()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    bench_search(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,68 @@
+# bench_sentiment.py
+# Classifier throughput in one process vs the worker pool, then an
+# end-to-end backlog run over N synthetic reviews in a temporary SQLite file.
+# Run: python bench_sentiment.py [rows]
+import os
+import sys
+import time
+import random
+import tempfile
+
+from sqlalchemy.orm import Session
+
+import models
+from services.sentiment_service import SENTIMENT_WORKERS, SentimentService, classify_batch
+from test_helpers import make_test_engine
+
+PHRASES = [
+    "the lectures are really clear", "video keeps buffering", "mock tests were excellent",
+    "support never replied", "not worth the price", "loved the doubt sessions",
+    "app crashed during the quiz", "notes are detailed and useful", "audio is terrible",
+    "covers the whole syllabus", "instructor explains slowly", "but the pdf is missing",
+]
+
+
+def synthetic_text(rng: random.Random) -> str:
+    return ", ".join(rng.sample(PHRASES, rng.randint(2, 5))) + rng.choice([".", "!", ""])
+
+
+def bench_sentiment(rows: int = 200_000):
+    rng = random.Random(7)
+    texts = [(i, synthetic_text(rng)) for i in range(rows)]
+    batches = [texts[i:i + 2000] for i in range(0, rows, 2000)]
+
+    start = time.perf_counter()
+    for batch in batches:
+        classify_batch(batch)
+    single = time.perf_counter() - start
+    print(f"1 process:   {rows / single:>10,.0f} texts/s")
+
+    executor = SentimentService._get_executor()
+    list(executor.map(classify_batch, batches[:SENTIMENT_WORKERS]))  # warm the workers
+    start = time.perf_counter()
+    list(executor.map(classify_batch, batches))
+    pooled = time.perf_counter() - start
+    print(f"{SENTIMENT_WORKERS} processes: {rows / pooled:>10,.0f} texts/s")
+
+    path = os.path.join(tempfile.mkdtemp(), "sentiment_bench.db")
+    engine = make_test_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(models.CourseReview.__table__.insert(), [
+            {"student": "S", "student_email": "s@example.com", "course": f"Course {i % 50}",
+             "rating": rng.randint(1, 5), "comment": text}
+            for i, text in texts
+        ])
+    with Session(engine) as db:
+        start = time.perf_counter()
+        scored = SentimentService.score_backlog(db)
+        elapsed = time.perf_counter() - start
+    print(f"Backlog:     {scored['review']:,} reviews scored and stored in {elapsed:.1f}s "
+          f"({scored['review'] / elapsed:,.0f}/s)")
+
+    SentimentService.shutdown()
+    engine.dispose()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    bench_sentiment(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,111 @@
+# bench_webhooks.py
+# A fake Razorpay gateway replays a sale-day burst against the webhook
+# endpoint (authorized + captured per order, gateway retries, failures,
+# partial refunds, shuffled delivery), then reports ingest throughput and
+# how fast the inbox drains one event per commit vs. in batches.
+# Run: python bench_webhooks.py [orders]
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import hashlib
+
+import models
+from services.payment_webhook_service import PaymentWebhookService, WEBHOOK_BATCH_SIZE
+
+SECRET = os.environ.setdefault("RAZORPAY_WEBHOOK_SECRET", "bench-secret")
+from test_helpers import make_test_engine, make_test_client
+
+PLANS = [("JEE Pro", 9999, [1, 2, 3]), ("NEET Pro", 8999, [4, 5]), ("Foundation", 2999, [6])]
+
+
+class FakeGateway:
+    """Generates Razorpay-shaped callbacks for a burst of checkouts"""
+
+    def __init__(self, users: int, seed: int = 7):
+        self.random = random.Random(seed)
+        self.users = [f"user-{i}" for i in range(users)]
+
+    def _event(self, event, order, status, amount, refund=None):
+        user, plan = order["user"], order["plan"]
+        payload = {"entity": "event", "event": event, "payload": {"payment": {"entity": {
+            "id": order["payment_id"], "order_id": order["order_id"], "status": status,
+            "amount": amount * 100, "created_at": int(time.time()),
+            "notes": {"user_id": user, "user_name": user, "plan_name": plan},
+        }}}}
+        if refund is not None:
+            payload["payload"]["refund"] = {"entity": {
+                "id": f"rfnd_{order['order_id']}", "payment_id": order["payment_id"], "amount": refund * 100}}
+        return payload
+
+    def burst(self, orders: int) -> list:
+        events = []
+        for i in range(orders):
+            name, price, _ = self.random.choice(PLANS)
+            order = {"order_id": f"order_{i}", "payment_id": f"pay_{i}", "user": self.random.choice(self.users),
+                     "plan": name}
+            events.append(self._event("payment.authorized", order, "authorized", price))
+            if self.random.random() < 0.05:
+                events.append(self._event("payment.failed", order, "failed", price))
+                continue
+            captured = self._event("payment.captured", order, "captured", price)
+            events.append(captured)
+            if self.random.random() < 0.1:
+                events.append(captured)  # gateway retry
+            if self.random.random() < 0.02:
+                events.append(self._event("refund.processed", order, "refunded", price, refund=price // 2))
+        # Delivery order is only roughly the order events happened in
+        for start in range(0, len(events), 50):
+            window = events[start:start + 50]
+            self.random.shuffle(window)
+            events[start:start + 50] = window
+        return events
+
+
+def setup(users: int):
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    db.add_all([models.SubscriptionPlan(name=name, offer_price=price, courses=courses, duration_months=3)
+                for name, price, courses in PLANS])
+    db.add_all([models.User(id=f"user-{i}", name=f"User {i}", email=f"user{i}@example.com") for i in range(users)])
+    db.commit()
+    return client, db
+
+
+def bench_webhooks(orders: int = 2000):
+    users = max(orders // 4, 1)
+    events = FakeGateway(users).burst(orders)
+    bodies = []
+    for event in events:
+        body = json.dumps(event).encode()
+        bodies.append((body, hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()))
+    results = {}
+    for batch_size in (1, WEBHOOK_BATCH_SIZE):
+        client, db = setup(users)
+        start = time.perf_counter()
+        statuses = [client.post("/api/webhooks/razorpay", content=body, headers={"X-Razorpay-Signature": signature})
+                    .json()["status"] for body, signature in bodies]
+        ingest = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = PaymentWebhookService.process_pending(db, batch_size)
+        processed, failed = result["processed"], result["failed"]
+        drain = time.perf_counter() - start
+
+        revenue = sum(plan.revenue for plan in db.query(models.SubscriptionPlan))
+        results[batch_size] = (drain, revenue)
+        print(f"batch {batch_size:>4}: ingest {len(events) / ingest:8.0f} events/s "
+              f"({statuses.count('duplicate')} retries dropped), "
+              f"process {processed / drain:8.0f} events/s ({failed} failed), revenue {revenue}")
+        db.close()
+
+    (single, single_revenue), (batched, batched_revenue) = results[1], results[WEBHOOK_BATCH_SIZE]
+    assert single_revenue == batched_revenue
+    print(f"✓ Batching drains the inbox {single / batched:.1f}x faster with identical results")
+
+
+if __name__ == "__main__":
+    bench_webhooks(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,112 @@
+# loadtest_login_storm.py
+# Fires a burst of concurrent logins and, at the same time, probes an
+# unrelated endpoint to measure how much the hashing work stalls the event
+# loop.  Compares hashing inline on the loop with the bounded executor.
+# Run: python loadtest_login_storm.py [logins] [concurrency]
+import sys
+import time
+import asyncio
+import statistics
+import uuid
+
+import httpx
+
+import main
+import models
+from routers.auth import get_password_hash
+from services.password_hasher import password_hasher
+from test_helpers import make_test_client
+
+EMAIL = "storm@example.com"
+PASSWORD = "storm-password-123"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_storm(logins: int, concurrency: int):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        probe_latencies = []
+        statuses = []
+        done = asyncio.Event()
+
+        async def probe():
+            # Probes are due every 5 ms; latency is measured from the due
+            # time, so a stalled loop counts against the probe
+            interval = 0.005
+            due = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                await client.get("/api/")
+                probe_latencies.append((time.perf_counter() - due) * 1000)
+                due += interval
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def login():
+            async with semaphore:
+                response = await client.post(
+                    "/api/auth/login", json={"email": EMAIL, "password": PASSWORD}
+                )
+                statuses.append(response.status_code)
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await prober
+
+    return elapsed, statuses, probe_latencies
+
+
+def report(label, elapsed, statuses, latencies):
+    ok = statuses.count(200)
+    busy = statuses.count(503)
+    print(
+        f"{label}: {ok} logins ok, {busy} rejected (503) in {elapsed:.2f}s | "
+        f"/api/ probe p50 {statistics.median(latencies):.1f} ms, "
+        f"p99 {percentile(latencies, 99):.1f} ms, max {max(latencies):.1f} ms "
+        f"({len(latencies)} probes)"
+    )
+
+
+def loadtest_login_storm(logins: int = 200, concurrency: int = 32):
+    _, TestSession = make_test_client()
+    db = TestSession()
+    db.add(models.Employee(
+        id=str(uuid.uuid4()),
+        first_name="Storm",
+        last_name="Test",
+        email=EMAIL,
+        password_hash=get_password_hash(PASSWORD),
+        is_active=True,
+    ))
+    db.commit()
+    db.close()
+
+    print(f"Login storm: {logins} logins, {concurrency} concurrent")
+
+    # Baseline: hash directly on the event loop, as before
+    offloaded_run = password_hasher._run
+
+    async def inline_run(func, *args):
+        return func(*args)
+
+    password_hasher._run = inline_run
+    report("inline on loop ", *asyncio.run(run_storm(logins, concurrency)))
+
+    password_hasher._run = offloaded_run
+    report("bounded executor", *asyncio.run(run_storm(logins, concurrency)))
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    loadtest_login_storm(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 32,
+    )
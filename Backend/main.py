@@ -1,8 +1,9 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, Query, UploadFile, File, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload, sessionmaker
 from typing import List, Optional, Union, Dict, Any
 import os
+import asyncio
 from datetime import datetime, date, timedelta, timezone
 import uuid
 from sqlalchemy import func
@@ -16,12 +17,44 @@ import crud
 from fastapi.staticfiles import StaticFiles
 
 from services.revenue_service import RevenueService
+from services.image_service import ImageDerivativeService
+from services.password_hasher import password_hasher
+from services.role_history_service import RoleHistoryService
+from services.search_service import SearchService
+from services.autocomplete_service import AutocompleteService
+from services.ticket_service import TicketService
+from services.sla_service import sla_monitor
+from services.assignment_service import assignment_engine
+from services.review_stats_service import ReviewStatsService
+from services.sentiment_service import SentimentService
+from services.duplicate_service import DuplicateService
+from services.subscription_expiry_service import SubscriptionExpiryService
+from services.entitlement_service import EntitlementService
+from services.plan_propagation_service import PlanPropagationService
+from services.enrollment_stats_service import EnrollmentStatsService
+from services.refund_service import RefundService
+from services.payment_webhook_service import webhook_worker
+from services.mrr_service import MrrService
+from services.revenue_series_service import RevenueSeriesService
+from services.retention_service import RetentionService
+from services.activity_ingest_service import ActivityIngestService, activity_buffer
+from services.auth_cache import EmployeePrincipal
 from routers import roles
 from routers import auth
 from routers import notifications  # or wherever you put the routes
 from schemas import Feedback
 from routers import account
 from routers import features
+from routers import search
+from routers import autocomplete
+from routers import sentiment
+from routers import duplicates
+from routers import subscriptions
+from routers import entitlements
+from routers import refunds
+from routers import webhooks
+from routers import analytics
+from routers import activity
 # from typing import List, Optional, Union, Dict, Any
 
 import logging
@@ -50,17 +83,67 @@ app.mount("/static", StaticFiles(directory="uploads"), name="static")
 app.include_router(features.router)
 app.include_router(notifications.router)
 app.include_router(account.router)
+app.include_router(search.router)
+app.include_router(autocomplete.router)
+app.include_router(sentiment.router)
+app.include_router(duplicates.router)
+app.include_router(subscriptions.router)
+app.include_router(entitlements.router)
+app.include_router(refunds.router)
+app.include_router(webhooks.router)
+app.include_router(analytics.router)
+app.include_router(activity.router)
 
 # Initialize roles data
 @app.on_event("startup")
 async def startup_event():
+    # users.total_study_minutes must exist before anything loads a User
+    ActivityIngestService.ensure_schema(engine)
     db = SessionLocal()
     try:
         # Initialize roles and permissions
         from routers.roles import initialize_roles_data
         initialize_roles_data(db)
+        TicketService.backfill_tags(db)
+        sla_monitor.ensure_index(engine)
+        sla_monitor.load(db)
+        assignment_engine.load(db)
+        ReviewStatsService.ensure_populated(db)
+        SubscriptionExpiryService.ensure_indexes(engine)
+        SubscriptionExpiryService.backfill_end_dates(db)
+        RefundService.ensure_schema(engine)
+        RefundService.backfill(db)
+        MrrService.ensure_populated(db)
+        RevenueSeriesService.ensure_populated(db)
+        EntitlementService.ensure_populated(db)
+        EnrollmentStatsService.ensure_populated(db)
+        RetentionService.ensure_index(engine)
     finally:
         db.close()
+    SearchService.ensure_populated(engine)
+    app.state.background_tasks = [
+        asyncio.create_task(RoleHistoryService.run_archival_loop(SessionLocal)),
+        asyncio.create_task(asyncio.to_thread(AutocompleteService.load_in_new_session, SessionLocal)),
+        asyncio.create_task(sla_monitor.run(SessionLocal)),
+        asyncio.create_task(asyncio.to_thread(SentimentService.score_backlog_in_new_session, SessionLocal)),
+        asyncio.create_task(asyncio.to_thread(DuplicateService.load_in_new_session, SessionLocal)),
+        asyncio.create_task(SubscriptionExpiryService.run_loop(SessionLocal)),
+        asyncio.create_task(asyncio.to_thread(PlanPropagationService.run_pending_in_new_session, SessionLocal)),
+        asyncio.create_task(EnrollmentStatsService.run_loop(SessionLocal)),
+        asyncio.create_task(webhook_worker.run(SessionLocal)),
+        asyncio.create_task(RevenueSeriesService.run_loop(SessionLocal)),
+        asyncio.create_task(activity_buffer.run(SessionLocal)),
+    ]
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in getattr(app.state, "background_tasks", []):
+        task.cancel()
+    # Write what is still buffered rather than lose it with the process
+    await asyncio.to_thread(ActivityIngestService.flush_in_new_session, SessionLocal)
+    ImageDerivativeService.shutdown()
+    SentimentService.shutdown()
+    password_hasher.shutdown()
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -81,6 +164,12 @@ async def api_root():
     return {"message": "Edu Dashboard API is running"}
 
 # ========== USER ENDPOINTS ==========
+def user_response(user: models.User) -> schemas.User:
+    """schemas.User with the resized avatars generated so far"""
+    response = schemas.User.model_validate(user)
+    response.avatar_urls = ImageDerivativeService.variant_urls(user.avatar_url)
+    return response
+
 @app.get("/api/users", response_model=List[schemas.User])
 def get_users(
     skip: int = 0, 
@@ -98,14 +187,14 @@ def get_users(
         query = query.filter(models.User.exam_type == exam_type)
     
     users = query.offset(skip).limit(limit).all()
-    return users
+    return [user_response(user) for user in users]
 
 @app.get("/api/users/{user_id}", response_model=schemas.User)
 def get_user(user_id: str, db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return user_response(user)
 
 # ========== COURSE ENDPOINTS ==========
 @app.get("/api/courses", response_model=List[schemas.Course])
@@ -118,6 +207,14 @@ def get_courses(
     courses = crud.get_courses(db, skip=skip, limit=limit, exam_type=exam_type)
     return courses
 
+# Registered before /api/courses/{course_id} so "popular" is not parsed as an id
+@app.get("/api/courses/popular", response_model=List[schemas.Course])
+def get_popular_courses(
+    limit: int = Query(5, ge=1, le=20),
+    db: Session = Depends(get_db)
+):
+    return db.query(models.Course).order_by(models.Course.enrolled_students.desc()).limit(limit).all()
+
 @app.get("/api/courses/{course_id}", response_model=schemas.CourseWithDetails)
 def get_course(course_id: int, db: Session = Depends(get_db)):
     db_course = crud.get_course(db, course_id=course_id)
@@ -129,13 +226,6 @@ def get_course(course_id: int, db: Session = Depends(get_db)):
 def get_course_students(course_id: int, db: Session = Depends(get_db)):
     return db.query(models.UserCourse).filter(models.UserCourse.course_id == course_id).all()
 
-@app.get("/api/courses/popular", response_model=List[schemas.Course])
-def get_popular_courses(
-    limit: int = Query(5, ge=1, le=20),
-    db: Session = Depends(get_db)
-):
-    return db.query(models.Course).order_by(models.Course.enrolled_students.desc()).limit(limit).all()
-
 # ========== SUBJECT ENDPOINTS ==========
 @app.get("/api/subjects", response_model=List[schemas.Subject])
 def get_subjects(
@@ -505,17 +595,29 @@ def create_subscription_plan(plan: schemas.SubscriptionPlanCreate, db: Session =
     return db_plan
 
 @app.put("/api/subscription-plans/{plan_id}", response_model=schemas.SubscriptionPlan)
-def update_subscription_plan(plan_id: int, plan: schemas.SubscriptionPlanUpdate, db: Session = Depends(get_db)):
+def update_subscription_plan(
+    plan_id: int,
+    plan: schemas.SubscriptionPlanUpdate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     db_plan = db.query(models.SubscriptionPlan).filter(models.SubscriptionPlan.id == plan_id).first()
     if db_plan is None:
         raise HTTPException(status_code=404, detail="Subscription plan not found")
     
-    for field, value in plan.dict(exclude_unset=True).items():
+    updates = plan.dict(exclude_unset=True)
+    for field, value in updates.items():
         setattr(db_plan, field, value)
     
     db_plan.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(db_plan)
+
+    # A course list edit queued a propagation job; apply it after responding
+    if "courses" in updates:
+        background_tasks.add_task(
+            PlanPropagationService.run_pending_in_new_session, sessionmaker(bind=db.get_bind())
+        )
     return db_plan
 
 @app.delete("/api/subscription-plans/{plan_id}")
@@ -601,6 +703,22 @@ def get_course_stats(db: Session = Depends(get_db)):
         "average_completion_rate": round(avg_completion_rate, 2),
         "popular_courses": popular_courses
     }
+
+@app.get("/api/stats/courses/progress")
+def get_course_progress_stats(course_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Enrollment count, completion rate and progress histogram per course,
+    read from the counters maintained on user_courses writes.
+    """
+    return EnrollmentStatsService.course_stats(db, course_id)
+
+@app.post("/api/stats/courses/reconcile")
+def reconcile_course_counters(db: Session = Depends(get_db)):
+    """
+    Recount enrollments from user_courses now and repair drifted counters.
+    """
+    return {"reconciled_courses": EnrollmentStatsService.reconcile(db)}
+
 #  Add this debug endpoint to see what's happening
 @app.get("/debug/contents")
 def debug_contents(db: Session = Depends(get_db)):
@@ -723,8 +841,10 @@ def get_subscription_analytics(db: Session = Depends(get_db)):
     active_users = db.query(models.User).filter(models.User.subscription_status == 'active').count()
     
     conversion_rate = (active_users / total_users * 100) if total_users > 0 else 0
-    churn_rate = 2.3  # You might want to calculate this based on historical data
-    monthly_recurring_revenue = total_revenue // 12
+    # From the MRR ledger: subscribers lost this month out of those at its start
+    mrr = MrrService.current(db)
+    churn_rate = mrr["customer_churn_rate"]
+    monthly_recurring_revenue = mrr["mrr"]
     
     return {
         "total_revenue": total_revenue,
@@ -739,38 +859,20 @@ def get_revenue_analytics(
     period: str = Query("monthly", regex="^(daily|weekly|monthly)$"),
     db: Session = Depends(get_db)
 ):
-    # Get actual transaction data for revenue analytics
+    # Gap-filled windows ending today, read from the daily revenue buckets:
+    # the last 12 months, 4 weeks or 7 days
+    today = date.today()
     if period == "monthly":
-        # Group transactions by month - FIXED: use func.strftime for SQLite
-        monthly_data = db.query(
-            func.strftime('%Y-%m', models.Transaction.date).label('month'),
-            func.sum(models.Transaction.amount).label('revenue')
-        ).filter(
-            models.Transaction.status == 'captured'
-        ).group_by('month').order_by('month').all()
-        
-        data = [{"month": item[0], "revenue": item[1] or 0} for item in monthly_data]
+        first_month = today.year * 12 + today.month - 12
+        start = date(first_month // 12, first_month % 12 + 1, 1)
+        series = RevenueSeriesService.series(db, start, today, "month")
+        data = [{"month": item["label"], "revenue": item["revenue"]} for item in series["data"]]
     elif period == "weekly":
-        # For SQLite, weekly grouping is more complex, so use simplified data
-        weekly_data = db.query(
-            func.strftime('%Y-%W', models.Transaction.date).label('week'),
-            func.sum(models.Transaction.amount).label('revenue')
-        ).filter(
-            models.Transaction.status == 'captured'
-        ).group_by('week').order_by('week').limit(4).all()
-        
-        data = [{"week": f"Week {i+1}", "revenue": item[1] or 0} for i, item in enumerate(weekly_data)]
+        series = RevenueSeriesService.series(db, today - timedelta(weeks=3), today, "week")
+        data = [{"week": f"Week {i+1}", "revenue": item["revenue"]} for i, item in enumerate(series["data"])]
     else:  # daily
-        # Get last 7 days of data
-        daily_data = db.query(
-            func.date(models.Transaction.date).label('date'),
-            func.sum(models.Transaction.amount).label('revenue')
-        ).filter(
-            models.Transaction.status == 'captured',
-            models.Transaction.date >= datetime.utcnow().date() - timedelta(days=7)
-        ).group_by('date').order_by('date').all()
-        
-        data = [{"date": item[0].strftime('%Y-%m-%d'), "revenue": item[1] or 0} for item in daily_data]
+        series = RevenueSeriesService.series(db, today - timedelta(days=6), today, "day")
+        data = [{"date": item["period"], "revenue": item["revenue"]} for item in series["data"]]
     
     return {"period": period, "data": data}
 
@@ -1184,7 +1286,7 @@ def create_user_legacy(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
+    return user_response(db_user)
 
 @app.put("/users/{user_id}", response_model=schemas.User)
 def update_user_legacy(user_id: str, user: schemas.UserUpdate, db: Session = Depends(get_db)):
@@ -1197,7 +1299,7 @@ def update_user_legacy(user_id: str, user: schemas.UserUpdate, db: Session = Dep
     
     db.commit()
     db.refresh(db_user)
-    return db_user
+    return user_response(db_user)
 
 @app.delete("/users/{user_id}", status_code=status.HTTP_200_OK)
 def delete_user(user_id: str, db: Session = Depends(get_db)):
@@ -1278,17 +1380,29 @@ def create_subscription_plan_legacy(plan: schemas.SubscriptionPlanCreate, db: Se
     return db_plan
 
 @app.put("/subscription-plans/{plan_id}", response_model=schemas.SubscriptionPlan)
-def update_subscription_plan_legacy(plan_id: int, plan: schemas.SubscriptionPlanUpdate, db: Session = Depends(get_db)):
+def update_subscription_plan_legacy(
+    plan_id: int,
+    plan: schemas.SubscriptionPlanUpdate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     db_plan = db.query(models.SubscriptionPlan).filter(models.SubscriptionPlan.id == plan_id).first()
     if db_plan is None:
         raise HTTPException(status_code=404, detail="Subscription plan not found")
     
-    for field, value in plan.dict(exclude_unset=True).items():
+    updates = plan.dict(exclude_unset=True)
+    for field, value in updates.items():
         setattr(db_plan, field, value)
     
     db_plan.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(db_plan)
+
+    # A course list edit queued a propagation job; apply it after responding
+    if "courses" in updates:
+        background_tasks.add_task(
+            PlanPropagationService.run_pending_in_new_session, sessionmaker(bind=db.get_bind())
+        )
     return db_plan
 
 @app.delete("/subscription-plans/{plan_id}")
@@ -1320,18 +1434,13 @@ def update_transaction_legacy(transaction_id: int, transaction: schemas.Transact
     if db_transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    old_status = db_transaction.status
-    
     for field, value in transaction.dict(exclude_unset=True).items():
         setattr(db_transaction, field, value)
     
+    # Status changes move plan revenue within this commit
     db.commit()
     db.refresh(db_transaction)
     
-    # Update revenue if status changed
-    if 'status' in transaction.dict(exclude_unset=True):
-        RevenueService.handle_transaction_status_change(db, transaction_id, old_status, transaction.status)
-    
     return db_transaction
 
 # Refund Request legacy endpoints
@@ -1470,7 +1579,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
+    return user_response(db_user)
 
 @app.put("/api/users/{user_id}", response_model=schemas.User)
 def update_user(user_id: str, user: schemas.UserUpdate, db: Session = Depends(get_db)):
@@ -1483,7 +1592,7 @@ def update_user(user_id: str, user: schemas.UserUpdate, db: Session = Depends(ge
     
     db.commit()
     db.refresh(db_user)
-    return db_user
+    return user_response(db_user)
 
 @app.delete("/api/users/{user_id}")
 def delete_user(user_id: str, db: Session = Depends(get_db)):
@@ -1522,12 +1631,10 @@ def delete_course(course_id: int, db: Session = Depends(get_db)):
 def create_transaction(transaction: schemas.TransactionCreate, db: Session = Depends(get_db)):
     db_transaction = models.Transaction(**transaction.dict())
     db.add(db_transaction)
+    # Plan revenue and course access follow the insert within this commit
     db.commit()
     db.refresh(db_transaction)
     
-    # Update revenue stats
-    RevenueService.update_all_plans_revenue(db)
-    
     return db_transaction
 
 @app.put("/api/transactions/{transaction_id}", response_model=schemas.TransactionBase)
@@ -1536,24 +1643,27 @@ def update_transaction(transaction_id: int, transaction: schemas.TransactionUpda
     if db_transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    old_status = db_transaction.status
-    
     for field, value in transaction.dict(exclude_unset=True).items():
         setattr(db_transaction, field, value)
     
+    # Status changes move plan revenue within this commit
     db.commit()
     db.refresh(db_transaction)
     
-    # Update revenue if status changed
-    if 'status' in transaction.dict(exclude_unset=True):
-        RevenueService.handle_transaction_status_change(db, transaction_id, old_status, transaction.status)
-    
     return db_transaction
 
 # ========== REFUND REQUEST ENDPOINTS - ADD MISSING METHODS ==========
 @app.post("/api/refund-requests", response_model=schemas.RefundRequest)
 def create_refund_request(refund_request: schemas.RefundRequestCreate, db: Session = Depends(get_db)):
     db_refund_request = models.RefundRequest(**refund_request.dict())
+    if db_refund_request.transaction_id is not None:
+        transaction = db.get(models.Transaction, db_refund_request.transaction_id)
+        if transaction is None or transaction.user_id != db_refund_request.user_id:
+            raise HTTPException(status_code=400, detail="Transaction not found for this user")
+    else:
+        transaction = RefundService.find_transaction(
+            db, db_refund_request.user_id, db_refund_request.plan_name, db_refund_request.amount)
+        db_refund_request.transaction_id = transaction.id if transaction else None
     db.add(db_refund_request)
     db.commit()
     db.refresh(db_refund_request)
@@ -1574,24 +1684,18 @@ def update_refund_request(request_id: int, refund_request: schemas.RefundRequest
         db_refund_request.processed_date = datetime.utcnow()
         db_refund_request.processed_by = "admin"
     
+    # Approval records the refund in the ledger against the linked transaction;
+    # plan revenue and course access follow in the same commit
+    if refund_request.status == "approved" and old_status != "approved":
+        try:
+            RefundService.approve(db, db_refund_request)
+        except ValueError as e:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+    
     db.commit()
     db.refresh(db_refund_request)
     
-    # If refund is approved, update related transaction and revenue
-    if refund_request.status == "approved" and old_status != "approved":
-        # Find and update the related transaction
-        transaction = db.query(models.Transaction).filter(
-            models.Transaction.user_id == db_refund_request.user_id,
-            models.Transaction.plan_name == db_refund_request.plan_name,
-            models.Transaction.amount == db_refund_request.amount,
-            models.Transaction.status == "captured"
-        ).first()
-        
-        if transaction:
-            transaction.status = "refunded"
-            db.commit()
-            RevenueService.update_all_plans_revenue(db)
-    
     return db_refund_request
 
 # ========== ACCOUNT DELETION REQUEST ENDPOINTS - ADD MISSING METHODS ==========
@@ -1982,61 +2086,31 @@ def get_support_tickets(
     priority: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
     assigned_to: Optional[str] = Query(None),
+    tag: Optional[List[str]] = Query(None),
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
-    """Get all support tickets with optional filters"""
-    query = db.query(models.SupportTicket)
-    
-    if status and status != "all":
-        query = query.filter(models.SupportTicket.status == status)
-    if priority and priority != "all":
-        query = query.filter(models.SupportTicket.priority == priority)
-    if category and category != "all":
-        query = query.filter(models.SupportTicket.category == category)
-    if assigned_to and assigned_to != "all":
-        if assigned_to == "unassigned":
-            query = query.filter(models.SupportTicket.assigned_to.is_(None))
-        else:
-            query = query.filter(models.SupportTicket.assigned_to == assigned_to)
-    
-    # FIXED: Use 'created' instead of 'created_at'
-    tickets = query.order_by(models.SupportTicket.created.desc()).offset(skip).limit(limit).all()
-    
-    # Convert to response format
-    response_tickets = []
-    for ticket in tickets:
-        # Parse tags if stored as string
-        tags = ticket.tags
-        if isinstance(tags, str):
-            try:
-                import json
-                tags = json.loads(tags)
-            except:
-                tags = []
-        
-        response_tickets.append({
-            "id": ticket.id,
-            "title": ticket.title,
-            "student": ticket.student,
-            "student_email": ticket.student_email,
-            "course": ticket.course,
-            "priority": ticket.priority,
-            "status": ticket.status,
-            "category": ticket.category,
-            "description": ticket.description,
-            "assigned_to": ticket.assigned_to,
-            "tags": tags,
-            "sla_deadline": ticket.sla_deadline,
-            "created": ticket.created,
-            "last_update": ticket.last_update,
-            "responses": ticket.responses or [],
-            "internal_notes": ticket.internal_notes or [],
-            "actions": ticket.actions or []
-        })
-    
-    return response_tickets
+    """Get all support tickets with optional filters; repeat `tag` to require several tags"""
+    tickets = TicketService.list_tickets(
+        db, status=status, priority=priority, category=category,
+        assigned_to=assigned_to, tags=tag, skip=skip, limit=limit
+    )
+    return [TicketService.serialize(ticket) for ticket in tickets]
+
+@app.get("/api/support-tickets/sla")
+def get_support_ticket_sla(db: Session = Depends(get_db)):
+    """At-risk and breached SLA counts for open tickets"""
+    if not sla_monitor.loaded:
+        sla_monitor.load(db)
+    return sla_monitor.summary()
+
+@app.get("/api/support-tickets/queues")
+def get_support_ticket_queues(db: Session = Depends(get_db)):
+    """Open ticket queue per support agent"""
+    if not assignment_engine.loaded:
+        assignment_engine.load(db)
+    return assignment_engine.queue_stats()
 
 @app.get("/api/support-tickets/{ticket_id}", response_model=schemas.SupportTicketResponse)
 def get_support_ticket(ticket_id: int, db: Session = Depends(get_db)):
@@ -2062,9 +2136,9 @@ def update_support_ticket(
     
     update_data = ticket.dict(exclude_unset=True)
     
-    # Convert tags list to JSON string if present
-    if 'tags' in update_data and update_data['tags']:
-        update_data['tags'] = json.dumps(update_data['tags'])
+    # Tags live in support_ticket_tags (with a JSON copy on the ticket)
+    if 'tags' in update_data:
+        TicketService.set_tags(db_ticket, update_data.pop('tags'))
     
     for field, value in update_data.items():
         setattr(db_ticket, field, value)
@@ -2148,9 +2222,11 @@ def create_support_ticket(ticket: schemas.SupportTicketCreate, db: Session = Dep
         category=ticket.category,
         description=ticket.description,
         assigned_to=ticket.assigned_to,
-        tags=json.dumps(ticket.tags) if ticket.tags else "[]",
         sla_deadline=ticket.sla_deadline
     )
+    if not db_ticket.assigned_to:
+        db_ticket.assigned_to = assignment_engine.choose_agent(db, db_ticket.category)
+    TicketService.set_tags(db_ticket, ticket.tags)
     db.add(db_ticket)
     db.commit()
     db.refresh(db_ticket)
@@ -2169,9 +2245,9 @@ def update_support_ticket(
     
     update_data = ticket.dict(exclude_unset=True)
     
-    # Convert tags list to JSON string if present
-    if 'tags' in update_data and update_data['tags'] is not None:
-        update_data['tags'] = json.dumps(update_data['tags'])
+    # Tags live in support_ticket_tags (with a JSON copy on the ticket)
+    if 'tags' in update_data:
+        TicketService.set_tags(db_ticket, update_data.pop('tags'))
     
     for field, value in update_data.items():
         setattr(db_ticket, field, value)
@@ -2231,7 +2307,7 @@ def get_course_reviews(
     db: Session = Depends(get_db)
 ):
     """Get all course reviews with optional filters"""
-    query = db.query(models.CourseReview)
+    query = db.query(models.CourseReview).options(selectinload(models.CourseReview.instructor_response))
     
     if rating and rating != 0:
         query = query.filter(models.CourseReview.rating == rating)
@@ -2272,6 +2348,14 @@ def get_course_reviews(
         })
     
     return response_reviews
+@app.get("/api/course-reviews/stats")
+def get_course_review_stats(course: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    """Rating histogram and sentiment counts per course"""
+    return {
+        "overall": ReviewStatsService.totals(db),
+        "courses": ReviewStatsService.course_stats(db, course),
+    }
+
 @app.get("/api/course-reviews/{review_id}", response_model=schemas.CourseReviewResponse)
 def get_course_review(review_id: int, db: Session = Depends(get_db)):
     """Get a specific course review"""
@@ -2381,7 +2465,10 @@ def delete_course_review(review_id: int, db: Session = Depends(get_db)):
 
 # ========== FEEDBACK STATISTICS ENDPOINT ==========
 @app.get("/api/feedback/stats", response_model=schemas.FeedbackStats)
-def get_feedback_stats(db: Session = Depends(get_db)):
+def get_feedback_stats(
+    db: Session = Depends(get_db),
+    current_employee: Optional[EmployeePrincipal] = Depends(auth.get_optional_employee),
+):
     """Get feedback and support statistics"""
     
     # Support ticket stats
@@ -2389,30 +2476,23 @@ def get_feedback_stats(db: Session = Depends(get_db)):
         models.SupportTicket.status == "open"
     ).count()
     
-    my_assigned_tickets = db.query(models.SupportTicket).filter(
-        models.SupportTicket.assigned_to == "Carol Davis"  # Replace with actual current user
-    ).count()
-    
-    # Review stats
-    total_reviews = db.query(models.CourseReview).count()
-    positive_reviews = db.query(models.CourseReview).filter(
-        models.CourseReview.sentiment == "positive"
-    ).count()
-    negative_reviews = db.query(models.CourseReview).filter(
-        models.CourseReview.sentiment == "negative"
-    ).count()
+    # Open queue of the signed-in agent, from the assignment index
+    if not assignment_engine.loaded:
+        assignment_engine.load(db)
+    my_assigned_tickets = assignment_engine.agent_load(
+        f"{current_employee.first_name} {current_employee.last_name}" if current_employee else None
+    )
     
-    # Calculate average rating
-    avg_rating_result = db.query(func.avg(models.CourseReview.rating)).scalar()
-    avg_rating = float(avg_rating_result) if avg_rating_result else 0.0
+    # Review stats from the maintained aggregate row
+    review_stats = ReviewStatsService.totals(db)
     
     return {
         "open_tickets": open_tickets,
         "my_assigned_tickets": my_assigned_tickets,
-        "satisfaction_rating": round(avg_rating, 1),
-        "total_reviews": total_reviews,
-        "positive_reviews": positive_reviews,
-        "negative_reviews": negative_reviews
+        "satisfaction_rating": round(review_stats["average_rating"], 1),
+        "total_reviews": review_stats["review_count"],
+        "positive_reviews": review_stats["sentiment"]["positive"],
+        "negative_reviews": review_stats["sentiment"]["negative"]
     }
 
 # ============= FEEDBACK ENDPOINTS =============
@@ -2557,10 +2637,14 @@ async def upload_logo(file: UploadFile = File(...), db: Session = Depends(get_db
         # Generate URL (adjust based on your deployment)
         file_url = f"/uploads/branding/{unique_filename}"
         
+        # Resized copies are generated in the background
+        future = ImageDerivativeService.schedule(file_path)
+        
         return {
             "success": True,
             "url": file_url,
-            "filename": unique_filename
+            "filename": unique_filename,
+            "variants": ImageDerivativeService.variant_urls(file_url, only_existing=False) if future else {}
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
@@ -2586,10 +2670,14 @@ async def upload_favicon(file: UploadFile = File(...), db: Session = Depends(get
         # Generate URL (adjust based on your deployment)
         file_url = f"/uploads/branding/{unique_filename}"
         
+        # Resized copies are generated in the background
+        future = ImageDerivativeService.schedule(file_path)
+        
         return {
             "success": True,
             "url": file_url,
-            "filename": unique_filename
+            "filename": unique_filename,
+            "variants": ImageDerivativeService.variant_urls(file_url, only_existing=False) if future else {}
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
@@ -3128,6 +3216,7 @@ async def upload_logo(file: UploadFile = File(...), db: Session = Depends(get_db
     with open(file_path, "wb") as buffer:
         content = await file.read()
         buffer.write(content)
+    ImageDerivativeService.schedule(file_path)
 
     # Update database
     settings = db.query(models.PlatformSettings).filter(models.PlatformSettings.id == 1).first()
@@ -3153,6 +3242,7 @@ async def upload_favicon(file: UploadFile = File(...), db: Session = Depends(get
     with open(file_path, "wb") as buffer:
         content = await file.read()
         buffer.write(content)
+    ImageDerivativeService.schedule(file_path)
 
     # Update database
     settings = db.query(models.PlatformSettings).filter(models.PlatformSettings.id == 1).first()
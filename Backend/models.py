@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Table, Date,JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Table, Date,JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship
 # from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -7,7 +7,7 @@ from database import Base
 from typing import   List,Optional
 from pydantic import BaseModel, EmailStr,Field
 import json
-from sqlalchemy import TypeDecorator, Text
+from sqlalchemy import TypeDecorator, Text, event, inspect
 
 from datetime import datetime
 from enum import Enum
@@ -60,6 +60,7 @@ class User(Base):
     join_date = Column(Date, nullable=True)
     last_active = Column(Date, nullable=True)
     total_study_hours = Column(Integer, default=0)
+    total_study_minutes = Column(Integer, default=0)  # kept with total_study_hours by activity ingestion
     tests_attempted = Column(Integer, default=0)
     average_score = Column(Float, default=0.0)
     current_rank = Column(Integer, nullable=True)
@@ -99,6 +100,11 @@ class User(Base):
     # New relationship for subscription plan
     subscription_plan_rel = relationship("SubscriptionPlan")
 
+    __table_args__ = (
+        # Expiry job and upcoming-expiration reports scan active users by end date
+        Index("ix_users_subscription_status_end", "subscription_status", "subscription_end_date"),
+    )
+
 class AccountDeletionRequest(Base):
     __tablename__ = "account_deletion_requests"
     
@@ -171,6 +177,82 @@ class Transaction(Base):
     user = relationship("User", back_populates="transactions")
     
     
+class PaymentWebhookEvent(Base):
+    """Raw payment-gateway callback, stored before processing. The payload is
+    never modified; only the processing columns change."""
+    __tablename__ = "payment_webhook_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    gateway = Column(String(20), nullable=False)            # razorpay, google, apple (Transaction.type)
+    event_type = Column(String(100), nullable=True)
+    idempotency_key = Column(String(255), nullable=False, unique=True)
+    order_id = Column(String, nullable=True, index=True)
+    payment_gateway_id = Column(String, nullable=True)
+    payload = Column(JSON, nullable=False)
+    received_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    status = Column(String(20), default="pending", nullable=False)  # pending, processed, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_payment_webhook_events_status_id", "status", "id"),
+    )
+
+
+class SubscriptionEvent(Base):
+    """Subscription lifecycle log (expired, reminder_<n>d) for churn analytics"""
+    __tablename__ = "subscription_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    event_type = Column(String(50), nullable=False)
+    plan_name = Column(String(50), nullable=True)
+    subscription_end_date = Column(DateTime, nullable=True)
+    occurred_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_subscription_events_type_occurred", "event_type", "occurred_at"),
+        Index("ix_subscription_events_user_type", "user_id", "event_type"),
+    )
+
+
+class CourseEntitlement(Base):
+    """One row per (user, course, grant): the normalized form of the JSON course lists"""
+    __tablename__ = "course_entitlements"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    course_id = Column(Integer, nullable=False)
+    source = Column(String(20), nullable=False)    # transaction, direct (User.subscribed_courses)
+    source_id = Column(Integer, nullable=True)     # transactions.id when source == "transaction"
+    valid_until = Column(DateTime, nullable=True)  # NULL = no expiry
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_course_entitlements_user_course", "user_id", "course_id"),
+        Index("ix_course_entitlements_course_valid", "course_id", "valid_until"),
+        Index("ix_course_entitlements_source", "source", "source_id"),
+    )
+
+
+class EntitlementPropagationJob(Base):
+    """Applies a SubscriptionPlan.courses edit to the plan's existing subscribers"""
+    __tablename__ = "entitlement_propagation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    plan_id = Column(Integer, ForeignKey("subscription_plans.id", ondelete="CASCADE"), nullable=False, index=True)
+    added_courses = Column(JSON, default=[])
+    removed_courses = Column(JSON, default=[])
+    status = Column(String(20), default="pending", index=True)  # pending, running, completed, failed
+    total = Column(Integer, default=0)      # subscriber transactions to update
+    processed = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
 class RefundRequest(Base):
     __tablename__ = "refund_requests"
     
@@ -182,6 +264,9 @@ class RefundRequest(Base):
     subscription_plan_id = Column(Integer, ForeignKey("subscription_plans.id"), nullable=True)
     plan_name = Column(String)
     
+    # The payment being refunded; added after launch, so ensured at startup
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=True, index=True)
+    
     amount = Column(Integer)
     reason = Column(String)
     status = Column(String)  # pending, processed, rejected
@@ -192,6 +277,58 @@ class RefundRequest(Base):
     # Relationships
     subscription_plan = relationship("SubscriptionPlan", back_populates="refund_requests")
     user = relationship("User", back_populates="refund_requests")
+    transaction = relationship("Transaction")
+
+
+class RefundLedgerEntry(Base):
+    """One refund paid out against a transaction; several entries may add up to a partial or full refund"""
+    __tablename__ = "refund_ledger"
+
+    id = Column(Integer, primary_key=True, index=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id", ondelete="CASCADE"), nullable=False, index=True)
+    refund_request_id = Column(Integer, ForeignKey("refund_requests.id"), nullable=True, unique=True)
+    user_id = Column(String, nullable=True)
+    plan_name = Column(String, nullable=True)
+    amount = Column(Integer, nullable=False)
+    reason = Column(String, nullable=True)
+    processed_by = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class RevenueDailyBucket(Base):
+    """Captured and refunded amounts per day, plan, gateway and buyer's exam,
+    kept in step with transaction writes for the revenue series"""
+    __tablename__ = "revenue_daily_buckets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    plan_name = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    exam = Column(String, nullable=False)
+    gross = Column(Integer, nullable=False, default=0)
+    refunded = Column(Integer, nullable=False, default=0)
+    transactions = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ux_revenue_daily_buckets_key", "day", "plan_name", "type", "exam", unique=True),
+    )
+
+
+class MrrMonthlySnapshot(Base):
+    """MRR movements per calendar month, derived from captured transactions
+    net of refunds; ending MRR and subscriber counts are running sums of them"""
+    __tablename__ = "mrr_monthly_snapshots"
+
+    month = Column(Date, primary_key=True)  # first day of the month
+    new_mrr = Column(Integer, nullable=False, default=0)
+    expansion_mrr = Column(Integer, nullable=False, default=0)
+    contraction_mrr = Column(Integer, nullable=False, default=0)
+    churned_mrr = Column(Integer, nullable=False, default=0)
+    reactivation_mrr = Column(Integer, nullable=False, default=0)
+    new_subscribers = Column(Integer, nullable=False, default=0)
+    reactivated_subscribers = Column(Integer, nullable=False, default=0)
+    churned_subscribers = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class Exam(Base):
@@ -334,6 +471,23 @@ class UserCourse(Base):
     user = relationship("User", back_populates="user_courses")
     course = relationship("Course", back_populates="user_courses")
     
+
+class CourseEnrollmentStats(Base):
+    """Running enrollment count and progress histogram per course, maintained
+    from user_courses writes; Course.enrolled_students and completion_rate
+    are derived from it"""
+    __tablename__ = "course_enrollment_stats"
+
+    course_id = Column(Integer, ForeignKey("courses.id", ondelete="CASCADE"), primary_key=True)
+    enrolled = Column(Integer, nullable=False, default=0)
+    progress_sum = Column(Integer, nullable=False, default=0)
+    progress_0 = Column(Integer, nullable=False, default=0)
+    progress_1_24 = Column(Integer, nullable=False, default=0)
+    progress_25_49 = Column(Integer, nullable=False, default=0)
+    progress_50_74 = Column(Integer, nullable=False, default=0)
+    progress_75_99 = Column(Integer, nullable=False, default=0)
+    progress_100 = Column(Integer, nullable=False, default=0)  # completed
+
     
 class UserActivity(Base):
     __tablename__ = "user_activities"
@@ -345,10 +499,27 @@ class UserActivity(Base):
     duration_minutes = Column(Integer, default=0)
     score = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_user_activities_user_date", "user_id", "activity_date"),
+    )
     
     # Relationships
     user = relationship("User", back_populates="activities")
 
+
+class UserActivityDay(Base):
+    """Per-user, per-day totals of user_activities, kept by the activity ingestion flush"""
+    __tablename__ = "user_activity_days"
+
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    events = Column(Integer, nullable=False, default=0)
+    study_minutes = Column(Integer, nullable=False, default=0)
+    tests = Column(Integer, nullable=False, default=0)
+    score_total = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 # Add to User model:
 
 
@@ -417,12 +588,19 @@ class RoleAssignmentHistory(Base):
     role_id = Column(String, ForeignKey("roles.id", ondelete="CASCADE"), nullable=False)
     action = Column(String, nullable=False)  # assigned, updated, removed
     assigned_by = Column(String, nullable=False)
-    timestamp = Column(DateTime, default=func.now())
+    # Set in Python so every row is stored in the same format the keyset
+    # cursor binds (SQLite CURRENT_TIMESTAMP drops microseconds)
+    timestamp = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User")
     role = relationship("Role")
 
+    __table_args__ = (
+        Index("ix_role_history_user_timestamp", "user_id", "timestamp"),
+        Index("ix_role_history_role_timestamp", "role_id", "timestamp"),
+    )
+
 # Add these to your existing models.py file, after the SQLAlchemy models
 
 # Pydantic Models for Roles
@@ -581,6 +759,13 @@ class SupportTicket(Base):
     responses = relationship("TicketResponse", back_populates="ticket", cascade="all, delete-orphan")
     internal_notes = relationship("InternalNote", back_populates="ticket", cascade="all, delete-orphan")
     actions = relationship("TicketAction", back_populates="ticket", cascade="all, delete-orphan")
+    tag_links = relationship("SupportTicketTag", back_populates="ticket", cascade="all, delete-orphan",
+                             order_by="SupportTicketTag.position")
+
+    __table_args__ = (
+        # SLA monitor: open tickets whose deadline has passed
+        Index("ix_support_tickets_status_sla_deadline", "status", "sla_deadline"),
+    )
 
 
 class TicketResponse(Base):
@@ -651,6 +836,26 @@ class TicketAction(Base):
     # Relationships
     ticket = relationship("SupportTicket", back_populates="actions", foreign_keys=[ticket_id])
 
+    __table_args__ = (
+        # SLA monitor: whether a ticket's breach has been recorded
+        Index("ix_ticket_actions_ticket_id_type", "ticket_id", "type"),
+    )
+
+
+class SupportTicketTag(Base):
+    """Normalized ticket tags; SupportTicket.tags keeps a JSON copy for older readers"""
+    __tablename__ = "support_ticket_tags"
+
+    ticket_id = Column(Integer, ForeignKey("support_tickets.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String(50), primary_key=True)
+    position = Column(Integer, default=0)
+
+    ticket = relationship("SupportTicket", back_populates="tag_links")
+
+    __table_args__ = (
+        Index("ix_support_ticket_tags_tag", "tag", "ticket_id"),
+    )
+
 
 # ============= COURSE REVIEW MODELS =============
 
@@ -687,6 +892,55 @@ class InstructorResponse(Base):
     review = relationship("CourseReview", back_populates="instructor_response", foreign_keys=[review_id])
 
 
+class SentimentScore(Base):
+    """Classifier output for a review ("review") or feedback entry ("feedback")"""
+    __tablename__ = "sentiment_scores"
+
+    entity = Column(String(20), primary_key=True)
+    entity_id = Column(Integer, primary_key=True)
+    label = Column(String(20), nullable=False)  # positive, neutral, negative
+    score = Column(Float, nullable=False)  # -1 .. 1
+    model_version = Column(String(50), nullable=False)
+    scored_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DuplicateSignature(Base):
+    """MinHash signature of a ticket ("ticket") or feedback entry ("feedback"),
+    with the earlier entry it most likely duplicates"""
+    __tablename__ = "duplicate_signatures"
+
+    entity = Column(String(20), primary_key=True)
+    entity_id = Column(Integer, primary_key=True)
+    signature = Column(LargeBinary, nullable=False)
+    duplicate_of = Column(Integer, nullable=True)
+    similarity = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_duplicate_signatures_root", "entity", "duplicate_of"),
+    )
+
+
+class CourseReviewStats(Base):
+    """Running review totals per course name (CourseReview.course), plus one
+    row under ALL_COURSES for the platform-wide figures"""
+    __tablename__ = "course_review_stats"
+
+    ALL_COURSES = "*"
+
+    course = Column(String(255), primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_1 = Column(Integer, nullable=False, default=0)
+    rating_2 = Column(Integer, nullable=False, default=0)
+    rating_3 = Column(Integer, nullable=False, default=0)
+    rating_4 = Column(Integer, nullable=False, default=0)
+    rating_5 = Column(Integer, nullable=False, default=0)
+    positive = Column(Integer, nullable=False, default=0)
+    neutral = Column(Integer, nullable=False, default=0)
+    negative = Column(Integer, nullable=False, default=0)
+
+
 # ============= RESPONSE TEMPLATES =============
 
 class ResponseTemplate(Base):
@@ -779,3 +1033,45 @@ class NotificationTemplate(Base):
     icon = Column(String, nullable=True)
     tag = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# ============= SEARCH =============
+
+class SearchDocument(Base):
+    """Flattened searchable text, one row per indexed entity.
+
+    On SQLite this is the external content table of the search_index FTS5
+    table (see services/search_service.py).
+    """
+    __tablename__ = "search_documents"
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String(20), nullable=False)  # user, ticket, review, feedback
+    entity_id = Column(String, nullable=False)
+    title = Column(Text, default="")
+    body = Column(Text, default="")
+
+    __table_args__ = (
+        Index("ux_search_documents_entity", "entity", "entity_id", unique=True),
+    )
+
+
+# ============= ATTRIBUTE HISTORY =============
+
+def _keep_previous(target, value, oldvalue, initiator):
+    # Registered with active_history, which is what loads the stored value
+    pass
+
+
+def track_history(*attributes):
+    """Load the stored value of each attribute before it is overwritten, so
+    flush listeners can read it with previous_value even when it was never loaded"""
+    for attribute in attributes:
+        if not event.contains(attribute, "set", _keep_previous):
+            event.listen(attribute, "set", _keep_previous, active_history=True)
+
+
+def previous_value(target, field):
+    """The value stored before this flush for a tracked attribute"""
+    history = inspect(target).attrs[field].history
+    return history.deleted[0] if history.deleted else getattr(target, field)
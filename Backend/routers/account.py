@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from database import get_db
 import models
 import schemas
+from services.image_service import ImageDerivativeService
 from typing import Optional
 import os
 import uuid
@@ -18,7 +19,7 @@ router = APIRouter(prefix="/api/account", tags=["account"])
 @router.get("/profile/{user_id}", response_model=schemas.EmployeeResponse)
 def get_user_profile(user_id: str, db: Session = Depends(get_db)):
     """Get user profile for account settings"""
-    user = db.query(models.Employee).filter(models.Employee.id == user_id).first()
+    user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -33,7 +34,8 @@ def get_user_profile(user_id: str, db: Session = Depends(get_db)):
         role=user.role or "Student",
         bio=user.bio or "",
         timezone=user.timezone or "Asia/Kolkata",
-        language=user.language or "English",
+        avatarUrl=user.avatar_url,
+        avatarUrls=ImageDerivativeService.variant_urls(user.avatar_url),
     )
 
 
@@ -71,7 +73,8 @@ def update_user_profile(
         role=user.role,
         bio=user.bio,
         timezone=user.timezone,
-        language=user.language,
+        avatarUrl=user.avatar_url,
+        avatarUrls=ImageDerivativeService.variant_urls(user.avatar_url),
     )
 
 
@@ -221,9 +224,18 @@ async def upload_avatar(
         user.avatar_url = file_url
         db.commit()
 
+        # Thumbnails are generated in the background; list the URLs they will have
+        future = ImageDerivativeService.schedule(file_path)
+        variants = (
+            ImageDerivativeService.variant_urls(file_url, only_existing=False)
+            if future is not None
+            else {}
+        )
+
         return schemas.AvatarResponse(
             success=True,
             url=file_url,
+            variants=variants,
             message="Avatar uploaded successfully",
         )
     except Exception as e:
@@ -0,0 +1,70 @@
+# routers/activity.py
+from datetime import date
+from typing import List, Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from database import get_db
+from services.activity_ingest_service import ActivityIngestService, activity_buffer
+
+router = APIRouter(prefix="/api/activity", tags=["activity"])
+
+MAX_EVENTS_PER_REQUEST = 10000
+
+
+@router.post("/events", status_code=202)
+async def ingest_activity(events: Union[List[schemas.ActivityEvent], schemas.ActivityEvent]):
+    """
+    Accept one activity event or a list of them. Events are buffered and written in batches
+    within about a second; a full buffer answers 503 with Retry-After instead of queueing more.
+    """
+    if not isinstance(events, list):
+        events = [events]
+    if len(events) > MAX_EVENTS_PER_REQUEST:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_EVENTS_PER_REQUEST} events per request")
+    today = date.today()
+    rows = [{
+        "user_id": event.user_id,
+        "activity_type": event.activity_type,
+        "activity_date": event.activity_date or today,
+        "duration_minutes": event.duration_minutes,
+        "score": event.score or 0,
+    } for event in events]
+    if not await activity_buffer.put(rows):
+        raise HTTPException(status_code=503, detail="Activity buffer is full, retry shortly",
+                            headers={"Retry-After": "1"})
+    return {"accepted": len(rows)}
+
+
+@router.get("/stats")
+def get_activity_buffer_stats():
+    return activity_buffer.stats()
+
+
+@router.post("/flush")
+def flush_activity(db: Session = Depends(get_db)):
+    """
+    Write everything buffered now instead of waiting for the next batch.
+    """
+    return {"written": ActivityIngestService.flush(db)}
+
+
+@router.get("/users/{user_id}/days", response_model=List[schemas.UserActivityDay])
+def get_user_activity_days(
+    user_id: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Per-day activity totals for a user, oldest first.
+    """
+    query = db.query(models.UserActivityDay).filter(models.UserActivityDay.user_id == user_id)
+    if start:
+        query = query.filter(models.UserActivityDay.day >= start)
+    if end:
+        query = query.filter(models.UserActivityDay.day <= end)
+    return query.order_by(models.UserActivityDay.day).all()
@@ -0,0 +1,96 @@
+# routers/analytics.py
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from database import get_db
+from services.mrr_service import MrrService
+from services.revenue_series_service import RevenueSeriesService
+from services.retention_service import RetentionService, retention_cache
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+
+def _month(value: Optional[str]) -> Optional[date]:
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid month {value}, expected YYYY-MM")
+
+
+@router.get("/mrr")
+def get_mrr_series(start: Optional[str] = None, end: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    MRR, ARR, subscribers and MRR movements per month (YYYY-MM), up to this month by default.
+    """
+    return MrrService.series(db, _month(start), _month(end))
+
+
+@router.get("/mrr/current")
+def get_current_mrr(db: Session = Depends(get_db)):
+    return MrrService.current(db)
+
+
+@router.post("/mrr/rebuild")
+def rebuild_mrr(db: Session = Depends(get_db)):
+    """
+    Recompute the monthly snapshots from the transaction ledger, e.g. after bulk imports.
+    """
+    return {"months": MrrService.rebuild(db)}
+
+
+@router.get("/revenue/series")
+def get_revenue_series(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: str = "day",
+    group_by: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Net revenue per day/week/month/quarter/year between two dates (the last 30 days by default),
+    optionally broken down by plan, type (gateway) or exam. Empty periods are filled with zeros.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    try:
+        return RevenueSeriesService.series(db, start, end, granularity, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/revenue/reconcile")
+def reconcile_revenue_buckets(db: Session = Depends(get_db)):
+    """
+    Repair the daily revenue buckets from the transactions, e.g. after bulk imports.
+    """
+    return {"reconciled_buckets": RevenueSeriesService.reconcile(db)}
+
+
+@router.get("/retention")
+def get_retention(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    granularity: str = "month",
+    periods: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Share of each join-month cohort (YYYY-MM, the last 12 months by default) active in the
+    weeks or months after joining. Period 0 is the week or month the users joined in.
+    """
+    end_month = _month(end) or date.today().replace(day=1)
+    start_month = _month(start) or date(end_month.year - (end_month.month < 12), end_month.month % 12 + 1, 1)
+    try:
+        return RetentionService.matrix(db, start_month, end_month, granularity, periods)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/retention/cache")
+def get_retention_cache_stats():
+    return retention_cache.stats()
@@ -7,11 +7,15 @@ from typing import Optional
 import uuid
 import jwt
 from jwt import PyJWTError
-from passlib.context import CryptContext
 import json
 
 from database import get_db
 from models import Employee, Role
+from services.auth_cache import EmployeePrincipal, principal_cache
+from services.permission_engine import permission_engine
+from services.password_hasher import (
+    pwd_context, password_hasher, hash_password_sync, verify_and_update_sync
+)
 from schemas import (
     EmployeeLogin, EmployeeSignup, EmployeeResponse, Token,
     PasswordResetRequest, PasswordResetConfirm, EmployeeUpdate,PasswordChange, User 
@@ -20,12 +24,7 @@ from schemas import (
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-
-# Use a more compatible hashing algorithm
-pwd_context = CryptContext(
-    schemes=["pbkdf2_sha256", "bcrypt"],  # Fallback to pbkdf2 if bcrypt fails
-    deprecated="auto"
-)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 # JWT Config
 SECRET_KEY = "your-secret-key-here-change-in-production"
@@ -36,20 +35,13 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 # Utility Functions
 # ======================
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    """Blocking check - async endpoints use password_hasher instead"""
+    valid, _ = verify_and_update_sync(plain_password, hashed_password)
+    return valid
 
 def get_password_hash(password):
-    try:
-        return pwd_context.hash(password)
-    except ValueError as e:
-        if "longer than 72 bytes" in str(e):
-            # Truncate password for bcrypt compatibility
-            password_bytes = password.encode('utf-8')
-            if len(password_bytes) > 72:
-                password_bytes = password_bytes[:72]
-            truncated_password = password_bytes.decode('utf-8', errors='ignore')
-            return pwd_context.hash(truncated_password)
-        raise
+    """Blocking hash - async endpoints use password_hasher instead"""
+    return hash_password_sync(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -58,7 +50,17 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 async def get_employee_from_token(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Dependency to extract employee from JWT token"""
+    """Dependency to extract the authenticated employee principal from a JWT token.
+
+    Verified tokens are served from the principal cache, so the hot path does
+    no signature check and no DB query. On a miss the token is decoded and the
+    employee loaded once.
+    """
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached[1]
+    generation = principal_cache.generation
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -77,11 +79,55 @@ async def get_employee_from_token(token: str = Depends(oauth2_scheme), db: Sessi
         raise credentials_exception
 
     employee = db.query(Employee).filter(Employee.id == employee_id).first()
-    if not employee:
+    if not employee or not employee.is_active:
         raise credentials_exception
-    print(employee)
+
+    principal = EmployeePrincipal.from_employee(employee)
+    principal_cache.put(token, payload, principal, generation)
+    return principal
+
+async def get_optional_employee(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> Optional[EmployeePrincipal]:
+    """Principal for endpoints that also serve anonymous callers"""
+    if not token:
+        return None
+    try:
+        return await get_employee_from_token(token, db)
+    except HTTPException:
+        return None
+
+async def get_current_employee_record(
+    principal: EmployeePrincipal = Depends(get_employee_from_token),
+    db: Session = Depends(get_db),
+):
+    """Load the ORM row for endpoints that modify the current employee"""
+    employee = db.query(Employee).filter(Employee.id == principal.id).first()
+    if not employee:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
     return employee
 
+def require_permission(*permissions: str):
+    """Dependency factory: 403 unless the employee holds every listed permission.
+
+    Resolved from the cached principal and the compiled role sets, so the
+    check itself never touches the database.
+
+        @router.get("/reports", dependencies=[Depends(require_permission("analytics_view"))])
+    """
+    async def check_permission(
+        principal: EmployeePrincipal = Depends(get_employee_from_token),
+    ) -> EmployeePrincipal:
+        for permission in permissions:
+            if not permission_engine.has_permission(principal.id, principal.roles, permission):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail=f"Missing permission: {permission}",
+                )
+        return principal
+    return check_permission
+
 # ======================
 # Auth Endpoints
 # ======================
@@ -92,9 +138,17 @@ async def login(login_data: EmployeeLogin, db: Session = Depends(get_db)):
     if not employee:
         raise HTTPException(status_code=401, detail="Employee not found")
 
-    if not verify_password(login_data.password, employee.password_hash):
+    valid, new_hash = await password_hasher.verify_and_update(
+        login_data.password, employee.password_hash
+    )
+    if not valid:
         raise HTTPException(status_code=401, detail="Incorrect password")
 
+    # Stored hash uses outdated parameters - upgrade it while we have the password
+    if new_hash:
+        employee.password_hash = new_hash
+        db.commit()
+
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": employee.email, "employee_id": employee.id},
@@ -136,6 +190,8 @@ async def signup(signup_data: EmployeeSignup, db: Session = Depends(get_db)):
             db.refresh(default_role)
         assigned_roles = [default_role]
 
+    password_hash = await password_hasher.hash(signup_data.password)
+
     try:
         # Create employee
         employee = Employee(
@@ -145,7 +201,7 @@ async def signup(signup_data: EmployeeSignup, db: Session = Depends(get_db)):
             email=signup_data.email,
             phone_number=signup_data.phone_number,
             organization=signup_data.organization,
-            password_hash=get_password_hash(signup_data.password),
+            password_hash=password_hash,
             bio=signup_data.bio,
             timezone=signup_data.timezone or "Asia/Kolkata",
             is_active=True,
@@ -178,7 +234,7 @@ async def signup(signup_data: EmployeeSignup, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=EmployeeResponse)
-async def get_me(current_employee: Employee = Depends(get_employee_from_token)):
+async def get_me(current_employee: EmployeePrincipal = Depends(get_employee_from_token)):
     """Get current employee"""
     return EmployeeResponse(
         id=current_employee.id,
@@ -187,7 +243,7 @@ async def get_me(current_employee: Employee = Depends(get_employee_from_token)):
         email=current_employee.email,
         phone_number=current_employee.phone_number,
         organization=current_employee.organization,
-        roles=[r.name for r in current_employee.roles],
+        roles=list(current_employee.roles),
         bio=current_employee.bio,
         is_active=current_employee.is_active,
         email_verified=current_employee.email_verified,
@@ -195,10 +251,16 @@ async def get_me(current_employee: Employee = Depends(get_employee_from_token)):
         updated_at=current_employee.updated_at,
     )
 
+@router.get("/me/permissions")
+async def get_my_permissions(current_employee: EmployeePrincipal = Depends(get_employee_from_token)):
+    """Effective permissions of the current employee"""
+    permissions = permission_engine.effective_permissions(current_employee.id, current_employee.roles)
+    return {"roles": list(current_employee.roles), "permissions": sorted(permissions)}
+
 @router.put("/update", response_model=EmployeeResponse)
 async def update_employee(
     update_data: EmployeeUpdate,
-    current_employee: Employee = Depends(get_employee_from_token),
+    current_employee: Employee = Depends(get_current_employee_record),
     db: Session = Depends(get_db),
 ):
     """Update current employee details."""
@@ -246,13 +308,13 @@ async def update_employee(
 @router.put("/change-password")
 async def change_password(
     password_data: PasswordChange,
-    current_employee: Employee = Depends(get_employee_from_token),
+    current_employee: Employee = Depends(get_current_employee_record),
     db: Session = Depends(get_db),
 ):
     """Change employee password"""
     
     # Verify current password
-    if not verify_password(password_data.currentPassword, current_employee.password_hash):
+    if not await password_hasher.verify(password_data.currentPassword, current_employee.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
@@ -265,9 +327,11 @@ async def change_password(
             detail="Password must be at least 8 characters long"
         )
     
+    new_hash = await password_hasher.hash(password_data.newPassword)
+
     # Update password
     try:
-        current_employee.password_hash = get_password_hash(password_data.newPassword)
+        current_employee.password_hash = new_hash
         current_employee.updated_at = datetime.utcnow()
         db.commit()
         
@@ -0,0 +1,41 @@
+# routers/autocomplete.py
+import time
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from database import get_db
+from services.autocomplete_service import AutocompleteService
+
+router = APIRouter(prefix="/api/autocomplete", tags=["autocomplete"])
+
+
+@router.get("/")
+def autocomplete(
+    q: str = Query(..., min_length=1, max_length=100),
+    type: str = Query("user", pattern="^(user|course)$"),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """
+    Type-ahead matches for user and course pickers. Every word of `q` is
+    matched as a prefix of a word in the name/email (users) or title
+    (courses).
+    """
+    AutocompleteService.ensure_loaded(db)
+    start = time.perf_counter()
+    results = AutocompleteService.search(type, q, limit)
+    return {
+        "query": q,
+        "type": type,
+        "results": results,
+        "took_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+@router.get("/stats")
+def autocomplete_stats():
+    """
+    Memory footprint of the in-memory autocomplete indexes.
+    """
+    return AutocompleteService.memory_report()
@@ -0,0 +1,53 @@
+# routers/duplicates.py
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from sqlalchemy.orm import Session
+
+from database import get_db
+from services.duplicate_service import DuplicateService
+
+router = APIRouter(prefix="/api/duplicates", tags=["duplicates"])
+
+ENTITY_PATTERN = "^(ticket|feedback)$"
+
+
+@router.get("/clusters")
+def duplicate_clusters(
+    entity: str = Query("ticket", pattern=ENTITY_PATTERN),
+    min_size: int = Query(2, ge=2),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """
+    Groups of near-identical tickets or feedback, largest first, for merging.
+    Each cluster has the earliest entry as `root` and the rest as `duplicates`.
+    """
+    return DuplicateService.clusters(db, entity, min_size=min_size, limit=limit)
+
+
+@router.get("/{entity}/{item_id}")
+def likely_duplicate(
+    entity: str = Path(..., pattern=ENTITY_PATTERN),
+    item_id: int = Path(...),
+    db: Session = Depends(get_db)
+):
+    """
+    The entry a ticket or feedback item most likely duplicates, if any.
+    """
+    index = DuplicateService.indexes[entity]
+    if not index.loaded:
+        DuplicateService.load(db)
+    if index.get(item_id) is None:
+        raise HTTPException(status_code=404, detail="No signature for this entry")
+    match = DuplicateService.similar(entity, item_id)
+    return {"entity": entity, "id": item_id,
+            "duplicate_of": match[0] if match else None,
+            "similarity": round(match[1], 3) if match else None}
+
+
+@router.post("/rebuild")
+def rebuild_duplicate_index(db: Session = Depends(get_db)):
+    """
+    Reload signatures and sign any entries that have none yet.
+    """
+    DuplicateService.load(db)
+    return {entity: len(index) for entity, index in DuplicateService.indexes.items()}
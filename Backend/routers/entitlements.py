@@ -0,0 +1,84 @@
+# routers/entitlements.py
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+import models
+from database import get_db
+from services.entitlement_service import EntitlementService, entitlement_cache
+from services.plan_propagation_service import PlanPropagationService
+
+router = APIRouter(prefix="/api/entitlements", tags=["entitlements"])
+
+
+@router.get("/users/{user_id}/courses")
+def get_user_courses(user_id: str, db: Session = Depends(get_db)):
+    """
+    Courses a user can open right now, with the latest expiry across their grants.
+    """
+    return {"user_id": user_id, "courses": EntitlementService.user_courses(db, user_id)}
+
+
+@router.get("/users/{user_id}/can-access/{course_id}")
+def check_course_access(user_id: str, course_id: int, db: Session = Depends(get_db)):
+    return {
+        "user_id": user_id,
+        "course_id": course_id,
+        "can_access": EntitlementService.can_access(db, user_id, course_id),
+    }
+
+
+@router.get("/courses/counts")
+def get_course_student_counts(db: Session = Depends(get_db)):
+    """
+    Distinct students with current access, per course id.
+    """
+    return EntitlementService.student_counts(db)
+
+
+@router.get("/courses/{course_id}/users")
+def get_course_users(
+    course_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    return {"course_id": course_id, "users": EntitlementService.course_users(db, course_id, skip, limit)}
+
+
+@router.get("/cache")
+def get_cache_stats():
+    return entitlement_cache.stats()
+
+
+@router.post("/rebuild")
+def rebuild_entitlements(db: Session = Depends(get_db)):
+    """
+    Recompute every grant from transactions and users, e.g. after a bulk import.
+    """
+    return {"entitlements": EntitlementService.rebuild(db)}
+
+
+@router.get("/jobs")
+def get_propagation_jobs(
+    plan_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """
+    Plan course-list propagation jobs, newest first.
+    """
+    query = db.query(models.EntitlementPropagationJob)
+    if plan_id is not None:
+        query = query.filter(models.EntitlementPropagationJob.plan_id == plan_id)
+    jobs = query.order_by(models.EntitlementPropagationJob.id.desc()).limit(limit).all()
+    return [PlanPropagationService.serialize(job) for job in jobs]
+
+
+@router.get("/jobs/{job_id}")
+def get_propagation_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.get(models.EntitlementPropagationJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Propagation job not found")
+    return PlanPropagationService.serialize(job)
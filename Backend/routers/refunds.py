@@ -0,0 +1,68 @@
+# routers/refunds.py
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from database import get_db
+from services.refund_service import RefundService
+
+router = APIRouter(prefix="/api/refunds", tags=["refunds"])
+
+
+@router.get("", response_model=List[schemas.RefundLedgerEntry])
+def get_refund_ledger(
+    transaction_id: Optional[int] = None,
+    user_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    Refund ledger entries, newest first.
+    """
+    query = db.query(models.RefundLedgerEntry)
+    if transaction_id is not None:
+        query = query.filter(models.RefundLedgerEntry.transaction_id == transaction_id)
+    if user_id:
+        query = query.filter(models.RefundLedgerEntry.user_id == user_id)
+    return query.order_by(models.RefundLedgerEntry.id.desc()).limit(limit).all()
+
+
+@router.get("/transactions/{transaction_id}")
+def get_transaction_refunds(transaction_id: int, db: Session = Depends(get_db)):
+    """
+    Amount refunded so far on a transaction, what is left, and the ledger entries.
+    """
+    transaction = db.get(models.Transaction, transaction_id)
+    if transaction is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    summary = RefundService.summary(db, transaction)
+    summary["entries"] = [schemas.RefundLedgerEntry.model_validate(entry) for entry in summary["entries"]]
+    return summary
+
+
+@router.post("/transactions/{transaction_id}", response_model=schemas.RefundLedgerEntry)
+def refund_transaction(transaction_id: int, refund: schemas.RefundLedgerCreate, db: Session = Depends(get_db)):
+    """
+    Refund part or all of a captured transaction directly, without a refund request.
+    """
+    transaction = db.get(models.Transaction, transaction_id)
+    if transaction is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    try:
+        entry = RefundService.refund(db, transaction, refund.amount, refund.reason, refund.processed_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+
+@router.post("/backfill")
+def backfill_refunds(db: Session = Depends(get_db)):
+    """
+    Link refund requests to transactions and record ledger entries for refunds made before the ledger existed.
+    """
+    return RefundService.backfill(db)
@@ -1,8 +1,9 @@
 # routers/roles.py
 import json
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 import uuid
 from datetime import datetime
 
@@ -12,35 +13,54 @@ from models import (
     RoleCreate, RoleUpdate, RoleResponse, RoleAssignmentResponse,
     RoleAssignmentCreate, BulkRoleAssignment, RoleAction,DEFAULT_PERMISSIONS
 )
+from services.permission_engine import parse_permissions, permission_engine
+from services.role_history_service import RoleHistoryService, RETENTION_DAYS
 # from "../models" import DEFAULT_PERMISSION
 
 router = APIRouter(prefix="/api/roles", tags=["roles"])
 
-# Helper function to parse permissions
-def parse_permissions(permissions_data):
-    """Parse permissions from string to list"""
-    if permissions_data is None:
-        return []
-    
-    if isinstance(permissions_data, list):
-        return permissions_data
-    
-    if isinstance(permissions_data, str):
-        try:
-            # Try to parse as JSON
-            return json.loads(permissions_data)
-        except json.JSONDecodeError:
-            # If it's a string representation of a list, try eval (be careful with this)
-            try:
-                # Only use eval if the string looks like a Python list
-                if permissions_data.startswith('[') and permissions_data.endswith(']'):
-                    return eval(permissions_data)
-                else:
-                    return [permissions_data]
-            except:
-                return [permissions_data]
-    
-    return []
+def get_role_user_counts(db: Session, role_ids: List[str]) -> Dict[str, int]:
+    """User counts for many roles in one grouped query"""
+    if not role_ids:
+        return {}
+    rows = db.query(user_roles.c.role_id, func.count(user_roles.c.user_id)).filter(
+        user_roles.c.role_id.in_(role_ids)
+    ).group_by(user_roles.c.role_id).all()
+    return dict(rows)
+
+# Users resolved per IN query / rows per bulk INSERT; stays under SQLite's
+# bound-parameter limit
+BULK_CHUNK_SIZE = 900
+
+def _chunks(items: List[str], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _dedupe_user_ids(user_ids: List[str], duplicate_error: str):
+    """Drop repeated ids, reporting each repeat the way the per-user path did"""
+    seen = set()
+    unique, errors = [], []
+    for user_id in user_ids:
+        if user_id in seen:
+            errors.append(duplicate_error.format(user_id))
+        else:
+            seen.add(user_id)
+            unique.append(user_id)
+    return unique, errors
+
+def _history_rows(user_ids: List[str], role_id: str, action: RoleAction, assigned_by: str):
+    now = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "role_id": role_id,
+            "action": action.value,
+            "assigned_by": assigned_by,
+            "timestamp": now,
+        }
+        for user_id in user_ids
+    ]
 
 # Role Management Endpoints
 @router.get("/", response_model=List[RoleResponse])
@@ -62,9 +82,10 @@ async def get_roles(
     roles = query.offset(skip).limit(limit).all()
     
     # Convert to response model with user count
+    user_counts = get_role_user_counts(db, [role.id for role in roles])
     role_responses = []
     for role in roles:
-        user_count = db.query(user_roles).filter(user_roles.c.role_id == role.id).count()
+        user_count = user_counts.get(role.id, 0)
         
         # Parse permissions properly
         permissions_list = parse_permissions(role.permissions)
@@ -92,7 +113,7 @@ async def get_role(role_id: str, db: Session = Depends(get_db)):
     if not role:
         raise HTTPException(status_code=404, detail="Role not found")
     
-    user_count = db.query(user_roles).filter(user_roles.c.role_id == role_id).count()
+    user_count = get_role_user_counts(db, [role_id]).get(role_id, 0)
     
     # Parse permissions properly
     permissions_list = parse_permissions(role.permissions)
@@ -183,7 +204,7 @@ async def update_role(role_id: str, role_data: RoleUpdate, db: Session = Depends
     db.commit()
     db.refresh(role)
     
-    user_count = db.query(user_roles).filter(user_roles.c.role_id == role_id).count()
+    user_count = get_role_user_counts(db, [role_id]).get(role_id, 0)
     
     # Parse permissions for response
     permissions_list = parse_permissions(role.permissions)
@@ -214,7 +235,7 @@ async def delete_role(role_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Cannot delete system roles")
     
     # Check if role has users assigned
-    user_count = db.query(user_roles).filter(user_roles.c.role_id == role_id).count()
+    user_count = get_role_user_counts(db, [role_id]).get(role_id, 0)
     if user_count > 0:
         raise HTTPException(
             status_code=400, 
@@ -282,54 +303,44 @@ async def bulk_assign_role(bulk_assignment: BulkRoleAssignment, db: Session = De
     if not role:
         raise HTTPException(status_code=404, detail="Role not found")
     
+    role_id = bulk_assignment.role_id
+    user_ids, errors = _dedupe_user_ids(bulk_assignment.user_ids, "User {} already has this role")
     success_count = 0
-    errors = []
     
-    for user_id in bulk_assignment.user_ids:
+    for chunk in _chunks(user_ids, BULK_CHUNK_SIZE):
         try:
-            # Check if user exists
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
-                errors.append(f"User {user_id} not found")
-                continue
-            
-            # Check if user already has this role
-            existing_assignment = db.execute(
-                user_roles.select().where(
-                    user_roles.c.user_id == user_id,
-                    user_roles.c.role_id == bulk_assignment.role_id
+            # One query each for existing users and existing assignments
+            known_users = {row[0] for row in db.query(User.id).filter(User.id.in_(chunk))}
+            already_assigned = {row[0] for row in db.execute(
+                select(user_roles.c.user_id).where(
+                    user_roles.c.role_id == role_id,
+                    user_roles.c.user_id.in_(chunk)
                 )
-            ).first()
-            
-            if existing_assignment:
-                errors.append(f"User {user_id} already has this role")
-                continue
-            
-            # Assign role
-            stmt = user_roles.insert().values(
-                user_id=user_id,
-                role_id=bulk_assignment.role_id,
-                assigned_by=bulk_assignment.assigned_by
-            )
-            db.execute(stmt)
+            )}
             
-            # Log assignment history
-            history_id = str(uuid.uuid4())
-            history = RoleAssignmentHistory(
-                id=history_id,
-                user_id=user_id,
-                role_id=bulk_assignment.role_id,
-                action=RoleAction.ASSIGNED,
-                assigned_by=bulk_assignment.assigned_by
-            )
-            db.add(history)
+            to_assign = []
+            for user_id in chunk:
+                if user_id not in known_users:
+                    errors.append(f"User {user_id} not found")
+                elif user_id in already_assigned:
+                    errors.append(f"User {user_id} already has this role")
+                else:
+                    to_assign.append(user_id)
             
-            success_count += 1
+            if to_assign:
+                db.execute(user_roles.insert(), [
+                    {"user_id": user_id, "role_id": role_id, "assigned_by": bulk_assignment.assigned_by}
+                    for user_id in to_assign
+                ])
+                db.execute(insert(RoleAssignmentHistory), _history_rows(
+                    to_assign, role_id, RoleAction.ASSIGNED, bulk_assignment.assigned_by
+                ))
+            db.commit()
+            success_count += len(to_assign)
             
         except Exception as e:
-            errors.append(f"Error assigning role to user {user_id}: {str(e)}")
-    
-    db.commit()
+            db.rollback()
+            errors.extend(f"Error assigning role to user {user_id}: {str(e)}" for user_id in chunk)
     
     return {
         "message": f"Role assigned to {success_count} users",
@@ -373,41 +384,106 @@ async def remove_role(assignment: RoleAssignmentCreate, db: Session = Depends(ge
     
     return {"message": "Role removed successfully"}
 
+@router.post("/bulk-remove")
+async def bulk_remove_role(bulk_assignment: BulkRoleAssignment, db: Session = Depends(get_db)):
+    """Remove a role from multiple users"""
+    role = db.query(Role).filter(Role.id == bulk_assignment.role_id).first()
+    if not role:
+        raise HTTPException(status_code=404, detail="Role not found")
+    
+    role_id = bulk_assignment.role_id
+    user_ids, errors = _dedupe_user_ids(bulk_assignment.user_ids, "Role assignment not found for user {}")
+    success_count = 0
+    
+    for chunk in _chunks(user_ids, BULK_CHUNK_SIZE):
+        try:
+            assigned = {row[0] for row in db.execute(
+                select(user_roles.c.user_id).where(
+                    user_roles.c.role_id == role_id,
+                    user_roles.c.user_id.in_(chunk)
+                )
+            )}
+            
+            to_remove = []
+            for user_id in chunk:
+                if user_id in assigned:
+                    to_remove.append(user_id)
+                else:
+                    errors.append(f"Role assignment not found for user {user_id}")
+            
+            if to_remove:
+                db.execute(user_roles.delete().where(
+                    user_roles.c.role_id == role_id,
+                    user_roles.c.user_id.in_(to_remove)
+                ))
+                db.execute(insert(RoleAssignmentHistory), _history_rows(
+                    to_remove, role_id, RoleAction.REMOVED, bulk_assignment.assigned_by
+                ))
+            db.commit()
+            success_count += len(to_remove)
+            
+        except Exception as e:
+            db.rollback()
+            errors.extend(f"Error removing role from user {user_id}: {str(e)}" for user_id in chunk)
+    
+    return {
+        "message": f"Role removed from {success_count} users",
+        "success_count": success_count,
+        "errors": errors
+    }
+
 @router.get("/assignments/history", response_model=List[RoleAssignmentResponse])
 async def get_role_assignments(
+    response: Response,
     skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=500),
     user_id: Optional[str] = None,
     role_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    include_archived: bool = True,
     db: Session = Depends(get_db)
 ):
-    """Get role assignment history"""
-    query = db.query(RoleAssignmentHistory)
-    
-    if user_id:
-        query = query.filter(RoleAssignmentHistory.user_id == user_id)
-    if role_id:
-        query = query.filter(RoleAssignmentHistory.role_id == role_id)
+    """Get role assignment history, newest first.
+
+    Pass the X-Next-Cursor header of a page back as `cursor` to fetch the
+    next one; archived entries are included transparently.
+    """
+    try:
+        entries, next_cursor = RoleHistoryService.query(
+            db, limit=limit, skip=skip, user_id=user_id, role_id=role_id,
+            since=since, until=until, cursor=cursor, include_archived=include_archived
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    assignments = query.order_by(RoleAssignmentHistory.timestamp.desc()).offset(skip).limit(limit).all()
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
-    assignment_responses = []
-    for assignment in assignments:
-        assignment_responses.append(RoleAssignmentResponse(
-            id=assignment.id,
+    return [
+        RoleAssignmentResponse(
+            id=entry["id"],
             user={
-                "id": assignment.user.id,
-                "name": assignment.user.name,
-                "email": assignment.user.email,
-                # "avatar": assignment.user.avatar
+                "id": entry["user_id"],
+                "name": entry["user_name"],
+                "email": entry["user_email"],
             },
-            role=assignment.role.name,
-            action=assignment.action,
-            date=assignment.timestamp,
-            assigned_by=assignment.assigned_by
-        ))
-    
-    return assignment_responses
+            role=entry["role_name"] or entry["role_id"],
+            action=entry["action"],
+            date=entry["timestamp"],
+            assigned_by=entry["assigned_by"]
+        )
+        for entry in entries
+    ]
+
+@router.post("/assignments/history/archive")
+async def archive_role_assignments(
+    older_than_days: int = Query(RETENTION_DAYS, ge=1),
+    db: Session = Depends(get_db)
+):
+    """Move history older than N days into compressed archive segments"""
+    return RoleHistoryService.archive(db, older_than_days)
 
 @router.get("/users/{user_id}/roles")
 async def get_user_roles(user_id: str, db: Session = Depends(get_db)):
@@ -440,7 +516,8 @@ async def get_all_permissions(db: Session = Depends(get_db)):
 # Initialize data function (call this from main.py)
 def initialize_roles_data(db: Session):
     """Initialize default permissions and system roles"""
-    pass
+    permission_engine.load(db)
+    RoleHistoryService.ensure_indexes(db.get_bind())
     # try:
     #     # Create default permissions
     #     for perm_data in DEFAULT_PERMISSIONS:
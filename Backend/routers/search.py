@@ -0,0 +1,34 @@
+# routers/search.py
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from database import get_db
+from services.search_service import SearchService
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+@router.get("/")
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    entity: Optional[str] = Query(None, pattern="^(user|ticket|review|feedback)$"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Ranked search across users, tickets, reviews and feedback.
+    Matches are wrapped in <mark> in `title` and `snippet`; `facets` holds
+    the hit count per entity for the whole query.
+    """
+    return SearchService.search(db, q, entity=entity, limit=limit, offset=offset)
+
+
+@router.post("/reindex")
+def reindex(db: Session = Depends(get_db)):
+    """
+    Rebuild the search index from the source tables.
+    """
+    return {"indexed": SearchService.rebuild(db.get_bind())}
@@ -0,0 +1,38 @@
+# routers/sentiment.py
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from database import get_db
+from services.sentiment_service import SentimentService, classify
+
+router = APIRouter(prefix="/api/sentiment", tags=["sentiment"])
+
+
+class ClassifyRequest(BaseModel):
+    text: str = Field(..., max_length=10000)
+
+
+@router.get("/stats")
+def sentiment_stats(db: Session = Depends(get_db)):
+    """
+    Label counts for reviews and feedback, plus how many still await scoring.
+    """
+    return SentimentService.stats(db)
+
+
+@router.post("/classify")
+def classify_text(request: ClassifyRequest):
+    """
+    Classify a piece of text without storing anything.
+    """
+    label, score = classify(request.text)
+    return {"label": label, "score": score}
+
+
+@router.post("/score-backlog")
+def score_backlog(db: Session = Depends(get_db)):
+    """
+    Score every review and feedback entry that has no current score.
+    """
+    return {"scored": SentimentService.score_backlog(db)}
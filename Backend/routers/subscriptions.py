@@ -0,0 +1,34 @@
+# routers/subscriptions.py
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from database import get_db
+from services.subscription_expiry_service import SubscriptionExpiryService
+
+router = APIRouter(prefix="/api/subscriptions", tags=["subscriptions"])
+
+
+@router.get("/expirations/upcoming")
+def upcoming_expirations(days: int = Query(30, ge=1, le=366), db: Session = Depends(get_db)):
+    """
+    Active subscriptions ending on each of the next `days` days.
+    """
+    daily = SubscriptionExpiryService.upcoming(db, days)
+    return {"days": days, "total": sum(d["expiring"] for d in daily), "daily": daily}
+
+
+@router.get("/expirations/history")
+def expiration_history(days: int = Query(30, ge=1, le=366), db: Session = Depends(get_db)):
+    """
+    Subscriptions expired by the expiry job on each of the last `days` days.
+    """
+    daily = SubscriptionExpiryService.history(db, days)
+    return {"days": days, "total": sum(d["expired"] for d in daily), "daily": daily}
+
+
+@router.post("/expirations/run")
+def run_expirations(db: Session = Depends(get_db)):
+    """
+    Expire due subscriptions and send reminders now instead of waiting for the next scheduled run.
+    """
+    return SubscriptionExpiryService.run_once(db)
@@ -0,0 +1,94 @@
+# routers/webhooks.py
+import asyncio
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session, sessionmaker
+
+import models
+import schemas
+from database import get_db
+from services.payment_webhook_service import (
+    GATEWAYS, SIGNATURE_HEADERS, PaymentWebhookService, verify_signature, webhook_worker,
+)
+
+router = APIRouter(prefix="/api/webhooks", tags=["webhooks"])
+
+
+@router.get("/stats")
+def get_webhook_stats(db: Session = Depends(get_db)):
+    """
+    Inbox counts by status and how long the oldest pending event has waited.
+    """
+    return PaymentWebhookService.stats(db)
+
+
+@router.get("/events", response_model=List[schemas.PaymentWebhookEvent])
+def get_webhook_events(
+    status: Optional[str] = None,
+    gateway: Optional[str] = None,
+    order_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    Stored gateway callbacks, newest first.
+    """
+    query = db.query(models.PaymentWebhookEvent)
+    if status:
+        query = query.filter(models.PaymentWebhookEvent.status == status)
+    if gateway:
+        query = query.filter(models.PaymentWebhookEvent.gateway == gateway)
+    if order_id:
+        query = query.filter(models.PaymentWebhookEvent.order_id == order_id)
+    return query.order_by(models.PaymentWebhookEvent.id.desc()).limit(limit).all()
+
+
+@router.get("/events/{event_id}", response_model=schemas.PaymentWebhookEventDetail)
+def get_webhook_event(event_id: int, db: Session = Depends(get_db)):
+    event = db.get(models.PaymentWebhookEvent, event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Webhook event not found")
+    return event
+
+
+@router.post("/replay")
+def replay_webhook_events(replay: schemas.PaymentWebhookReplay, background_tasks: BackgroundTasks,
+                          db: Session = Depends(get_db)):
+    """
+    Queue stored events to be applied again, by id or by status/gateway/received-since (failed ones by default).
+    """
+    replayed = PaymentWebhookService.replay(db, replay.event_ids, replay.status, replay.gateway, replay.since)
+    if replayed:
+        background_tasks.add_task(PaymentWebhookService.process_pending_in_new_session,
+                                  sessionmaker(bind=db.get_bind()))
+    return {"replayed": replayed}
+
+
+@router.post("/process")
+def process_webhook_events(db: Session = Depends(get_db)):
+    """
+    Apply every pending event now instead of waiting for the worker.
+    """
+    return PaymentWebhookService.process_pending(db)
+
+
+@router.post("/{gateway}")
+async def receive_webhook(gateway: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Gateway callback endpoint: stores the event and acknowledges it; the worker applies it.
+    The insert runs in a worker thread so a slow commit does not stall the event loop.
+    """
+    if gateway not in GATEWAYS:
+        raise HTTPException(status_code=404, detail=f"Unknown gateway {gateway}")
+    body = await request.body()
+    if not verify_signature(gateway, body, request.headers.get(SIGNATURE_HEADERS[gateway])):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    try:
+        payload = json.loads(body)
+        result = await asyncio.to_thread(PaymentWebhookService.ingest, db, gateway, payload)
+    except ValueError as e:  # json.JSONDecodeError is a ValueError too
+        raise HTTPException(status_code=400, detail=str(e))
+    webhook_worker.notify()
+    return result
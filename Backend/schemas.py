@@ -44,6 +44,8 @@ class User(UserBase):
     deletion_reason: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
+    avatar_url: Optional[str] = None
+    avatar_urls: Dict[str, Dict[str, str]] = {}  # size -> {format: url}, filled in by the endpoints
 
     class Config:
         from_attributes = True
@@ -154,6 +156,7 @@ class RefundRequestBase(BaseModel):
     amount: int
     reason: str
     status: str = "pending"
+    transaction_id: Optional[int] = None
 
 class RefundRequestCreate(RefundRequestBase):
     pass
@@ -174,6 +177,51 @@ class RefundRequest(RefundRequestBase):
     class Config:
         from_attributes = True
 
+# Refund Ledger Schemas
+class RefundLedgerCreate(BaseModel):
+    amount: int = Field(..., gt=0)
+    reason: Optional[str] = None
+    processed_by: Optional[str] = None
+
+class RefundLedgerEntry(BaseModel):
+    id: int
+    transaction_id: int
+    refund_request_id: Optional[int] = None
+    user_id: Optional[str] = None
+    plan_name: Optional[str] = None
+    amount: int
+    reason: Optional[str] = None
+    processed_by: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class PaymentWebhookEvent(BaseModel):
+    id: int
+    gateway: str
+    event_type: Optional[str] = None
+    idempotency_key: str
+    order_id: Optional[str] = None
+    payment_gateway_id: Optional[str] = None
+    received_at: datetime
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    processed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class PaymentWebhookEventDetail(PaymentWebhookEvent):
+    payload: Dict[str, Any]
+
+class PaymentWebhookReplay(BaseModel):
+    event_ids: Optional[List[int]] = None
+    status: Optional[str] = "failed"
+    gateway: Optional[str] = None
+    since: Optional[datetime] = None
+
 # Exam Schemas
 class ExamBase(BaseModel):
     name: str
@@ -438,6 +486,25 @@ class UserCourse(UserCourseBase):
     class Config:
         from_attributes = True
 
+# User Activity Schemas
+class ActivityEvent(BaseModel):
+    user_id: str
+    activity_type: str = Field("study", max_length=50)
+    activity_date: Optional[date] = None  # today when omitted
+    duration_minutes: int = Field(0, ge=0, le=1440)
+    score: Optional[int] = Field(None, ge=0, le=100)
+
+class UserActivityDay(BaseModel):
+    user_id: str
+    day: date
+    events: int
+    study_minutes: int
+    tests: int
+    score_total: int
+
+    class Config:
+        from_attributes = True
+
 # Stats Schemas
 class CourseStats(BaseModel):
     total_courses: int
@@ -602,6 +669,8 @@ class EmployeeBase(BaseModel):
     # language: Optional[str] = "English"
 class EmployeeResponse(EmployeeBase):
     id: str
+    avatarUrl: Optional[str] = None
+    avatarUrls: Dict[str, Dict[str, str]] = {}  # size -> {format: url}
 
     class Config:
         from_attributes = True
@@ -674,6 +743,7 @@ class NotificationSettings(BaseModel):
 class AvatarResponse(BaseModel):
     success: bool
     url: str
+    variants: Dict[str, Dict[str, str]] = {}  # size -> {format: url}
     message: str
 
 
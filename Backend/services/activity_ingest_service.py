@@ -0,0 +1,337 @@
+# services/activity_ingest_service.py
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import date
+from typing import Dict, List, Tuple
+
+from sqlalchemy import bindparam, case, func, insert, inspect, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+from sqlalchemy.orm import Session
+
+import models
+from services.retention_service import RetentionService
+
+logger = logging.getLogger(__name__)
+
+# Events held in memory before producers are made to wait
+ACTIVITY_BUFFER_CAPACITY = int(os.getenv("ACTIVITY_BUFFER_CAPACITY", "200000"))
+ACTIVITY_BATCH_SIZE = int(os.getenv("ACTIVITY_BATCH_SIZE", "5000"))
+ACTIVITY_FLUSH_INTERVAL_SECONDS = float(os.getenv("ACTIVITY_FLUSH_INTERVAL_SECONDS", "1"))
+# How long a request waits for room in a full buffer before it is turned away
+ACTIVITY_BACKPRESSURE_TIMEOUT_SECONDS = float(os.getenv("ACTIVITY_BACKPRESSURE_TIMEOUT_SECONDS", "2"))
+BACKPRESSURE_POLL_SECONDS = 0.01
+# Longest wait between flushes while writes keep failing, e.g. during a database outage
+ACTIVITY_MAX_BACKOFF_SECONDS = float(os.getenv("ACTIVITY_MAX_BACKOFF_SECONDS", "60"))
+# Activity types that count as an attempted test, with their score in average_score
+TEST_TYPES = ("test",)
+
+users_table = models.User.__table__
+activities_table = models.UserActivity.__table__
+days_table = models.UserActivityDay.__table__
+
+
+def summarize(events: List[dict]) -> Tuple[Dict[Tuple[str, date], List[int]], Dict[str, List]]:
+    """Totals per (user_id, day) as [events, minutes, tests, score_total] and
+    per user as [minutes, tests, score_total, last_day]"""
+    days: Dict[Tuple[str, date], List[int]] = {}
+    users: Dict[str, List] = {}
+    for event in events:
+        minutes = event["duration_minutes"] or 0
+        is_test = event["activity_type"] in TEST_TYPES
+        score = (event["score"] or 0) if is_test else 0
+        totals = days.get((event["user_id"], event["activity_date"]))
+        if totals is None:
+            days[(event["user_id"], event["activity_date"])] = [1, minutes, int(is_test), score]
+        else:
+            totals[0] += 1
+            totals[1] += minutes
+            totals[2] += is_test
+            totals[3] += score
+        totals = users.get(event["user_id"])
+        if totals is None:
+            users[event["user_id"]] = [minutes, int(is_test), score, event["activity_date"]]
+        else:
+            totals[0] += minutes
+            totals[1] += is_test
+            totals[2] += score
+            totals[3] = max(totals[3], event["activity_date"])
+    return days, users
+
+
+def _upsert_days(bind):
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(bind.dialect.name)
+    if dialect is None:
+        return None
+    statement = dialect.insert(days_table)
+    return statement.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={
+            column: days_table.c[column] + statement.excluded[column]
+            for column in ("events", "study_minutes", "tests", "score_total")
+        } | {"updated_at": func.now()},
+    )
+
+
+# Running totals on users: hours follow the minutes, and the average score is re-weighted by the new tests
+_tests = func.coalesce(users_table.c.tests_attempted, 0)
+_minutes = func.coalesce(users_table.c.total_study_minutes, 0) + bindparam("minutes")
+update_user_totals = update(users_table).where(users_table.c.id == bindparam("user_id")).values(
+    total_study_minutes=_minutes,
+    total_study_hours=_minutes // 60,
+    tests_attempted=_tests + bindparam("tests"),
+    average_score=case(
+        (_tests + bindparam("tests") > 0,
+         (func.coalesce(users_table.c.average_score, 0.0) * _tests + bindparam("score_total"))
+         / (_tests + bindparam("tests"))),
+        else_=users_table.c.average_score,
+    ),
+    last_active=case(
+        ((users_table.c.last_active.is_(None)) | (users_table.c.last_active < bindparam("last_day")),
+         bindparam("last_day")),
+        else_=users_table.c.last_active,
+    ),
+)
+
+
+class ActivityBuffer:
+    """Bounded in-process queue of activity events waiting to be written.
+
+    Producers add events with put(), which waits while the buffer is full
+    and gives up after ACTIVITY_BACKPRESSURE_TIMEOUT_SECONDS, so memory stays
+    within capacity and callers are told to retry instead of piling up.
+    run() writes a batch whenever ACTIVITY_BATCH_SIZE events are waiting and
+    every ACTIVITY_FLUSH_INTERVAL_SECONDS otherwise. A batch the database
+    rejects (integrity or data errors) is written in halves and the single
+    events it still rejects are dropped and counted as failed. Any other
+    failure, such as a lost connection or a locked database, puts the batch
+    back at the front and run() backs off, doubling the wait per failure up
+    to ACTIVITY_MAX_BACKOFF_SECONDS.
+    """
+
+    def __init__(self, capacity: int = 200000, batch_size: int = 5000):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self._events: List[dict] = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wake = None
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        # Consecutive failed flushes, for the backoff in run()
+        self.attempts = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def offer(self, events: List[dict]) -> bool:
+        """Add events if they all fit; never blocks"""
+        with self._lock:
+            if len(self._events) + len(events) > self.capacity:
+                return False
+            self._events.extend(events)
+            self.accepted += len(events)
+            ready = len(self._events) >= self.batch_size
+        if ready:
+            self.notify()
+        return True
+
+    async def put(self, events: List[dict], timeout: float = ACTIVITY_BACKPRESSURE_TIMEOUT_SECONDS) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.offer(events):
+            self.notify()
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self.rejected += len(events)
+                return False
+            await asyncio.sleep(BACKPRESSURE_POLL_SECONDS)
+        return True
+
+    def take(self, limit: int) -> List[dict]:
+        with self._lock:
+            batch = self._events[:limit]
+            del self._events[:limit]
+            return batch
+
+    def restore(self, events: List[dict]):
+        """Put a batch that could not be written back at the front, as far as capacity allows"""
+        with self._lock:
+            room = max(self.capacity - len(self._events), 0)
+            self._events[:0] = events[:room]
+            self.dropped += len(events) - min(room, len(events))
+
+    def record(self, written: int, dropped: int, failed: int = 0):
+        with self._lock:
+            self.written += written
+            self.dropped += dropped
+            self.failed += failed
+
+    def notify(self):
+        if self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"buffered": len(self._events), "capacity": self.capacity, "batch_size": self.batch_size,
+                    "accepted": self.accepted, "rejected": self.rejected,
+                    "written": self.written, "dropped": self.dropped, "failed": self.failed,
+                    "attempts": self.attempts}
+
+    async def run(self, session_factory):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=ACTIVITY_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(ActivityIngestService.flush_in_new_session, session_factory)
+            except Exception as e:
+                delay = min(ACTIVITY_FLUSH_INTERVAL_SECONDS * 2 ** self.attempts, ACTIVITY_MAX_BACKOFF_SECONDS)
+                logger.error(f"Activity flush failed ({e}); retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+
+activity_buffer = ActivityBuffer(capacity=ACTIVITY_BUFFER_CAPACITY, batch_size=ACTIVITY_BATCH_SIZE)
+
+# One flush at a time, so two batches never race on the same summary rows
+_flush_lock = threading.Lock()
+
+
+def _is_rejection(error: Exception) -> bool:
+    """Whether the events themselves were refused, so retrying them as they are cannot succeed"""
+    if isinstance(error, (IntegrityError, DataError)):
+        return True
+    # Values that could not even be bound to the statement
+    return isinstance(error, StatementError) and not isinstance(error, DBAPIError)
+
+
+class ActivityIngestService:
+    """Writes buffered activity events in batches.
+
+    Each batch is one bulk INSERT into user_activities, one upsert per
+    (user, day) into user_activity_days and one UPDATE per user of
+    total_study_minutes/hours, tests_attempted, average_score and
+    last_active, all in a single commit. Events for unknown users are
+    dropped.
+    """
+
+    @staticmethod
+    def ensure_schema(bind):
+        # create_all does not add columns to tables that already exist
+        columns = {column["name"] for column in inspect(bind).get_columns("users")}
+        if "total_study_minutes" not in columns:
+            with bind.begin() as connection:
+                connection.execute(text("ALTER TABLE users ADD COLUMN total_study_minutes INTEGER DEFAULT 0"))
+                connection.execute(text("UPDATE users SET total_study_minutes = COALESCE(total_study_hours, 0) * 60"))
+
+    @staticmethod
+    def write(db: Session, events: List[dict]) -> int:
+        """Store a batch of events and fold it into the summaries; returns the events written"""
+        user_ids = list({event["user_id"] for event in events})
+        known = set()
+        for offset in range(0, len(user_ids), 500):
+            known.update(db.execute(
+                select(users_table.c.id).where(users_table.c.id.in_(user_ids[offset:offset + 500]))).scalars())
+        events = [event for event in events if event["user_id"] in known]
+        if not events:
+            return 0
+
+        days, users = summarize(events)
+        db.execute(insert(activities_table), events)
+        day_rows = [{"user_id": user_id, "day": day, "events": totals[0], "study_minutes": totals[1],
+                     "tests": totals[2], "score_total": totals[3]} for (user_id, day), totals in days.items()]
+        upsert = _upsert_days(db.get_bind())
+        if upsert is not None:
+            db.execute(upsert, day_rows)
+        else:
+            for row in day_rows:
+                result = db.execute(update(days_table).where(
+                    days_table.c.user_id == row["user_id"], days_table.c.day == row["day"]
+                ).values({column: days_table.c[column] + row[column]
+                          for column in ("events", "study_minutes", "tests", "score_total")}))
+                if result.rowcount == 0:
+                    db.execute(insert(days_table).values(row))
+        db.execute(update_user_totals, [
+            {"user_id": user_id, "minutes": totals[0], "tests": totals[1], "score_total": totals[2],
+             "last_day": totals[3]} for user_id, totals in users.items()
+        ])
+        # Cached cohorts are dropped once this commits
+        RetentionService.queue_invalidation(db, RetentionService.cohorts_for_users(db.connection(), users))
+        db.commit()
+        return len(events)
+
+    @staticmethod
+    def write_in_parts(db: Session, events: List[dict], buffer: ActivityBuffer) -> int:
+        """Write a batch the database rejected by halves, dropping the single events it still rejects.
+
+        Returns the events written. An error other than a rejection puts the
+        events not written yet back in the buffer and is raised.
+        """
+        written = failed = 0
+        parts = [events]
+        try:
+            while parts:
+                part = parts.pop()
+                try:
+                    written += ActivityIngestService.write(db, part)
+                except Exception as e:
+                    db.rollback()
+                    if not _is_rejection(e):
+                        parts.append(part)
+                        raise
+                    if len(part) == 1:
+                        logger.error(f"Dropping activity event the database rejects: {part[0]} ({e})")
+                        failed += 1
+                    else:
+                        middle = len(part) // 2
+                        parts += [part[middle:], part[:middle]]
+        finally:
+            unwritten = [event for part in reversed(parts) for event in part]
+            buffer.restore(unwritten)
+            buffer.record(written=written, dropped=len(events) - len(unwritten) - written - failed, failed=failed)
+        return written
+
+    @staticmethod
+    def flush(db: Session, buffer: ActivityBuffer = activity_buffer) -> int:
+        """Write everything buffered so far, a batch per commit; returns the events written"""
+        written = 0
+        with _flush_lock:
+            while True:
+                batch = buffer.take(buffer.batch_size)
+                if not batch:
+                    buffer.attempts = 0
+                    return written
+                try:
+                    count = ActivityIngestService.write(db, batch)
+                except Exception as e:
+                    db.rollback()
+                    if not _is_rejection(e):
+                        buffer.attempts += 1
+                        buffer.restore(batch)
+                        raise
+                    logger.warning(f"Activity batch of {len(batch)} rejected ({e}); writing it in parts")
+                    try:
+                        written += ActivityIngestService.write_in_parts(db, batch, buffer)
+                    except Exception:
+                        buffer.attempts += 1
+                        raise
+                    continue
+                buffer.record(written=count, dropped=len(batch) - count)
+                written += count
+
+    @staticmethod
+    def flush_in_new_session(session_factory) -> int:
+        db = session_factory()
+        try:
+            return ActivityIngestService.flush(db)
+        finally:
+            db.close()
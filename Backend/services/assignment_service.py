@@ -0,0 +1,271 @@
+# services/assignment_service.py
+import heapq
+import logging
+import threading
+from collections import Counter
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session, selectinload
+
+import models
+from services.permission_engine import WILDCARD_PERMISSION, permission_engine
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ("open", "in_progress")
+# Holding this permission makes an employee/team member a support agent for
+# every category; "support_tickets:<category>" limits them to one category
+SUPPORT_PERMISSION = "support_tickets"
+ALL_CATEGORIES = "*"
+
+Ticket = models.SupportTicket
+TicketState = Tuple[Optional[str], str, Optional[str], Optional[str]]  # (agent, status, priority, category)
+
+
+def _agent_categories(permissions) -> Optional[FrozenSet[str]]:
+    """Categories an agent may take: ALL_CATEGORIES, a set, or None (not an agent)"""
+    if WILDCARD_PERMISSION in permissions or SUPPORT_PERMISSION in permissions:
+        return frozenset([ALL_CATEGORIES])
+    prefix = SUPPORT_PERMISSION + ":"
+    categories = frozenset(p[len(prefix):] for p in permissions if p.startswith(prefix))
+    return categories or None
+
+
+class AssignmentEngine:
+    """Workload index of open support tickets per agent.
+
+    Agents are active team members and employees whose roles carry the
+    support_tickets permission. Each category (plus ALL_CATEGORIES for
+    agents who take anything) has a min-heap of (open tickets, name).
+    Heaps are updated lazily: a load change pushes a fresh entry and stale
+    ones are discarded when they surface, so picking the least-loaded
+    eligible agent is O(log n).
+
+    Ticket loads follow committed ticket writes; roster changes (team
+    members, employees, roles) mark the roster stale and it is reloaded on
+    the next pick.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._agents: Dict[str, FrozenSet[str]] = {}
+        self._heaps: Dict[str, List[Tuple[int, str]]] = {}
+        self._load: Counter = Counter()
+        self._tickets: Dict[int, TicketState] = {}
+        self.loaded = False
+        self.roster_stale = False
+
+    # ---------- loading ----------
+
+    def load(self, db: Session):
+        tickets = db.query(
+            Ticket.id, Ticket.assigned_to, Ticket.status, Ticket.priority, Ticket.category
+        ).filter(Ticket.status.in_(OPEN_STATUSES)).all()
+        with self._lock:
+            self._tickets = {
+                ticket_id: (agent or None, status, priority, category)
+                for ticket_id, agent, status, priority, category in tickets
+            }
+            self._load = Counter(state[0] for state in self._tickets.values() if state[0])
+            self._load_roster(db)
+            self.loaded = True
+
+    def _load_roster(self, db: Session):
+        agents: Dict[str, FrozenSet[str]] = {}
+        for member in db.query(models.TeamMember).filter(models.TeamMember.is_active == True).all():
+            categories = _agent_categories(permission_engine.role_permissions(member.role))
+            if categories:
+                agents[member.name] = categories
+        employees = db.query(models.Employee).options(selectinload(models.Employee.roles)).filter(
+            models.Employee.is_active == True
+        ).all()
+        for employee in employees:
+            roles = [role.name for role in employee.roles]
+            categories = _agent_categories(permission_engine.effective_permissions(employee.id, roles))
+            if categories:
+                name = f"{employee.first_name} {employee.last_name}"
+                agents[name] = agents.get(name, frozenset()) | categories
+        with self._lock:
+            self._agents = agents
+            self._heaps = {}
+            for name, categories in agents.items():
+                for category in categories:
+                    self._heaps.setdefault(category, []).append((self._load[name], name))
+            for heap in self._heaps.values():
+                heapq.heapify(heap)
+            self.roster_stale = False
+
+    # ---------- picking ----------
+
+    def _top(self, category: str) -> Optional[Tuple[int, str]]:
+        heap = self._heaps.get(category)
+        while heap:
+            load, name = heap[0]
+            if category in self._agents.get(name, ()) and self._load[name] == load:
+                return load, name
+            heapq.heappop(heap)
+        return None
+
+    def choose_agent(self, db: Session, category: Optional[str]) -> Optional[str]:
+        """Least-loaded agent eligible for the category, or None if nobody is"""
+        with self._lock:
+            if not self.loaded:
+                self.load(db)
+            elif self.roster_stale:
+                self._load_roster(db)
+            candidates = [top for top in (self._top(category or ""), self._top(ALL_CATEGORIES)) if top]
+            return min(candidates)[1] if candidates else None
+
+    # ---------- keeping loads current ----------
+
+    def _push(self, name: str):
+        for category in self._agents.get(name, ()):
+            heap = self._heaps.setdefault(category, [])
+            heapq.heappush(heap, (self._load[name], name))
+            # Drop the stale entries once they outnumber the live ones
+            if len(heap) > 4 * len(self._agents) + 64:
+                self._heaps[category] = [(self._load[n], n) for n, c in self._agents.items() if category in c]
+                heapq.heapify(self._heaps[category])
+
+    def track(self, ticket_id: int, state: Optional[TicketState]):
+        """Record a ticket's committed (agent, status, priority, category); None = deleted"""
+        if state is not None and state[1] not in OPEN_STATUSES:
+            state = None
+        with self._lock:
+            previous = self._tickets.pop(ticket_id, None)
+            if state is not None:
+                self._tickets[ticket_id] = state
+            old_agent = previous[0] if previous else None
+            new_agent = state[0] if state else None
+            if old_agent == new_agent:
+                return
+            if old_agent:
+                self._load[old_agent] -= 1
+                if self._load[old_agent] <= 0:
+                    del self._load[old_agent]
+                self._push(old_agent)
+            if new_agent:
+                self._load[new_agent] += 1
+                self._push(new_agent)
+
+    # ---------- stats ----------
+
+    def agent_load(self, name: Optional[str]) -> int:
+        return self._load.get(name, 0) if name else 0
+
+    def queue_stats(self) -> dict:
+        with self._lock:
+            queues: Dict[str, dict] = {}
+            for name, categories in self._agents.items():
+                queues[name] = {
+                    "agent": name,
+                    "is_agent": True,
+                    "categories": sorted(categories),
+                    "open_tickets": 0,
+                    "by_status": Counter(),
+                    "by_priority": Counter(),
+                }
+            unassigned = 0
+            for agent, status, priority, _ in self._tickets.values():
+                if not agent:
+                    unassigned += 1
+                    continue
+                # Tickets assigned to someone who is no longer an agent still show up
+                queue = queues.setdefault(agent, {
+                    "agent": agent, "is_agent": False, "categories": [],
+                    "open_tickets": 0, "by_status": Counter(), "by_priority": Counter(),
+                })
+                queue["open_tickets"] += 1
+                queue["by_status"][status] += 1
+                queue["by_priority"][priority or "medium"] += 1
+        return {
+            "agents": sorted(queues.values(), key=lambda q: (-q["open_tickets"], q["agent"])),
+            "unassigned": unassigned,
+            "open_tickets": len(self._tickets),
+        }
+
+
+assignment_engine = AssignmentEngine()
+
+
+# ---------- following committed writes ----------
+
+def _queue_ticket(target, deleted: bool = False):
+    state = None if deleted else (target.assigned_to or None, target.status, target.priority, target.category)
+    session = object_session(target)
+    if session is None:
+        assignment_engine.track(target.id, state)
+    else:
+        session.info.setdefault("assignment_changes", []).append((target.id, state))
+
+
+@event.listens_for(Ticket, "after_insert")
+def _on_ticket_insert(mapper, connection, target):
+    _queue_ticket(target)
+
+
+@event.listens_for(Ticket, "after_update")
+def _on_ticket_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(attrs[field].history.has_changes() for field in ("assigned_to", "status", "priority", "category")):
+        _queue_ticket(target)
+
+
+@event.listens_for(Ticket, "after_delete")
+def _on_ticket_delete(mapper, connection, target):
+    _queue_ticket(target, deleted=True)
+
+
+def _mark_roster_stale(target):
+    session = object_session(target)
+    if session is None:
+        assignment_engine.roster_stale = True
+    else:
+        session.info["assignment_roster_stale"] = True
+
+
+# Fields that decide who is an agent and for which categories
+_ROSTER_FIELDS = {
+    models.TeamMember: ("name", "role", "is_active"),
+    models.Employee: ("first_name", "last_name", "is_active"),
+    models.Role: ("name", "permissions", "is_active"),
+}
+
+
+def _on_roster_write(mapper, connection, target):
+    _mark_roster_stale(target)
+
+
+def _on_roster_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(attrs[field].history.has_changes() for field in _ROSTER_FIELDS[type(target)]):
+        _mark_roster_stale(target)
+
+
+for _model in _ROSTER_FIELDS:
+    event.listen(_model, "after_insert", _on_roster_write)
+    event.listen(_model, "after_update", _on_roster_update)
+    event.listen(_model, "after_delete", _on_roster_write)
+
+
+@event.listens_for(models.Employee.roles, "append")
+@event.listens_for(models.Employee.roles, "remove")
+def _on_employee_roles(target, value, initiator):
+    _mark_roster_stale(target)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session):
+    changes = session.info.pop("assignment_changes", [])
+    if session.info.pop("assignment_roster_stale", False):
+        assignment_engine.roster_stale = True
+    if assignment_engine.loaded:
+        for ticket_id, state in changes:
+            assignment_engine.track(ticket_id, state)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("assignment_changes", None)
+    session.info.pop("assignment_roster_stale", None)
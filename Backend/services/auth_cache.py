@@ -0,0 +1,190 @@
+# services/auth_cache.py
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import Employee
+
+
+@dataclass(frozen=True)
+class EmployeePrincipal:
+    """Detached snapshot of an authenticated employee.
+
+    Holds only plain values so it can be cached across requests without
+    keeping a SQLAlchemy session alive.
+    """
+    id: str
+    email: str
+    first_name: str
+    last_name: str
+    phone_number: Optional[str]
+    organization: Optional[str]
+    bio: Optional[str]
+    timezone: Optional[str]
+    is_active: bool
+    email_verified: bool
+    roles: Tuple[str, ...]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_employee(cls, employee: Employee) -> "EmployeePrincipal":
+        return cls(
+            id=employee.id,
+            email=employee.email,
+            first_name=employee.first_name,
+            last_name=employee.last_name,
+            phone_number=employee.phone_number,
+            organization=employee.organization,
+            bio=employee.bio,
+            timezone=employee.timezone,
+            is_active=bool(employee.is_active),
+            email_verified=bool(employee.email_verified),
+            roles=tuple(r.name for r in employee.roles),
+            created_at=employee.created_at,
+            updated_at=employee.updated_at,
+        )
+
+
+class PrincipalCache:
+    """LRU of verified tokens -> (claims, principal).
+
+    Keys are a hash of the full token, so a hit implies the exact token was
+    verified before. Entries expire with the token's `exp` claim and are
+    dropped explicitly once a change to the employee row is committed.
+    Every invalidation bumps a generation counter; a principal loaded
+    before an invalidation is not cached, so a request that read the row
+    just before a commit cannot store the old state.
+    """
+
+    def __init__(self, maxsize: int = 10000, enabled: bool = True):
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, dict, EmployeePrincipal]]" = OrderedDict()
+        self._by_employee: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[Tuple[dict, EmployeePrincipal]]:
+        if not self.enabled:
+            return None
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, claims, principal = entry
+            if expires_at <= time.time():
+                self._discard(key, principal.id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims, principal
+
+    def put(self, token: str, claims: dict, principal: EmployeePrincipal, generation: Optional[int] = None):
+        if not self.enabled:
+            return
+        expires_at = float(claims.get("exp") or 0)
+        if expires_at <= time.time():
+            return
+        key = self._key(token)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (expires_at, claims, principal)
+            self._entries.move_to_end(key)
+            self._by_employee.setdefault(principal.id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                old_key, (_, _, old_principal) = self._entries.popitem(last=False)
+                self._unindex(old_key, old_principal.id)
+
+    def invalidate_employee(self, employee_id: str):
+        """Drop every cached token belonging to an employee"""
+        with self._lock:
+            self.generation += 1
+            for key in self._by_employee.pop(employee_id, set()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._by_employee.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _discard(self, key: str, employee_id: str):
+        self._entries.pop(key, None)
+        self._unindex(key, employee_id)
+
+    def _unindex(self, key: str, employee_id: str):
+        keys = self._by_employee.get(employee_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_employee[employee_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+principal_cache = PrincipalCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "10000")),
+    enabled=os.getenv("AUTH_CACHE_ENABLED", "true").lower() != "false",
+)
+
+
+# Any write to an employee row (profile update, password change,
+# deactivation, role change) invalidates their cached principals once it
+# is committed. Dropping them at flush time would let a request that reads
+# the row before the commit cache the old state again.
+
+def queue_invalidation(target: Employee):
+    session = object_session(target)
+    if session is None:
+        principal_cache.invalidate_employee(target.id)
+    else:
+        session.info.setdefault("auth_cache_employees", set()).add(target.id)
+
+
+@event.listens_for(Employee, "after_update")
+@event.listens_for(Employee, "after_delete")
+def _invalidate_on_employee_change(mapper, connection, target):
+    queue_invalidation(target)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for employee_id in session.info.pop("auth_cache_employees", ()):
+        principal_cache.invalidate_employee(employee_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("auth_cache_employees", None)
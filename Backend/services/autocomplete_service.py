@@ -0,0 +1,444 @@
+# services/autocomplete_service.py
+import re
+import sys
+import hashlib
+import logging
+import threading
+from array import array
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+SEP = "\x1f"
+# Prefix matches examined per query; bounds latency for one-letter prefixes
+SCAN_LIMIT = 2000
+# Fold the write delta into the main arrays once it grows past this share
+COMPACT_RATIO = 0.05
+COMPACT_MIN = 10000
+
+Record = Tuple[str, str, str]  # (id, label, sublabel)
+
+
+def normalize_words(text: str) -> List[str]:
+    return re.findall(r"\w+", (text or "").casefold())
+
+
+def _id_hash(item_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(item_id.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def _unpack(records, record_offsets, slot: int) -> Record:
+    raw = records[record_offsets[slot]:record_offsets[slot + 1]]
+    item_id, label, sublabel = raw.decode("utf-8").split(SEP)
+    return item_id, label, sublabel
+
+
+def _live_records(records, record_offsets, alive) -> Iterable[Record]:
+    for slot, is_alive in enumerate(alive):
+        if is_alive:
+            yield _unpack(records, record_offsets, slot)
+
+
+# Fields swapped in wholesale when a rebuilt index replaces the current one
+_STATE = ("_records", "_record_offsets", "_alive", "_dead", "_keys", "_key_offsets", "_key_slots",
+          "_delta", "_id_hashes", "_id_slots", "_recent_ids")
+
+
+class PrefixIndex:
+    """Compact sorted-array prefix index.
+
+    Records ("id, label, sublabel") are packed into one bytearray addressed
+    by slot. Search keys (normalised words) live in a single sorted bytes
+    blob with an offsets array, so a million users cost a few tens of MB
+    instead of one Python object per key. Writes go to a small sorted
+    delta list plus a tombstone per replaced slot; the delta is folded
+    into the main arrays once it passes COMPACT_RATIO of the index.
+
+    Builds and compactions run without the lock and swap the finished
+    arrays in under it. Writes made while a background compaction runs
+    are logged and replayed onto the new arrays before they go live.
+    """
+
+    def __init__(self, name: str, keys_for: Callable[[Record], Iterable[str]]):
+        self.name = name
+        self.keys_for = keys_for
+        self._lock = threading.RLock()
+        self.loaded = False
+        # Bumped by every build so an outdated background compaction is discarded
+        self._epoch = 0
+        self._compaction: Optional[threading.Thread] = None
+        self._pending: Optional[List[Tuple[str, Record]]] = None
+        self._reset()
+
+    def _reset(self):
+        self._records = bytearray()
+        self._record_offsets = array("I", [0])
+        self._alive = bytearray()
+        self._dead = 0
+        self._keys = b""
+        self._key_offsets = array("I", [0])
+        self._key_slots = array("I")
+        self._delta: List[Tuple[bytes, int]] = []
+        self._id_hashes = array("q")
+        self._id_slots = array("I")
+        self._recent_ids: Dict[str, int] = {}
+
+    # ---------- building ----------
+
+    def build(self, records: Iterable[Record]):
+        fresh = PrefixIndex(self.name, self.keys_for)
+        fresh._fill(records)
+        with self._lock:
+            self._epoch += 1
+            self._install(fresh)
+            self.loaded = True
+
+    def _install(self, other: "PrefixIndex"):
+        for field in _STATE:
+            setattr(self, field, getattr(other, field))
+
+    def _fill(self, records: Iterable[Record]):
+        self._reset()
+        entries = []
+        id_entries = []
+        for record in records:
+            slot = self._append_record(record)
+            id_entries.append((_id_hash(record[0]), slot))
+            for key in set(self.keys_for(record)):
+                entries.append((key.encode("utf-8"), slot))
+        entries.sort()
+        id_entries.sort()
+
+        self._keys = b"".join(key for key, _ in entries)
+        offsets = array("I", [0])
+        position = 0
+        for key, _ in entries:
+            position += len(key)
+            offsets.append(position)
+        self._key_offsets = offsets
+        self._key_slots = array("I", (slot for _, slot in entries))
+        self._id_hashes = array("q", (h for h, _ in id_entries))
+        self._id_slots = array("I", (slot for _, slot in id_entries))
+
+    def _append_record(self, record: Record) -> int:
+        slot = len(self._alive)
+        self._records += SEP.join(value or "" for value in record).encode("utf-8")
+        self._record_offsets.append(len(self._records))
+        self._alive.append(1)
+        return slot
+
+    def _record(self, slot: int) -> Record:
+        return _unpack(self._records, self._record_offsets, slot)
+
+    def compact(self):
+        """Fold the delta and tombstones into the main arrays now, blocking writes."""
+        with self._lock:
+            self.build(list(_live_records(self._records, self._record_offsets, self._alive)))
+
+    def _compact_later(self):
+        # Called with the lock held. Copying the three record buffers is a
+        # memcpy; decoding and sorting happen on the compaction thread.
+        snapshot = (bytes(self._records), array("I", self._record_offsets), bytes(self._alive))
+        self._pending = []
+        self._compaction = threading.Thread(
+            target=self._compact_snapshot, args=(self._epoch, *snapshot),
+            name=f"autocomplete-compact-{self.name}", daemon=True,
+        )
+        self._compaction.start()
+
+    def _compact_snapshot(self, epoch: int, records: bytes, record_offsets: array, alive: bytes):
+        fresh = None
+        try:
+            fresh = PrefixIndex(self.name, self.keys_for)
+            fresh._fill(_live_records(records, record_offsets, alive))
+        except Exception:
+            logger.exception(f"Autocomplete compaction of {self.name} failed")
+        with self._lock:
+            pending, self._pending, self._compaction = self._pending, None, None
+            if fresh is None or epoch != self._epoch:
+                return
+            self._install(fresh)
+            for op, record in pending:
+                if op == "delete":
+                    self._remove(record[0])
+                else:
+                    self._upsert(record)
+            self._check_compaction()
+
+    def wait_for_compaction(self):
+        # A replay can itself pass the threshold and start another round
+        while self._compaction is not None:
+            thread = self._compaction
+            if thread is not None:
+                thread.join()
+
+    # ---------- writes ----------
+
+    def _find_slot(self, item_id: str) -> Optional[int]:
+        slot = self._recent_ids.get(item_id)
+        if slot is not None:
+            return slot
+        target = _id_hash(item_id)
+        i = bisect_left(self._id_hashes, target)
+        while i < len(self._id_hashes) and self._id_hashes[i] == target:
+            slot = self._id_slots[i]
+            if self._alive[slot] and self._record(slot)[0] == item_id:
+                return slot
+            i += 1
+        return None
+
+    def remove(self, item_id: str):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("delete", (item_id, "", "")))
+            self._remove(item_id)
+            self._check_compaction()
+
+    def upsert(self, record: Record):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("upsert", record))
+            self._upsert(record)
+            self._check_compaction()
+
+    def _remove(self, item_id: str):
+        slot = self._find_slot(item_id)
+        if slot is not None and self._alive[slot]:
+            self._alive[slot] = 0
+            self._dead += 1
+        self._recent_ids.pop(item_id, None)
+
+    def _upsert(self, record: Record):
+        self._remove(record[0])
+        slot = self._append_record(record)
+        self._recent_ids[record[0]] = slot
+        for key in set(self.keys_for(record)):
+            insort(self._delta, (key.encode("utf-8"), slot))
+
+    def _check_compaction(self):
+        threshold = max(COMPACT_MIN, COMPACT_RATIO * len(self._key_slots))
+        if self._compaction is None and (len(self._delta) > threshold or self._dead > threshold):
+            self._compact_later()
+
+    # ---------- queries ----------
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        words = normalize_words(query)
+        if not words:
+            return []
+        lead = max(words, key=len)
+        lead_bytes = lead.encode("utf-8")
+        rest = [word for word in words if word != lead]
+
+        with self._lock:
+            keys, offsets, slots = self._keys, self._key_offsets, self._key_slots
+            key_at = lambda i: keys[offsets[i]:offsets[i + 1]]
+            start = bisect_left(range(len(slots)), lead_bytes, key=key_at)
+            delta_start = bisect_left(self._delta, (lead_bytes,))
+
+            seen = set()
+            matches = []
+            scanned = 0
+
+            def consider(key: bytes, slot: int):
+                if slot in seen or not self._alive[slot]:
+                    return
+                seen.add(slot)
+                record = self._record(slot)
+                if rest:
+                    text = f"{record[1]} {record[2]}".casefold()
+                    # Cheap substring reject before the word-prefix check
+                    if not all(word in text for word in rest):
+                        return
+                    record_words = normalize_words(text)
+                    if not all(any(w.startswith(word) for w in record_words) for word in rest):
+                        return
+                # Whole-word hits first, then shorter labels
+                matches.append(((key != lead_bytes, len(record[1]), record[1]), record))
+
+            # Keys are scanned in sorted order, so whole-word hits come
+            # first; a few times `limit` matches is enough to rank
+            enough = max(limit * 4, 40)
+            for i in range(delta_start, len(self._delta)):
+                key, slot = self._delta[i]
+                if not key.startswith(lead_bytes) or len(matches) >= enough:
+                    break
+                consider(key, slot)
+
+            i = start
+            while i < len(slots) and scanned < SCAN_LIMIT and len(matches) < enough:
+                key = key_at(i)
+                if not key.startswith(lead_bytes):
+                    break
+                consider(key, slots[i])
+                scanned += 1
+                i += 1
+
+        matches.sort(key=lambda match: match[0])
+        return [
+            {"id": item_id, "label": label, "sublabel": sublabel}
+            for _, (item_id, label, sublabel) in matches[:limit]
+        ]
+
+    def memory_report(self) -> dict:
+        with self._lock:
+            arrays = {
+                "records": len(self._records),
+                "record_offsets": self._record_offsets.itemsize * len(self._record_offsets),
+                "tombstones": len(self._alive),
+                "keys": len(self._keys),
+                "key_offsets": self._key_offsets.itemsize * len(self._key_offsets),
+                "key_slots": self._key_slots.itemsize * len(self._key_slots),
+                "id_hashes": (self._id_hashes.itemsize * len(self._id_hashes)
+                              + self._id_slots.itemsize * len(self._id_slots)),
+                "delta": sys.getsizeof(self._delta) + sum(
+                    sys.getsizeof(entry) + sys.getsizeof(entry[0]) for entry in self._delta
+                ),
+                "recent_ids": sys.getsizeof(self._recent_ids) + sum(
+                    sys.getsizeof(item_id) for item_id in self._recent_ids
+                ),
+            }
+            return {
+                "items": len(self._alive) - self._dead,
+                "dead_slots": self._dead,
+                "keys": len(self._key_slots),
+                "delta_keys": len(self._delta),
+                "compacting": self._compaction is not None,
+                "bytes": arrays,
+                "total_bytes": sum(arrays.values()),
+            }
+
+
+def _user_keys(record: Record) -> Iterable[str]:
+    _, name, email = record
+    return normalize_words(name) + normalize_words(email.split("@")[0])
+
+
+def _course_keys(record: Record) -> Iterable[str]:
+    return normalize_words(record[1])
+
+
+def _user_record(user) -> Record:
+    return str(user.id), user.name or "", user.email or ""
+
+
+def _course_record(course) -> Record:
+    return str(course.id), course.title or "", course.exam_type or ""
+
+
+class AutocompleteService:
+    indexes: Dict[str, PrefixIndex] = {
+        "user": PrefixIndex("user", _user_keys),
+        "course": PrefixIndex("course", _course_keys),
+    }
+    # Held for the whole load so requests wait on the startup load instead of repeating it
+    _load_lock = threading.Lock()
+
+    @staticmethod
+    def load(db: Session):
+        with AutocompleteService._load_lock:
+            AutocompleteService._load(db)
+
+    @staticmethod
+    def _load(db: Session):
+        users = db.query(models.User.id, models.User.name, models.User.email).yield_per(10000)
+        AutocompleteService.indexes["user"].build(_user_record(row) for row in users)
+        courses = db.query(models.Course.id, models.Course.title, models.Course.exam_type).all()
+        AutocompleteService.indexes["course"].build(_course_record(row) for row in courses)
+        logger.info(f"Autocomplete loaded: {AutocompleteService.memory_report()['total_bytes']} bytes")
+
+    @staticmethod
+    def load_in_new_session(session_factory):
+        db = session_factory()
+        try:
+            AutocompleteService.load(db)
+        finally:
+            db.close()
+
+    @staticmethod
+    def ensure_loaded(db: Session):
+        if AutocompleteService.is_loaded():
+            return
+        with AutocompleteService._load_lock:
+            if not AutocompleteService.is_loaded():
+                AutocompleteService._load(db)
+
+    @staticmethod
+    def is_loaded() -> bool:
+        return all(index.loaded for index in AutocompleteService.indexes.values())
+
+    @staticmethod
+    def search(kind: str, q: str, limit: int = 10) -> List[dict]:
+        return AutocompleteService.indexes[kind].search(q, limit)
+
+    @staticmethod
+    def memory_report() -> dict:
+        report = {kind: index.memory_report() for kind, index in AutocompleteService.indexes.items()}
+        report["total_bytes"] = sum(entry["total_bytes"] for entry in report.values())
+        return report
+
+
+# ---------- applying committed writes ----------
+
+_TRACKED = {
+    models.User: ("user", ("name", "email"), _user_record),
+    models.Course: ("course", ("title", "exam_type"), _course_record),
+}
+
+
+def _queue(target, op: str):
+    kind, _, to_record = _TRACKED[type(target)]
+    change = (kind, op, to_record(target))
+    session = object_session(target)
+    if session is None:
+        _apply([change])
+    else:
+        session.info.setdefault("autocomplete_changes", []).append(change)
+
+
+def _apply(changes):
+    for kind, op, record in changes:
+        index = AutocompleteService.indexes[kind]
+        if not index.loaded:
+            continue
+        if op == "delete":
+            index.remove(record[0])
+        else:
+            index.upsert(record)
+
+
+def _on_insert(mapper, connection, target):
+    _queue(target, "upsert")
+
+
+def _on_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in _TRACKED[type(target)][1]):
+        _queue(target, "upsert")
+
+
+def _on_delete(mapper, connection, target):
+    _queue(target, "delete")
+
+
+for _model in _TRACKED:
+    event.listen(_model, "after_insert", _on_insert)
+    event.listen(_model, "after_update", _on_update)
+    event.listen(_model, "after_delete", _on_delete)
+
+
+# Only committed changes reach the index
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session):
+    _apply(session.info.pop("autocomplete_changes", []))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("autocomplete_changes", None)
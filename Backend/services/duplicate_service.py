@@ -0,0 +1,348 @@
+# services/duplicate_service.py
+import os
+import re
+import hashlib
+import logging
+import threading
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, event, func, inspect
+from sqlalchemy.orm import Session, object_session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+# LSH with 16 bands of 4 rows surfaces pairs from ~0.5 Jaccard; pairs at or
+# above this estimated similarity are flagged as duplicates
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_SIMILARITY_THRESHOLD", "0.6"))
+SHINGLE_WORDS = 3
+LOAD_BATCH_SIZE = 5000
+
+_BIN_SHIFT = 64 - 6  # top 6 bits pick one of the 64 bins
+_VALUE_MASK = (1 << _BIN_SHIFT) - 1
+_ROTATION = 0x9E3779B1
+
+Signature = array  # array("I") of NUM_HASHES values
+Signatures = models.DuplicateSignature
+signatures_table = Signatures.__table__
+
+
+def shingles(text: Optional[str]) -> Set[str]:
+    words = re.findall(r"\w+", (text or "").casefold())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def signature(text: Optional[str]) -> Optional[Signature]:
+    """One-permutation MinHash with rotation densification.
+
+    Each shingle is hashed once; its top bits choose a bin and the rest is
+    min-ed into that bin. Empty bins borrow the next filled bin's value
+    (plus an offset per step), which keeps the collision probability equal
+    to the Jaccard similarity while costing one hash per shingle rather
+    than NUM_HASHES.
+    """
+    grams = shingles(text)
+    if not grams:
+        return None
+    bins = [None] * NUM_HASHES
+    for gram in grams:
+        h = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "little")
+        slot = h >> _BIN_SHIFT
+        value = h & _VALUE_MASK
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+    result = array("I", bytes(4 * NUM_HASHES))
+    for i in range(NUM_HASHES):
+        step = 0
+        while bins[(i + step) % NUM_HASHES] is None:
+            step += 1
+        result[i] = (bins[(i + step) % NUM_HASHES] + step * _ROTATION) & 0xFFFFFFFF
+    return result
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_HASHES
+
+
+def _band_keys(sig: Signature) -> List[bytes]:
+    raw = sig.tobytes()
+    width = 4 * ROWS
+    return [bytes([band]) + raw[band * width:(band + 1) * width] for band in range(BANDS)]
+
+
+class LshIndex:
+    """Banded LSH over MinHash signatures, plus each entry's cluster root"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._signatures: Dict[int, Signature] = {}
+        self._roots: Dict[int, int] = {}
+        self._buckets: Dict[bytes, List[int]] = defaultdict(list)
+        self.loaded = False
+
+    def clear(self):
+        with self._lock:
+            self._signatures.clear()
+            self._roots.clear()
+            self._buckets.clear()
+
+    def add(self, item_id: int, sig: Optional[Signature], duplicate_of: Optional[int] = None):
+        with self._lock:
+            self.remove(item_id)
+            if duplicate_of:
+                self._roots[item_id] = duplicate_of
+            if sig is None:
+                return
+            self._signatures[item_id] = sig
+            for key in _band_keys(sig):
+                self._buckets[key].append(item_id)
+
+    def get(self, item_id: int) -> Optional[Signature]:
+        return self._signatures.get(item_id)
+
+    def remove(self, item_id: int, orphan_children: bool = False):
+        with self._lock:
+            self._roots.pop(item_id, None)
+            if orphan_children:
+                for child in [child for child, root in self._roots.items() if root == item_id]:
+                    del self._roots[child]
+            sig = self._signatures.pop(item_id, None)
+            if sig is None:
+                return
+            for key in _band_keys(sig):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.remove(item_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def best_match(self, sig: Optional[Signature], exclude: Optional[int] = None) -> Optional[Tuple[int, float]]:
+        """Most similar indexed entry at or above DUPLICATE_THRESHOLD, resolved to its cluster root"""
+        if sig is None:
+            return None
+        with self._lock:
+            candidates = set()
+            for key in _band_keys(sig):
+                candidates.update(self._buckets.get(key, ()))
+            candidates.discard(exclude)
+            best = None
+            for candidate in candidates:
+                score = similarity(sig, self._signatures[candidate])
+                if score >= DUPLICATE_THRESHOLD and (best is None or (score, -candidate) > (best[1], -best[0])):
+                    best = (candidate, score)
+            if best is None:
+                return None
+            root = self._roots.get(best[0], best[0])
+            return (root, best[1]) if root != exclude else None
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+def _ticket_text(ticket) -> str:
+    return f"{ticket.title or ''} {ticket.description or ''}"
+
+
+def _feedback_text(feedback) -> str:
+    return f"{feedback.subject or ''} {feedback.message or ''}"
+
+
+# entity -> (model, text of an ORM row, fields the text is built from)
+_SOURCES = {
+    "ticket": (models.SupportTicket, _ticket_text, ("title", "description")),
+    "feedback": (models.Feedback, _feedback_text, ("subject", "message")),
+}
+
+
+class DuplicateService:
+    """Near-duplicate detection for support tickets and feedback.
+
+    Signatures are computed at creation (or text edit) inside the flush and
+    persisted in duplicate_signatures together with the matched cluster
+    root, so a restart only reloads bytes into the in-memory LSH buckets.
+    Rows that predate the table are signed in batches on load.
+    """
+
+    indexes: Dict[str, LshIndex] = {entity: LshIndex() for entity in _SOURCES}
+
+    @staticmethod
+    def load(db: Session):
+        for entity, index in DuplicateService.indexes.items():
+            index.clear()
+            rows = db.query(Signatures.entity_id, Signatures.signature, Signatures.duplicate_of).filter(
+                Signatures.entity == entity
+            ).yield_per(LOAD_BATCH_SIZE)
+            for entity_id, raw, duplicate_of in rows:
+                index.add(entity_id, array("I", raw) if raw else None, duplicate_of)
+            index.loaded = True
+            signed = DuplicateService._sign_backlog(db, entity)
+            logger.info(f"Duplicate index for {entity}: {len(index)} signatures ({signed} new)")
+
+    @staticmethod
+    def load_in_new_session(session_factory):
+        db = session_factory()
+        try:
+            DuplicateService.load(db)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _sign_backlog(db: Session, entity: str) -> int:
+        model, text_of, _ = _SOURCES[entity]
+        index = DuplicateService.indexes[entity]
+        signed = 0
+        while True:
+            # Oldest first, so earlier entries become the cluster roots
+            batch = db.query(model).outerjoin(
+                Signatures, and_(Signatures.entity == entity, Signatures.entity_id == model.id)
+            ).filter(Signatures.entity_id.is_(None)).order_by(model.id).limit(LOAD_BATCH_SIZE).all()
+            if not batch:
+                return signed
+            rows = []
+            for row in batch:
+                sig = signature(text_of(row))
+                match = index.best_match(sig, exclude=row.id)
+                duplicate_of, score = match if match else (None, None)
+                index.add(row.id, sig, duplicate_of)
+                rows.append({"entity": entity, "entity_id": row.id, "signature": sig.tobytes() if sig else b"",
+                             "duplicate_of": duplicate_of, "similarity": score})
+            db.execute(signatures_table.insert(), rows)
+            db.commit()
+            signed += len(rows)
+
+    @staticmethod
+    def similar(entity: str, item_id: int) -> Optional[Tuple[int, float]]:
+        index = DuplicateService.indexes[entity]
+        return index.best_match(index.get(item_id), exclude=item_id)
+
+    @staticmethod
+    def clusters(db: Session, entity: str, min_size: int = 2, limit: int = 50) -> List[dict]:
+        """Largest duplicate clusters: the root entry plus everything flagged against it"""
+        model, _, _ = _SOURCES[entity]
+        sizes = db.query(Signatures.duplicate_of, func.count()).filter(
+            Signatures.entity == entity, Signatures.duplicate_of.isnot(None)
+        ).group_by(Signatures.duplicate_of).having(func.count() >= min_size - 1).order_by(
+            func.count().desc(), Signatures.duplicate_of
+        ).limit(limit).all()
+        if not sizes:
+            return []
+        roots = [root for root, _ in sizes]
+        members = db.query(Signatures.entity_id, Signatures.duplicate_of, Signatures.similarity).filter(
+            Signatures.entity == entity, Signatures.duplicate_of.in_(roots)
+        ).order_by(Signatures.entity_id).all()
+        ids = set(roots) | {entity_id for entity_id, _, _ in members}
+        rows = {row.id: row for row in db.query(model).filter(model.id.in_(ids))}
+
+        def describe(item_id, score=None):
+            row = rows.get(item_id)
+            if entity == "ticket":
+                details = {"title": row.title, "student": row.student, "status": row.status,
+                           "created": row.created} if row else {}
+            else:
+                details = {"title": row.subject, "user_name": row.user_name, "status": row.status,
+                           "created": row.created_at} if row else {}
+            return {"id": item_id, "similarity": score, **details}
+
+        by_root: Dict[int, List[dict]] = defaultdict(list)
+        for entity_id, root, score in members:
+            by_root[root].append(describe(entity_id, round(score, 3) if score is not None else None))
+        return [
+            {"entity": entity, "size": count + 1, "root": describe(root), "duplicates": by_root[root]}
+            for root, count in sizes
+        ]
+
+
+# ---------- signing new and edited entries inside the flush ----------
+
+def _entity_of(target) -> str:
+    return "ticket" if isinstance(target, models.SupportTicket) else "feedback"
+
+
+def _queue(target, change):
+    session = object_session(target)
+    if session is None:
+        _apply([change])
+    else:
+        session.info.setdefault("duplicate_changes", []).append(change)
+
+
+def _apply(changes):
+    for entity, item_id, sig, duplicate_of in changes:
+        index = DuplicateService.indexes[entity]
+        if not index.loaded:
+            continue
+        if sig is False:
+            index.remove(item_id, orphan_children=True)
+        else:
+            index.add(item_id, sig, duplicate_of)
+
+
+def _sign(connection, target, replace: bool):
+    entity = _entity_of(target)
+    sig = signature(_SOURCES[entity][1](target))
+    match = DuplicateService.indexes[entity].best_match(sig, exclude=target.id)
+    # Entries from the same, not yet committed transaction are not indexed yet
+    session = object_session(target)
+    pending = session.info.get("duplicate_changes", []) if session is not None else []
+    for other_entity, other_id, other_sig, other_root in pending:
+        if other_entity != entity or not other_sig or other_id == target.id or sig is None:
+            continue
+        score = similarity(sig, other_sig)
+        if score >= DUPLICATE_THRESHOLD and (match is None or score > match[1]):
+            match = (other_root or other_id, score)
+    duplicate_of, score = match if match else (None, None)
+    if replace:
+        connection.execute(signatures_table.delete().where(
+            signatures_table.c.entity == entity, signatures_table.c.entity_id == target.id
+        ))
+    connection.execute(signatures_table.insert().values(
+        entity=entity, entity_id=target.id, signature=sig.tobytes() if sig else b"",
+        duplicate_of=duplicate_of, similarity=score,
+    ))
+    _queue(target, (entity, target.id, sig, duplicate_of))
+
+
+def _on_insert(mapper, connection, target):
+    _sign(connection, target, replace=False)
+
+
+def _on_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(attrs[field].history.has_changes() for field in _SOURCES[_entity_of(target)][2]):
+        _sign(connection, target, replace=True)
+
+
+def _on_delete(mapper, connection, target):
+    entity = _entity_of(target)
+    connection.execute(signatures_table.delete().where(
+        signatures_table.c.entity == entity, signatures_table.c.entity_id == target.id
+    ))
+    # Entries flagged against a deleted root stand on their own again
+    connection.execute(signatures_table.update().where(
+        signatures_table.c.entity == entity, signatures_table.c.duplicate_of == target.id
+    ).values(duplicate_of=None, similarity=None))
+    _queue(target, (entity, target.id, False, None))
+
+
+for _model, _, _ in _SOURCES.values():
+    event.listen(_model, "after_insert", _on_insert)
+    event.listen(_model, "after_update", _on_update)
+    event.listen(_model, "after_delete", _on_delete)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session):
+    _apply(session.info.pop("duplicate_changes", []))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("duplicate_changes", None)
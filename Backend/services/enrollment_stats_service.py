@@ -0,0 +1,226 @@
+# services/enrollment_stats_service.py
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, event, func, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("ENROLLMENT_RECONCILE_INTERVAL_SECONDS", "21600"))
+
+Stats = models.CourseEnrollmentStats
+stats_table = Stats.__table__
+courses_table = models.Course.__table__
+
+# (column, lowest progress, highest progress); completed enrollments land in progress_100
+BUCKETS = (
+    ("progress_0", 0, 0),
+    ("progress_1_24", 1, 24),
+    ("progress_25_49", 25, 49),
+    ("progress_50_74", 50, 74),
+    ("progress_75_99", 75, 99),
+    ("progress_100", 100, 100),
+)
+COUNTERS = ("enrolled", "progress_sum") + tuple(column for column, _, _ in BUCKETS)
+
+
+def _clamp(progress: Optional[int]) -> int:
+    return min(max(progress or 0, 0), 100)
+
+
+def _bucket(progress: Optional[int], completion_status: Optional[str]) -> str:
+    if completion_status == "completed":
+        return "progress_100"
+    progress = _clamp(progress)
+    return next(column for column, _, highest in BUCKETS if progress <= highest)
+
+
+def _completion_rate():
+    """Scalar subquery: percentage of a course's enrollments in the completed bucket"""
+    return func.coalesce(select(
+        case((stats_table.c.enrolled > 0,
+              func.round(stats_table.c.progress_100 * 100.0 / stats_table.c.enrolled, 2)),
+             else_=0.0)
+    ).where(stats_table.c.course_id == courses_table.c.id).scalar_subquery(), 0.0)
+
+
+def _enrolled():
+    return func.coalesce(
+        select(stats_table.c.enrolled).where(stats_table.c.course_id == courses_table.c.id).scalar_subquery(), 0
+    )
+
+
+class EnrollmentStatsService:
+    """Per-course enrollment counters kept in course_enrollment_stats.
+
+    Every UserCourse insert/update/delete applies a +1/-1 delta to its
+    course's enrollment count, progress sum and progress bucket inside the
+    same flush, then copies the count and the completed share onto
+    Course.enrolled_students and Course.completion_rate, which the
+    popularity and stats endpoints sort and sum on. Bulk writes bypass the
+    events; reconcile() runs periodically to repair any drift.
+    """
+
+    @staticmethod
+    def apply_delta(connection, course_id: int, progress: Optional[int], completion_status: Optional[str],
+                    sign: int):
+        if course_id is None:
+            return
+        increments = {"enrolled": sign, "progress_sum": sign * _clamp(progress),
+                      _bucket(progress, completion_status): sign}
+        result = connection.execute(
+            update(stats_table).where(stats_table.c.course_id == course_id).values({
+                column: stats_table.c[column] + amount for column, amount in increments.items()
+            })
+        )
+        if result.rowcount == 0 and sign > 0:
+            row = {column: 0 for column in COUNTERS}
+            row.update(increments, course_id=course_id)
+            connection.execute(stats_table.insert().values(row))
+        connection.execute(
+            update(courses_table).where(courses_table.c.id == course_id).values(
+                enrolled_students=_enrolled(),
+                completion_rate=_completion_rate(),
+                updated_at=courses_table.c.updated_at,
+            )
+        )
+
+    @staticmethod
+    def _actual(db: Session) -> Dict[int, dict]:
+        """Counters recomputed from user_courses with one GROUP BY"""
+        uc = models.UserCourse
+        progress = case((uc.progress > 100, 100), (uc.progress > 0, uc.progress), else_=0)
+        columns = [func.count().label("enrolled"), func.coalesce(func.sum(progress), 0).label("progress_sum")]
+        completed = func.coalesce(uc.completion_status, "") == "completed"
+        for column, lowest, highest in BUCKETS:
+            if column == "progress_100":
+                condition = or_(completed, progress >= 100)
+            else:
+                condition = and_(~completed, progress.between(lowest, highest))
+            columns.append(func.sum(case((condition, 1), else_=0)).label(column))
+        return {
+            row.course_id: {column: row._mapping[column] or 0 for column in COUNTERS}
+            for row in db.execute(select(uc.course_id, *columns).group_by(uc.course_id))
+        }
+
+    @staticmethod
+    def reconcile(db: Session) -> int:
+        """Rewrite the counters of every course whose stats row disagrees with user_courses.
+
+        Returns the number of courses that were repaired.
+        """
+        actual = EnrollmentStatsService._actual(db)
+        stored = {
+            row.course_id: {column: row._mapping[column] for column in COUNTERS}
+            for row in db.execute(select(stats_table))
+        }
+        empty = {column: 0 for column in COUNTERS}
+        drifted = [course_id for course_id in actual.keys() | stored.keys()
+                   if actual.get(course_id, empty) != stored.get(course_id, empty)]
+        for course_id in drifted:
+            db.execute(stats_table.delete().where(stats_table.c.course_id == course_id))
+            if course_id in actual:
+                db.execute(stats_table.insert().values(course_id=course_id, **actual[course_id]))
+        # Also catches Course columns edited directly, e.g. by seed scripts
+        db.execute(
+            update(courses_table).where(or_(
+                courses_table.c.enrolled_students.is_(None),
+                courses_table.c.enrolled_students != _enrolled(),
+                courses_table.c.completion_rate.is_(None),
+                courses_table.c.completion_rate != _completion_rate(),
+            )).values(
+                enrolled_students=_enrolled(),
+                completion_rate=_completion_rate(),
+                updated_at=courses_table.c.updated_at,
+            )
+        )
+        db.commit()
+        if drifted:
+            logger.info(f"Reconciled enrollment counters for {len(drifted)} courses")
+        return len(drifted)
+
+    @staticmethod
+    def ensure_populated(db: Session):
+        if db.query(Stats).first() is None and db.query(models.UserCourse.id).first() is not None:
+            EnrollmentStatsService.reconcile(db)
+
+    @staticmethod
+    def _reconcile_in_new_session(session_factory) -> int:
+        db = session_factory()
+        try:
+            return EnrollmentStatsService.reconcile(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    async def run_loop(session_factory):
+        """Reconcile every RECONCILE_INTERVAL_SECONDS until cancelled"""
+        while True:
+            await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(EnrollmentStatsService._reconcile_in_new_session, session_factory)
+            except Exception as e:
+                logger.error(f"Enrollment counter reconciliation failed: {e}")
+
+    @staticmethod
+    def serialize(stats: Optional[Stats], course_id: int) -> dict:
+        enrolled = stats.enrolled if stats else 0
+        completed = stats.progress_100 if stats else 0
+        return {
+            "course_id": course_id,
+            "enrolled": enrolled,
+            "completed": completed,
+            "completion_rate": round(completed * 100.0 / enrolled, 2) if enrolled else 0.0,
+            "average_progress": round(stats.progress_sum / enrolled, 2) if enrolled else 0.0,
+            "progress_buckets": {
+                f"{lowest}-{highest}" if lowest != highest else str(lowest): getattr(stats, column) if stats else 0
+                for column, lowest, highest in BUCKETS
+            },
+        }
+
+    @staticmethod
+    def course_stats(db: Session, course_id: Optional[int] = None) -> List[dict]:
+        query = db.query(Stats)
+        if course_id is not None:
+            query = query.filter(Stats.course_id == course_id)
+        return [EnrollmentStatsService.serialize(stats, stats.course_id) for stats in query.order_by(Stats.course_id)]
+
+
+# ---------- applying user_courses writes inside the same flush ----------
+
+FIELDS = ("course_id", "progress", "completion_status")
+
+
+# Load the stored values on assignment so updates can subtract the right bucket
+models.track_history(*(getattr(models.UserCourse, field) for field in FIELDS))
+
+
+def _previous_delta(connection, target):
+    EnrollmentStatsService.apply_delta(connection, *(models.previous_value(target, field) for field in FIELDS), -1)
+
+
+@event.listens_for(models.UserCourse, "after_insert")
+def _on_enrollment_insert(mapper, connection, target):
+    EnrollmentStatsService.apply_delta(connection, target.course_id, target.progress, target.completion_status, +1)
+
+
+@event.listens_for(models.UserCourse, "after_update")
+def _on_enrollment_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if not any(attrs[field].history.has_changes() for field in FIELDS):
+        return
+    _previous_delta(connection, target)
+    EnrollmentStatsService.apply_delta(connection, target.course_id, target.progress, target.completion_status, +1)
+
+
+@event.listens_for(models.UserCourse, "after_delete")
+def _on_enrollment_delete(mapper, connection, target):
+    _previous_delta(connection, target)
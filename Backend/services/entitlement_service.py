@@ -0,0 +1,371 @@
+# services/entitlement_service.py
+import os
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, event, func, inspect, or_, select, update
+from sqlalchemy.orm import Session, object_session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TRANSACTION = "transaction"
+SOURCE_DIRECT = "direct"
+INSERT_BATCH_SIZE = 1000
+
+Entitlement = models.CourseEntitlement
+entitlements_table = Entitlement.__table__
+users_table = models.User.__table__
+plans_table = models.SubscriptionPlan.__table__
+
+
+def course_ids(courses) -> List[int]:
+    """Course ids from a JSON course list, skipping anything that is not an id"""
+    ids = set()
+    for course in courses or []:
+        try:
+            ids.add(int(course))
+        except (TypeError, ValueError):
+            continue
+    return sorted(ids)
+
+
+def _granted_courses(courses, plan_id, plan_name, plan_courses) -> List[int]:
+    """Courses a captured transaction grants.
+
+    A transaction linked to a plan follows the plan's current course list,
+    so plan edits reach existing subscribers. Otherwise its own course list
+    applies, falling back to the plan with the same name.
+    """
+    if plan_id is not None:
+        linked = plan_courses(plan_id)
+        if linked is not None:
+            return linked
+    return course_ids(courses) or (plan_name and plan_courses(plan_name)) or []
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    return value.replace(tzinfo=None) if value is not None else None
+
+
+class EntitlementCache:
+    """LRU of user_id -> {course_id: valid_until} for access checks.
+
+    A valid_until of None means the grant never expires. Every
+    invalidation bumps a generation counter; a load that started before
+    an invalidation is not cached, so a reader racing a commit cannot
+    store pre-commit grants.
+    """
+
+    def __init__(self, maxsize: int = 50000):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Dict[int, Optional[datetime]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[Dict[int, Optional[datetime]]]:
+        with self._lock:
+            grants = self._entries.get(user_id)
+            if grants is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return grants
+
+    def put(self, user_id: str, grants: Dict[int, Optional[datetime]], generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[user_id] = grants
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids: Iterable[str]):
+        with self._lock:
+            self.generation += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize,
+                    "hits": self.hits, "misses": self.misses}
+
+
+entitlement_cache = EntitlementCache(maxsize=int(os.getenv("ENTITLEMENT_CACHE_SIZE", "50000")))
+
+
+class EntitlementService:
+    """Course access kept in course_entitlements instead of JSON lists.
+
+    A captured transaction grants its plan's courses (see
+    _granted_courses) until its valid_until; an active user's
+    subscribed_courses grant access until subscription_end_date. ORM
+    writes to transactions and users rewrite the affected rows inside the
+    same flush, so refunds and expiries revoke access on commit. Bulk
+    Query.update()/delete() bypass the events; call rebuild() after those.
+    """
+
+    # ---------- maintenance ----------
+
+    @staticmethod
+    def touch(session: Optional[Session], user_ids: Iterable[str]):
+        """Drop cached grants for these users once the session commits"""
+        user_ids = [user_id for user_id in user_ids if user_id]
+        if session is None:
+            entitlement_cache.invalidate(user_ids)
+        else:
+            session.info.setdefault("entitlement_users", set()).update(user_ids)
+
+    @staticmethod
+    def plan_courses(connection, plan_key) -> Optional[List[int]]:
+        """Course ids of a plan looked up by id or name; None when there is no such plan"""
+        column = plans_table.c.id if isinstance(plan_key, int) else plans_table.c.name
+        row = connection.execute(select(plans_table.c.courses).where(column == plan_key)).first()
+        return course_ids(row.courses) if row is not None else None
+
+    @staticmethod
+    def sync_transaction(connection, transaction, session: Optional[Session] = None):
+        """Rewrite the grants of one transaction from its current state"""
+        connection.execute(delete(entitlements_table).where(
+            entitlements_table.c.source == SOURCE_TRANSACTION,
+            entitlements_table.c.source_id == transaction.id,
+        ))
+        if transaction.status == "captured" and transaction.user_id:
+            courses = _granted_courses(
+                transaction.courses, transaction.subscription_plan_id, transaction.plan_name,
+                lambda plan_key: EntitlementService.plan_courses(connection, plan_key))
+            if courses:
+                connection.execute(entitlements_table.insert(), [
+                    {"user_id": transaction.user_id, "course_id": course_id,
+                     "source": SOURCE_TRANSACTION, "source_id": transaction.id,
+                     "valid_until": _naive(transaction.valid_until), "created_at": datetime.utcnow()}
+                    for course_id in courses
+                ])
+        EntitlementService.touch(session, [transaction.user_id])
+
+    @staticmethod
+    def sync_direct(connection, user_id: str, session: Optional[Session] = None):
+        """Rewrite a user's subscribed_courses grants from the users row"""
+        connection.execute(delete(entitlements_table).where(
+            entitlements_table.c.user_id == user_id,
+            entitlements_table.c.source == SOURCE_DIRECT,
+        ))
+        row = connection.execute(
+            select(users_table.c.subscribed_courses, users_table.c.subscription_status,
+                   users_table.c.subscription_end_date).where(users_table.c.id == user_id)
+        ).first()
+        if row is not None and row.subscription_status == "active":
+            courses = course_ids(row.subscribed_courses)
+            if courses:
+                connection.execute(entitlements_table.insert(), [
+                    {"user_id": user_id, "course_id": course_id, "source": SOURCE_DIRECT,
+                     "source_id": None, "valid_until": _naive(row.subscription_end_date),
+                     "created_at": datetime.utcnow()}
+                    for course_id in courses
+                ])
+        EntitlementService.touch(session, [user_id])
+
+    @staticmethod
+    def revoke_direct(db: Session, user_ids: List[str]):
+        """Drop subscribed_courses grants of users whose subscription ended"""
+        if not user_ids:
+            return
+        db.execute(delete(entitlements_table).where(
+            entitlements_table.c.user_id.in_(user_ids),
+            entitlements_table.c.source == SOURCE_DIRECT,
+        ))
+        EntitlementService.touch(db, user_ids)
+
+    @staticmethod
+    def backfill_direct_valid_until(db: Session):
+        """Copy end dates filled in by a bulk users UPDATE onto open-ended direct grants"""
+        end_date = select(users_table.c.subscription_end_date).where(
+            users_table.c.id == entitlements_table.c.user_id).scalar_subquery()
+        db.execute(update(entitlements_table).where(
+            entitlements_table.c.source == SOURCE_DIRECT,
+            entitlements_table.c.valid_until.is_(None),
+        ).values(valid_until=end_date))
+        entitlement_cache.clear()
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Recompute every grant from transactions and users"""
+        db.execute(delete(entitlements_table))
+        plans = {}
+        for plan_id, name, courses in db.execute(
+                select(plans_table.c.id, plans_table.c.name, plans_table.c.courses)):
+            plans[plan_id] = plans[name] = course_ids(courses)
+
+        now = datetime.utcnow()
+        rows = []
+        transactions = models.Transaction.__table__
+        for tx in db.execute(
+            select(transactions.c.id, transactions.c.user_id, transactions.c.courses,
+                   transactions.c.subscription_plan_id, transactions.c.plan_name,
+                   transactions.c.valid_until).where(
+                transactions.c.status == "captured", transactions.c.user_id.isnot(None))
+        ):
+            courses = _granted_courses(tx.courses, tx.subscription_plan_id, tx.plan_name, plans.get)
+            rows.extend({"user_id": tx.user_id, "course_id": course_id, "source": SOURCE_TRANSACTION,
+                         "source_id": tx.id, "valid_until": tx.valid_until, "created_at": now}
+                        for course_id in courses)
+        for user in db.execute(
+            select(users_table.c.id, users_table.c.subscribed_courses,
+                   users_table.c.subscription_end_date).where(users_table.c.subscription_status == "active")
+        ):
+            rows.extend({"user_id": user.id, "course_id": course_id, "source": SOURCE_DIRECT,
+                         "source_id": None, "valid_until": _naive(user.subscription_end_date),
+                         "created_at": now}
+                        for course_id in course_ids(user.subscribed_courses))
+
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            db.execute(entitlements_table.insert(), rows[start:start + INSERT_BATCH_SIZE])
+        db.commit()
+        entitlement_cache.clear()
+        logger.info(f"Rebuilt {len(rows)} course entitlements")
+        return len(rows)
+
+    @staticmethod
+    def ensure_populated(db: Session):
+        """Backfill from the JSON columns the first time the table is empty"""
+        if db.query(Entitlement.id).first() is not None:
+            return
+        if db.query(models.Transaction.id).first() is None and db.query(models.User.id).first() is None:
+            return
+        EntitlementService.rebuild(db)
+
+    # ---------- reads ----------
+
+    @staticmethod
+    def _grants(db: Session, user_id: str) -> Dict[int, Optional[datetime]]:
+        grants = entitlement_cache.get(user_id)
+        if grants is not None:
+            return grants
+        generation = entitlement_cache.generation
+        grants = {}
+        for course_id, valid_until in db.execute(
+            select(Entitlement.course_id, Entitlement.valid_until).where(Entitlement.user_id == user_id)
+        ):
+            if course_id in grants and (grants[course_id] is None
+                                        or (valid_until is not None and valid_until <= grants[course_id])):
+                continue
+            grants[course_id] = valid_until
+        entitlement_cache.put(user_id, grants, generation)
+        return grants
+
+    @staticmethod
+    def can_access(db: Session, user_id: str, course_id: int, now: Optional[datetime] = None) -> bool:
+        """Whether a user may open a course right now; a dict lookup once the user is cached"""
+        grants = EntitlementService._grants(db, user_id)
+        if course_id not in grants:
+            return False
+        valid_until = grants[course_id]
+        return valid_until is None or valid_until > (now or datetime.utcnow())
+
+    @staticmethod
+    def user_courses(db: Session, user_id: str, now: Optional[datetime] = None) -> List[dict]:
+        now = now or datetime.utcnow()
+        return [
+            {"course_id": course_id, "valid_until": valid_until}
+            for course_id, valid_until in sorted(EntitlementService._grants(db, user_id).items())
+            if valid_until is None or valid_until > now
+        ]
+
+    @staticmethod
+    def _active(now: datetime):
+        return or_(Entitlement.valid_until.is_(None), Entitlement.valid_until > now)
+
+    @staticmethod
+    def course_users(db: Session, course_id: int, skip: int = 0, limit: int = 100,
+                     now: Optional[datetime] = None) -> List[str]:
+        """Users with current access to a course, via the (course_id, valid_until) index"""
+        now = now or datetime.utcnow()
+        rows = db.query(Entitlement.user_id).filter(
+            Entitlement.course_id == course_id, EntitlementService._active(now)
+        ).distinct().order_by(Entitlement.user_id).offset(skip).limit(limit).all()
+        return [user_id for user_id, in rows]
+
+    @staticmethod
+    def student_counts(db: Session, now: Optional[datetime] = None) -> Dict[int, int]:
+        """Distinct users with current access, per course"""
+        now = now or datetime.utcnow()
+        rows = db.query(Entitlement.course_id, func.count(func.distinct(Entitlement.user_id))).filter(
+            EntitlementService._active(now)
+        ).group_by(Entitlement.course_id).all()
+        return dict(rows)
+
+
+# ---------- keeping grants in step with ORM writes ----------
+
+TRANSACTION_FIELDS = ("status", "courses", "valid_until", "subscription_plan_id", "plan_name", "user_id")
+USER_FIELDS = ("subscribed_courses", "subscription_status", "subscription_end_date")
+
+
+@event.listens_for(models.Transaction, "after_insert")
+def _on_transaction_insert(mapper, connection, target):
+    EntitlementService.sync_transaction(connection, target, object_session(target))
+
+
+@event.listens_for(models.Transaction, "after_update")
+def _on_transaction_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in TRANSACTION_FIELDS):
+        previous = state.attrs.user_id.history.deleted
+        EntitlementService.touch(object_session(target), previous)
+        EntitlementService.sync_transaction(connection, target, object_session(target))
+
+
+@event.listens_for(models.Transaction, "after_delete")
+def _on_transaction_delete(mapper, connection, target):
+    connection.execute(delete(entitlements_table).where(
+        entitlements_table.c.source == SOURCE_TRANSACTION,
+        entitlements_table.c.source_id == target.id,
+    ))
+    EntitlementService.touch(object_session(target), [target.user_id])
+
+
+@event.listens_for(models.User, "after_insert")
+def _on_user_insert(mapper, connection, target):
+    if target.subscribed_courses:
+        EntitlementService.sync_direct(connection, target.id, object_session(target))
+
+
+@event.listens_for(models.User, "after_update")
+def _on_user_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in USER_FIELDS):
+        EntitlementService.sync_direct(connection, target.id, object_session(target))
+
+
+@event.listens_for(models.User, "after_delete")
+def _on_user_delete(mapper, connection, target):
+    connection.execute(delete(entitlements_table).where(entitlements_table.c.user_id == target.id))
+    EntitlementService.touch(object_session(target), [target.id])
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session):
+    user_ids = session.info.pop("entitlement_users", None)
+    if user_ids:
+        entitlement_cache.invalidate(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("entitlement_users", None)
@@ -0,0 +1,139 @@
+# services/image_service.py
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional - originals are served as-is without it
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Thumbnail edge lengths (px) generated for every uploaded image
+DERIVATIVE_SIZES = (64, 128, 256)
+# file extension -> Pillow format name
+DERIVATIVE_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# Directory served at /static (see the mount in main.py)
+UPLOAD_DIR = "uploads"
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def derivative_path(original_path: str, size: int, ext: str) -> str:
+    """Path of a resized copy, stored next to the original"""
+    stem, _ = os.path.splitext(original_path)
+    return f"{stem}_{size}.{ext}"
+
+
+def generate_derivatives(original_path: str, sizes=DERIVATIVE_SIZES) -> List[str]:
+    """Resize one image into every size/format. Runs inside a worker process."""
+    written = []
+    with Image.open(original_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+
+        for size in sizes:
+            thumb = img.copy()
+            thumb.thumbnail((size, size), Image.LANCZOS)
+
+            for ext, fmt in DERIVATIVE_FORMATS.items():
+                out = thumb
+                if fmt == "JPEG" and thumb.mode == "RGBA":
+                    # JPEG has no alpha channel - flatten on white
+                    out = Image.new("RGB", thumb.size, (255, 255, 255))
+                    out.paste(thumb, mask=thumb.split()[3])
+
+                path = derivative_path(original_path, size, ext)
+                quality = JPEG_QUALITY if fmt == "JPEG" else WEBP_QUALITY
+                out.save(path, fmt, quality=quality, optimize=True)
+                written.append(path)
+    return written
+
+
+def _log_result(future):
+    try:
+        paths = future.result()
+        logger.info(f"Generated {len(paths)} image derivatives")
+    except Exception as e:
+        logger.warning(f"Image derivative generation failed: {e}")
+
+
+class ImageDerivativeService:
+    @staticmethod
+    def is_available() -> bool:
+        return Image is not None
+
+    @staticmethod
+    def _get_executor() -> ProcessPoolExecutor:
+        global _executor
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+        return _executor
+
+    @staticmethod
+    def schedule(original_path: str):
+        """Queue thumbnail generation for a freshly uploaded file.
+
+        Returns the Future, or None when Pillow is not installed.
+        """
+        if not ImageDerivativeService.is_available():
+            logger.info("Pillow not installed, skipping image derivatives")
+            return None
+
+        future = ImageDerivativeService._get_executor().submit(
+            generate_derivatives, original_path
+        )
+        future.add_done_callback(_log_result)
+        return future
+
+    @staticmethod
+    def shutdown():
+        global _executor
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+    @staticmethod
+    def url_to_path(url: str) -> str:
+        """Map a public upload URL back to its file on disk.
+
+        /static is mounted on the uploads directory, so /static/avatars/x.png
+        and /uploads/avatars/x.png are both uploads/avatars/x.png.
+        """
+        path = url.lstrip("/")
+        if path.startswith("static/"):
+            path = os.path.join(UPLOAD_DIR, path[len("static/"):])
+        return path
+
+    @staticmethod
+    def variant_urls(original_url: Optional[str], only_existing: bool = True) -> Dict[str, Dict[str, str]]:
+        """Size-specific URLs for an uploaded image, e.g. {"64": {"webp": ..., "jpg": ...}}
+
+        With only_existing=True sizes that are not generated yet are left out,
+        so callers can fall back to the original URL.
+        """
+        if not original_url:
+            return {}
+
+        original_path = ImageDerivativeService.url_to_path(original_url)
+        url_prefix = original_url[: len(original_url) - len(os.path.basename(original_url))]
+
+        variants = {}
+        for size in DERIVATIVE_SIZES:
+            formats = {}
+            for ext in DERIVATIVE_FORMATS:
+                path = derivative_path(original_path, size, ext)
+                if only_existing and not os.path.exists(path):
+                    continue
+                formats[ext] = url_prefix + os.path.basename(path)
+            if formats:
+                variants[str(size)] = formats
+        return variants
@@ -0,0 +1,282 @@
+# services/mrr_service.py
+import os
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, inspect, insert, select, update
+from sqlalchemy.orm import Session
+
+import models
+from services.revenue_service import net_amount
+
+logger = logging.getLogger(__name__)
+
+MRR_REBUILD_FETCH_SIZE = int(os.getenv("MRR_REBUILD_FETCH_SIZE", "10000"))
+
+# Order matters: a user's month vector is a list in this order
+MOVEMENTS = (
+    "new_mrr", "expansion_mrr", "contraction_mrr", "churned_mrr", "reactivation_mrr",
+    "new_subscribers", "reactivated_subscribers", "churned_subscribers",
+)
+NEW, EXPANSION, CONTRACTION, CHURNED, REACTIVATION, NEW_SUBS, REACTIVATED_SUBS, CHURNED_SUBS = range(len(MOVEMENTS))
+
+Snapshot = models.MrrMonthlySnapshot
+snapshots_table = Snapshot.__table__
+transactions_table = models.Transaction.__table__
+ledger_table = models.RefundLedgerEntry.__table__
+
+# Transaction fields that move MRR
+TRANSACTION_FIELDS = ("user_id", "status", "amount", "date", "duration_months", "valid_until")
+
+
+def month_index(value) -> int:
+    return value.year * 12 + value.month - 1
+
+
+def month_start(index: int) -> date:
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def contribution(amount, refunded, start: datetime, duration_months, valid_until) -> Tuple[int, int, int]:
+    """(first month, months covered, monthly amount) of a captured transaction.
+
+    A transaction covers the months from its date up to the month of
+    valid_until, or duration_months months when it has no end date, and
+    spreads its amount net of refunds evenly over them.
+    """
+    first = month_index(start)
+    months = max(month_index(valid_until) - first, 1) if valid_until else max(duration_months or 1, 1)
+    return first, months, round(net_amount("captured", amount, refunded) / months)
+
+
+def user_movements(contributions: Iterable[Tuple[int, int, int]]) -> Dict[int, List[int]]:
+    """MOVEMENTS per month for one user, for the months in which their MRR changes.
+
+    The user's MRR per month is a running sum over a difference map of
+    their transactions; comparing each month with the one before
+    classifies the change. Only the months with a change are returned.
+    """
+    diff = defaultdict(int)
+    for first, months, monthly in contributions:
+        if monthly:
+            diff[first] += monthly
+            diff[first + months] -= monthly
+    movements = {}
+    previous = current = 0
+    subscribed_before = False
+    for month in sorted(diff):
+        current += diff[month]
+        if current == previous:
+            continue
+        row = [0] * len(MOVEMENTS)
+        if previous == 0:
+            if subscribed_before:
+                row[REACTIVATION], row[REACTIVATED_SUBS] = current, 1
+            else:
+                row[NEW], row[NEW_SUBS] = current, 1
+            subscribed_before = True
+        elif current == 0:
+            row[CHURNED], row[CHURNED_SUBS] = previous, 1
+        elif current > previous:
+            row[EXPANSION] = current - previous
+        else:
+            row[CONTRACTION] = previous - current
+        movements[month] = row
+        previous = current
+    return movements
+
+
+def _add(totals: Dict[int, List[int]], movements: Dict[int, List[int]], sign: int = 1):
+    for month, row in movements.items():
+        total = totals.get(month)
+        if total is None:
+            total = totals[month] = [0] * len(MOVEMENTS)
+        for i, value in enumerate(row):
+            total[i] += sign * value
+
+
+def _captured_rows(user_ids: Optional[Iterable[str]] = None):
+    tx = transactions_table.c
+    statement = select(tx.user_id, tx.id, tx.amount, tx.date, tx.duration_months, tx.valid_until).where(
+        tx.status == "captured",
+        tx.user_id.isnot(None),
+        tx.date.isnot(None),
+    ).order_by(tx.user_id)
+    if user_ids is not None:
+        statement = statement.where(tx.user_id.in_(user_ids))
+    return statement
+
+
+def _refunds(connection, transaction_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    statement = select(ledger_table.c.transaction_id, func.sum(ledger_table.c.amount)).group_by(
+        ledger_table.c.transaction_id)
+    if transaction_ids is not None:
+        statement = statement.where(ledger_table.c.transaction_id.in_(transaction_ids))
+    return dict(connection.execute(statement).all())
+
+
+def _movements_by_user(rows, refunds: Dict[int, int]):
+    """(user_id, movements) per user from rows sorted by user_id"""
+    for user_id, group in groupby(rows, key=itemgetter(0)):
+        yield user_id, user_movements(
+            contribution(amount, refunds.get(tx_id, 0), start, duration_months, valid_until)
+            for _, tx_id, amount, start, duration_months, valid_until in group
+        )
+
+
+class MrrService:
+    """Monthly recurring revenue from the transaction ledger.
+
+    rebuild() streams captured transactions sorted by user (the
+    transactions.user_id index supplies the order) and keeps one user's
+    rows in memory at a time: each user's MRR per month is classified into
+    new, expansion, contraction, churn and reactivation, and summed into
+    one mrr_monthly_snapshots row per month. Afterwards every flush that
+    touches transactions or refund ledger entries recomputes just the
+    affected users before and after the flush and applies the difference
+    to the snapshots in the same transaction. Ending MRR, ARR and
+    subscriber counts are running sums of the movements, so reading a
+    series costs one row per month.
+    """
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        connection = db.connection()
+        refunds = _refunds(connection)
+        rows = connection.execute(_captured_rows().execution_options(yield_per=MRR_REBUILD_FETCH_SIZE))
+        totals = {}
+        for _, movements in _movements_by_user(rows, refunds):
+            _add(totals, movements)
+        db.execute(delete(snapshots_table))
+        if totals:
+            now = datetime.utcnow()
+            db.execute(insert(snapshots_table), [
+                {"month": month_start(month), "updated_at": now, **dict(zip(MOVEMENTS, row))}
+                for month, row in sorted(totals.items())
+            ])
+        db.commit()
+        logger.info(f"Rebuilt MRR snapshots for {len(totals)} months")
+        return len(totals)
+
+    @staticmethod
+    def ensure_populated(db: Session):
+        if db.query(Snapshot.month).first() is None and db.query(models.Transaction.id).filter(
+            models.Transaction.status == "captured"
+        ).first() is not None:
+            MrrService.rebuild(db)
+
+    # ---------- incremental maintenance ----------
+
+    @staticmethod
+    def load_user_movements(connection, user_ids: Iterable[str]) -> Dict[str, Dict[int, List[int]]]:
+        rows = connection.execute(_captured_rows(list(user_ids))).all()
+        refunds = _refunds(connection, [row.id for row in rows])
+        return dict(_movements_by_user(rows, refunds))
+
+    @staticmethod
+    def apply_movement_deltas(connection, deltas: Dict[int, List[int]]):
+        deltas = {month: row for month, row in deltas.items() if any(row)}
+        if not deltas:
+            return
+        months = [month_start(month) for month in deltas]
+        existing = set(connection.execute(
+            select(snapshots_table.c.month).where(snapshots_table.c.month.in_(months))).scalars())
+        now = datetime.utcnow()
+        missing = [{"month": month, "updated_at": now, **{column: 0 for column in MOVEMENTS}}
+                   for month in months if month not in existing]
+        if missing:
+            connection.execute(insert(snapshots_table), missing)
+        for month, row in deltas.items():
+            connection.execute(update(snapshots_table).where(snapshots_table.c.month == month_start(month)).values(
+                updated_at=now,
+                **{column: snapshots_table.c[column] + value for column, value in zip(MOVEMENTS, row) if value},
+            ))
+
+    # ---------- reporting ----------
+
+    @staticmethod
+    def series(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> List[dict]:
+        """One entry per month from start to end (default: first snapshot to this month), gaps filled"""
+        snapshots = {month_index(s.month): s for s in db.query(Snapshot).order_by(Snapshot.month)}
+        last = month_index(end or date.today())
+        first = min(snapshots, default=last)
+        if start is not None:
+            first = min(first, month_index(start))
+        mrr = subscribers = 0
+        result = []
+        for month in range(first, last + 1):
+            snapshot = snapshots.get(month)
+            row = [getattr(snapshot, column) for column in MOVEMENTS] if snapshot else [0] * len(MOVEMENTS)
+            starting_mrr, starting_subscribers = mrr, subscribers
+            mrr += row[NEW] + row[EXPANSION] + row[REACTIVATION] - row[CONTRACTION] - row[CHURNED]
+            subscribers += row[NEW_SUBS] + row[REACTIVATED_SUBS] - row[CHURNED_SUBS]
+            if start is not None and month < month_index(start):
+                continue
+            result.append({
+                "month": month_start(month).strftime("%Y-%m"),
+                "starting_mrr": starting_mrr,
+                "mrr": mrr,
+                "arr": mrr * 12,
+                "net_new_mrr": mrr - starting_mrr,
+                "subscribers": subscribers,
+                **dict(zip(MOVEMENTS, row)),
+                "customer_churn_rate": round(
+                    row[CHURNED_SUBS] / starting_subscribers * 100, 2) if starting_subscribers else 0,
+                "revenue_churn_rate": round(
+                    (row[CHURNED] + row[CONTRACTION]) / starting_mrr * 100, 2) if starting_mrr else 0,
+            })
+        return result
+
+    @staticmethod
+    def current(db: Session, month: Optional[date] = None) -> dict:
+        month = month or date.today()
+        return MrrService.series(db, month, month)[0]
+
+
+# ---------- applying writes inside the same flush ----------
+
+# A moved transaction still reports its previous user
+models.track_history(models.Transaction.user_id)
+
+
+def _affected_users(session: Session) -> set:
+    user_ids = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, models.Transaction):
+            if obj in session.dirty and obj not in session.deleted:
+                attrs = inspect(obj).attrs
+                if not any(attrs[field].history.has_changes() for field in TRANSACTION_FIELDS):
+                    continue
+                user_ids.update(attrs.user_id.history.deleted)
+            user_ids.add(obj.user_id)
+        elif isinstance(obj, models.RefundLedgerEntry):
+            user_ids.add(obj.user_id)
+    user_ids.discard(None)
+    return user_ids
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session, flush_context, instances):
+    user_ids = _affected_users(session)
+    if user_ids:
+        session.info["mrr_before"] = (user_ids, MrrService.load_user_movements(session.connection(), user_ids))
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    pending = session.info.pop("mrr_before", None)
+    if pending is None:
+        return
+    user_ids, before = pending
+    connection = session.connection()
+    after = MrrService.load_user_movements(connection, user_ids)
+    deltas = {}
+    for movements in before.values():
+        _add(deltas, movements, -1)
+    for movements in after.values():
+        _add(deltas, movements)
+    MrrService.apply_movement_deltas(connection, deltas)
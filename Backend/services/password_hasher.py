@@ -0,0 +1,121 @@
+# services/password_hasher.py
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# Raising PASSWORD_HASH_ROUNDS makes older, weaker hashes "need update";
+# they are re-hashed transparently on the next successful login.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to wait or run at once before new ones are refused
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# Use a more compatible hashing algorithm
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256", "bcrypt"],  # Fallback to pbkdf2 if bcrypt fails
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS,
+)
+
+
+def _truncate_for_bcrypt(password: str) -> str:
+    password_bytes = password.encode('utf-8')
+    if len(password_bytes) > 72:
+        password_bytes = password_bytes[:72]
+    return password_bytes.decode('utf-8', errors='ignore')
+
+
+def hash_password_sync(password: str) -> str:
+    try:
+        return pwd_context.hash(password)
+    except ValueError as e:
+        if "longer than 72 bytes" in str(e):
+            # Truncate password for bcrypt compatibility
+            return pwd_context.hash(_truncate_for_bcrypt(password))
+        raise
+
+
+def verify_and_update_sync(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """Return (valid, new_hash); new_hash is set when the stored hash is outdated"""
+    if not password_hash:
+        return False, None
+    try:
+        return pwd_context.verify_and_update(password, password_hash)
+    except ValueError:
+        # Unknown or malformed hash
+        return False, None
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded thread pool.
+
+    pbkdf2/bcrypt take tens of milliseconds of CPU per call; calling them
+    from an async endpoint would stall every other request on the worker.
+    The work is pushed to a dedicated executor instead, and once
+    HASH_MAX_PENDING jobs are queued new requests get a 503 rather than
+    piling up behind each other.
+    """
+
+    def __init__(self, max_workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="password-hash"
+            )
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"Password hash queue full ({self.pending} pending)")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password_sync, password)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update_sync, password, password_hash)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        valid, _ = await self.verify_and_update(password, password_hash)
+        return valid
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,505 @@
+# services/payment_webhook_service.py
+import os
+import hmac
+import asyncio
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+from services.refund_service import RefundService
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_BATCH_SIZE = int(os.getenv("PAYMENT_WEBHOOK_BATCH_SIZE", "500"))
+WEBHOOK_POLL_INTERVAL_SECONDS = float(os.getenv("PAYMENT_WEBHOOK_POLL_INTERVAL_SECONDS", "5"))
+# How long after it was received an event that cannot apply yet (or keeps raising
+# database errors) is retried before it is parked as failed; gateways retry for a day or more
+WEBHOOK_RETRY_WINDOW_SECONDS = float(os.getenv("PAYMENT_WEBHOOK_RETRY_WINDOW_SECONDS", str(48 * 3600)))
+# First delay between retries of such an event, doubled after every attempt up to the max
+WEBHOOK_RETRY_BASE_SECONDS = float(os.getenv("PAYMENT_WEBHOOK_RETRY_BASE_SECONDS", "30"))
+WEBHOOK_RETRY_MAX_SECONDS = float(os.getenv("PAYMENT_WEBHOOK_RETRY_MAX_SECONDS", "3600"))
+
+GATEWAYS = ("razorpay", "google", "apple")
+SIGNATURE_HEADERS = {"razorpay": "x-razorpay-signature", "google": "x-webhook-signature", "apple": "x-webhook-signature"}
+
+# Events can arrive out of order; a transaction never moves back to an earlier state
+STATUS_RANK = {"created": 0, "pending": 0, "authorized": 1, "failed": 1, "captured": 2, "refunded": 3}
+
+class DeferredEvent(ValueError):
+    """An event that arrived ahead of the one it depends on; retried in a later batch"""
+
+
+Event = models.PaymentWebhookEvent
+Transaction = models.Transaction
+events_table = Event.__table__
+
+
+def _retry_at(received_at: datetime, attempts: int) -> datetime:
+    """When an event received at `received_at` that has failed `attempts` times is next due"""
+    delay, step = 0.0, WEBHOOK_RETRY_BASE_SECONDS
+    for _ in range(attempts):
+        delay += step
+        step = min(step * 2, WEBHOOK_RETRY_MAX_SECONDS)
+    return received_at + timedelta(seconds=delay)
+
+
+def _retry_expired(event: Event, now: datetime) -> bool:
+    return now - event.received_at >= timedelta(seconds=WEBHOOK_RETRY_WINDOW_SECONDS)
+
+
+@dataclass
+class GatewayPayment:
+    """The fields of a gateway callback that matter to a transaction"""
+    event_type: str
+    order_id: str
+    status: str
+    payment_gateway_id: Optional[str] = None
+    amount: Optional[int] = None
+    refund_id: Optional[str] = None
+    refund_amount: Optional[int] = None
+    user_id: Optional[str] = None
+    user_name: Optional[str] = None
+    plan_name: Optional[str] = None
+    subscription_plan_id: Optional[int] = None
+    courses: List[int] = field(default_factory=list)
+    duration_months: Optional[int] = None
+    occurred_at: Optional[datetime] = None
+
+    @property
+    def idempotency_key(self) -> str:
+        # Gateways retry until acknowledged; a retry carries the same event and reference
+        reference = self.refund_id or self.payment_gateway_id or self.order_id
+        return f"{self.event_type}:{reference}"
+
+
+def _int(value) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+
+def _timestamp(value) -> Optional[datetime]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        # Unix seconds; Apple sends milliseconds
+        return datetime.utcfromtimestamp(value / 1000 if value > 1e11 else value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def _parse_razorpay(payload: dict) -> GatewayPayment:
+    """Razorpay payment.* and refund.* events; amounts are in paise and our
+    checkout puts user_id, plan_name and the like in the payment notes."""
+    body = payload.get("payload") or {}
+    payment = (body.get("payment") or {}).get("entity") or {}
+    refund = (body.get("refund") or {}).get("entity") or {}
+    notes = payment.get("notes") or {}
+    if not isinstance(notes, dict):
+        notes = {}  # Razorpay sends [] for empty notes
+    status = "refunded" if refund or payment.get("status") == "refunded" else payment.get("status")
+    return GatewayPayment(
+        event_type=payload.get("event") or "",
+        order_id=payment.get("order_id") or notes.get("order_id"),
+        status=status,
+        payment_gateway_id=payment.get("id") or refund.get("payment_id"),
+        amount=_int(payment.get("amount")) // 100 if payment.get("amount") is not None else None,
+        refund_id=refund.get("id"),
+        refund_amount=_int(refund.get("amount")) // 100 if refund.get("amount") is not None else None,
+        user_id=notes.get("user_id"),
+        user_name=notes.get("user_name"),
+        plan_name=notes.get("plan_name"),
+        subscription_plan_id=_int(notes.get("plan_id")),
+        courses=[int(c) for c in str(notes.get("courses") or "").split(",") if c.strip()],
+        duration_months=_int(notes.get("duration_months")),
+        occurred_at=_timestamp(payment.get("created_at") or payload.get("created_at")),
+    )
+
+
+def _parse_store(payload: dict) -> GatewayPayment:
+    """Google Play and App Store notifications only carry a purchase token;
+    the app server verifies it with the store and forwards the purchase in
+    this flat shape, amounts in rupees."""
+    return GatewayPayment(
+        event_type=payload.get("event_type") or "",
+        order_id=payload.get("order_id"),
+        status=payload.get("status"),
+        payment_gateway_id=payload.get("payment_id"),
+        amount=_int(payload.get("amount")),
+        refund_id=payload.get("refund_id"),
+        refund_amount=_int(payload.get("refund_amount")),
+        user_id=payload.get("user_id"),
+        user_name=payload.get("user_name"),
+        plan_name=payload.get("plan_name"),
+        subscription_plan_id=_int(payload.get("plan_id")),
+        courses=[int(c) for c in payload.get("courses") or []],
+        duration_months=_int(payload.get("duration_months")),
+        occurred_at=_timestamp(payload.get("event_time")),
+    )
+
+
+PARSERS = {"razorpay": _parse_razorpay, "google": _parse_store, "apple": _parse_store}
+
+
+def parse_payment(gateway: str, payload: dict) -> GatewayPayment:
+    """Raises ValueError for payloads that cannot become a transaction"""
+    if gateway not in PARSERS:
+        raise ValueError(f"Unknown gateway {gateway}")
+    try:
+        payment = PARSERS[gateway](payload)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError(f"Malformed {gateway} payload: {e}")
+    if not payment.order_id:
+        raise ValueError("Payload has no order id")
+    if payment.status not in STATUS_RANK:
+        raise ValueError(f"Unknown payment status {payment.status}")
+    return payment
+
+
+def verify_signature(gateway: str, body: bytes, signature: Optional[str]) -> bool:
+    """HMAC-SHA256 of the raw body with <GATEWAY>_WEBHOOK_SECRET
+
+    A gateway without a secret has every callback refused, unless
+    PAYMENT_WEBHOOK_ALLOW_UNSIGNED=1 explicitly turns the check off (local
+    development against a gateway sandbox).
+    """
+    secret = os.getenv(f"{gateway.upper()}_WEBHOOK_SECRET")
+    if not secret:
+        return os.getenv("PAYMENT_WEBHOOK_ALLOW_UNSIGNED", "").lower() in ("1", "true")
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return signature is not None and hmac.compare_digest(expected, signature)
+
+
+def _insert_ignoring_duplicates(bind):
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(bind.dialect.name)
+    if dialect is None:
+        return None
+    return dialect.insert(events_table).on_conflict_do_nothing(index_elements=["idempotency_key"])
+
+
+class PaymentWebhookService:
+    """Payment gateway callbacks, stored first and applied in batches.
+
+    ingest() only parses enough of a callback to build its idempotency key
+    and inserts the raw payload into payment_webhook_events, so the gateway
+    is acknowledged after one INSERT even during a sale. process_batch()
+    takes up to WEBHOOK_BATCH_SIZE pending events in arrival order, loads
+    their transactions, users and plans with one query each, upserts the
+    transactions through the ORM (so course entitlements, plan revenue and
+    subscription end dates follow in the same flush) and commits once. A
+    batch that hits a database error is retried one event per commit so a
+    single bad event cannot hold up the rest.
+
+    Events that cannot apply yet (a refund ahead of its capture) or that hit
+    a database error stay pending and are retried with backoff from
+    received_at, or as soon as their order is captured, until
+    WEBHOOK_RETRY_WINDOW_SECONDS have passed since they arrived.
+    """
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def ingest(db: Session, gateway: str, payload: dict) -> dict:
+        """Store a callback; duplicates of an already stored event are acknowledged and dropped"""
+        payment = parse_payment(gateway, payload)
+        key = f"{gateway}:{payment.idempotency_key}"
+        row = {
+            "gateway": gateway,
+            "event_type": payment.event_type,
+            "idempotency_key": key,
+            "order_id": payment.order_id,
+            "payment_gateway_id": payment.payment_gateway_id,
+            "payload": payload,
+            "received_at": datetime.utcnow(),
+            "status": "pending",
+            "attempts": 0,
+        }
+        statement = _insert_ignoring_duplicates(db.get_bind())
+        if statement is not None:
+            inserted = db.execute(statement, row).rowcount == 1
+        else:
+            inserted = db.query(Event.id).filter(Event.idempotency_key == key).first() is None
+            if inserted:
+                db.execute(insert(events_table), row)
+        db.commit()
+        return {"status": "accepted" if inserted else "duplicate", "idempotency_key": key}
+
+    # ---------- processing ----------
+
+    @staticmethod
+    def _valid_until(payment: GatewayPayment, months: int, start: datetime) -> Optional[datetime]:
+        if payment.status != "captured":
+            return None
+        return start + timedelta(days=30 * months)
+
+    @staticmethod
+    def _apply(db: Session, gateway: str, payment: GatewayPayment, transactions: Dict[str, Transaction],
+               users: set, plans_by_id: dict, plans_by_name: dict):
+        """Upsert one payment; raises ValueError before writing anything when it cannot apply"""
+        tx = transactions.get(payment.order_id)
+
+        if payment.status == "refunded":
+            if tx is None or STATUS_RANK.get(tx.status, 0) < STATUS_RANK["captured"]:
+                raise DeferredEvent(f"Refund for order {payment.order_id} arrived before its capture")
+            if tx.status == "failed":
+                raise ValueError(f"Refund for failed order {payment.order_id}")
+            if tx.status == "refunded":
+                return
+            # Earlier events of this batch may have created the transaction or refunded part of it
+            db.flush()
+            reason = f"{gateway} refund {payment.refund_id or payment.payment_gateway_id or tx.order_id}"
+            if db.query(models.RefundLedgerEntry.id).filter(
+                models.RefundLedgerEntry.transaction_id == tx.id,
+                models.RefundLedgerEntry.reason == reason,
+            ).first() is not None:
+                return  # recorded before a replay
+            remaining = (tx.amount or 0) - RefundService.refunded(db, tx.id)
+            amount = min(payment.refund_amount or remaining, remaining)
+            if amount > 0:
+                RefundService.refund(db, tx, amount, reason, processed_by=gateway)
+            return
+
+        if tx is None:
+            if payment.user_id not in users:
+                raise ValueError(f"Unknown user {payment.user_id} for order {payment.order_id}")
+            plan = plans_by_id.get(payment.subscription_plan_id) or plans_by_name.get(payment.plan_name)
+            months = payment.duration_months or (plan.duration_months if plan is not None else None) or 1
+            occurred_at = payment.occurred_at or datetime.utcnow()
+            tx = Transaction(
+                user_id=payment.user_id,
+                user_name=payment.user_name,
+                subscription_plan_id=plan.id if plan is not None else None,
+                plan_name=plan.name if plan is not None else payment.plan_name,
+                type=gateway,
+                amount=payment.amount or 0,
+                status=payment.status,
+                date=occurred_at,
+                order_id=payment.order_id,
+                payment_gateway_id=payment.payment_gateway_id,
+                courses=payment.courses,
+                duration_months=months,
+                valid_until=PaymentWebhookService._valid_until(payment, months, occurred_at),
+            )
+            db.add(tx)
+            transactions[payment.order_id] = tx
+            return
+
+        if STATUS_RANK[payment.status] < STATUS_RANK.get(tx.status, 0):
+            return  # a late event for a state the transaction has already left
+        tx.status = payment.status
+        if payment.amount is not None:
+            tx.amount = payment.amount
+        if payment.payment_gateway_id:
+            tx.payment_gateway_id = payment.payment_gateway_id
+        if tx.valid_until is None:
+            tx.valid_until = PaymentWebhookService._valid_until(
+                payment, tx.duration_months or 1, tx.date or datetime.utcnow())
+
+    @staticmethod
+    def _apply_events(db: Session, events: Sequence[Event], now: datetime) -> dict:
+        parsed = []
+        failed = 0
+        for event in events:
+            event.attempts = (event.attempts or 0) + 1
+            try:
+                parsed.append((event, parse_payment(event.gateway, event.payload)))
+            except ValueError as e:
+                event.status, event.error, event.processed_at = "failed", str(e), now
+                failed += 1
+
+        order_ids = {payment.order_id for _, payment in parsed}
+        user_ids = {payment.user_id for _, payment in parsed if payment.user_id}
+        transactions = {tx.order_id: tx for tx in db.query(Transaction).filter(Transaction.order_id.in_(order_ids))}
+        users = {user_id for user_id, in db.query(models.User.id).filter(models.User.id.in_(user_ids))}
+        plans = db.query(models.SubscriptionPlan).all()
+        plans_by_id = {plan.id: plan for plan in plans}
+        plans_by_name = {plan.name: plan for plan in plans}
+
+        processed = deferred = 0
+        for event, payment in parsed:
+            try:
+                PaymentWebhookService._apply(db, event.gateway, payment, transactions, users,
+                                             plans_by_id, plans_by_name)
+            except DeferredEvent as e:
+                event.error = str(e)
+                if _retry_expired(event, now):
+                    event.status, event.processed_at = "failed", now
+                    failed += 1
+                else:
+                    deferred += 1
+            except ValueError as e:
+                event.status, event.error, event.processed_at = "failed", str(e), now
+                failed += 1
+            else:
+                event.status, event.error, event.processed_at = "processed", None, now
+                processed += 1
+        return {"processed": processed, "failed": failed, "deferred": deferred}
+
+    @staticmethod
+    def _due_retries(db: Session, limit: int, after_id: int, now: datetime) -> List[int]:
+        """Deferred events after `after_id` whose backoff has run out or whose order is now captured"""
+        rows = db.query(Event.id, Event.order_id, Event.received_at, Event.attempts).filter(
+            Event.status == "pending",
+            Event.id > after_id,
+            Event.error.isnot(None),
+        ).order_by(Event.id).all()
+        captured = {order_id for order_id, in db.query(Transaction.order_id).filter(
+            Transaction.order_id.in_({row.order_id for row in rows if row.order_id}),
+            Transaction.status.in_(("captured", "refunded")),
+        )} if rows else set()
+        return [row.id for row in rows
+                if row.order_id in captured or _retry_at(row.received_at, row.attempts or 0) <= now][:limit]
+
+    @staticmethod
+    def process_batch(db: Session, limit: int = WEBHOOK_BATCH_SIZE, retry_deferred: bool = False,
+                      after_id: int = 0) -> dict:
+        """Apply up to `limit` pending events after `after_id` in arrival order.
+
+        Fresh events have no error; deferred ones (and ones that hit a
+        database error) keep theirs until they apply, and are only picked
+        with retry_deferred once they are due.
+        """
+        now = datetime.utcnow()
+        if retry_deferred:
+            ids = PaymentWebhookService._due_retries(db, limit, after_id, now)
+        else:
+            ids = [event_id for event_id, in db.query(Event.id).filter(
+                Event.status == "pending",
+                Event.id > after_id,
+                Event.error.is_(None),
+            ).order_by(Event.id).limit(limit)]
+        result = {"processed": 0, "failed": 0, "deferred": 0, "last_id": ids[-1] if ids else None}
+        if not ids:
+            return result
+        try:
+            events = db.query(Event).filter(Event.id.in_(ids)).order_by(Event.id).all()
+            result.update(PaymentWebhookService._apply_events(db, events, now))
+            db.commit()
+            return result
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Webhook batch of {len(ids)} failed ({e}); retrying one event at a time")
+
+        for event_id in ids:
+            try:
+                counts = PaymentWebhookService._apply_events(db, [db.get(Event, event_id)], now)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                event = db.get(Event, event_id)
+                event.attempts = (event.attempts or 0) + 1
+                event.error = str(e)
+                if _retry_expired(event, now):
+                    event.status, event.processed_at = "failed", now
+                    counts = {"processed": 0, "failed": 1, "deferred": 0}
+                else:
+                    counts = {"processed": 0, "failed": 0, "deferred": 1}
+                db.commit()
+            for key, count in counts.items():
+                result[key] += count
+        return result
+
+    @staticmethod
+    def process_pending(db: Session, batch_size: int = WEBHOOK_BATCH_SIZE) -> dict:
+        """Drain fresh events batch by batch, then retry the deferred events that are due; one caller at a time"""
+        totals = {"processed": 0, "failed": 0, "batches": 0}
+        with PaymentWebhookService._lock:
+            # Every fresh event leaves the fresh set (processed, failed or deferred), so this ends
+            while True:
+                result = PaymentWebhookService.process_batch(db, batch_size)
+                if result["last_id"] is None:
+                    break
+                for key in ("processed", "failed"):
+                    totals[key] += result[key]
+                totals["batches"] += 1
+            after_id = 0
+            while True:
+                result = PaymentWebhookService.process_batch(db, batch_size, retry_deferred=True, after_id=after_id)
+                if result["last_id"] is None:
+                    break
+                after_id = result["last_id"]
+                for key in ("processed", "failed"):
+                    totals[key] += result[key]
+                totals["batches"] += 1
+        if totals["batches"]:
+            logger.info(f"Processed {totals['processed']} webhook events, {totals['failed']} failed")
+        return totals
+
+    @staticmethod
+    def process_pending_in_new_session(session_factory) -> dict:
+        db = session_factory()
+        try:
+            return PaymentWebhookService.process_pending(db)
+        finally:
+            db.close()
+
+    # ---------- replay and reporting ----------
+
+    @staticmethod
+    def replay(db: Session, event_ids: Optional[List[int]] = None, status: Optional[str] = "failed",
+               gateway: Optional[str] = None, since: Optional[datetime] = None) -> int:
+        """Queue stored events to be applied again: the given ids, or every event matching the filters"""
+        statement = update(events_table).values(status="pending", attempts=0, error=None, processed_at=None)
+        if event_ids:
+            statement = statement.where(events_table.c.id.in_(event_ids))
+        else:
+            if status:
+                statement = statement.where(events_table.c.status == status)
+            if gateway:
+                statement = statement.where(events_table.c.gateway == gateway)
+            if since:
+                statement = statement.where(events_table.c.received_at >= since)
+        count = db.execute(statement).rowcount
+        db.commit()
+        return count
+
+    @staticmethod
+    def stats(db: Session, now: Optional[datetime] = None) -> dict:
+        now = now or datetime.utcnow()
+        by_status = dict(db.query(Event.status, func.count()).group_by(Event.status).all())
+        oldest_pending = db.execute(
+            select(func.min(Event.received_at)).where(Event.status == "pending")
+        ).scalar()
+        return {
+            "pending": by_status.get("pending", 0),
+            "processed": by_status.get("processed", 0),
+            "failed": by_status.get("failed", 0),
+            "oldest_pending_seconds": round((now - oldest_pending).total_seconds(), 1) if oldest_pending else 0,
+            "processed_last_hour": db.query(func.count(Event.id)).filter(
+                Event.status == "processed", Event.processed_at >= now - timedelta(hours=1)).scalar(),
+        }
+
+
+class WebhookWorker:
+    """Runs process_pending whenever ingest signals new events, and every
+    WEBHOOK_POLL_INTERVAL_SECONDS in case a signal was missed. Events that
+    arrive while a batch is being applied wait for the next one, so a burst
+    turns into a few large batches rather than one commit per callback."""
+
+    def __init__(self):
+        self._wake: Optional[asyncio.Event] = None
+
+    def notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self, session_factory):
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=WEBHOOK_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(PaymentWebhookService.process_pending_in_new_session, session_factory)
+            except Exception as e:
+                logger.error(f"Webhook processing failed: {e}")
+
+
+webhook_worker = WebhookWorker()
@@ -0,0 +1,190 @@
+# services/permission_engine.py
+import ast
+import json
+import threading
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from models import Employee, Role
+from services.auth_cache import principal_cache
+
+# Granted to roles such as Super Admin; satisfies every check
+WILDCARD_PERMISSION = "all"
+
+
+@lru_cache(maxsize=1024)
+def _parse_permission_string(raw: str) -> Tuple[str, ...]:
+    text = raw.strip()
+    for loader in (json.loads, ast.literal_eval):
+        try:
+            value = loader(text)
+        except (ValueError, SyntaxError, TypeError):
+            continue
+        # Stored values may be JSON-encoded twice
+        if isinstance(value, str):
+            return _parse_permission_string(value) if value.strip() != text else (value,)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return tuple(str(p) for p in value)
+        return (str(value),)
+    return (text,) if text else ()
+
+
+def parse_permissions(permissions_data) -> List[str]:
+    """Normalize a stored permissions value (list, JSON or Python-repr string) to a list"""
+    if permissions_data is None:
+        return []
+    if isinstance(permissions_data, str):
+        return list(_parse_permission_string(permissions_data))
+    if isinstance(permissions_data, (list, tuple, set, frozenset)):
+        permissions: List[str] = []
+        for item in permissions_data:
+            if isinstance(item, str) and item.strip().startswith("["):
+                permissions.extend(_parse_permission_string(item))
+            else:
+                permissions.append(str(item))
+        return permissions
+    return []
+
+
+class PermissionEngine:
+    """Resolves "does this principal have permission P" from memory.
+
+    Each active role's permissions are compiled once into a frozenset, keyed
+    by role name (the same names carried on EmployeePrincipal.roles). The
+    union for a subject is cached alongside the role names it was built
+    from, so a check is a dict lookup plus a set membership test. Role
+    writes recompile the role and drop every effective set that used it;
+    role assignment changes drop the subject's entry.
+    """
+
+    def __init__(self):
+        self._roles: Dict[str, FrozenSet[str]] = {}
+        self._effective: Dict[str, Tuple[Tuple[str, ...], FrozenSet[str]]] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, db: Session):
+        """Compile every active role; call once at startup"""
+        compiled = {
+            role.name: frozenset(parse_permissions(role.permissions))
+            for role in db.query(Role).filter(Role.is_active == True).all()
+        }
+        with self._lock:
+            self._roles = compiled
+            self._effective.clear()
+            self.loaded = True
+
+    def compile_role(self, name: str, permissions, is_active: bool = True):
+        with self._lock:
+            if is_active:
+                self._roles[name] = frozenset(parse_permissions(permissions))
+            else:
+                self._roles.pop(name, None)
+            self._drop_effective_for_role(name)
+
+    def remove_role(self, name: str):
+        with self._lock:
+            self._roles.pop(name, None)
+            self._drop_effective_for_role(name)
+
+    def role_permissions(self, name: str) -> FrozenSet[str]:
+        return self._roles.get(name, frozenset())
+
+    def effective_permissions(self, subject_id: str, role_names: Iterable[str]) -> FrozenSet[str]:
+        role_names = tuple(role_names)
+        cached = self._effective.get(subject_id)
+        if cached is not None and cached[0] == role_names:
+            return cached[1]
+        with self._lock:
+            roles = self._roles
+            permissions = frozenset().union(*(roles.get(name, ()) for name in role_names))
+            self._effective[subject_id] = (role_names, permissions)
+        return permissions
+
+    def has_permission(self, subject_id: str, role_names: Iterable[str], permission: str) -> bool:
+        permissions = self.effective_permissions(subject_id, role_names)
+        return WILDCARD_PERMISSION in permissions or permission in permissions
+
+    def invalidate_subject(self, subject_id: str):
+        with self._lock:
+            self._effective.pop(subject_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._roles.clear()
+            self._effective.clear()
+            self.loaded = False
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "roles": len(self._roles),
+            "cached_subjects": len(self._effective),
+        }
+
+    def _drop_effective_for_role(self, name: str):
+        stale = [sid for sid, (names, _) in self._effective.items() if name in names]
+        for subject_id in stale:
+            del self._effective[subject_id]
+
+
+permission_engine = PermissionEngine()
+
+
+# ---------- following committed writes ----------
+# Role and assignment changes are queued at flush and applied after the
+# commit, so a transaction that rolls back never grants its permissions.
+
+def _queue(target, key: str, change):
+    session = object_session(target)
+    if session is None:
+        _apply({key: [change]})
+    else:
+        session.info.setdefault(key, []).append(change)
+
+
+def _apply(changes):
+    for old_names, name, permissions, is_active in changes.get("permission_role_changes", ()):
+        for old_name in old_names:
+            permission_engine.remove_role(old_name)
+        if name is not None:
+            permission_engine.compile_role(name, permissions, is_active)
+    for subject_id in changes.get("permission_subject_changes", ()):
+        principal_cache.invalidate_employee(subject_id)
+        permission_engine.invalidate_subject(subject_id)
+
+
+@event.listens_for(Role, "after_insert")
+@event.listens_for(Role, "after_update")
+def _recompile_role(mapper, connection, target):
+    # A rename leaves the old name compiled unless it is dropped too
+    old_names = tuple(inspect(target).attrs.name.history.deleted or ())
+    _queue(target, "permission_role_changes",
+           (old_names, target.name, target.permissions, bool(target.is_active)))
+
+
+@event.listens_for(Role, "after_delete")
+def _forget_role(mapper, connection, target):
+    _queue(target, "permission_role_changes", ((target.name,), None, None, False))
+
+
+# Employee role assignments change the role names cached on principals
+@event.listens_for(Employee.roles, "append")
+@event.listens_for(Employee.roles, "remove")
+def _invalidate_employee_roles(target, value, initiator):
+    if target.id:
+        _queue(target, "permission_subject_changes", target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session):
+    _apply({key: session.info.pop(key, []) for key in ("permission_role_changes", "permission_subject_changes")})
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("permission_role_changes", None)
+    session.info.pop("permission_subject_changes", None)
@@ -0,0 +1,181 @@
+# services/plan_propagation_service.py
+import os
+import logging
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import and_, delete, event, exists, func, inspect, literal, or_, select
+from sqlalchemy.orm import Session
+
+import models
+from services.entitlement_service import (
+    EntitlementService, SOURCE_TRANSACTION, course_ids, entitlements_table,
+)
+
+logger = logging.getLogger(__name__)
+
+PROPAGATION_CHUNK_SIZE = int(os.getenv("ENTITLEMENT_PROPAGATION_CHUNK_SIZE", "1000"))
+
+Job = models.EntitlementPropagationJob
+jobs_table = Job.__table__
+transactions_table = models.Transaction.__table__
+
+
+class PlanPropagationService:
+    """Applies SubscriptionPlan.courses edits to existing subscribers.
+
+    Editing a plan's course list only records a job with the added and
+    removed course ids; the job then walks the plan's live transactions in
+    PROPAGATION_CHUNK_SIZE keyset chunks, issuing one DELETE for the
+    removed courses and one INSERT ... SELECT per added course per chunk,
+    and commits its progress after each chunk. Both statements are
+    idempotent, so a job interrupted by a restart simply runs again.
+    Jobs run one at a time in creation order, so successive edits of the
+    same plan apply in sequence.
+    """
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _subscribers(plan_id: int, plan_name: Optional[str], now: datetime):
+        tx = transactions_table.c
+        return and_(
+            tx.status == "captured",
+            tx.user_id.isnot(None),
+            or_(tx.valid_until.is_(None), tx.valid_until > now),
+            or_(tx.subscription_plan_id == plan_id,
+                and_(tx.subscription_plan_id.is_(None), tx.plan_name == plan_name)),
+        )
+
+    @staticmethod
+    def _apply_chunk(db: Session, ids: List[int], added: List[int], removed: List[int], now: datetime):
+        tx = transactions_table.c
+        ent = entitlements_table.c
+        if removed:
+            db.execute(delete(entitlements_table).where(
+                ent.source == SOURCE_TRANSACTION,
+                ent.source_id.in_(ids),
+                ent.course_id.in_(removed),
+            ))
+        for course_id in added:
+            already_granted = exists().where(
+                ent.source == SOURCE_TRANSACTION, ent.source_id == tx.id, ent.course_id == course_id,
+            )
+            db.execute(entitlements_table.insert().from_select(
+                ["user_id", "course_id", "source", "source_id", "valid_until", "created_at"],
+                select(tx.user_id, literal(course_id), literal(SOURCE_TRANSACTION), tx.id,
+                       tx.valid_until, literal(now)).where(tx.id.in_(ids), ~already_granted),
+            ))
+        user_ids = db.execute(select(tx.user_id).where(tx.id.in_(ids)).distinct()).scalars().all()
+        EntitlementService.touch(db, user_ids)
+
+    @staticmethod
+    def run(db: Session, job: Job):
+        plan = db.get(models.SubscriptionPlan, job.plan_id)
+        added, removed = course_ids(job.added_courses), course_ids(job.removed_courses)
+        now = datetime.utcnow()
+        job.status = "running"
+        job.started_at = now
+        job.processed = 0
+        if plan is None:
+            job.total = 0
+        else:
+            subscribers = PlanPropagationService._subscribers(plan.id, plan.name, now)
+            job.total = db.execute(select(func.count()).where(subscribers)).scalar()
+        db.commit()
+
+        last_id = 0
+        while plan is not None:
+            rows = db.execute(
+                select(transactions_table.c.id, transactions_table.c.subscription_plan_id,
+                       transactions_table.c.courses).where(
+                    transactions_table.c.id > last_id, subscribers,
+                ).order_by(transactions_table.c.id).limit(PROPAGATION_CHUNK_SIZE)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            # Transactions matched by plan name only follow the plan when they list no courses
+            ids = [row.id for row in rows if row.subscription_plan_id == plan.id or not course_ids(row.courses)]
+            if ids:
+                PlanPropagationService._apply_chunk(db, ids, added, removed, now)
+            job.processed += len(rows)
+            db.commit()
+
+        job.status = "completed"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        logger.info(f"Propagated plan {job.plan_id} course changes (+{added} -{removed}) "
+                    f"to {job.processed} subscriptions")
+
+    @staticmethod
+    def run_pending(db: Session) -> int:
+        """Run queued jobs oldest first; returns how many ran"""
+        ran = 0
+        with PlanPropagationService._lock:
+            while True:
+                # A job left "running" by a restart is picked up again
+                job = db.query(Job).filter(Job.status.in_(("pending", "running"))).order_by(Job.id).first()
+                if job is None:
+                    return ran
+                try:
+                    PlanPropagationService.run(db, job)
+                except Exception as e:
+                    db.rollback()
+                    job.status = "failed"
+                    job.error = str(e)
+                    job.finished_at = datetime.utcnow()
+                    db.commit()
+                    logger.error(f"Entitlement propagation job {job.id} failed: {e}")
+                ran += 1
+
+    @staticmethod
+    def run_pending_in_new_session(session_factory) -> int:
+        db = session_factory()
+        try:
+            return PlanPropagationService.run_pending(db)
+        finally:
+            db.close()
+
+    @staticmethod
+    def serialize(job: Job) -> dict:
+        return {
+            "id": job.id,
+            "plan_id": job.plan_id,
+            "added_courses": job.added_courses or [],
+            "removed_courses": job.removed_courses or [],
+            "status": job.status,
+            "total": job.total or 0,
+            "processed": job.processed or 0,
+            "progress": round((job.processed or 0) / job.total, 4) if job.total else
+                        (1.0 if job.status == "completed" else 0.0),
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+
+# Load the previous course list on assignment so the diff below is exact
+models.track_history(models.SubscriptionPlan.courses)
+
+
+# Editing a plan's course list queues a job in the same transaction as the edit
+@event.listens_for(models.SubscriptionPlan, "after_update")
+def _on_plan_update(mapper, connection, target):
+    if not inspect(target).attrs.courses.history.has_changes():
+        return
+    old = set(course_ids(models.previous_value(target, "courses")))
+    new = set(course_ids(target.courses))
+    if old == new:
+        return
+    connection.execute(jobs_table.insert().values(
+        plan_id=target.id,
+        added_courses=sorted(new - old),
+        removed_courses=sorted(old - new),
+        status="pending",
+        total=0,
+        processed=0,
+        created_at=datetime.utcnow(),
+    ))
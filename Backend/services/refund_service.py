@@ -0,0 +1,208 @@
+# services/refund_service.py
+import logging
+from datetime import datetime
+from typing import Optional, Sequence
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.orm import Session
+
+import models
+from services.mrr_service import MrrService
+from services.revenue_series_service import RevenueSeriesService
+from services.revenue_service import RevenueService
+
+logger = logging.getLogger(__name__)
+
+Transaction = models.Transaction
+Ledger = models.RefundLedgerEntry
+ledger_table = Ledger.__table__
+transactions_table = Transaction.__table__
+
+
+class RefundService:
+    """Refunds recorded in refund_ledger against the transaction they pay back.
+
+    A transaction can take several ledger entries (partial refunds) up to
+    its amount; the entry that exhausts it marks the transaction refunded,
+    which also revokes its course entitlements. Plan revenue follows the
+    ledger through the RevenueService flush events, so approving a refund
+    and adjusting the aggregates happen in one commit.
+    """
+
+    @staticmethod
+    def ensure_schema(bind):
+        # create_all does not add columns or indexes to tables that already exist
+        columns = {column["name"] for column in inspect(bind).get_columns("refund_requests")}
+        if "transaction_id" not in columns:
+            with bind.begin() as connection:
+                connection.execute(text(
+                    "ALTER TABLE refund_requests ADD COLUMN transaction_id INTEGER REFERENCES transactions(id)"
+                ))
+        for index in models.RefundRequest.__table__.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+    @staticmethod
+    def refunded(db: Session, transaction_id: int) -> int:
+        return RevenueService.refunded_total(db.connection(), transaction_id)
+
+    @staticmethod
+    def lock_transaction(db: Session, transaction: Transaction):
+        """Hold the transaction's row until the caller commits and reload it"""
+        if db.get_bind().dialect.name == "sqlite":
+            # SQLite ignores FOR UPDATE; a no-op UPDATE takes the database write lock instead
+            db.execute(transactions_table.update().where(transactions_table.c.id == transaction.id)
+                       .values(id=transactions_table.c.id))
+        db.refresh(transaction, with_for_update=True)
+
+    @staticmethod
+    def find_transaction(db: Session, user_id: str, plan_name: Optional[str], amount: Optional[int],
+                         statuses: Sequence[str] = ("captured",)) -> Optional[Transaction]:
+        """The transaction a refund request most likely refers to, for requests that do not name one.
+
+        Only the user's own transactions are read (transactions.user_id is
+        indexed); an exact plan and amount match wins over a plan match
+        large enough to cover the amount, newest first.
+        """
+        candidates = db.query(Transaction).filter(
+            Transaction.user_id == user_id,
+            Transaction.status.in_(statuses),
+        ).order_by(Transaction.date.desc(), Transaction.id.desc()).all()
+        same_plan = [tx for tx in candidates if tx.plan_name == plan_name]
+        for tx in same_plan:
+            if tx.amount == amount:
+                return tx
+        for tx in same_plan:
+            if amount is not None and (tx.amount or 0) >= amount:
+                return tx
+        return None
+
+    @staticmethod
+    def refund(db: Session, transaction: Transaction, amount: int, reason: Optional[str] = None,
+               processed_by: Optional[str] = None, refund_request: Optional[models.RefundRequest] = None) -> Ledger:
+        """Add a ledger entry; the caller commits"""
+        if amount is None or amount <= 0:
+            raise ValueError("Refund amount must be positive")
+        # Concurrent refunds of the same transaction queue here, so each one
+        # reads a refunded total that includes every committed entry
+        RefundService.lock_transaction(db, transaction)
+        if transaction.status != "captured":
+            raise ValueError(f"Transaction {transaction.id} is {transaction.status}, not captured")
+        remaining = (transaction.amount or 0) - RefundService.refunded(db, transaction.id)
+        if amount > remaining:
+            raise ValueError(f"Refund of {amount} exceeds the {remaining} left on transaction {transaction.id}")
+
+        entry = Ledger(
+            transaction_id=transaction.id,
+            refund_request_id=refund_request.id if refund_request is not None else None,
+            user_id=transaction.user_id,
+            plan_name=transaction.plan_name,
+            amount=amount,
+            reason=reason,
+            processed_by=processed_by,
+            created_at=datetime.utcnow(),
+        )
+        db.add(entry)
+        if amount == remaining:
+            transaction.status = "refunded"
+        return entry
+
+    @staticmethod
+    def approve(db: Session, refund_request: models.RefundRequest) -> Ledger:
+        """Pay out an approved refund request against its transaction; the caller commits"""
+        existing = db.query(Ledger).filter(Ledger.refund_request_id == refund_request.id).first()
+        if existing is not None:
+            return existing
+        if refund_request.transaction_id is None:
+            transaction = RefundService.find_transaction(
+                db, refund_request.user_id, refund_request.plan_name, refund_request.amount)
+            if transaction is None:
+                raise ValueError("No captured transaction matches this refund request")
+            refund_request.transaction_id = transaction.id
+        else:
+            transaction = db.get(Transaction, refund_request.transaction_id)
+            if transaction is None:
+                raise ValueError(f"Transaction {refund_request.transaction_id} not found")
+        return RefundService.refund(db, transaction, refund_request.amount, refund_request.reason,
+                                    refund_request.processed_by, refund_request)
+
+    @staticmethod
+    def summary(db: Session, transaction: Transaction) -> dict:
+        entries = db.query(Ledger).filter(Ledger.transaction_id == transaction.id).order_by(Ledger.id).all()
+        refunded = sum(entry.amount for entry in entries)
+        return {
+            "transaction_id": transaction.id,
+            "status": transaction.status,
+            "amount": transaction.amount,
+            "refunded": refunded,
+            "remaining": max((transaction.amount or 0) - refunded, 0),
+            "entries": entries,
+        }
+
+    @staticmethod
+    def backfill(db: Session) -> dict:
+        """Record ledger entries for refunds made before the ledger existed
+
+        Only rows the ledger does not cover yet are read: approved requests
+        without an entry and refunded transactions whose entries fall short of
+        the amount. Once the backfill has run, a startup reads neither.
+        """
+        recorded = select(Ledger.refund_request_id).where(Ledger.refund_request_id.isnot(None))
+        requests = db.query(models.RefundRequest).filter(
+            models.RefundRequest.status.in_(("approved", "processed")),
+            models.RefundRequest.id.notin_(recorded),
+        ).order_by(models.RefundRequest.id).all()
+        linked = 0
+        for request in requests:
+            if request.transaction_id is None:
+                # Requests approved before the ledger existed already flipped their transaction to refunded
+                transaction = RefundService.find_transaction(
+                    db, request.user_id, request.plan_name, request.amount, ("refunded", "captured"))
+                if transaction is not None:
+                    request.transaction_id = transaction.id
+                    linked += 1
+        db.flush()
+
+        ledger_total = select(func.coalesce(func.sum(Ledger.amount), 0)).where(
+            Ledger.transaction_id == Transaction.id).scalar_subquery()
+        # Transactions marked refunded by hand were refunded in full
+        short = db.query(Transaction.id).filter(
+            Transaction.status == "refunded", ledger_total < Transaction.amount).order_by(Transaction.id).all()
+        transaction_ids = sorted({request.transaction_id for request in requests if request.transaction_id}
+                                 | {transaction_id for transaction_id, in short})
+        amounts = {}
+        refunded = {}
+        for offset in range(0, len(transaction_ids), 500):
+            chunk = transaction_ids[offset:offset + 500]
+            for tx in db.query(Transaction.id, Transaction.amount, Transaction.user_id, Transaction.plan_name).filter(
+                    Transaction.id.in_(chunk)):
+                amounts[tx.id] = (tx.amount or 0, tx.user_id, tx.plan_name)
+            refunded.update(db.query(Ledger.transaction_id, func.sum(Ledger.amount)).filter(
+                Ledger.transaction_id.in_(chunk)).group_by(Ledger.transaction_id).all())
+        rows = []
+
+        def record(transaction_id, amount, **fields):
+            total, user_id, plan_name = amounts[transaction_id]
+            amount = min(amount or 0, total - refunded.get(transaction_id, 0))
+            if amount > 0:
+                refunded[transaction_id] = refunded.get(transaction_id, 0) + amount
+                rows.append({"transaction_id": transaction_id, "user_id": user_id, "plan_name": plan_name,
+                             "amount": amount, "created_at": datetime.utcnow(), **fields})
+
+        for request in requests:
+            if request.transaction_id in amounts:
+                record(request.transaction_id, request.amount, refund_request_id=request.id,
+                       reason=request.reason, processed_by=request.processed_by)
+        for transaction_id, in short:
+            record(transaction_id, amounts[transaction_id][0], refund_request_id=None, reason="backfill",
+                   processed_by=None)
+
+        if rows:
+            db.execute(ledger_table.insert(), rows)
+        db.commit()
+        if linked or rows:
+            # Bulk inserts skip the flush events; recount the plan aggregates, MRR and revenue buckets once
+            RevenueService.update_all_plans_revenue(db)
+            MrrService.rebuild(db)
+            RevenueSeriesService.reconcile(db)
+            logger.info(f"Refund backfill: linked {linked} requests, recorded {len(rows)} ledger entries")
+        return {"linked": linked, "ledger_entries": len(rows)}
@@ -0,0 +1,296 @@
+# services/retention_service.py
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import String, cast, event, inspect, select
+from sqlalchemy.orm import Session
+
+import models
+
+GRANULARITIES = ("week", "month")
+# Periods kept per cohort; requests may ask for fewer
+MAX_PERIODS = {"week": 156, "month": 60}
+# Longest cohort range a single request may ask for, in months
+MAX_COHORTS = 120
+CACHE_TTL_SECONDS = float(os.getenv("RETENTION_CACHE_TTL_SECONDS", "3600"))
+FETCH_BATCH = 100000
+
+users_table = models.User.__table__
+activities_table = models.UserActivity.__table__
+
+
+def month_number(day: date) -> int:
+    return day.year * 12 + day.month - 1
+
+
+def month_label(number: int) -> str:
+    return f"{number // 12:04d}-{number % 12 + 1:02d}"
+
+
+def _days(values) -> np.ndarray:
+    """ISO date strings as int64 days since the epoch"""
+    return np.array(values, dtype="datetime64[D]").astype(np.int64)
+
+
+def _months(days: np.ndarray) -> np.ndarray:
+    """Days since the epoch as int64 month numbers (year * 12 + month - 1)"""
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) + 1970 * 12
+
+
+def period_offsets(activity_days: np.ndarray, join_days: np.ndarray, granularity: str) -> np.ndarray:
+    """Periods between each user's join date and an activity: whole weeks, or calendar months"""
+    if granularity == "week":
+        return (activity_days - join_days) // 7
+    return _months(activity_days) - _months(join_days)
+
+
+def retention_counts(users: np.ndarray, cohorts: np.ndarray, offsets: np.ndarray,
+                     n_cohorts: int, periods: int) -> np.ndarray:
+    """Distinct active users per (cohort, period) as an n_cohorts x periods matrix.
+
+    users, cohorts and offsets describe one activity each. users are integer
+    codes; rows arrive sorted by (user, offset) when read in (user_id,
+    activity_date) order, in which case duplicates are dropped in one pass
+    over adjacent keys, otherwise the keys are sorted first. Activity before
+    joining or past the last period is ignored.
+    """
+    keep = (offsets >= 0) & (offsets < periods)
+    users, cohorts, offsets = users[keep], cohorts[keep], offsets[keep]
+    keys = users.astype(np.int64) * periods + offsets
+    if keys.size > 1 and (keys[1:] < keys[:-1]).any():
+        order = np.argsort(keys, kind="stable")
+        keys, cohorts = keys[order], cohorts[order]
+    first = np.ones(keys.size, dtype=bool)
+    np.not_equal(keys[1:], keys[:-1], out=first[1:])
+    cells = cohorts[first].astype(np.int64) * periods + keys[first] % periods
+    return np.bincount(cells, minlength=n_cohorts * periods).reshape(n_cohorts, periods)
+
+
+def observable_periods(cohort: int, granularity: str, today: date) -> int:
+    """Periods that have started for the first members of a cohort"""
+    if granularity == "week":
+        first_day = date(cohort // 12, cohort % 12 + 1, 1)
+        return (today - first_day).days // 7 + 1
+    return month_number(today) - cohort + 1
+
+
+class RetentionCache:
+    """Cohort rows keyed by (granularity, cohort month number).
+
+    A row holds the cohort size and its distinct active users for each of
+    the MAX_PERIODS periods. Rows expire after ttl seconds and are dropped
+    when activity or join dates change for their cohort. Every invalidation
+    bumps a generation counter; rows computed from a read that started
+    before an invalidation are not cached.
+    """
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, int], Tuple[float, int, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, granularity: str, cohort: int) -> Optional[Tuple[int, np.ndarray]]:
+        with self._lock:
+            entry = self._entries.get((granularity, cohort))
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, granularity: str, cohort: int, size: int, counts: np.ndarray, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[(granularity, cohort)] = (time.monotonic(), size, counts)
+
+    def invalidate(self, cohorts: Iterable[int]):
+        with self._lock:
+            self.generation += 1
+            for cohort in cohorts:
+                for granularity in GRANULARITIES:
+                    self._entries.pop((granularity, cohort), None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+retention_cache = RetentionCache(ttl=CACHE_TTL_SECONDS)
+
+
+class RetentionService:
+    """Cohort retention from user_activities.
+
+    Users are grouped by the month of their join_date; period 0 is the week
+    or calendar month they joined in. A user is retained in a period if
+    they have any activity in it.
+    """
+
+    @staticmethod
+    def ensure_index(bind):
+        # create_all does not add indexes to a table that already exists
+        for index in activities_table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+    @staticmethod
+    def cohorts_for_users(connection, user_ids: Iterable[str]) -> Set[int]:
+        """Month numbers of the cohorts the given users joined in"""
+        user_ids = list(set(user_ids))
+        cohorts = set()
+        for offset in range(0, len(user_ids), 500):
+            cohorts.update(
+                month_number(join_date) for (join_date,) in connection.execute(
+                    select(users_table.c.join_date).distinct().where(
+                        users_table.c.id.in_(user_ids[offset:offset + 500]),
+                        users_table.c.join_date.is_not(None)))
+            )
+        return cohorts
+
+    @staticmethod
+    def queue_invalidation(session: Session, cohorts: Iterable[int]):
+        """Drop these cohorts from the cache once the session commits"""
+        session.info.setdefault("retention_cohorts", set()).update(cohorts)
+
+    # ---------- computing ----------
+
+    @staticmethod
+    def compute(db: Session, first: int, last: int, granularity: str) -> Dict[int, Tuple[int, np.ndarray]]:
+        """Size and active users per period for every cohort from month number first to last"""
+        periods = MAX_PERIODS[granularity]
+        n_cohorts = last - first + 1
+        start = date(first // 12, first % 12 + 1, 1)
+        end = date((last + 1) // 12, (last + 1) % 12 + 1, 1)
+        in_range = (users_table.c.join_date >= start) & (users_table.c.join_date < end)
+        # Dates are read as ISO strings, which NumPy parses far faster than date objects
+        join_date = cast(users_table.c.join_date, String)
+
+        join_dates = db.execute(select(join_date).where(in_range)).scalars().all()
+        sizes = np.bincount(_months(_days(join_dates)) - first, minlength=n_cohorts)
+
+        counts = np.zeros((n_cohorts, periods), dtype=np.int64)
+        result = db.execute(
+            select(activities_table.c.user_id, cast(activities_table.c.activity_date, String), join_date)
+            .select_from(activities_table.join(users_table, users_table.c.id == activities_table.c.user_id))
+            .where(in_range)
+            .order_by(activities_table.c.user_id, activities_table.c.activity_date)
+            .execution_options(yield_per=FETCH_BATCH)
+        )
+        # Users are numbered in read order. A user split across two batches keeps its
+        # number, and rows repeating the (user, period) the last batch ended on are dropped
+        next_code, last_user, last_key = 0, None, (-1, 0)
+        for batch in result.partitions():
+            user_ids, activity_dates, joined = zip(*batch)
+            ids = np.array(user_ids, dtype=object)
+            changed = np.empty(ids.size, dtype=bool)
+            changed[0] = ids[0] != last_user
+            np.not_equal(ids[1:], ids[:-1], out=changed[1:])
+            users = next_code + np.cumsum(changed) - 1
+
+            join_days = _days(joined)
+            offsets = period_offsets(_days(activity_dates), join_days, granularity)
+            fresh = (users != last_key[0]) | (offsets != last_key[1])
+            next_code, last_user, last_key = int(users[-1]) + 1, ids[-1], (users[-1], offsets[-1])
+            counts += retention_counts(users[fresh], _months(join_days[fresh]) - first, offsets[fresh],
+                                       n_cohorts, periods)
+        return {first + i: (int(sizes[i]), counts[i]) for i in range(n_cohorts)}
+
+    # ---------- reading ----------
+
+    @staticmethod
+    def matrix(db: Session, start: date, end: date, granularity: str = "month",
+               periods: Optional[int] = None, today: Optional[date] = None) -> dict:
+        """Retention of the cohorts that joined from start's month to end's month inclusive.
+
+        Raises ValueError for unknown granularities, reversed or overlong
+        cohort ranges and period counts outside 1..MAX_PERIODS.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        limit = MAX_PERIODS[granularity]
+        periods = periods or limit
+        if not 1 <= periods <= limit:
+            raise ValueError(f"periods must be between 1 and {limit} for {granularity} retention")
+        first, last = month_number(start), month_number(end)
+        if last < first:
+            raise ValueError("end must not be before start")
+        if last - first + 1 > MAX_COHORTS:
+            raise ValueError(f"at most {MAX_COHORTS} cohorts can be requested at once")
+        today = today or date.today()
+
+        rows = {}
+        missing = []
+        for cohort in range(first, last + 1):
+            cached = retention_cache.get(granularity, cohort)
+            if cached is None:
+                missing.append(cohort)
+            else:
+                rows[cohort] = cached
+        if missing:
+            generation = retention_cache.generation
+            computed = RetentionService.compute(db, missing[0], missing[-1], granularity)
+            for cohort in missing:
+                size, counts = computed[cohort]
+                retention_cache.put(granularity, cohort, size, counts, generation)
+                rows[cohort] = (size, counts)
+
+        cohorts = []
+        for cohort in range(first, last + 1):
+            size, counts = rows[cohort]
+            visible = max(0, min(periods, observable_periods(cohort, granularity, today)))
+            active = counts[:visible]
+            cohorts.append({
+                "cohort": month_label(cohort),
+                "users": size,
+                "active": active.tolist(),
+                "retention": (np.round(active * 100.0 / size, 2) if size else np.zeros(visible)).tolist(),
+            })
+        return {"granularity": granularity, "periods": periods, "cohorts": cohorts}
+
+
+# Keep cached cohorts in step with activity and join dates written through the ORM.
+# Cohorts are resolved while the flush can still query and dropped from the
+# cache only once the data is committed, so a read in between cannot cache
+# the old rows again.
+
+@event.listens_for(Session, "after_flush")
+def _queue_changed_cohorts(session, flush_context):
+    user_ids = set()
+    cohorts = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.UserActivity):
+            user_ids.add(obj.user_id)
+        elif isinstance(obj, models.User):
+            history = inspect(obj).attrs.join_date.history
+            if obj in session.new or obj in session.deleted or history.has_changes():
+                cohorts.update(month_number(value) for value in [obj.join_date, *history.deleted] if value)
+    if user_ids:
+        cohorts |= RetentionService.cohorts_for_users(session.connection(), user_ids)
+    if cohorts:
+        RetentionService.queue_invalidation(session, cohorts)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    cohorts = session.info.pop("retention_cohorts", None)
+    if cohorts:
+        retention_cache.invalidate(cohorts)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("retention_cohorts", None)
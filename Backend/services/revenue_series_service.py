@@ -0,0 +1,392 @@
+# services/revenue_series_service.py
+import os
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, event, false, func, insert, inspect, select, text, update
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("REVENUE_BUCKET_RECONCILE_INTERVAL_SECONDS", "21600"))
+
+GRANULARITIES = ("day", "week", "month", "quarter", "year")
+DIMENSIONS = {"plan": "plan_name", "type": "type", "exam": "exam"}
+# Longest series a single request may ask for
+MAX_PERIODS = 5000
+UNKNOWN = "unknown"
+EMPTY = (0, 0, 0)
+
+Bucket = models.RevenueDailyBucket
+buckets_table = Bucket.__table__
+transactions_table = models.Transaction.__table__
+users_table = models.User.__table__
+ledger_table = models.RefundLedgerEntry.__table__
+
+TRANSACTION_FIELDS = ("user_id", "status", "amount", "plan_name", "type", "date")
+
+
+def contribution(status, amount, refunded) -> Tuple[int, int, int]:
+    """(gross, refunded, transactions) a transaction adds to its day's bucket"""
+    amount = amount or 0
+    if status == "captured":
+        return amount, min(refunded or 0, amount), 1
+    if status == "refunded":
+        # Refunded in full, whether or not the ledger has the entries
+        return amount, amount, 1
+    return 0, 0, 0
+
+
+def period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "quarter":
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if granularity == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_period(start: date, granularity: str) -> date:
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(days=7)
+    months = {"month": 1, "quarter": 3, "year": 12}[granularity]
+    index = start.year * 12 + start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def period_label(start: date, granularity: str) -> str:
+    if granularity == "week":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == "month":
+        return start.strftime("%Y-%m")
+    if granularity == "quarter":
+        return f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+    if granularity == "year":
+        return str(start.year)
+    return start.isoformat()
+
+
+class RevenueSeriesService:
+    """Revenue over time from revenue_daily_buckets.
+
+    Each captured (or refunded) transaction adds its amount, its refunds
+    and a count of one to the bucket for its day, plan, gateway and the
+    buyer's exam. Transaction and refund ledger writes move the buckets
+    inside the same flush, so a series over any range reads at most one
+    row per day and dimension value, whatever the number of transactions,
+    and never touches the transactions table. Periods without revenue are
+    filled with zeros. Bulk writes bypass the events; reconcile() runs
+    periodically to repair any drift.
+    """
+
+    # ---------- maintenance ----------
+
+    @staticmethod
+    def apply_delta(connection, day: Optional[date], plan_name, type_, exam, gross: int, refunded: int,
+                    transactions: int):
+        if day is None or not (gross or refunded or transactions):
+            return
+        key = {"day": day, "plan_name": plan_name or UNKNOWN, "type": type_ or UNKNOWN, "exam": exam or UNKNOWN}
+        increments = {"gross": gross, "refunded": refunded, "transactions": transactions}
+        result = connection.execute(
+            update(buckets_table).where(and_(*(buckets_table.c[column] == value for column, value in key.items())))
+            .values({column: buckets_table.c[column] + amount for column, amount in increments.items()})
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(buckets_table).values(**key, **increments))
+
+    @staticmethod
+    def _exam(connection, user_id) -> Optional[str]:
+        if user_id is None:
+            return None
+        return connection.execute(select(users_table.c.exam_type).where(users_table.c.id == user_id)).scalar()
+
+    @staticmethod
+    def _refunded(connection, transaction_id) -> int:
+        return connection.execute(
+            select(func.coalesce(func.sum(ledger_table.c.amount), 0)).where(
+                ledger_table.c.transaction_id == transaction_id)
+        ).scalar()
+
+    @staticmethod
+    def _actual(connection, first: Optional[date] = None, last: Optional[date] = None) -> Dict[tuple, tuple]:
+        """Buckets recomputed from transactions with one GROUP BY, optionally for days first..last only"""
+        tx = transactions_table.c
+        refunds = select(ledger_table.c.transaction_id, func.sum(ledger_table.c.amount).label("amount")).group_by(
+            ledger_table.c.transaction_id).subquery()
+        amount = func.coalesce(tx.amount, 0)
+        refunded = case(
+            (tx.status == "refunded", amount),
+            (func.coalesce(refunds.c.amount, 0) > amount, amount),
+            else_=func.coalesce(refunds.c.amount, 0),
+        )
+        day = func.date(tx.date)
+        plan_name, type_, exam = (
+            case((func.coalesce(column, "") == "", UNKNOWN), else_=column)
+            for column in (tx.plan_name, tx.type, users_table.c.exam_type)
+        )
+        query = (
+            select(day, plan_name, type_, exam, func.sum(amount), func.sum(refunded), func.count())
+            .select_from(transactions_table)
+            .outerjoin(users_table, users_table.c.id == tx.user_id)
+            .outerjoin(refunds, refunds.c.transaction_id == tx.id)
+            .where(tx.status.in_(("captured", "refunded")), tx.date.isnot(None))
+            .group_by(day, plan_name, type_, exam)
+        )
+        if first is not None:
+            query = query.where(tx.date >= datetime.combine(first, time.min),
+                                tx.date < datetime.combine(last + timedelta(days=1), time.min))
+        rows = connection.execute(query)
+        result = {}
+        for day_value, plan_value, type_value, exam_value, gross, refunded_total, count in rows:
+            if isinstance(day_value, str):
+                day_value = date.fromisoformat(day_value)
+            result[(day_value, plan_value, type_value, exam_value)] = (gross or 0, refunded_total or 0, count)
+        return result
+
+    @staticmethod
+    def _drifted(connection, first: Optional[date] = None, last: Optional[date] = None):
+        """(actual buckets, keys whose stored bucket disagrees), optionally for days first..last only"""
+        actual = RevenueSeriesService._actual(connection, first, last)
+        query = select(buckets_table)
+        if first is not None:
+            query = query.where(buckets_table.c.day >= first, buckets_table.c.day <= last)
+        stored = {
+            (row.day, row.plan_name, row.type, row.exam): (row.gross, row.refunded, row.transactions)
+            for row in connection.execute(query)
+        }
+        drifted = [key for key in actual.keys() | stored.keys() if actual.get(key, EMPTY) != stored.get(key, EMPTY)]
+        return actual, drifted
+
+    @staticmethod
+    def _lock_buckets(db: Session):
+        """Keep transaction writers out of the buckets until the caller commits"""
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            db.execute(text(f"LOCK TABLE {buckets_table.name} IN EXCLUSIVE MODE"))
+        elif dialect == "sqlite":
+            # SQLite takes its single write lock at the first write; an UPDATE matching nothing takes it now
+            db.execute(update(buckets_table).where(false()).values(gross=buckets_table.c.gross))
+
+    @staticmethod
+    def reconcile(db: Session) -> int:
+        """Rewrite the buckets that disagree with the transactions; returns how many were repaired
+
+        The first comparison runs without locks and only narrows down the
+        days to look at. Those days are compared again with the writers
+        locked out before any bucket is rewritten, so an increment committed
+        in between is counted instead of overwritten.
+        """
+        _, drifted = RevenueSeriesService._drifted(db.connection())
+        if not drifted:
+            db.commit()
+            return 0
+        days = sorted(key[0] for key in drifted)
+        RevenueSeriesService._lock_buckets(db)
+        actual, drifted = RevenueSeriesService._drifted(db.connection(), days[0], days[-1])
+        for key in drifted:
+            day, plan_name, type_, exam = key
+            db.execute(delete(buckets_table).where(
+                buckets_table.c.day == day, buckets_table.c.plan_name == plan_name,
+                buckets_table.c.type == type_, buckets_table.c.exam == exam,
+            ))
+            if key in actual:
+                gross, refunded, count = actual[key]
+                db.execute(insert(buckets_table).values(
+                    day=day, plan_name=plan_name, type=type_, exam=exam,
+                    gross=gross, refunded=refunded, transactions=count,
+                ))
+        db.commit()
+        if drifted:
+            logger.info(f"Reconciled {len(drifted)} revenue buckets")
+        return len(drifted)
+
+    @staticmethod
+    def ensure_populated(db: Session):
+        if db.query(Bucket.id).first() is None and db.query(models.Transaction.id).filter(
+            models.Transaction.status.in_(("captured", "refunded"))
+        ).first() is not None:
+            RevenueSeriesService.reconcile(db)
+
+    @staticmethod
+    def _reconcile_in_new_session(session_factory) -> int:
+        db = session_factory()
+        try:
+            return RevenueSeriesService.reconcile(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    async def run_loop(session_factory):
+        """Reconcile every RECONCILE_INTERVAL_SECONDS until cancelled"""
+        while True:
+            await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(RevenueSeriesService._reconcile_in_new_session, session_factory)
+            except Exception as e:
+                logger.error(f"Revenue bucket reconciliation failed: {e}")
+
+    # ---------- reading ----------
+
+    @staticmethod
+    def series(db: Session, start: date, end: date, granularity: str = "day",
+               group_by: Optional[str] = None) -> dict:
+        """Revenue per period from start to end, optionally broken down by plan, type or exam.
+
+        The first period is counted in full from its own start, which the
+        response reports as "start"; the last one runs up to end.
+
+        Raises ValueError for unknown granularities or dimensions and for
+        ranges that are reversed or longer than MAX_PERIODS periods.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        if group_by is not None and group_by not in DIMENSIONS:
+            raise ValueError(f"group_by must be one of {', '.join(DIMENSIONS)}")
+        if end < start:
+            raise ValueError("end is before start")
+
+        periods = []
+        current = period_start(start, granularity)
+        while current <= end:
+            periods.append(current)
+            if len(periods) > MAX_PERIODS:
+                raise ValueError(f"Range spans more than {MAX_PERIODS} periods; use a coarser granularity")
+            current = next_period(current, granularity)
+        index = {period: i for i, period in enumerate(periods)}
+
+        b = buckets_table.c
+        dimension = b[DIMENSIONS[group_by]] if group_by else None
+        columns = [b.day] + ([dimension] if dimension is not None else [])
+        rows = db.execute(
+            select(*columns, func.sum(b.gross), func.sum(b.refunded), func.sum(b.transactions))
+            .where(b.day >= periods[0], b.day <= end)
+            .group_by(*columns)
+        )
+
+        def empty():
+            return [[0, 0, 0] for _ in periods]
+
+        totals = empty()
+        breakdown: Dict[str, List[List[int]]] = {}
+        for row in rows:
+            sums = row[-3:]
+            if not any(sums):
+                continue  # emptied by refunds, deletes or moves
+            i = index[period_start(row[0], granularity)]
+            targets = [totals, breakdown.setdefault(row[1], empty())] if group_by else [totals]
+            for target in targets:
+                for j, value in enumerate(sums):
+                    target[i][j] += value or 0
+
+        data = []
+        for i, period in enumerate(periods):
+            gross, refunded, count = totals[i]
+            entry = {
+                "period": period.isoformat(),
+                "label": period_label(period, granularity),
+                "revenue": gross - refunded,
+                "gross": gross,
+                "refunded": refunded,
+                "transactions": count,
+            }
+            if group_by:
+                entry["breakdown"] = {key: values[i][0] - values[i][1] for key, values in sorted(breakdown.items())}
+            data.append(entry)
+        return {
+            "start": periods[0].isoformat(),
+            "end": end.isoformat(),
+            "granularity": granularity,
+            "group_by": group_by,
+            "total_revenue": sum(entry["revenue"] for entry in data),
+            "data": data,
+        }
+
+
+# ---------- applying writes inside the same flush ----------
+
+models.track_history(*(getattr(models.Transaction, field) for field in TRANSACTION_FIELDS), models.User.exam_type)
+
+
+def _day(value) -> Optional[date]:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _apply(connection, target, sign: int, refunded: int, previous: bool = False):
+    value = (lambda field: models.previous_value(target, field)) if previous else (lambda field: getattr(target, field))
+    gross, refunded, count = contribution(value("status"), value("amount"), refunded)
+    RevenueSeriesService.apply_delta(
+        connection, _day(value("date")), value("plan_name"), value("type"),
+        RevenueSeriesService._exam(connection, value("user_id")),
+        sign * gross, sign * refunded, sign * count,
+    )
+
+
+@event.listens_for(models.Transaction, "after_insert")
+def _on_transaction_insert(mapper, connection, target):
+    _apply(connection, target, 1, 0)
+
+
+@event.listens_for(models.Transaction, "after_update")
+def _on_transaction_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if not any(attrs[field].history.has_changes() for field in TRANSACTION_FIELDS):
+        return
+    refunded = RevenueSeriesService._refunded(connection, target.id)
+    _apply(connection, target, -1, refunded, previous=True)
+    _apply(connection, target, 1, refunded)
+
+
+# insert=True: runs before the revenue listener deletes the transaction's ledger entries
+@event.listens_for(models.Transaction, "after_delete", insert=True)
+def _on_transaction_delete(mapper, connection, target):
+    _apply(connection, target, -1, RevenueSeriesService._refunded(connection, target.id), previous=True)
+
+
+@event.listens_for(models.RefundLedgerEntry, "after_insert")
+def _on_refund_recorded(mapper, connection, target):
+    tx = transactions_table.c
+    row = connection.execute(
+        select(tx.status, tx.amount, tx.plan_name, tx.type, tx.date, tx.user_id).where(tx.id == target.transaction_id)
+    ).first()
+    if row is None or row.status != "captured":
+        return
+    refunded = RevenueSeriesService._refunded(connection, target.transaction_id)
+    _, before, _ = contribution(row.status, row.amount, refunded - target.amount)
+    _, after, _ = contribution(row.status, row.amount, refunded)
+    RevenueSeriesService.apply_delta(connection, _day(row.date), row.plan_name, row.type,
+                                     RevenueSeriesService._exam(connection, row.user_id), 0, after - before, 0)
+
+
+@event.listens_for(models.User, "after_update")
+def _on_user_update(mapper, connection, target):
+    history = inspect(target).attrs.exam_type.history
+    if not history.has_changes():
+        return
+    previous = history.deleted[0] if history.deleted else None
+    if (previous or UNKNOWN) == (target.exam_type or UNKNOWN):
+        return
+    # Buckets follow the buyer's current exam; move this user's transactions across
+    tx = transactions_table.c
+    for row in connection.execute(
+        select(tx.id, tx.status, tx.amount, tx.plan_name, tx.type, tx.date).where(
+            tx.user_id == target.id, tx.status.in_(("captured", "refunded")))
+    ):
+        gross, refunded, count = contribution(row.status, row.amount,
+                                              RevenueSeriesService._refunded(connection, row.id))
+        for exam, sign in ((previous, -1), (target.exam_type, 1)):
+            RevenueSeriesService.apply_delta(connection, _day(row.date), row.plan_name, row.type, exam,
+                                             sign * gross, sign * refunded, sign * count)
@@ -1,38 +1,72 @@
 # services/revenue_service.py
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import event, func, inspect, select, update
 import models
 
+plans_table = models.SubscriptionPlan.__table__
+ledger_table = models.RefundLedgerEntry.__table__
+
+
+def net_amount(status, amount, refunded) -> int:
+    """What a transaction contributes to its plan's revenue"""
+    if status != 'captured':
+        return 0
+    return max((amount or 0) - (refunded or 0), 0)
+
+
 class RevenueService:
+    """SubscriptionPlan.revenue and .subscribers, kept in step with writes.
+
+    revenue is the captured amount net of refunds per plan name; it moves
+    with every transaction insert/update/delete and refund ledger entry,
+    inside the same flush. subscribers counts active users per plan name
+    and moves with user writes. update_all_plans_revenue() recomputes both
+    from scratch after bulk changes.
+    """
+
     @staticmethod
     def update_all_plans_revenue(db: Session):
         """Update revenue for all subscription plans based on transactions"""
-        plans = db.query(models.SubscriptionPlan).all()
-        
-        for plan in plans:
-            # Calculate total revenue for this plan from successful transactions
-            total_revenue = db.query(func.sum(models.Transaction.amount)).filter(
-                models.Transaction.plan_name == plan.name,
-                models.Transaction.status == 'captured'
-            ).scalar() or 0
-            
-            # Calculate number of subscribers for this plan
-            subscribers = db.query(models.User).filter(
-                models.User.subscription_plan == plan.name,
-                models.User.subscription_status == 'active'
-            ).count()
-            
-            plan.revenue = total_revenue
-            plan.subscribers = subscribers
-        
+        tx = models.Transaction
+        captured = dict(db.query(tx.plan_name, func.sum(tx.amount)).filter(
+            tx.status == 'captured'
+        ).group_by(tx.plan_name).all())
+        refunded = dict(db.query(tx.plan_name, func.sum(models.RefundLedgerEntry.amount)).join(
+            models.RefundLedgerEntry, models.RefundLedgerEntry.transaction_id == tx.id
+        ).filter(tx.status == 'captured').group_by(tx.plan_name).all())
+        subscribers = dict(db.query(models.User.subscription_plan, func.count()).filter(
+            models.User.subscription_status == 'active'
+        ).group_by(models.User.subscription_plan).all())
+
+        for plan in db.query(models.SubscriptionPlan).all():
+            plan.revenue = (captured.get(plan.name) or 0) - (refunded.get(plan.name) or 0)
+            plan.subscribers = subscribers.get(plan.name, 0)
+
         db.commit()
-    
+
     @staticmethod
-    def handle_transaction_status_change(db: Session, transaction_id: int, old_status: str, new_status: str):
-        """Handle revenue updates when transaction status changes"""
-        if old_status != new_status:
-            RevenueService.update_all_plans_revenue(db)
-    
+    def refunded_total(connection, transaction_id: int) -> int:
+        return connection.execute(
+            select(func.coalesce(func.sum(ledger_table.c.amount), 0)).where(
+                ledger_table.c.transaction_id == transaction_id)
+        ).scalar()
+
+    @staticmethod
+    def apply_revenue_delta(connection, plan_name, delta: int):
+        if plan_name and delta:
+            connection.execute(update(plans_table).where(plans_table.c.name == plan_name).values(
+                revenue=func.coalesce(plans_table.c.revenue, 0) + delta,
+                updated_at=plans_table.c.updated_at,
+            ))
+
+    @staticmethod
+    def apply_subscriber_delta(connection, plan_name, delta: int):
+        if plan_name and delta:
+            connection.execute(update(plans_table).where(plans_table.c.name == plan_name).values(
+                subscribers=func.coalesce(plans_table.c.subscribers, 0) + delta,
+                updated_at=plans_table.c.updated_at,
+            ))
+
     @staticmethod
     def get_subscription_stats(db: Session):
         """Get comprehensive subscription statistics"""
@@ -41,19 +75,95 @@ class RevenueService:
         active_plans = db.query(models.SubscriptionPlan).filter(
             models.SubscriptionPlan.is_active == True
         ).count()
-        
+
         # Calculate conversion rate (simplified)
         total_users = db.query(models.User).count()
         conversion_rate = (total_subscribers / total_users * 100) if total_users > 0 else 0
-        
-        # Calculate churn rate (simplified)
-        churn_rate = 2.3  # This would be calculated from historical data
-        
+
+        # Churn and MRR come from the monthly snapshots of the transaction ledger
+        from services.mrr_service import MrrService
+        mrr = MrrService.current(db)
+
         return {
             "total_revenue": total_revenue,
             "total_subscribers": total_subscribers,
             "conversion_rate": round(conversion_rate, 2),
-            "churn_rate": churn_rate,
+            "churn_rate": mrr["customer_churn_rate"],
             "active_plans": active_plans,
-            "monthly_recurring_revenue": total_revenue // 12
-        }
\ No newline at end of file
+            "monthly_recurring_revenue": mrr["mrr"]
+        }
+
+
+# ---------- applying writes inside the same flush ----------
+
+TRANSACTION_FIELDS = ("status", "amount", "plan_name")
+USER_FIELDS = ("subscription_status", "subscription_plan")
+
+
+models.track_history(*(getattr(models.Transaction, field) for field in TRANSACTION_FIELDS),
+                     *(getattr(models.User, field) for field in USER_FIELDS))
+
+
+@event.listens_for(models.Transaction, "after_insert")
+def _on_transaction_insert(mapper, connection, target):
+    RevenueService.apply_revenue_delta(connection, target.plan_name, net_amount(target.status, target.amount, 0))
+
+
+@event.listens_for(models.Transaction, "after_update")
+def _on_transaction_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if not any(attrs[field].history.has_changes() for field in TRANSACTION_FIELDS):
+        return
+    refunded = RevenueService.refunded_total(connection, target.id)
+    RevenueService.apply_revenue_delta(
+        connection, models.previous_value(target, "plan_name"),
+        -net_amount(models.previous_value(target, "status"), models.previous_value(target, "amount"), refunded))
+    RevenueService.apply_revenue_delta(
+        connection, target.plan_name, net_amount(target.status, target.amount, refunded))
+
+
+@event.listens_for(models.Transaction, "after_delete")
+def _on_transaction_delete(mapper, connection, target):
+    refunded = RevenueService.refunded_total(connection, target.id)
+    RevenueService.apply_revenue_delta(
+        connection, models.previous_value(target, "plan_name"),
+        -net_amount(models.previous_value(target, "status"), models.previous_value(target, "amount"), refunded))
+    connection.execute(ledger_table.delete().where(ledger_table.c.transaction_id == target.id))
+
+
+@event.listens_for(models.RefundLedgerEntry, "after_insert")
+def _on_refund_recorded(mapper, connection, target):
+    transactions = models.Transaction.__table__
+    row = connection.execute(
+        select(transactions.c.status, transactions.c.amount, transactions.c.plan_name).where(
+            transactions.c.id == target.transaction_id)
+    ).first()
+    if row is None or row.status != 'captured':
+        return
+    # The entry is already in the ledger, so subtract the change in net amount
+    refunded = RevenueService.refunded_total(connection, target.transaction_id)
+    delta = net_amount(row.status, row.amount, refunded) - net_amount(row.status, row.amount, refunded - target.amount)
+    RevenueService.apply_revenue_delta(connection, row.plan_name, delta)
+
+
+@event.listens_for(models.User, "after_insert")
+def _on_user_insert(mapper, connection, target):
+    if target.subscription_status == 'active':
+        RevenueService.apply_subscriber_delta(connection, target.subscription_plan, 1)
+
+
+@event.listens_for(models.User, "after_update")
+def _on_user_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if not any(attrs[field].history.has_changes() for field in USER_FIELDS):
+        return
+    if models.previous_value(target, "subscription_status") == 'active':
+        RevenueService.apply_subscriber_delta(connection, models.previous_value(target, "subscription_plan"), -1)
+    if target.subscription_status == 'active':
+        RevenueService.apply_subscriber_delta(connection, target.subscription_plan, 1)
+
+
+@event.listens_for(models.User, "after_delete")
+def _on_user_delete(mapper, connection, target):
+    if models.previous_value(target, "subscription_status") == 'active':
+        RevenueService.apply_subscriber_delta(connection, models.previous_value(target, "subscription_plan"), -1)
@@ -0,0 +1,163 @@
+# services/review_stats_service.py
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+Stats = models.CourseReviewStats
+ALL_COURSES = Stats.ALL_COURSES
+SENTIMENTS = ("positive", "neutral", "negative")
+RATINGS = range(1, 6)
+
+stats_table = Stats.__table__
+courses_table = models.Course.__table__
+
+
+def _increments(rating: Optional[int], sentiment: Optional[str], sign: int) -> Dict[str, int]:
+    increments = {"review_count": sign, "rating_sum": sign * (rating or 0)}
+    if rating in RATINGS:
+        increments[f"rating_{rating}"] = sign
+    if sentiment in SENTIMENTS:
+        increments[sentiment] = sign
+    return increments
+
+
+def _course_rating(course: str):
+    """Scalar subquery: average rating of a course from its stats row"""
+    return select(
+        case((stats_table.c.review_count > 0,
+              func.round(stats_table.c.rating_sum * 1.0 / stats_table.c.review_count, 2)),
+             else_=0.0)
+    ).where(stats_table.c.course == course).scalar_subquery()
+
+
+class ReviewStatsService:
+    """Per-course review aggregates kept in course_review_stats.
+
+    Every CourseReview insert/update/delete applies a +1/-1 delta to its
+    course row and to the ALL_COURSES row inside the same flush, and
+    refreshes Course.rating for courses whose title matches. Reads are a
+    primary-key lookup. Bulk Query.update()/delete() bypass the ORM events;
+    call rebuild() after those.
+    """
+
+    @staticmethod
+    def apply_delta(connection, course: str, rating: Optional[int], sentiment: Optional[str], sign: int):
+        increments = _increments(rating, sentiment, sign)
+        for key in (course, ALL_COURSES):
+            result = connection.execute(
+                update(stats_table).where(stats_table.c.course == key).values({
+                    column: stats_table.c[column] + amount for column, amount in increments.items()
+                })
+            )
+            if result.rowcount == 0 and sign > 0:
+                row = {column: 0 for column in stats_table.c.keys()}
+                row.update(increments, course=key)
+                connection.execute(stats_table.insert().values(row))
+        connection.execute(
+            update(courses_table).where(courses_table.c.title == course).values(
+                rating=_course_rating(course),
+                updated_at=courses_table.c.updated_at,
+            )
+        )
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Recompute every aggregate from course_reviews"""
+        review = models.CourseReview
+        columns = [
+            func.count().label("review_count"),
+            func.coalesce(func.sum(review.rating), 0).label("rating_sum"),
+        ]
+        columns += [func.sum(case((review.rating == r, 1), else_=0)).label(f"rating_{r}") for r in RATINGS]
+        columns += [func.sum(case((review.sentiment == s, 1), else_=0)).label(s) for s in SENTIMENTS]
+
+        rows = [dict(row._mapping) for row in db.execute(
+            select(review.course, *columns).group_by(review.course)
+        )]
+        totals = {"course": ALL_COURSES}
+        for row in rows:
+            for column, value in row.items():
+                if column != "course":
+                    totals[column] = totals.get(column, 0) + (value or 0)
+
+        # Courses whose reviews are all gone fall back to 0, as apply_delta leaves them
+        rated = set(db.execute(select(stats_table.c.course)).scalars()) | {row["course"] for row in rows}
+        rated.discard(ALL_COURSES)
+        db.execute(stats_table.delete())
+        if rows:
+            db.execute(stats_table.insert(), rows + [totals])
+        db.execute(
+            update(courses_table).where(courses_table.c.title.in_(rated)).values(
+                rating=func.coalesce(select(
+                    func.round(stats_table.c.rating_sum * 1.0 / stats_table.c.review_count, 2)
+                ).where(stats_table.c.course == courses_table.c.title,
+                        stats_table.c.review_count > 0).scalar_subquery(), 0.0),
+                updated_at=courses_table.c.updated_at,
+            )
+        )
+        db.commit()
+        logger.info(f"Rebuilt review stats for {len(rows)} courses")
+        return len(rows)
+
+    @staticmethod
+    def ensure_populated(db: Session):
+        if db.query(Stats).first() is None and db.query(models.CourseReview.id).first() is not None:
+            ReviewStatsService.rebuild(db)
+
+    @staticmethod
+    def serialize(stats: Optional[Stats], course: str = ALL_COURSES) -> dict:
+        count = stats.review_count if stats else 0
+        return {
+            "course": course,
+            "review_count": count,
+            "average_rating": round(stats.rating_sum / count, 2) if count else 0.0,
+            "histogram": {str(r): getattr(stats, f"rating_{r}") if stats else 0 for r in RATINGS},
+            "sentiment": {s: getattr(stats, s) if stats else 0 for s in SENTIMENTS},
+        }
+
+    @staticmethod
+    def totals(db: Session) -> dict:
+        return ReviewStatsService.serialize(db.get(Stats, ALL_COURSES))
+
+    @staticmethod
+    def course_stats(db: Session, course: Optional[str] = None) -> List[dict]:
+        query = db.query(Stats).filter(Stats.course != ALL_COURSES)
+        if course:
+            query = query.filter(Stats.course == course)
+        return [ReviewStatsService.serialize(stats, stats.course) for stats in query.order_by(Stats.course)]
+
+
+# ---------- applying review writes inside the same flush ----------
+
+@event.listens_for(models.CourseReview, "after_insert")
+def _on_review_insert(mapper, connection, target):
+    ReviewStatsService.apply_delta(connection, target.course, target.rating, target.sentiment, +1)
+
+
+TRACKED_FIELDS = ("course", "rating", "sentiment")
+# Expired reviews still report the stored values they are moved away from
+models.track_history(*(getattr(models.CourseReview, field) for field in TRACKED_FIELDS))
+
+
+def _previous_delta(connection, target):
+    ReviewStatsService.apply_delta(connection, *(models.previous_value(target, field) for field in TRACKED_FIELDS), -1)
+
+
+@event.listens_for(models.CourseReview, "after_update")
+def _on_review_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if not any(attrs[field].history.has_changes() for field in TRACKED_FIELDS):
+        return
+    _previous_delta(connection, target)
+    ReviewStatsService.apply_delta(connection, target.course, target.rating, target.sentiment, +1)
+
+
+@event.listens_for(models.CourseReview, "after_delete")
+def _on_review_delete(mapper, connection, target):
+    _previous_delta(connection, target)
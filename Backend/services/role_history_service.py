@@ -0,0 +1,243 @@
+# services/role_history_service.py
+import os
+import glob
+import gzip
+import json
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, joinedload
+
+import models
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ROLE_HISTORY_ARCHIVE_DIR", "archives/role_history")
+# Entries older than this are moved out of the database by the archival job
+RETENTION_DAYS = int(os.getenv("ROLE_HISTORY_RETENTION_DAYS", "180"))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ROLE_HISTORY_ARCHIVE_INTERVAL_HOURS", "24"))
+ARCHIVE_BATCH_SIZE = 5000
+
+History = models.RoleAssignmentHistory
+
+
+def _as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Timestamps are stored as naive UTC
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def encode_cursor(entry: dict) -> str:
+    return f"{entry['timestamp'].isoformat()}|{entry['id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    timestamp, _, entry_id = cursor.partition("|")
+    return datetime.fromisoformat(timestamp), entry_id
+
+
+class RoleHistoryService:
+    """Role assignment history split between the live table and archive segments.
+
+    Recent entries live in role_assignment_history, indexed on
+    (user_id, timestamp) and (role_id, timestamp). The archival job moves
+    older entries into gzipped NDJSON segments whose file names carry the
+    time range they cover, so reads only open segments that can overlap
+    the requested window. Every archived entry is older than every live
+    one, so the archive is only read for pages the live table cannot fill.
+    Both sources are read newest-first and merged on (timestamp, id), which
+    is also the keyset cursor.
+    """
+
+    @staticmethod
+    def ensure_indexes(bind):
+        # create_all does not add indexes to a table that already exists
+        for index in History.__table__.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+    @staticmethod
+    def _entry_from_model(history) -> dict:
+        return {
+            "id": history.id,
+            "user_id": history.user_id,
+            "user_name": history.user.name if history.user else None,
+            "user_email": history.user.email if history.user else None,
+            "role_id": history.role_id,
+            "role_name": history.role.name if history.role else None,
+            "action": history.action,
+            "assigned_by": history.assigned_by,
+            "timestamp": history.timestamp,
+        }
+
+    @staticmethod
+    def query(
+        db: Session,
+        limit: int = 50,
+        skip: int = 0,
+        user_id: Optional[str] = None,
+        role_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        include_archived: bool = True,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Return (entries newest first, next cursor or None)"""
+        wanted = skip + limit + 1
+        since, until = _as_naive_utc(since), _as_naive_utc(until)
+        after = decode_cursor(cursor) if cursor else None
+
+        query = db.query(History).options(joinedload(History.user), joinedload(History.role))
+        if user_id:
+            query = query.filter(History.user_id == user_id)
+        if role_id:
+            query = query.filter(History.role_id == role_id)
+        if since:
+            query = query.filter(History.timestamp >= since)
+        if until:
+            query = query.filter(History.timestamp < until)
+        if after:
+            query = query.filter(or_(
+                History.timestamp < after[0],
+                and_(History.timestamp == after[0], History.id < after[1]),
+            ))
+        rows = query.order_by(History.timestamp.desc(), History.id.desc()).limit(wanted).all()
+        entries = {row.id: RoleHistoryService._entry_from_model(row) for row in rows}
+
+        # Archived entries are all older than live ones, so the archive is
+        # only needed when the live rows do not fill the page
+        if include_archived and len(rows) < wanted:
+            for entry in RoleHistoryService._read_archive(
+                wanted, user_id, role_id, since, until, after
+            ):
+                entries.setdefault(entry["id"], entry)
+
+        ordered = sorted(entries.values(), key=lambda e: (e["timestamp"], e["id"]), reverse=True)
+        page = ordered[skip:skip + limit]
+        next_cursor = encode_cursor(page[-1]) if len(ordered) > skip + limit and page else None
+        return page, next_cursor
+
+    @staticmethod
+    def _segments() -> List[Tuple[datetime, datetime, str]]:
+        segments = []
+        for path in glob.glob(os.path.join(ARCHIVE_DIR, "role_history_*.ndjson.gz")):
+            try:
+                _, _, start, end, _ = os.path.basename(path).split("_", 4)
+                segments.append((
+                    datetime.strptime(start, "%Y%m%dT%H%M%S%f"),
+                    datetime.strptime(end, "%Y%m%dT%H%M%S%f"),
+                    path,
+                ))
+            except ValueError:
+                logger.warning(f"Skipping unrecognised history segment {path}")
+        return segments
+
+    @staticmethod
+    def _read_archive(wanted, user_id, role_id, since, until, after) -> List[dict]:
+        # Segments outside [since, until) or newer than the cursor are never opened
+        segments = [
+            (start, end, path) for start, end, path in RoleHistoryService._segments()
+            if not (since and end < since)
+            and not (until and start >= until)
+            and not (after and start > after[0])
+        ]
+        # Newest segments first; stop once the remaining ones are all older
+        # than the oldest entry we would keep
+        segments.sort(key=lambda s: s[1], reverse=True)
+
+        found: List[dict] = []
+        for start, end, path in segments:
+            if len(found) >= wanted:
+                found.sort(key=lambda e: (e["timestamp"], e["id"]), reverse=True)
+                del found[wanted:]
+                if end < found[-1]["timestamp"]:
+                    break
+            with gzip.open(path, "rt", encoding="utf-8") as segment:
+                for line in segment:
+                    entry = json.loads(line)
+                    if user_id and entry["user_id"] != user_id:
+                        continue
+                    if role_id and entry["role_id"] != role_id:
+                        continue
+                    entry["timestamp"] = datetime.fromisoformat(entry["timestamp"])
+                    timestamp = entry["timestamp"]
+                    if since and timestamp < since:
+                        continue
+                    if until and timestamp >= until:
+                        continue
+                    if after and (timestamp, entry["id"]) >= after:
+                        continue
+                    found.append(entry)
+        return found
+
+    @staticmethod
+    def archive(db: Session, older_than_days: int = RETENTION_DAYS) -> Dict:
+        """Move entries older than the cutoff into archive segments"""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        archived = 0
+        segments = []
+
+        while True:
+            rows = db.query(History).options(
+                joinedload(History.user), joinedload(History.role)
+            ).filter(History.timestamp < cutoff).order_by(
+                History.timestamp, History.id
+            ).limit(ARCHIVE_BATCH_SIZE).all()
+            if not rows:
+                break
+
+            entries = [RoleHistoryService._entry_from_model(row) for row in rows]
+            # The segment is complete on disk before any row is deleted; a
+            # crash in between only leaves duplicates, which reads drop by id
+            path = RoleHistoryService._write_segment(entries)
+            db.query(History).filter(
+                History.id.in_([entry["id"] for entry in entries])
+            ).delete(synchronize_session=False)
+            db.commit()
+
+            archived += len(entries)
+            segments.append(os.path.basename(path))
+
+        if archived:
+            logger.info(f"Archived {archived} role history entries into {len(segments)} segments")
+        return {"archived": archived, "segments": segments, "cutoff": cutoff}
+
+    @staticmethod
+    def _write_segment(entries: List[dict]) -> str:
+        name = "role_history_{}_{}_{}.ndjson.gz".format(
+            entries[0]["timestamp"].strftime("%Y%m%dT%H%M%S%f"),
+            entries[-1]["timestamp"].strftime("%Y%m%dT%H%M%S%f"),
+            uuid.uuid4().hex[:8],
+        )
+        path = os.path.join(ARCHIVE_DIR, name)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as segment:
+            for entry in entries:
+                segment.write(json.dumps(entry, default=lambda v: v.isoformat()) + "\n")
+        os.replace(path + ".tmp", path)
+        return path
+
+    @staticmethod
+    def _archive_in_new_session(session_factory):
+        db = session_factory()
+        try:
+            return RoleHistoryService.archive(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    async def run_archival_loop(session_factory):
+        """Archive old history every ARCHIVE_INTERVAL_HOURS until cancelled"""
+        while True:
+            await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+            try:
+                await asyncio.to_thread(RoleHistoryService._archive_in_new_session, session_factory)
+            except Exception as e:
+                logger.error(f"Role history archival failed: {e}")
@@ -0,0 +1,324 @@
+# services/search_service.py
+import re
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event, func, inspect, insert, or_, select, text, update, delete
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+Docs = models.SearchDocument.__table__
+
+ENTITIES = ("user", "ticket", "review", "feedback")
+REBUILD_BATCH_SIZE = 5000
+
+# FTS5 index over search_documents (external content: the text is stored
+# once, in search_documents, and the triggers keep the index in step).
+# entity is indexed so facets and entity filters are part of the MATCH.
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        entity, title, body,
+        content='search_documents', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN
+        INSERT INTO search_index(rowid, entity, title, body)
+        VALUES (new.id, new.entity, new.title, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN
+        INSERT INTO search_index(search_index, rowid, entity, title, body)
+        VALUES ('delete', old.id, old.entity, old.title, old.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN
+        INSERT INTO search_index(search_index, rowid, entity, title, body)
+        VALUES ('delete', old.id, old.entity, old.title, old.body);
+        INSERT INTO search_index(rowid, entity, title, body)
+        VALUES (new.id, new.entity, new.title, new.body);
+    END""",
+]
+FTS_TRIGGERS = ("search_documents_ai", "search_documents_ad", "search_documents_au")
+
+# Column weights for bm25(): entity, title, body
+RANK = "bm25(search_index, 0.0, 5.0, 1.0)"
+
+
+def _join(*parts) -> str:
+    return " ".join(str(p) for p in parts if p)
+
+
+def build_match_query(q: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word, prefix-matched, ANDed,
+    against the text columns only"""
+    tokens = re.findall(r"\w+", q.lower())
+    if not tokens:
+        return None
+    return "{title body} : (" + " AND ".join(f'"{token}"*' for token in tokens) + ")"
+
+
+def _uses_fts(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+class SearchService:
+    """Full-text search over users, tickets, reviews and feedback.
+
+    Each entity is flattened into one search_documents row (title + body).
+    On SQLite the rows feed an FTS5 index with bm25 ranking, highlight()
+    and snippet(); other databases fall back to a LIKE scan of the same
+    table (a tsvector column with a GIN index is the PostgreSQL analogue).
+    ORM writes to the source models update the documents in the same
+    transaction; rebuild() repopulates everything for rows written outside
+    the ORM.
+    """
+
+    @staticmethod
+    def ensure_index(bind):
+        if not _uses_fts(bind):
+            return
+        with bind.begin() as conn:
+            for ddl in FTS_DDL:
+                conn.execute(text(ddl))
+
+    # ---------- documents ----------
+
+    @staticmethod
+    def _ticket_body(conn, ticket_id, description) -> str:
+        messages = conn.execute(
+            select(models.TicketResponse.message).where(
+                models.TicketResponse.ticket_id == ticket_id
+            ).order_by(models.TicketResponse.id)
+        ).scalars()
+        return _join(description, *messages)
+
+    @staticmethod
+    def _document(conn, target) -> Optional[dict]:
+        if isinstance(target, models.User):
+            return {"entity": "user", "entity_id": str(target.id), "title": target.name or "",
+                    "body": _join(target.email, target.phone)}
+        if isinstance(target, models.SupportTicket):
+            return {"entity": "ticket", "entity_id": str(target.id), "title": target.title or "",
+                    "body": SearchService._ticket_body(conn, target.id, target.description)}
+        if isinstance(target, models.CourseReview):
+            return {"entity": "review", "entity_id": str(target.id),
+                    "title": _join(target.course, "-", target.student), "body": target.comment or ""}
+        if isinstance(target, models.Feedback):
+            return {"entity": "feedback", "entity_id": str(target.id), "title": target.subject or "",
+                    "body": target.message or ""}
+        return None
+
+    @staticmethod
+    def upsert(conn, document: dict):
+        result = conn.execute(
+            update(Docs).where(
+                Docs.c.entity == document["entity"], Docs.c.entity_id == document["entity_id"]
+            ).values(title=document["title"], body=document["body"])
+        )
+        if result.rowcount == 0:
+            conn.execute(insert(Docs).values(**document))
+
+    @staticmethod
+    def remove(conn, entity: str, entity_id):
+        conn.execute(delete(Docs).where(Docs.c.entity == entity, Docs.c.entity_id == str(entity_id)))
+
+    @staticmethod
+    def _iter_documents(conn) -> Iterable[dict]:
+        for user_id, name, email, phone in conn.execute(
+            select(models.User.id, models.User.name, models.User.email, models.User.phone)
+        ):
+            yield {"entity": "user", "entity_id": str(user_id), "title": name or "",
+                   "body": _join(email, phone)}
+
+        responses = defaultdict(list)
+        for ticket_id, message in conn.execute(
+            select(models.TicketResponse.ticket_id, models.TicketResponse.message)
+            .order_by(models.TicketResponse.id)
+        ):
+            responses[ticket_id].append(message)
+        for ticket_id, title, description in conn.execute(
+            select(models.SupportTicket.id, models.SupportTicket.title, models.SupportTicket.description)
+        ):
+            yield {"entity": "ticket", "entity_id": str(ticket_id), "title": title or "",
+                   "body": _join(description, *responses.get(ticket_id, ()))}
+
+        for review_id, course, student, comment in conn.execute(
+            select(models.CourseReview.id, models.CourseReview.course,
+                   models.CourseReview.student, models.CourseReview.comment)
+        ):
+            yield {"entity": "review", "entity_id": str(review_id),
+                   "title": _join(course, "-", student), "body": comment or ""}
+
+        for feedback_id, subject, message in conn.execute(
+            select(models.Feedback.id, models.Feedback.subject, models.Feedback.message)
+        ):
+            yield {"entity": "feedback", "entity_id": str(feedback_id), "title": subject or "",
+                   "body": message or ""}
+
+    @staticmethod
+    def rebuild(bind) -> Dict[str, int]:
+        """Repopulate search_documents and the index from the source tables"""
+        fts = _uses_fts(bind)
+        counts = defaultdict(int)
+        SearchService.ensure_index(bind)
+        with bind.begin() as conn:
+            if fts:
+                # Bulk-load without per-row triggers, then index in one pass
+                for trigger in FTS_TRIGGERS:
+                    conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            conn.execute(delete(Docs))
+
+            batch = []
+            for document in SearchService._iter_documents(conn):
+                batch.append(document)
+                counts[document["entity"]] += 1
+                if len(batch) >= REBUILD_BATCH_SIZE:
+                    conn.execute(insert(Docs), batch)
+                    batch = []
+            if batch:
+                conn.execute(insert(Docs), batch)
+
+            if fts:
+                conn.execute(text("INSERT INTO search_index(search_index) VALUES('rebuild')"))
+        if fts:
+            SearchService.ensure_index(bind)
+        logger.info(f"Search index rebuilt: {dict(counts)}")
+        return dict(counts)
+
+    @staticmethod
+    def ensure_populated(bind):
+        """Build the index on first start against an existing database"""
+        SearchService.ensure_index(bind)
+        with bind.connect() as conn:
+            if conn.execute(select(Docs.c.id).limit(1)).first():
+                return
+            if not any(conn.execute(select(model.id).limit(1)).first() for model in (
+                models.User, models.SupportTicket, models.CourseReview, models.Feedback
+            )):
+                return
+        SearchService.rebuild(bind)
+
+    # ---------- queries ----------
+
+    @staticmethod
+    def search(db: Session, q: str, entity: Optional[str] = None, limit: int = 20, offset: int = 0) -> Dict:
+        match = build_match_query(q)
+        facets = {name: 0 for name in ENTITIES}
+        if not match:
+            return {"query": q, "total": 0, "facets": facets, "results": []}
+        if not _uses_fts(db.get_bind()):
+            return SearchService._search_like(db, q, entity, limit, offset, facets)
+
+        def count(expression: str) -> int:
+            return db.execute(text(
+                "SELECT count(*) FROM search_index WHERE search_index MATCH :match"
+            ), {"match": expression}).scalar()
+
+        # Users make up most of the index, so their facet is derived from
+        # the total instead of intersecting with the large "user" doclist
+        total = count(match)
+        for name in ENTITIES[1:]:
+            facets[name] = count(f'entity : "{name}" AND ({match})')
+        facets["user"] = total - sum(facets.values())
+        if entity:
+            match = f'entity : "{entity}" AND ({match})'
+            total = facets[entity]
+
+        # bm25 scores every hit; SQLite keeps only the top offset + limit
+        # rows while sorting, so ranking the full match set stays cheap
+        rows = db.execute(text(f"""
+            SELECT search_index.entity, d.entity_id,
+                   highlight(search_index, 1, '<mark>', '</mark>') AS title,
+                   snippet(search_index, 2, '<mark>', '</mark>', '…', 16) AS snippet,
+                   {RANK} AS score
+            FROM search_index JOIN search_documents d ON d.id = search_index.rowid
+            WHERE search_index MATCH :match
+            ORDER BY score
+            LIMIT :limit OFFSET :offset
+        """), {"match": match, "limit": limit, "offset": offset})
+
+        results = [
+            {"entity": row.entity, "id": row.entity_id, "title": row.title,
+             "snippet": row.snippet, "score": round(-row.score, 4)}
+            for row in rows
+        ]
+        return {"query": q, "total": total, "facets": facets, "results": results}
+
+    @staticmethod
+    def _search_like(db: Session, q: str, entity, limit, offset, facets) -> Dict:
+        conditions = [
+            or_(Docs.c.title.ilike(f"%{token}%"), Docs.c.body.ilike(f"%{token}%"))
+            for token in re.findall(r"\w+", q)
+        ]
+        for name, count in db.execute(
+            select(Docs.c.entity, func.count()).where(*conditions).group_by(Docs.c.entity)
+        ):
+            facets[name] = count
+        query = select(Docs).where(*conditions)
+        if entity:
+            query = query.where(Docs.c.entity == entity)
+        results = [
+            {"entity": row.entity, "id": row.entity_id, "title": row.title,
+             "snippet": (row.body or "")[:200], "score": 0.0}
+            for row in db.execute(query.limit(limit).offset(offset))
+        ]
+        total = facets.get(entity, 0) if entity else sum(facets.values())
+        return {"query": q, "total": total, "facets": facets, "results": results}
+
+
+# ---------- keeping documents in sync with ORM writes ----------
+
+_INDEXED_FIELDS = {
+    models.User: ("name", "email", "phone"),
+    models.SupportTicket: ("title", "description"),
+    models.CourseReview: ("course", "student", "comment"),
+    models.Feedback: ("subject", "message"),
+}
+
+_ENTITY_NAMES = {
+    models.User: "user",
+    models.SupportTicket: "ticket",
+    models.CourseReview: "review",
+    models.Feedback: "feedback",
+}
+
+
+def _index_entity(mapper, connection, target):
+    SearchService.upsert(connection, SearchService._document(connection, target))
+
+
+def _reindex_changed_entity(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in _INDEXED_FIELDS[type(target)]):
+        _index_entity(mapper, connection, target)
+
+
+def _unindex_entity(mapper, connection, target):
+    SearchService.remove(connection, _ENTITY_NAMES[type(target)], target.id)
+
+
+for _model in _INDEXED_FIELDS:
+    event.listen(_model, "after_insert", _index_entity)
+    event.listen(_model, "after_update", _reindex_changed_entity)
+    event.listen(_model, "after_delete", _unindex_entity)
+
+
+# Ticket responses are part of the ticket's document
+@event.listens_for(models.TicketResponse, "after_insert")
+@event.listens_for(models.TicketResponse, "after_update")
+@event.listens_for(models.TicketResponse, "after_delete")
+def _reindex_ticket_for_response(mapper, connection, target):
+    ticket = connection.execute(
+        select(models.SupportTicket.id, models.SupportTicket.title, models.SupportTicket.description)
+        .where(models.SupportTicket.id == target.ticket_id)
+    ).first()
+    if ticket is None:
+        return
+    SearchService.upsert(connection, {
+        "entity": "ticket",
+        "entity_id": str(ticket.id),
+        "title": ticket.title or "",
+        "body": SearchService._ticket_body(connection, ticket.id, ticket.description),
+    })
@@ -0,0 +1,55 @@
+# services/sentiment_lexicon.py
+# Word valences (-4..4) for the offline sentiment classifier. Bump
+# LEXICON_VERSION whenever the word lists change so stored scores are
+# recomputed on the next backlog run.
+
+LEXICON_VERSION = "lexicon-1"
+
+POSITIVE = {
+    4: "excellent outstanding amazing awesome fantastic superb brilliant phenomenal exceptional "
+       "perfect loved love wonderful incredible best",
+    3: "great helpful useful clear insightful engaging enjoyed enjoy impressive recommend recommended "
+       "valuable thorough informative inspiring lifesaver happy delighted satisfied thank thanks "
+       "thankful grateful easy intuitive smooth fast quick responsive well-structured organized "
+       "comprehensive detailed knowledgeable patient passionate effective",
+    2: "good nice fine solid interesting worth works working fixed resolved improved improvement "
+       "better friendly polite supportive concise simple practical relevant reliable affordable "
+       "fair liked appreciate appreciated pleased glad fun cool handy crisp",
+    1: "ok okay decent adequate reasonable acceptable",
+}
+
+NEGATIVE = {
+    4: "terrible horrible awful worst useless pathetic disgusting scam fraud garbage hate hated "
+       "unacceptable disaster",
+    3: "bad poor broken crash crashes crashed crashing fail fails failed failure error errors bug "
+       "buggy frustrating frustrated disappointing disappointed annoying angry furious waste wasted "
+       "unusable confusing confused rude misleading overpriced stuck freezes freezing refund "
+       "cancel cancelled unhelpful unresponsive outdated incorrect wrong",
+    2: "slow lag laggy buffering issue issues problem problems difficult hard boring "
+       "unclear missing lacking expensive late delayed delay glitch glitches complicated "
+       "inconsistent repetitive weak mediocre sucks unhappy dislike disliked worse",
+    1: "meh average confusingly minor complain complaint",
+}
+
+
+def _expand(groups, sign):
+    return {word: sign * weight for weight, words in groups.items() for word in words.split()}
+
+
+LEXICON = {**_expand(POSITIVE, 1), **_expand(NEGATIVE, -1)}
+
+NEGATIONS = frozenset(
+    "not no never neither nor none nothing nobody cannot cant can't don't dont doesn't doesnt "
+    "didn't didnt isn't isnt wasn't wasnt aren't arent won't wont wouldn't wouldnt shouldn't "
+    "couldn't couldnt hardly barely without".split()
+)
+
+# multiplier applied to the next sentiment word
+BOOSTERS = {
+    "very": 1.3, "really": 1.3, "extremely": 1.5, "super": 1.3, "so": 1.2, "too": 1.2,
+    "incredibly": 1.5, "absolutely": 1.4, "totally": 1.3, "completely": 1.3, "highly": 1.3,
+    "quite": 1.1, "pretty": 1.1, "slightly": 0.6, "somewhat": 0.7, "bit": 0.7, "kinda": 0.7,
+}
+
+# Words after these carry more weight than the clause before them
+CONTRAST = frozenset("but however although though yet".split())
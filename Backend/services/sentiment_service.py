@@ -0,0 +1,259 @@
+# services/sentiment_service.py
+import os
+import re
+import math
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, event, func, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+import models
+from services.review_stats_service import ReviewStatsService
+from services.sentiment_lexicon import BOOSTERS, CONTRAST, LEXICON, LEXICON_VERSION, NEGATIONS
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", str(min(4, os.cpu_count() or 1))))
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "2000"))
+# Compound scores inside +/- this band are neutral
+NEUTRAL_BAND = 0.05
+NEGATION_FACTOR = -0.74
+NEGATION_WINDOW = 3
+
+_TOKEN = re.compile(r"[a-z][a-z'\-]*|!")
+_executor: Optional[ProcessPoolExecutor] = None
+
+Scores = models.SentimentScore
+scores_table = Scores.__table__
+
+
+def classify(text: Optional[str]) -> Tuple[str, float]:
+    """Lexicon sentiment of a text as (label, compound score in -1..1)"""
+    tokens = _TOKEN.findall((text or "").lower())
+    total = 0.0
+    boost = 1.0
+    clause_weight = 1.0
+    exclamations = 0
+    for i, token in enumerate(tokens):
+        if token == "!":
+            exclamations += 1
+            continue
+        if token in CONTRAST:
+            # "good content but the player keeps crashing" leans negative
+            total *= 0.5
+            clause_weight = 1.5
+            continue
+        if token in BOOSTERS:
+            boost *= BOOSTERS[token]
+            continue
+        valence = LEXICON.get(token)
+        if valence:
+            value = valence * boost
+            if any(word in NEGATIONS for word in tokens[max(0, i - NEGATION_WINDOW):i]):
+                value *= NEGATION_FACTOR
+            total += value * clause_weight
+        boost = 1.0
+
+    if total:
+        total += math.copysign(0.3 * min(exclamations, 3), total)
+    score = total / math.sqrt(total * total + 15)
+    if score >= NEUTRAL_BAND:
+        return "positive", round(score, 4)
+    if score <= -NEUTRAL_BAND:
+        return "negative", round(score, 4)
+    return "neutral", round(score, 4)
+
+
+def classify_batch(items: List[Tuple[int, str]]) -> List[Tuple[int, str, float]]:
+    """Score (id, text) pairs. Runs inside a worker process."""
+    return [(item_id, *classify(text)) for item_id, text in items]
+
+
+def _review_text(review) -> str:
+    return review.comment or ""
+
+
+def _feedback_text(feedback) -> str:
+    return f"{feedback.subject or ''}. {feedback.message or ''}"
+
+
+# entity -> (model, SQL expression for the scored text)
+_SOURCES = {
+    "review": (models.CourseReview, lambda: models.CourseReview.comment),
+    "feedback": (
+        models.Feedback,
+        lambda: func.coalesce(models.Feedback.subject, "") + ". " + func.coalesce(models.Feedback.message, ""),
+    ),
+}
+
+
+class SentimentService:
+    """Offline lexicon sentiment for course reviews and feedback.
+
+    New and edited entries are scored inline during the flush (a lexicon
+    lookup per word, microseconds per entry) and reviews get their
+    sentiment column set from the result. The backlog - rows with no score
+    or a score from an older LEXICON_VERSION - is read in keyset pages and
+    classified in SENTIMENT_BATCH_SIZE batches across a process pool.
+    """
+
+    @staticmethod
+    def _get_executor() -> ProcessPoolExecutor:
+        global _executor
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=SENTIMENT_WORKERS)
+        return _executor
+
+    @staticmethod
+    def shutdown():
+        global _executor
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+    @staticmethod
+    def _unscored(entity: str, *columns):
+        model = _SOURCES[entity][0]
+        return select(*columns).select_from(model).outerjoin(
+            Scores, and_(Scores.entity == entity, Scores.entity_id == model.id)
+        ).where(or_(Scores.entity_id.is_(None), Scores.model_version != LEXICON_VERSION))
+
+    @staticmethod
+    def _unscored_page(db: Session, entity: str, after_id: int, limit: int) -> List[Tuple[int, str]]:
+        model, text = _SOURCES[entity]
+        query = SentimentService._unscored(entity, model.id, text()).where(
+            model.id > after_id
+        ).order_by(model.id).limit(limit)
+        return [tuple(row) for row in db.execute(query)]
+
+    @staticmethod
+    def _store(db: Session, entity: str, results: List[Tuple[int, str, float]]):
+        ids = [item_id for item_id, _, _ in results]
+        db.execute(scores_table.delete().where(
+            scores_table.c.entity == entity, scores_table.c.entity_id.in_(ids)
+        ))
+        db.execute(scores_table.insert(), [
+            {"entity": entity, "entity_id": item_id, "label": label, "score": score,
+             "model_version": LEXICON_VERSION}
+            for item_id, label, score in results
+        ])
+        if entity == "review":
+            # Core UPDATE skips the review stats events; rebuilt once at the end
+            reviews = models.CourseReview.__table__
+            db.execute(
+                update(reviews).where(reviews.c.id == bindparam("review_id")).values(sentiment=bindparam("label")),
+                [{"review_id": item_id, "label": label} for item_id, label, _ in results],
+            )
+
+    @staticmethod
+    def score_backlog(db: Session, batch_size: int = SENTIMENT_BATCH_SIZE,
+                      workers: int = SENTIMENT_WORKERS) -> Dict[str, int]:
+        """Classify every unscored review and feedback entry; returns rows scored per entity"""
+        scored = {}
+        for entity in _SOURCES:
+            scored[entity] = 0
+            after_id = 0
+            while True:
+                page = SentimentService._unscored_page(db, entity, after_id, batch_size * max(workers, 1))
+                if not page:
+                    break
+                batches = [page[i:i + batch_size] for i in range(0, len(page), batch_size)]
+                if workers > 1 and len(batches) > 1:
+                    results = SentimentService._get_executor().map(classify_batch, batches)
+                else:
+                    results = map(classify_batch, batches)
+                for batch in results:
+                    SentimentService._store(db, entity, batch)
+                    scored[entity] += len(batch)
+                db.commit()
+                after_id = page[-1][0]
+
+        if scored["review"]:
+            ReviewStatsService.rebuild(db)
+        if any(scored.values()):
+            logger.info(f"Scored sentiment backlog: {scored}")
+        return scored
+
+    @staticmethod
+    def score_backlog_in_new_session(session_factory) -> Dict[str, int]:
+        db = session_factory()
+        try:
+            return SentimentService.score_backlog(db)
+        finally:
+            db.close()
+
+    @staticmethod
+    def stats(db: Session) -> dict:
+        counts: Dict[str, Dict[str, int]] = {entity: {} for entity in _SOURCES}
+        rows = db.query(Scores.entity, Scores.label, func.count()).filter(
+            Scores.model_version == LEXICON_VERSION
+        ).group_by(Scores.entity, Scores.label)
+        for entity, label, count in rows:
+            counts.setdefault(entity, {})[label] = count
+        pending = {
+            entity: db.execute(SentimentService._unscored(entity, func.count())).scalar()
+            for entity in _SOURCES
+        }
+        return {"model_version": LEXICON_VERSION, "labels": counts, "pending": pending}
+
+
+# ---------- scoring new and edited entries inside the flush ----------
+
+def _text_changed(target, fields) -> bool:
+    attrs = inspect(target).attrs
+    return any(attrs[field].history.has_changes() for field in fields)
+
+
+def _write_score(connection, entity: str, entity_id: int, label: str, score: float):
+    connection.execute(scores_table.delete().where(
+        scores_table.c.entity == entity, scores_table.c.entity_id == entity_id
+    ))
+    connection.execute(scores_table.insert().values(
+        entity=entity, entity_id=entity_id, label=label, score=score, model_version=LEXICON_VERSION
+    ))
+
+
+# A label the client sets explicitly is kept; "neutral" is the schema default, so it counts as unset
+@event.listens_for(models.CourseReview, "before_insert")
+def _label_new_review(mapper, connection, target):
+    if target.sentiment in (None, "neutral"):
+        target.sentiment = classify(_review_text(target))[0]
+
+
+@event.listens_for(models.CourseReview, "before_update")
+def _label_edited_review(mapper, connection, target):
+    if _text_changed(target, ("comment",)) and not _text_changed(target, ("sentiment",)):
+        target.sentiment = classify(_review_text(target))[0]
+
+
+@event.listens_for(models.CourseReview, "after_insert")
+def _score_new_review(mapper, connection, target):
+    _write_score(connection, "review", target.id, *classify(_review_text(target)))
+
+
+@event.listens_for(models.CourseReview, "after_update")
+def _score_edited_review(mapper, connection, target):
+    if _text_changed(target, ("comment",)):
+        _write_score(connection, "review", target.id, *classify(_review_text(target)))
+
+
+@event.listens_for(models.Feedback, "after_insert")
+def _score_new_feedback(mapper, connection, target):
+    _write_score(connection, "feedback", target.id, *classify(_feedback_text(target)))
+
+
+@event.listens_for(models.Feedback, "after_update")
+def _score_edited_feedback(mapper, connection, target):
+    if _text_changed(target, ("subject", "message")):
+        _write_score(connection, "feedback", target.id, *classify(_feedback_text(target)))
+
+
+@event.listens_for(models.CourseReview, "after_delete")
+@event.listens_for(models.Feedback, "after_delete")
+def _drop_score(mapper, connection, target):
+    entity = "review" if isinstance(target, models.CourseReview) else "feedback"
+    connection.execute(scores_table.delete().where(
+        scores_table.c.entity == entity, scores_table.c.entity_id == target.id
+    ))
@@ -0,0 +1,217 @@
+# services/sla_service.py
+import os
+import asyncio
+import logging
+import threading
+from bisect import bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, exists, inspect
+from sqlalchemy.orm import Session, object_session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ("open", "in_progress")
+PRIORITY_ESCALATION = {"low": "medium", "medium": "high", "high": "urgent"}
+BREACH_ACTION = "sla_breach"
+MONITOR_USER = "SLA Monitor"
+
+SLA_CHECK_INTERVAL_SECONDS = float(os.getenv("SLA_CHECK_INTERVAL_SECONDS", "60"))
+# Open tickets due within this window count as at risk
+SLA_AT_RISK_HOURS = float(os.getenv("SLA_AT_RISK_HOURS", "4"))
+
+Ticket = models.SupportTicket
+
+
+def _as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class SlaMonitor:
+    """Acts on support ticket SLA deadlines.
+
+    tick() fetches open tickets past their deadline that have no breach
+    recorded since that deadline, using the (status, sla_deadline) and
+    (ticket_id, type) indexes, records a breach action, escalates priority
+    and raises a notification. Checking the recorded breaches rather than
+    the time since the last tick also catches deadlines moved into the past
+    and tickets reopened after theirs passed.
+
+    The at-risk/breached summary comes from a sorted list of deadlines of
+    open tickets, kept up to date from committed ticket writes, so the
+    counts are two binary searches rather than a table scan.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deadlines: List[Tuple[datetime, int]] = []
+        self._by_ticket: Dict[int, datetime] = {}
+        self.last_tick: Optional[datetime] = None
+        self.breaches_recorded = 0
+        self.loaded = False
+
+    @staticmethod
+    def ensure_index(bind):
+        # create_all does not add indexes to a table that already exists
+        for table in (Ticket.__table__, models.TicketAction.__table__):
+            for index in table.indexes:
+                index.create(bind=bind, checkfirst=True)
+
+    # ---------- summary ----------
+
+    def load(self, db: Session):
+        rows = db.query(Ticket.id, Ticket.sla_deadline).filter(
+            Ticket.status.in_(OPEN_STATUSES), Ticket.sla_deadline.isnot(None)
+        ).all()
+        breaches = db.query(models.TicketAction).filter(models.TicketAction.type == BREACH_ACTION).count()
+        with self._lock:
+            self._by_ticket = {ticket_id: _as_naive_utc(deadline) for ticket_id, deadline in rows}
+            self._deadlines = sorted((deadline, ticket_id) for ticket_id, deadline in self._by_ticket.items())
+            self.breaches_recorded = breaches
+            self.loaded = True
+
+    def track(self, ticket_id: int, status: Optional[str], deadline: Optional[datetime]):
+        """Record the current status/deadline of a ticket (None status = deleted)"""
+        deadline = _as_naive_utc(deadline)
+        with self._lock:
+            previous = self._by_ticket.pop(ticket_id, None)
+            if previous is not None:
+                self._deadlines.remove((previous, ticket_id))
+            if status in OPEN_STATUSES and deadline is not None:
+                self._by_ticket[ticket_id] = deadline
+                insort(self._deadlines, (deadline, ticket_id))
+
+    def summary(self, now: Optional[datetime] = None) -> dict:
+        now = now or datetime.utcnow()
+        at_risk_until = now + timedelta(hours=SLA_AT_RISK_HOURS)
+        with self._lock:
+            breached = bisect_right(self._deadlines, (now, float("inf")))
+            due_soon = bisect_right(self._deadlines, (at_risk_until, float("inf")))
+            tracked = len(self._deadlines)
+            next_deadline = self._deadlines[breached][0] if breached < tracked else None
+        return {
+            "breached": breached,
+            "at_risk": due_soon - breached,
+            "on_track": tracked - due_soon,
+            "open_with_sla": tracked,
+            "at_risk_window_hours": SLA_AT_RISK_HOURS,
+            "next_deadline": next_deadline,
+            "breaches_recorded": self.breaches_recorded,
+            "last_check": self.last_tick,
+        }
+
+    # ---------- monitor ----------
+
+    def tick(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Act on open tickets past their deadline whose breach is not recorded yet"""
+        now = now or datetime.utcnow()
+        breached = db.query(Ticket).filter(
+            Ticket.status.in_(OPEN_STATUSES),
+            Ticket.sla_deadline <= now,
+            # A breach recorded before the current deadline belongs to an earlier, extended one
+            ~exists().where(
+                models.TicketAction.ticket_id == Ticket.id,
+                models.TicketAction.type == BREACH_ACTION,
+                models.TicketAction.timestamp >= Ticket.sla_deadline,
+            ),
+        ).all()
+        for ticket in breached:
+            old_priority = ticket.priority
+            ticket.priority = PRIORITY_ESCALATION.get(old_priority, old_priority)
+            ticket.last_update = now
+            ticket.actions.append(models.TicketAction(
+                type=BREACH_ACTION,
+                user=MONITOR_USER,
+                from_status=ticket.status,
+                to_status=ticket.status,
+                resolution=(
+                    f"SLA deadline {ticket.sla_deadline:%Y-%m-%d %H:%M} passed; "
+                    f"priority {old_priority} -> {ticket.priority}"
+                ),
+                timestamp=now,
+            ))
+            db.add(models.Notification(
+                title=f"SLA breached: ticket #{ticket.id}",
+                subtitle=f"{ticket.title} ({ticket.priority}, assigned to {ticket.assigned_to or 'nobody'})",
+                icon="⏰",
+                tag="support",
+                status="sent",
+                sent_at=now,
+            ))
+        db.commit()
+
+        self.last_tick = now
+        self.breaches_recorded += len(breached)
+        if breached:
+            logger.warning(f"SLA breached for {len(breached)} tickets")
+        return len(breached)
+
+    def _tick_in_new_session(self, session_factory) -> int:
+        db = session_factory()
+        try:
+            if not self.loaded:
+                self.load(db)
+            return self.tick(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def run(self, session_factory):
+        """Check deadlines every SLA_CHECK_INTERVAL_SECONDS until cancelled"""
+        while True:
+            try:
+                await asyncio.to_thread(self._tick_in_new_session, session_factory)
+            except Exception as e:
+                logger.error(f"SLA monitor tick failed: {e}")
+            await asyncio.sleep(SLA_CHECK_INTERVAL_SECONDS)
+
+
+sla_monitor = SlaMonitor()
+
+
+# ---------- keeping the summary in step with committed writes ----------
+
+def _queue(target, deleted: bool = False):
+    change = (target.id, None if deleted else target.status, target.sla_deadline)
+    session = object_session(target)
+    if session is None:
+        sla_monitor.track(*change)
+    else:
+        session.info.setdefault("sla_changes", []).append(change)
+
+
+@event.listens_for(Ticket, "after_insert")
+def _on_ticket_insert(mapper, connection, target):
+    _queue(target)
+
+
+@event.listens_for(Ticket, "after_update")
+def _on_ticket_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.status.history.has_changes() or state.attrs.sla_deadline.history.has_changes():
+        _queue(target)
+
+
+@event.listens_for(Ticket, "after_delete")
+def _on_ticket_delete(mapper, connection, target):
+    _queue(target, deleted=True)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session):
+    changes = session.info.pop("sla_changes", [])
+    if sla_monitor.loaded:
+        for change in changes:
+            sla_monitor.track(*change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("sla_changes", None)
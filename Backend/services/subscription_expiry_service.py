@@ -0,0 +1,223 @@
+# services/subscription_expiry_service.py
+import os
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, exists, func, literal, select, update
+from sqlalchemy.orm import Session, object_session
+
+import models
+from services.entitlement_service import EntitlementService
+from services.revenue_service import RevenueService
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_BATCH_SIZE = int(os.getenv("SUBSCRIPTION_EXPIRY_BATCH_SIZE", "500"))
+SUBSCRIPTION_EXPIRY_INTERVAL_SECONDS = float(os.getenv("SUBSCRIPTION_EXPIRY_INTERVAL_SECONDS", "3600"))
+# Days before the end date at which a renewal reminder goes out
+REMINDER_DAYS = tuple(sorted(int(d) for d in os.getenv("SUBSCRIPTION_REMINDER_DAYS", "7,1").split(",") if d.strip()))
+
+EXPIRED_EVENT = "expired"
+
+User = models.User
+Event = models.SubscriptionEvent
+users_table = User.__table__
+
+
+def reminder_event(days: int) -> str:
+    return f"reminder_{days}d"
+
+
+class SubscriptionExpiryService:
+    """Expires subscriptions once subscription_end_date passes.
+
+    Every query walks the (subscription_status, subscription_end_date)
+    index from the "active" end, so a run touches only users that are due
+    and costs nothing for the ones already expired. Each expiry and each
+    reminder is logged in subscription_events.
+    """
+
+    @staticmethod
+    def ensure_indexes(bind):
+        # create_all does not add indexes to a table that already exists
+        for index in users_table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+    @staticmethod
+    def backfill_end_dates(db: Session) -> int:
+        """Give active users without an end date the latest valid_until of their captured transactions"""
+        latest = select(func.max(models.Transaction.valid_until)).where(
+            models.Transaction.user_id == User.id,
+            models.Transaction.status == "captured",
+        ).scalar_subquery()
+        result = db.execute(
+            update(User).where(
+                User.subscription_status == "active",
+                User.subscription_end_date.is_(None),
+                latest.isnot(None),
+            ).values(subscription_end_date=latest).execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            EntitlementService.backfill_direct_valid_until(db)
+        db.commit()
+        if result.rowcount:
+            logger.info(f"Backfilled subscription end dates for {result.rowcount} users")
+        return result.rowcount
+
+    @staticmethod
+    def expire_due(db: Session, now: Optional[datetime] = None) -> int:
+        """Flip active users past their end date to expired, EXPIRY_BATCH_SIZE per UPDATE"""
+        now = now or datetime.utcnow()
+        expired = 0
+        while True:
+            due = db.execute(
+                select(User.id, User.subscription_plan, User.subscription_end_date).where(
+                    User.subscription_status == "active",
+                    User.subscription_end_date <= now,
+                ).limit(EXPIRY_BATCH_SIZE)
+            ).all()
+            if not due:
+                return expired
+            ids = [user_id for user_id, _, _ in due]
+            db.execute(
+                update(User).where(User.id.in_(ids), User.subscription_status == "active")
+                .values(subscription_status="expired").execution_options(synchronize_session=False)
+            )
+            db.execute(Event.__table__.insert(), [
+                {"user_id": user_id, "event_type": EXPIRED_EVENT, "plan_name": plan,
+                 "subscription_end_date": end_date, "occurred_at": now}
+                for user_id, plan, end_date in due
+            ])
+            EntitlementService.revoke_direct(db, ids)
+            for plan, count in Counter(plan for _, plan, _ in due).items():
+                RevenueService.apply_subscriber_delta(db.connection(), plan, -count)
+            db.commit()
+            expired += len(due)
+
+    @staticmethod
+    def send_reminders(db: Session, now: Optional[datetime] = None) -> Dict[int, int]:
+        """Log one reminder per user and end date, and a notification per reminder window"""
+        now = now or datetime.utcnow()
+        sent = {}
+        lower = now
+        # Windows are disjoint: 1 day covers (now, now+1d], 7 days (now+1d, now+7d]
+        for days in REMINDER_DAYS:
+            upper = now + timedelta(days=days)
+            event_type = reminder_event(days)
+            already_sent = exists().where(
+                Event.user_id == User.id,
+                Event.event_type == event_type,
+                Event.subscription_end_date == User.subscription_end_date,
+            )
+            result = db.execute(Event.__table__.insert().from_select(
+                ["user_id", "event_type", "plan_name", "subscription_end_date", "occurred_at"],
+                select(User.id, literal(event_type), User.subscription_plan,
+                       User.subscription_end_date, literal(now)).where(
+                    User.subscription_status == "active",
+                    User.subscription_end_date > lower,
+                    User.subscription_end_date <= upper,
+                    ~already_sent,
+                ),
+            ))
+            sent[days] = result.rowcount
+            if result.rowcount:
+                db.add(models.Notification(
+                    title=f"Your subscription ends in {days} day{'s' if days != 1 else ''}",
+                    subtitle="Renew now to keep access to your courses and mock tests",
+                    icon="⏳",
+                    tag="personalized",
+                    status="sent",
+                    recipients_count=result.rowcount,
+                    sent_at=now,
+                ))
+            lower = upper
+        db.commit()
+        return sent
+
+    @staticmethod
+    def run_once(db: Session, now: Optional[datetime] = None) -> dict:
+        now = now or datetime.utcnow()
+        expired = SubscriptionExpiryService.expire_due(db, now)
+        reminders = SubscriptionExpiryService.send_reminders(db, now)
+        if expired or any(reminders.values()):
+            logger.info(f"Subscription expiry: {expired} expired, reminders {reminders}")
+        return {"expired": expired, "reminders": reminders}
+
+    @staticmethod
+    def _run_in_new_session(session_factory) -> dict:
+        db = session_factory()
+        try:
+            return SubscriptionExpiryService.run_once(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    async def run_loop(session_factory):
+        """Expire and remind every SUBSCRIPTION_EXPIRY_INTERVAL_SECONDS until cancelled"""
+        while True:
+            try:
+                await asyncio.to_thread(SubscriptionExpiryService._run_in_new_session, session_factory)
+            except Exception as e:
+                logger.error(f"Subscription expiry run failed: {e}")
+            await asyncio.sleep(SUBSCRIPTION_EXPIRY_INTERVAL_SECONDS)
+
+    # ---------- reporting ----------
+
+    @staticmethod
+    def upcoming(db: Session, days: int = 30, now: Optional[datetime] = None) -> List[dict]:
+        """Active subscriptions ending on each of the next `days` days"""
+        now = now or datetime.utcnow()
+        day = func.date(User.subscription_end_date)
+        rows = db.query(day, func.count()).filter(
+            User.subscription_status == "active",
+            User.subscription_end_date > now,
+            User.subscription_end_date <= now + timedelta(days=days),
+        ).group_by(day).order_by(day).all()
+        return [{"date": str(date), "expiring": count} for date, count in rows]
+
+    @staticmethod
+    def history(db: Session, days: int = 30, now: Optional[datetime] = None) -> List[dict]:
+        """Expiries recorded on each of the last `days` days"""
+        now = now or datetime.utcnow()
+        day = func.date(Event.occurred_at)
+        rows = db.query(day, func.count()).filter(
+            Event.event_type == EXPIRED_EVENT,
+            Event.occurred_at > now - timedelta(days=days),
+        ).group_by(day).order_by(day).all()
+        return [{"date": str(date), "expired": count} for date, count in rows]
+
+
+# A captured payment with a future valid_until extends the user's subscription
+# and moves them onto the plan they paid for
+@event.listens_for(models.Transaction, "after_insert")
+@event.listens_for(models.Transaction, "after_update")
+def _extend_subscription(mapper, connection, target):
+    if target.status != "captured" or target.valid_until is None or not target.user_id:
+        return
+    valid_until = target.valid_until.replace(tzinfo=None)
+    if valid_until <= datetime.utcnow():
+        return
+    previous = connection.execute(
+        select(users_table.c.subscription_status, users_table.c.subscription_plan).where(
+            users_table.c.id == target.user_id)
+    ).first()
+    plan_name = target.plan_name or previous.subscription_plan
+    result = connection.execute(
+        update(users_table).where(
+            users_table.c.id == target.user_id,
+            (users_table.c.subscription_end_date.is_(None)) | (users_table.c.subscription_end_date < valid_until),
+        ).values(subscription_end_date=valid_until, subscription_status="active", subscription_plan=plan_name)
+    )
+    if result.rowcount:
+        was_active = previous.subscription_status == "active"
+        if not was_active or previous.subscription_plan != plan_name:
+            if was_active:
+                RevenueService.apply_subscriber_delta(connection, previous.subscription_plan, -1)
+            RevenueService.apply_subscriber_delta(connection, plan_name, 1)
+        EntitlementService.sync_direct(connection, target.user_id, object_session(target))
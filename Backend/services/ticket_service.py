@@ -0,0 +1,127 @@
+# services/ticket_service.py
+import json
+import logging
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+
+import models
+
+logger = logging.getLogger(__name__)
+
+
+def parse_tag_list(tags) -> List[str]:
+    if isinstance(tags, str):
+        try:
+            tags = json.loads(tags)
+        except ValueError:
+            return []
+    if not isinstance(tags, list):
+        return []
+    return [str(tag) for tag in tags]
+
+
+class TicketService:
+    @staticmethod
+    def set_tags(ticket: models.SupportTicket, tags: Optional[List[str]]):
+        """Replace a ticket's tags in the tag table and the JSON column"""
+        unique = list(dict.fromkeys(tag.strip() for tag in (tags or []) if tag and tag.strip()))
+        existing = {link.tag: link for link in ticket.tag_links}
+        ticket.tag_links = [
+            existing.get(tag) or models.SupportTicketTag(tag=tag)
+            for tag in unique
+        ]
+        for position, link in enumerate(ticket.tag_links):
+            link.position = position
+        ticket.tags = json.dumps(unique)
+
+    @staticmethod
+    def backfill_tags(db: Session) -> int:
+        """Copy JSON tags into support_ticket_tags for tickets that have no rows yet"""
+        tagged = select(models.SupportTicketTag.ticket_id)
+        tickets = db.query(models.SupportTicket).filter(
+            models.SupportTicket.tags.isnot(None),
+            models.SupportTicket.tags != "[]",
+            models.SupportTicket.id.notin_(tagged),
+        ).all()
+        for ticket in tickets:
+            TicketService.set_tags(ticket, parse_tag_list(ticket.tags))
+        if tickets:
+            db.commit()
+            logger.info(f"Backfilled tags for {len(tickets)} support tickets")
+        return len(tickets)
+
+    @staticmethod
+    def list_tickets(
+        db: Session,
+        status: Optional[str] = None,
+        priority: Optional[str] = None,
+        category: Optional[str] = None,
+        assigned_to: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> List[models.SupportTicket]:
+        """Filtered page of tickets with children loaded in one query per relationship"""
+        query = db.query(models.SupportTicket).options(
+            selectinload(models.SupportTicket.responses),
+            selectinload(models.SupportTicket.internal_notes),
+            selectinload(models.SupportTicket.actions),
+            selectinload(models.SupportTicket.tag_links),
+        )
+
+        if status and status != "all":
+            query = query.filter(models.SupportTicket.status == status)
+        if priority and priority != "all":
+            query = query.filter(models.SupportTicket.priority == priority)
+        if category and category != "all":
+            query = query.filter(models.SupportTicket.category == category)
+        if assigned_to and assigned_to != "all":
+            if assigned_to == "unassigned":
+                query = query.filter(models.SupportTicket.assigned_to.is_(None))
+            else:
+                query = query.filter(models.SupportTicket.assigned_to == assigned_to)
+        if tags:
+            # Tickets carrying every requested tag
+            wanted = list(dict.fromkeys(tags))
+            matching = select(models.SupportTicketTag.ticket_id).where(
+                models.SupportTicketTag.tag.in_(wanted)
+            ).group_by(models.SupportTicketTag.ticket_id).having(
+                func.count() == len(wanted)
+            )
+            query = query.filter(models.SupportTicket.id.in_(matching))
+
+        return query.order_by(models.SupportTicket.created.desc()).offset(skip).limit(limit).all()
+
+    @staticmethod
+    def serialize(ticket: models.SupportTicket) -> dict:
+        return {
+            "id": ticket.id,
+            "title": ticket.title,
+            "student": ticket.student,
+            "student_email": ticket.student_email,
+            "course": ticket.course,
+            "priority": ticket.priority,
+            "status": ticket.status,
+            "category": ticket.category,
+            "description": ticket.description,
+            "assigned_to": ticket.assigned_to,
+            "tags": [link.tag for link in ticket.tag_links],
+            "sla_deadline": ticket.sla_deadline,
+            "created": ticket.created,
+            "last_update": ticket.last_update,
+            "responses": [
+                {"id": r.id, "author": r.author, "type": r.type, "message": r.message, "timestamp": r.timestamp}
+                for r in ticket.responses
+            ],
+            "internal_notes": [
+                {"id": n.id, "author": n.author, "message": n.message, "timestamp": n.timestamp}
+                for n in ticket.internal_notes
+            ],
+            "actions": [
+                {"id": a.id, "type": a.type, "user": a.user, "from_status": a.from_status,
+                 "to_status": a.to_status, "resolution": a.resolution, "timestamp": a.timestamp}
+                for a in ticket.actions
+            ],
+        }
@@ -0,0 +1,159 @@
+# test_activity_ingest.py
+import asyncio
+from datetime import date
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+import main
+import models
+from services.activity_ingest_service import ActivityBuffer, ActivityIngestService, activity_buffer
+from services.retention_service import retention_cache
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_activity_ingest():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    db.add_all([
+        models.User(id="asha", name="Asha", email="asha@example.com", total_study_hours=2,
+                    total_study_minutes=120, tests_attempted=2, average_score=80.0, last_active=date(2026, 1, 1)),
+        models.User(id="ravi", name="Ravi", email="ravi@example.com"),
+    ])
+    db.commit()
+
+    def post(body):
+        response = client.post("/api/activity/events", json=body)
+        assert response.status_code == 202, response.text
+        return response.json()
+
+    assert post({"user_id": "asha", "activity_date": "2026-03-01", "duration_minutes": 45}) == {"accepted": 1}
+    assert post([
+        {"user_id": "asha", "activity_type": "test", "activity_date": "2026-03-01", "duration_minutes": 30, "score": 50},
+        {"user_id": "asha", "activity_type": "test", "activity_date": "2026-03-02", "duration_minutes": 20, "score": 70},
+        {"user_id": "ravi", "activity_type": "login", "activity_date": "2026-02-27"},
+        {"user_id": "ghost", "activity_date": "2026-03-01", "duration_minutes": 10},
+    ]) == {"accepted": 4}
+    assert db.query(models.UserActivity).count() == 0
+    print("✓ Single and batched events are accepted into the buffer")
+
+    # One flush writes the events, the daily summaries and the user totals
+    with count_queries(engine) as statements:
+        assert client.post("/api/activity/flush").json() == {"written": 4}
+    assert sum(s.startswith("INSERT INTO user_activities ") for s in statements) == 1
+    assert db.query(models.UserActivity).count() == 4
+    db.expire_all()
+    asha = db.get(models.User, "asha")
+    assert (asha.total_study_minutes, asha.total_study_hours, asha.tests_attempted) == (215, 3, 4)
+    assert (asha.average_score, asha.last_active) == (70.0, date(2026, 3, 2))
+    ravi = db.get(models.User, "ravi")
+    assert (ravi.tests_attempted, ravi.total_study_hours, ravi.last_active) == (0, 0, date(2026, 2, 27))
+    days = client.get("/api/activity/users/asha/days").json()
+    assert [(d["day"], d["events"], d["study_minutes"], d["tests"], d["score_total"]) for d in days] == [
+        ("2026-03-01", 2, 75, 1, 50), ("2026-03-02", 1, 20, 1, 70)]
+    print("✓ A flush bulk inserts events and updates daily summaries and user totals")
+
+    # Later batches add to the same summary rows
+    post([{"user_id": "asha", "activity_date": "2026-03-02", "duration_minutes": 60}] * 3)
+    ActivityIngestService.flush(db)
+    day = client.get("/api/activity/users/asha/days", params={"start": "2026-03-02"}).json()
+    assert [(d["events"], d["study_minutes"]) for d in day] == [(4, 200)]
+    db.expire_all()
+    assert db.get(models.User, "asha").total_study_hours == 6
+    stats = client.get("/api/activity/stats").json()
+    assert stats["buffered"] == 0 and stats["dropped"] >= 1
+    print("✓ Repeated days accumulate and unknown users are dropped")
+
+    # A full buffer pushes back instead of growing
+    small = ActivityBuffer(capacity=3, batch_size=2)
+    event = {"user_id": "ravi", "activity_type": "study", "activity_date": date(2026, 3, 3),
+             "duration_minutes": 5, "score": 0}
+    assert small.offer([event, event]) and not small.offer([event, event])
+    assert asyncio.run(small.put([event, event], timeout=0.05)) is False
+    assert small.stats()["rejected"] == 2 and len(small) == 2
+    assert ActivityIngestService.flush(db, small) == 2 and len(small) == 0
+    assert asyncio.run(small.put([event], timeout=0.05)) is True
+
+    original = activity_buffer.capacity
+    activity_buffer.capacity = 1
+    try:
+        response = client.post("/api/activity/events", json=[{"user_id": "ravi"}] * 2)
+        assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+    finally:
+        activity_buffer.capacity = original
+    assert client.post("/api/activity/events", json={"user_id": "ravi", "score": 101}).status_code == 422
+    print("✓ Backpressure rejects events that do not fit within the buffer's capacity")
+
+    # A batch the database rejects is split so only the bad event is dropped;
+    # an outage puts the batch back untouched
+    write = ActivityIngestService.write
+    outages = []
+
+    def failing_write(session, events):
+        if outages and outages[0] == len(events):
+            outages.pop(0)
+            raise OperationalError("INSERT INTO user_activities", {}, Exception("database is locked"))
+        if any(event["score"] < 0 for event in events):
+            raise IntegrityError("INSERT INTO user_activities", {}, Exception("CHECK constraint failed"))
+        return write(session, events)
+
+    flaky = ActivityBuffer(capacity=20, batch_size=10)
+    flaky.offer([event] * 3)
+    poisoned = ActivityBuffer(capacity=20, batch_size=10)
+    poisoned.offer([event] * 4 + [{**event, "score": -1}] + [event] * 2)
+    ActivityIngestService.write = staticmethod(failing_write)
+    try:
+        outages[:] = [3, 3]
+        for attempt in (1, 2):
+            try:
+                ActivityIngestService.flush(db, flaky)
+                assert False, "the batch was written during the outage"
+            except OperationalError:
+                pass
+            assert (len(flaky), flaky.attempts, flaky.stats()["failed"]) == (3, attempt, 0)
+        assert ActivityIngestService.flush(db, flaky) == 3 and flaky.attempts == 0
+
+        # The outage hits while the rejected batch is being split: the part not written yet goes back
+        outages[:] = [4]
+        try:
+            ActivityIngestService.flush(db, poisoned)
+            assert False, "the batch was written during the outage"
+        except OperationalError:
+            pass
+        assert (len(poisoned), poisoned.stats()["written"], poisoned.attempts) == (4, 3, 1)
+        assert ActivityIngestService.flush(db, poisoned) == 3
+    finally:
+        ActivityIngestService.write = staticmethod(write)
+    stats = poisoned.stats()
+    assert (stats["buffered"], stats["written"], stats["failed"], stats["attempts"]) == (0, 6, 1, 0)
+    print("✓ Rejected events are dropped and counted; outages keep the batch for a later retry")
+
+    # Cached retention cohorts are dropped only once the batch is committed
+    db.get(models.User, "ravi").join_date = date(2026, 1, 10)
+    db.commit()
+    retention_cache.clear()
+    assert client.get("/api/analytics/retention", params={"start": "2026-01", "end": "2026-01"}).status_code == 200
+    cached = retention_cache.stats()["size"]
+    sizes_at_commit = []
+    commit = db.commit
+
+    def observed_commit():
+        sizes_at_commit.append(retention_cache.stats()["size"])
+        commit()
+
+    single = ActivityBuffer(capacity=1, batch_size=1)
+    single.offer([event])
+    db.commit = observed_commit
+    try:
+        assert ActivityIngestService.flush(db, single) == 1
+    finally:
+        db.commit = commit
+    assert cached == 1 and sizes_at_commit == [1] and retention_cache.stats()["size"] == 0
+    print("✓ Retention cohorts are invalidated after the batch commits")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_activity_ingest()
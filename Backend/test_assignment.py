@@ -0,0 +1,91 @@
+# test_assignment.py
+import uuid
+from datetime import timedelta
+
+import main
+import models
+from routers.auth import create_access_token, get_password_hash
+from services.assignment_service import assignment_engine
+from services.permission_engine import permission_engine
+from test_helpers import make_test_engine, make_test_client
+
+
+def make_ticket(category, assigned_to=None, status="open"):
+    return models.SupportTicket(title="Help", student="Asha", student_email="asha@example.com",
+                                course="Physics", category=category, description="...",
+                                status=status, assigned_to=assigned_to)
+
+
+def test_assignment():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+
+    support = models.Role(id=str(uuid.uuid4()), name="Support Staff", level=1,
+                          permissions='["support_tickets"]', is_active=True)
+    billing = models.Role(id=str(uuid.uuid4()), name="Billing Support", level=1,
+                          permissions='["support_tickets:billing"]', is_active=True)
+    carol = models.Employee(id=str(uuid.uuid4()), first_name="Carol", last_name="Davis",
+                            email="carol@example.com", password_hash=get_password_hash("password-123"),
+                            is_active=True, roles=[support])
+    alice = models.TeamMember(name="Alice Rao", role="Support Staff", email="alice@example.com")
+    bob = models.TeamMember(name="Bob Kumar", role="Billing Support", email="bob@example.com")
+    db.add_all([support, billing, carol, alice, bob,
+                make_ticket("technical", "Alice Rao"), make_ticket("account", "Alice Rao"),
+                make_ticket("technical", "Carol Davis"), make_ticket("content", "Carol Davis", "resolved")])
+    db.commit()
+    permission_engine.load(db)
+    assignment_engine.load(db)
+
+    def create(category):
+        response = client.post("/api/support-tickets", json={
+            "title": "New", "student": "Ravi", "student_email": "ravi@example.com",
+            "course": "Physics", "category": category, "description": "...",
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["assigned_to"]
+
+    assert create("technical") == "Carol Davis"   # 1 open vs Alice's 2
+    assert create("billing") == "Bob Kumar"       # only billing agent, 0 open
+    assert create("billing") == "Bob Kumar"       # 1 open, Alice/Carol have 2
+    assert create("technical") in ("Alice Rao", "Carol Davis")
+    print("✓ New tickets go to the least-loaded eligible agent")
+
+    # Resolving tickets frees the agent up
+    for ticket in db.query(models.SupportTicket).filter(models.SupportTicket.assigned_to == "Alice Rao"):
+        ticket.status = "resolved"
+    db.commit()
+    assert create("content") == "Alice Rao"
+
+    # Roster changes apply on the next pick
+    bob.is_active = False
+    db.commit()
+    assert create("billing") == "Alice Rao"
+    print("✓ Index follows status and roster changes")
+
+    queues = client.get("/api/support-tickets/queues").json()
+    by_agent = {queue["agent"]: queue for queue in queues["agents"]}
+    expected = {
+        name: db.query(models.SupportTicket).filter(
+            models.SupportTicket.assigned_to == name,
+            models.SupportTicket.status.in_(["open", "in_progress"]),
+        ).count()
+        for name in ("Alice Rao", "Carol Davis", "Bob Kumar")
+    }
+    assert {name: by_agent[name]["open_tickets"] for name in expected} == expected
+    assert by_agent["Bob Kumar"]["is_agent"] is False
+    assert queues["unassigned"] == 0
+
+    token = create_access_token({"sub": carol.email, "employee_id": carol.id},
+                                expires_delta=timedelta(minutes=5))
+    stats = client.get("/api/feedback/stats", headers={"Authorization": f"Bearer {token}"}).json()
+    assert stats["my_assigned_tickets"] == expected["Carol Davis"]
+    assert client.get("/api/feedback/stats").json()["my_assigned_tickets"] == 0
+    print("✓ Queue stats and my_assigned_tickets come from the index")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_assignment()
@@ -0,0 +1,84 @@
+# test_auth_cache.py
+import time
+import uuid
+from datetime import timedelta
+
+import main
+import models
+from routers.auth import create_access_token, get_password_hash
+from services.auth_cache import EmployeePrincipal, PrincipalCache, principal_cache
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_auth_cache():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    principal_cache.clear()
+    db = TestSession()
+    editor = models.Role(id=str(uuid.uuid4()), name="Editor", level=1, permissions='["course_edit"]', is_active=True)
+    employee = models.Employee(id=str(uuid.uuid4()), first_name="Cache", last_name="Test", email="cache@example.com",
+                               password_hash=get_password_hash("password-123"), is_active=True)
+    employee.roles.append(editor)
+    db.add_all([editor, employee])
+    db.commit()
+    token = create_access_token({"sub": employee.email, "employee_id": employee.id}, expires_delta=timedelta(minutes=5))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def me():
+        return client.get("/api/auth/me", headers=headers)
+
+    assert me().status_code == 200
+    hits = principal_cache.hits
+    with count_queries(engine) as statements:
+        assert me().status_code == 200
+    assert statements == [] and principal_cache.hits == hits + 1
+    print("✓ A verified token is served from the cache without DB access")
+
+    # Role changes reach the cached principal once committed
+    reviewer = models.Role(id=str(uuid.uuid4()), name="Reviewer", level=1, permissions='["review"]', is_active=True)
+    employee.roles.append(reviewer)
+    db.commit()
+    assert set(client.get("/api/auth/me/permissions", headers=headers).json()["permissions"]) == {"course_edit", "review"}
+
+    # A flushed but uncommitted deactivation keeps the committed principal,
+    # and a rollback leaves nothing queued
+    employee.is_active = False
+    db.flush()
+    assert len(principal_cache) == 1
+    db.rollback()
+    assert "auth_cache_employees" not in db.info and me().status_code == 200
+
+    # Committing the deactivation evicts the principal and the token is refused
+    employee.is_active = False
+    db.commit()
+    assert len(principal_cache) == 0
+    assert me().status_code == 401
+    assert len(principal_cache) == 0
+    print("✓ Committed role changes and deactivation evict cached principals")
+
+    # Inactive employees are rejected on a cold cache too
+    inactive = models.Employee(id=str(uuid.uuid4()), first_name="Gone", last_name="Away", email="gone@example.com",
+                               password_hash=get_password_hash("password-123"), is_active=False)
+    db.add(inactive)
+    db.commit()
+    cold = create_access_token({"sub": inactive.email, "employee_id": inactive.id}, expires_delta=timedelta(minutes=5))
+    assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {cold}"}).status_code == 401
+    assert len(principal_cache) == 0
+
+    # A principal read before an invalidation is not cached afterwards
+    cache = PrincipalCache()
+    principal = EmployeePrincipal.from_employee(inactive)
+    generation = cache.generation
+    cache.invalidate_employee(inactive.id)
+    cache.put("token", {"exp": time.time() + 60}, principal, generation)
+    assert cache.get("token") is None
+    cache.put("token", {"exp": time.time() + 60}, principal, cache.generation)
+    assert cache.get("token") is not None
+    print("✓ Inactive employees are refused and stale loads are not cached")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_auth_cache()
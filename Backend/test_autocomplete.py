@@ -0,0 +1,111 @@
+# test_autocomplete.py
+import threading
+
+import main
+import models
+from services import autocomplete_service
+from services.autocomplete_service import AutocompleteService, PrefixIndex, _user_keys
+from test_helpers import make_test_client
+
+
+def test_autocomplete():
+    client, TestSession = make_test_client()
+    db = TestSession()
+    db.add_all([
+        models.User(id="u1", name="Priya Raman", email="priya.raman@example.com"),
+        models.User(id="u2", name="Priyanka Das", email="pdas@example.com"),
+        models.User(id="u3", name="Rohan Iyer", email="rohan.iyer@example.com"),
+        models.Course(title="JEE Physics Crash Course", exam_type="JEE"),
+    ])
+    db.commit()
+    AutocompleteService.load(db)
+
+    def complete(q, **params):
+        response = client.get("/api/autocomplete/", params={"q": q, **params})
+        assert response.status_code == 200, response.text
+        return [item["id"] for item in response.json()["results"]]
+
+    assert complete("priya") == ["u1", "u2"]  # whole-word match first
+    assert complete("pri ram") == ["u1"]
+    assert complete("iyer") == ["u3"]
+    assert complete("pdas") == ["u2"]
+    assert complete("phys", type="course") != []
+    print("✓ Prefix matches on names, emails and course titles")
+
+    # Committed writes are picked up; rolled back ones are not
+    user = db.get(models.User, "u3")
+    user.name = "Rohit Iyer"
+    db.add(models.User(id="u4", name="Rohini Menon", email="rohini@example.com"))
+    db.delete(db.get(models.User, "u2"))
+    db.commit()
+    db.add(models.User(id="u5", name="Rollback Person", email="rb@example.com"))
+    db.flush()
+    db.rollback()
+    assert complete("roh") == ["u3", "u4"]
+    assert complete("rohit") == ["u3"]
+    assert complete("priya") == ["u1"]
+    assert complete("rollback") == []
+    print("✓ Index follows committed inserts, updates and deletes")
+
+    stats = client.get("/api/autocomplete/stats").json()
+    assert stats["user"]["items"] == 3 and stats["total_bytes"] > 0
+
+    # Compaction folds the delta into the main arrays
+    index = PrefixIndex("user", _user_keys)
+    index.build([(f"id{i}", f"Name{i} Person", f"n{i}@example.com") for i in range(100)])
+    for i in range(50):
+        index.upsert((f"id{i}", f"Renamed{i} Person", f"n{i}@example.com"))
+    index.compact()
+    report = index.memory_report()
+    assert report["items"] == 100 and report["delta_keys"] == 0 and report["dead_slots"] == 0
+    assert [r["id"] for r in index.search("renamed4")][:1] == ["id4"]
+    print("✓ Compaction keeps results stable")
+
+    # Past the threshold, compaction runs in the background; writes made
+    # meanwhile are replayed onto the rebuilt arrays
+    original = autocomplete_service.COMPACT_MIN
+    autocomplete_service.COMPACT_MIN = 20
+    try:
+        with index._lock:
+            for i in range(30):
+                index.upsert((f"id{i}", f"Moved{i} Person", f"n{i}@example.com"))
+            assert index.memory_report()["compacting"]
+            index.upsert((f"id0", "Latest Person", "n0@example.com"))
+            index.remove("id99")
+            index.upsert(("id100", "Added Person", "n100@example.com"))
+            assert [r["id"] for r in index.search("latest")] == ["id0"]
+        index.wait_for_compaction()
+    finally:
+        autocomplete_service.COMPACT_MIN = original
+    report = index.memory_report()
+    assert report["items"] == 100 and not report["compacting"] and report["delta_keys"] < 20
+    assert [r["id"] for r in index.search("latest")] == ["id0"] and index.search("moved0") == []
+    assert [r["id"] for r in index.search("moved29")] == ["id29"]
+    assert index.search("name99") == [] and [r["id"] for r in index.search("added")] == ["id100"]
+    print("✓ Background compaction keeps writes made while it runs")
+
+    # A request arriving during the startup load waits for it instead of loading again
+    loads = []
+    load = AutocompleteService._load
+    for kind in AutocompleteService.indexes:
+        AutocompleteService.indexes[kind].loaded = False
+    AutocompleteService._load = staticmethod(lambda session: (loads.append(1), load(session)))
+    try:
+        with AutocompleteService._load_lock:
+            waiting = threading.Thread(target=AutocompleteService.ensure_loaded, args=(db,))
+            waiting.start()
+            waiting.join(0.05)
+            assert waiting.is_alive()
+            AutocompleteService._load(db)
+        waiting.join()
+    finally:
+        AutocompleteService._load = staticmethod(load)
+    assert len(loads) == 1 and complete("rohit") == ["u3"]
+    print("✓ Autocomplete requests wait for the load already in flight")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_autocomplete()
@@ -0,0 +1,73 @@
+# test_course_counters.py
+from datetime import date
+
+import main
+import models
+from services.enrollment_stats_service import EnrollmentStatsService
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_course_counters():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    details = {"description": "", "exam_type": "jee", "instructor": "Dr. Rao", "duration": "6 months",
+               "status": "published"}
+    physics = models.Course(title="Physics", price=100.0, **details)
+    chemistry = models.Course(title="Chemistry", price=50.0, **details)
+    db.add_all([physics, chemistry])
+    db.add_all([models.User(id=f"user-{i}", name=f"User {i}", email=f"user{i}@example.com") for i in range(4)])
+    db.commit()
+
+    def enroll(user, course, progress=0, status="not_started"):
+        enrollment = models.UserCourse(user_id=user, course_id=course.id, enrollment_date=date.today(),
+                                       progress=progress, completion_status=status)
+        db.add(enrollment)
+        db.commit()
+        return enrollment
+
+    enroll("user-0", physics, 100, "completed")
+    halfway = enroll("user-1", physics, 50, "in_progress")
+    enroll("user-2", physics, 10, "in_progress")
+    enroll("user-3", chemistry)
+    db.refresh(physics)
+    assert (physics.enrolled_students, physics.completion_rate) == (3, 33.33)
+
+    halfway.progress, halfway.completion_status = 100, "completed"
+    db.commit()
+    db.delete(db.query(models.UserCourse).filter_by(user_id="user-2").one())
+    db.commit()
+    db.refresh(physics)
+    assert (physics.enrolled_students, physics.completion_rate) == (2, 100.0)
+
+    progress = client.get("/api/stats/courses/progress", params={"course_id": physics.id}).json()[0]
+    assert progress["progress_buckets"] == {"0": 0, "1-24": 0, "25-49": 0, "50-74": 0, "75-99": 0, "100": 2}
+    assert progress["average_progress"] == 100.0
+    print("✓ Enrollment writes maintain Course.enrolled_students and completion_rate")
+
+    # Stats and popularity read the maintained columns, never user_courses
+    with count_queries(engine) as statements:
+        stats = client.get("/api/stats/courses").json()
+        popular = client.get("/api/courses/popular", params={"limit": 2}).json()
+    assert not any("user_courses" in s for s in statements)
+    assert (stats["total_students"], stats["total_revenue"]) == (3, 250.0)
+    assert [c["title"] for c in popular] == ["Physics", "Chemistry"]
+    print("✓ Course stats and popular courses need no aggregate scans")
+
+    # Bulk writes bypass the events until reconciliation repairs them
+    db.query(models.UserCourse).filter_by(course_id=chemistry.id).delete()
+    db.query(models.Course).filter_by(id=physics.id).update({"enrolled_students": 99})
+    db.commit()
+    assert client.post("/api/stats/courses/reconcile").json() == {"reconciled_courses": 1}
+    db.refresh(physics)
+    db.refresh(chemistry)
+    assert (physics.enrolled_students, chemistry.enrolled_students) == (2, 0)
+    assert EnrollmentStatsService.reconcile(db) == 0
+    print("✓ Reconciliation repairs drifted counters")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_course_counters()
@@ -0,0 +1,105 @@
+# test_course_reviews.py
+import main
+import models
+from services.review_stats_service import ReviewStatsService
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_course_reviews():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    physics = models.Course(title="Physics", rating=0.0)
+    chemistry = models.Course(title="Chemistry", rating=0.0)
+    db.add_all([physics, chemistry])
+    db.commit()
+
+    # Sentiment comes from the comment text
+    comments = {"positive": "Really helpful lectures", "negative": "Terrible audio",
+                "neutral": "Covers chapter 3"}
+
+    def create(course, rating, sentiment):
+        response = client.post("/api/course-reviews", json={
+            "student": "Asha", "student_email": "asha@example.com", "course": course,
+            "rating": rating, "comment": comments[sentiment],
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    first = create("Physics", 5, "positive")
+    create("Physics", 4, "positive")
+    create("Physics", 1, "negative")
+    create("Chemistry", 3, "neutral")
+    db.refresh(physics)
+    assert physics.rating == 3.33
+
+    stats = client.get("/api/course-reviews/stats", params={"course": "Physics"}).json()
+    assert stats["courses"][0]["histogram"] == {"1": 1, "2": 0, "3": 0, "4": 1, "5": 1}
+    assert stats["overall"]["review_count"] == 4
+    print("✓ Review writes maintain per-course aggregates and Course.rating")
+
+    review = db.get(models.CourseReview, first)
+    review.course, review.rating, review.comment = "Chemistry", 2, comments["negative"]
+    db.commit()
+    assert client.delete(f"/api/course-reviews/{first + 2}").status_code == 200
+    db.refresh(physics)
+    db.refresh(chemistry)
+    assert (physics.rating, chemistry.rating) == (4.0, 2.5)
+
+    feedback = client.get("/api/feedback/stats").json()
+    assert (feedback["total_reviews"], feedback["positive_reviews"], feedback["negative_reviews"]) == (3, 1, 1)
+    assert feedback["satisfaction_rating"] == 3.0
+
+    before = client.get("/api/course-reviews/stats").json()
+    ReviewStatsService.rebuild(db)
+    assert client.get("/api/course-reviews/stats").json() == before
+    print("✓ Updates and deletes move the aggregates; rebuild agrees")
+
+    # Instructor responses load in one extra query regardless of page size
+    for review_id in range(first + 1, first + 4, 2):
+        client.post(f"/api/course-reviews/{review_id}/response", json={"message": "Thanks!"})
+    for i in range(20):
+        create("Physics", 5, "positive")
+    with count_queries(engine) as statements:
+        reviews = client.get("/api/course-reviews").json()
+    assert sum(1 for r in reviews if r["instructor_response"]) == 2
+    assert len(statements) == 2, statements
+    print("✓ Review listing eager-loads instructor responses")
+
+    # Edits of a review expired by an earlier commit move it out of its old bucket
+    biology = models.Course(title="Biology", rating=0.0)
+    review = models.CourseReview(student="Ravi", student_email="ravi@example.com", course="Biology",
+                                 rating=5, comment=comments["positive"], sentiment="positive")
+    db.add_all([biology, review])
+    db.commit()
+    review.rating = 1
+    db.commit()
+
+    def biology_stats():
+        return client.get("/api/course-reviews/stats", params={"course": "Biology"}).json()["courses"][0]
+
+    assert biology_stats()["histogram"] == {"1": 1, "2": 0, "3": 0, "4": 0, "5": 0}
+    db.delete(review)
+    db.commit()
+    stats = biology_stats()
+    assert stats["review_count"] == 0 and set(stats["histogram"].values()) == {0}
+    print("✓ Updates and deletes of expired reviews subtract their stored values")
+
+    # Rebuild resets the rating of a course whose reviews were bulk deleted
+    create("Biology", 4, "positive")
+    db.refresh(biology)
+    assert biology.rating == 4.0
+    db.query(models.CourseReview).filter(models.CourseReview.course == "Biology").delete()
+    db.commit()
+    ReviewStatsService.rebuild(db)
+    db.refresh(biology)
+    assert biology.rating == 0.0
+    assert client.get("/api/course-reviews/stats", params={"course": "Biology"}).json()["courses"] == []
+    print("✓ Rebuild resets ratings of courses left without reviews")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_course_reviews()
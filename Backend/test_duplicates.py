@@ -0,0 +1,81 @@
+# test_duplicates.py
+import main
+import models
+from services.duplicate_service import DuplicateService, signature, similarity
+from test_helpers import make_test_engine, make_test_client
+
+BUFFERING = ("Physics lecture videos keep buffering and never finish loading on my laptop "
+             "even though my internet connection is fast and other sites work fine")
+
+
+def make_ticket(title, description):
+    return models.SupportTicket(title=title, student="Asha", student_email="asha@example.com",
+                                course="Physics", category="technical", description=description)
+
+
+def test_duplicates():
+    a = signature(BUFFERING)
+    assert similarity(a, signature(BUFFERING + " please help")) > 0.75
+    assert similarity(a, signature("Refund for the chemistry crash course has not arrived yet")) < 0.2
+    assert signature("") is None
+    print("✓ MinHash similarity tracks word-shingle overlap")
+
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+
+    # Pre-existing rows get signed when the index loads
+    original = make_ticket("Videos buffering", BUFFERING)
+    db.add_all([original, make_ticket("Refund", "Refund for the chemistry crash course has not arrived")])
+    db.commit()
+    db.query(models.DuplicateSignature).delete()
+    db.commit()
+    DuplicateService.load(db)
+    assert len(DuplicateService.indexes["ticket"]) == 2
+
+    def create(title, description):
+        response = client.post("/api/support-tickets", json={
+            "title": title, "student": "Ravi", "student_email": "ravi@example.com",
+            "course": "Physics", "category": "technical", "description": description,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    repeat = create("Videos buffering", BUFFERING + " please help")
+    again = create("Videos buffering!!", BUFFERING.replace("laptop", "phone"))
+    unrelated = create("Certificate", "My certificate shows the wrong name")
+
+    flagged = {row.entity_id: row.duplicate_of for row in db.query(models.DuplicateSignature)}
+    assert flagged[repeat] == original.id
+    assert flagged[again] == original.id
+    assert flagged[unrelated] is None
+    print("✓ Duplicates flagged against the earliest entry on insert")
+
+    clusters = client.get("/api/duplicates/clusters", params={"entity": "ticket"}).json()
+    assert len(clusters) == 1
+    assert clusters[0]["root"]["id"] == original.id
+    assert [d["id"] for d in clusters[0]["duplicates"]] == [repeat, again]
+    assert client.get(f"/api/duplicates/ticket/{repeat}").json()["duplicate_of"] == original.id
+
+    # Feedback uses its own index
+    for _ in range(2):
+        db.add(models.Feedback(subject="Dark mode", message="Please add a dark mode for late night study sessions"))
+    db.commit()
+    assert client.get("/api/duplicates/clusters", params={"entity": "feedback"}).json()[0]["size"] == 2
+    print("✓ Cluster listing for tickets and feedback")
+
+    # Deleting the root breaks its cluster up; the signatures survive a reload
+    db.delete(original)
+    db.commit()
+    assert client.get("/api/duplicates/clusters").json() == []
+    DuplicateService.load(db)
+    assert len(DuplicateService.indexes["ticket"]) == 4
+    assert DuplicateService.similar("ticket", again)[0] == repeat
+    print("✓ Deletes and reloads keep the index consistent")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_duplicates()
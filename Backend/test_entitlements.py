@@ -0,0 +1,94 @@
+# test_entitlements.py
+from datetime import datetime, timedelta
+
+import main
+import models
+from services.entitlement_service import EntitlementService, entitlement_cache
+from services.subscription_expiry_service import SubscriptionExpiryService
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_entitlements():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    now = datetime.utcnow()
+
+    bundle = models.SubscriptionPlan(name="Bundle", courses=[1, 2, 3])
+    asha = models.User(id="asha", name="Asha", email="asha@example.com")
+    ravi = models.User(id="ravi", name="Ravi", email="ravi@example.com", subscription_status="active",
+                       subscription_end_date=now + timedelta(days=3), subscribed_courses=[4])
+    db.add_all([bundle, asha, ravi])
+    db.commit()
+
+    def transaction(order_id, **fields):
+        fields.setdefault("valid_until", now + timedelta(days=30))
+        return models.Transaction(user_id="asha", user_name="Asha", plan_name="Bundle", type="razorpay",
+                                  amount=999, order_id=order_id, **fields)
+
+    # Legacy rows written before the table existed are backfilled
+    db.add_all([transaction("order-1", status="captured", courses=[5]),
+                transaction("order-2", status="failed", courses=[6])])
+    db.commit()
+    db.query(models.CourseEntitlement).delete()
+    db.commit()
+    EntitlementService.ensure_populated(db)
+    assert EntitlementService.can_access(db, "asha", 5)
+    assert not EntitlementService.can_access(db, "asha", 6)
+    assert EntitlementService.can_access(db, "ravi", 4)
+    print("✓ Entitlements backfilled from transaction and user course lists")
+
+    # A purchase without a course list grants the plan's courses
+    purchase = transaction("order-3", status="captured", subscription_plan_id=bundle.id)
+    db.add(purchase)
+    db.commit()
+    courses = client.get("/api/entitlements/users/asha/courses").json()["courses"]
+    assert [c["course_id"] for c in courses] == [1, 2, 3, 5]
+
+    # Repeat checks are served from the cache
+    entitlement_cache.clear()
+    EntitlementService.can_access(db, "asha", 1)
+    with count_queries(engine) as statements:
+        for course_id in (1, 2, 3, 4, 5):
+            EntitlementService.can_access(db, "asha", course_id)
+    assert statements == []
+    assert client.get("/api/entitlements/users/asha/can-access/2").json()["can_access"] is True
+    assert client.get("/api/entitlements/courses/1/users").json()["users"] == ["asha"]
+    assert client.get("/api/entitlements/courses/counts").json() == {"1": 1, "2": 1, "3": 1, "4": 1, "5": 1}
+    print("✓ Purchases grant access; access checks hit the cache")
+
+    # Refunds revoke access and invalidate the cache on commit
+    order_1 = db.query(models.Transaction.id).filter_by(order_id="order-1").scalar()
+    refund = client.post("/api/refund-requests", json={
+        "user_id": "asha", "user_name": "Asha", "plan_name": "Bundle", "amount": 999, "reason": "Duplicate",
+        "transaction_id": order_1,
+    }).json()
+    client.put(f"/api/refund-requests/{refund['id']}", json={"status": "approved"})
+    remaining = {c["course_id"] for c in client.get("/api/entitlements/users/asha/courses").json()["courses"]}
+    assert remaining == {1, 2, 3}
+    print("✓ Refunded transactions lose their grants")
+
+    # Expired grants stop counting; the expiry job drops direct grants
+    assert not EntitlementService.can_access(db, "ravi", 4, now=now + timedelta(days=4))
+    SubscriptionExpiryService.run_once(db, now + timedelta(days=4))
+    assert db.query(models.CourseEntitlement).filter_by(user_id="ravi").count() == 0
+    assert not EntitlementService.can_access(db, "ravi", 4)
+
+    # A renewal re-activates the subscription and its direct grants
+    db.add(models.Transaction(user_id="ravi", plan_name="Solo", type="razorpay", amount=499,
+                              status="captured", order_id="order-ravi", valid_until=now + timedelta(days=30)))
+    db.commit()
+    assert EntitlementService.can_access(db, "ravi", 4)
+    print("✓ Expiry and renewal keep direct grants in step")
+
+    before = client.get("/api/entitlements/courses/counts").json()
+    assert client.post("/api/entitlements/rebuild").status_code == 200
+    assert client.get("/api/entitlements/courses/counts").json() == before
+    print("✓ Rebuild agrees with the incrementally maintained table")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_entitlements()
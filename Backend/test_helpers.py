@@ -0,0 +1,57 @@
+# test_helpers.py
+# Shared setup for the endpoint tests and benchmarks: an isolated in-memory
+# SQLite database wired into every get_db dependency, so running them never
+# touches edudashboard.db.
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import database
+import models
+
+
+def make_test_engine(url: str = "sqlite://"):
+    engine = create_engine(
+        url, connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def make_test_client(engine=None):
+    """Return (client, SessionLocal) bound to an isolated database"""
+    from fastapi.testclient import TestClient
+    import main
+    from routers import notifications
+
+    engine = engine or make_test_engine()
+    TestSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = TestSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    for dependency in (database.get_db, main.get_db, notifications.get_db):
+        main.app.dependency_overrides[dependency] = override_get_db
+
+    return TestClient(main.app), TestSession
+
+
+@contextmanager
+def count_queries(engine):
+    """Count SQL statements executed on an engine inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,56 @@
+# test_image_service.py
+import os
+import tempfile
+
+from PIL import Image
+
+import main
+import models
+from services.image_service import DERIVATIVE_SIZES, ImageDerivativeService, generate_derivatives
+from test_helpers import make_test_client
+
+
+def test_image_service():
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        os.makedirs("uploads/avatars")
+        Image.new("RGBA", (600, 300), (200, 30, 30, 128)).save("uploads/avatars/a.png")
+
+        # Both public URL forms map to the file under uploads/
+        assert ImageDerivativeService.url_to_path("/static/avatars/a.png") == "uploads/avatars/a.png"
+        assert ImageDerivativeService.url_to_path("/uploads/avatars/a.png") == "uploads/avatars/a.png"
+        for url in ("/static/avatars/a.png", "/uploads/avatars/a.png"):
+            assert ImageDerivativeService.variant_urls(url) == {}
+        print("✓ Avatar URLs under /static and /uploads resolve to the uploads directory")
+
+        written = generate_derivatives("uploads/avatars/a.png")
+        assert len(written) == len(DERIVATIVE_SIZES) * 2 and all(os.path.exists(path) for path in written)
+        with Image.open("uploads/avatars/a_64.jpg") as jpg, Image.open("uploads/avatars/a_256.webp") as webp:
+            assert (jpg.size, jpg.mode, webp.size) == ((64, 32), "RGB", (256, 128))
+        for url, prefix in (("/static/avatars/a.png", "/static/avatars/"), ("/uploads/avatars/a.png", "/uploads/avatars/")):
+            variants = ImageDerivativeService.variant_urls(url)
+            assert sorted(variants, key=int) == [str(size) for size in DERIVATIVE_SIZES]
+            assert variants["128"] == {"webp": prefix + "a_128.webp", "jpg": prefix + "a_128.jpg"}
+        os.remove("uploads/avatars/a_128.webp")
+        assert ImageDerivativeService.variant_urls("/static/avatars/a.png")["128"] == {"jpg": "/static/avatars/a_128.jpg"}
+        print("✓ Derivatives are written in every size and format and listed once they exist")
+
+        # The profile and user APIs report the thumbnails
+        client, TestSession = make_test_client()
+        db = TestSession()
+        db.add(models.User(id="asha", name="Asha Rao", email="asha@example.com", avatar_url="/uploads/avatars/a.png"))
+        db.commit()
+        profile = client.get("/api/account/profile/asha").json()
+        assert profile["avatarUrl"] == "/uploads/avatars/a.png"
+        assert profile["avatarUrls"]["64"]["webp"] == "/uploads/avatars/a_64.webp"
+        assert client.get("/api/users/asha").json()["avatar_urls"]["256"]["jpg"] == "/uploads/avatars/a_256.jpg"
+        print("✓ Profile and user responses include the avatar variants")
+        db.close()
+        main.app.dependency_overrides.clear()
+    finally:
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    test_image_service()
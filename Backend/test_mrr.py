@@ -0,0 +1,73 @@
+# test_mrr.py
+import main
+import models
+from services.mrr_service import MrrService
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_mrr():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    db.add(models.SubscriptionPlan(name="Pro", courses=[]))
+    db.add_all([models.User(id=user, name=user.title(), email=f"{user}@example.com") for user in ("asha", "ravi", "meera")])
+    db.commit()
+
+    def buy(user, order_id, day, amount, months):
+        response = client.post("/api/transactions", json={
+            "user_id": user, "user_name": user.title(), "plan_name": "Pro", "type": "razorpay",
+            "amount": amount, "status": "captured", "date": f"{day}T10:00:00", "order_id": order_id,
+            "duration_months": months,
+        })
+        assert response.status_code == 200, response.text
+        return db.query(models.Transaction.id).filter_by(order_id=order_id).scalar()
+
+    buy("asha", "a-1", "2026-01-05", 3000, 3)      # 1000/month Jan-Mar
+    buy("ravi", "r-1", "2026-01-20", 1000, 1)      # Jan, lapses in Feb
+    buy("ravi", "r-2", "2026-03-02", 2000, 1)      # comes back in Mar
+    buy("meera", "m-1", "2026-02-10", 12000, 12)   # 1000/month Feb 2026 - Jan 2027
+    addon = buy("meera", "m-2", "2026-03-15", 500, 1)
+
+    def series():
+        return client.get("/api/analytics/mrr", params={"start": "2026-01", "end": "2026-04"}).json()
+
+    jan, feb, mar, apr = series()
+    assert (jan["new_mrr"], jan["mrr"], jan["subscribers"]) == (2000, 2000, 2)
+    assert (feb["churned_mrr"], feb["new_mrr"], feb["mrr"], feb["customer_churn_rate"]) == (1000, 1000, 2000, 50.0)
+    assert (mar["reactivation_mrr"], mar["expansion_mrr"], mar["mrr"], mar["subscribers"]) == (2000, 500, 4500, 3)
+    assert (apr["churned_mrr"], apr["contraction_mrr"], apr["mrr"], apr["arr"]) == (3000, 500, 1000, 12000)
+    assert apr["revenue_churn_rate"] == 77.78
+    print("✓ Transactions are classified into new, expansion, contraction, churn and reactivation MRR")
+
+    # Snapshots kept up by the flush events match a rebuild from scratch
+    incremental = series()
+    assert MrrService.rebuild(db) > 0
+    assert series() == incremental
+
+    # Refunds and status changes restate the months the transaction covered
+    assert client.post(f"/api/refunds/transactions/{addon}", json={"amount": 500}).status_code == 200
+    first = db.query(models.Transaction.id).filter_by(order_id="a-1").scalar()
+    assert client.put(f"/api/transactions/{first}", json={"status": "failed"}).status_code == 200
+    jan, feb, mar, apr = series()
+    assert (jan["mrr"], mar["expansion_mrr"], mar["mrr"], apr["churned_mrr"]) == (1000, 0, 3000, 2000)
+    incremental = series()
+    MrrService.rebuild(db)
+    assert series() == incremental
+    print("✓ Incremental snapshots match a rebuild after inserts, refunds and status changes")
+
+    # The dashboard reads this month's figures from the snapshots, not the transactions
+    with count_queries(engine) as statements:
+        analytics = client.get("/api/analytics/subscription-analytics").json()
+    current = client.get("/api/analytics/mrr/current").json()
+    assert analytics["monthly_recurring_revenue"] == current["mrr"]
+    assert analytics["churn_rate"] == current["customer_churn_rate"]
+    assert not any("FROM transactions" in s for s in statements)
+    assert client.get("/api/analytics/mrr", params={"start": "2026-13"}).status_code == 400
+    print("✓ Subscription analytics report ledger MRR and churn instead of constants")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_mrr()
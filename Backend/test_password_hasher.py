@@ -0,0 +1,92 @@
+# test_password_hasher.py
+import asyncio
+import threading
+import uuid
+
+from fastapi import HTTPException
+
+import main
+import models
+from services.password_hasher import (
+    PASSWORD_HASH_ROUNDS, PasswordHasher, password_hasher, pwd_context, verify_and_update_sync,
+)
+from test_helpers import make_test_engine, make_test_client
+
+PASSWORD = "password-123"
+
+
+def weak_hash(password: str) -> str:
+    """A hash made before PASSWORD_HASH_ROUNDS was raised to its current value"""
+    return pwd_context.handler("pbkdf2_sha256").using(rounds=PASSWORD_HASH_ROUNDS // 10).hash(password)
+
+
+def test_password_hasher():
+    # A full queue refuses new work with 503 instead of waiting behind it
+    async def saturate():
+        hasher = PasswordHasher(max_workers=1, max_pending=1)
+        release = threading.Event()
+        busy = asyncio.ensure_future(hasher._run(release.wait))
+        await asyncio.sleep(0.05)
+        try:
+            await hasher.hash(PASSWORD)
+        except HTTPException as e:
+            refused = e
+        else:
+            refused = None
+        release.set()
+        await busy
+        hashed = await hasher.hash(PASSWORD)
+        hasher.shutdown()
+        return hasher, refused, hashed
+
+    hasher, refused, hashed = asyncio.run(saturate())
+    assert refused is not None and refused.status_code == 503 and refused.headers["Retry-After"] == "1"
+    assert hasher.stats()["rejected"] == 1 and hasher.stats()["pending"] == 0
+    assert verify_and_update_sync(PASSWORD, hashed) == (True, None)
+    print("✓ Hashing beyond max_pending is refused with 503 and Retry-After")
+
+    # Hashes with fewer rounds than PASSWORD_HASH_ROUNDS verify and come back re-hashed
+    old_hash = weak_hash(PASSWORD)
+    valid, new_hash = verify_and_update_sync(PASSWORD, old_hash)
+    assert valid and new_hash.startswith(f"$pbkdf2-sha256${PASSWORD_HASH_ROUNDS}$")
+    assert verify_and_update_sync(PASSWORD, new_hash) == (True, None)
+    assert verify_and_update_sync("wrong-password", old_hash) == (False, None)
+    print("✓ Outdated hashes are upgraded on verification")
+
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    employee = models.Employee(id=str(uuid.uuid4()), first_name="Hash", last_name="Test",
+                               email="hash@example.com", password_hash=old_hash, is_active=True)
+    db.add(employee)
+    db.commit()
+
+    def login(password=PASSWORD):
+        return client.post("/api/auth/login", json={"email": employee.email, "password": password})
+
+    assert login().status_code == 200
+    db.refresh(employee)
+    upgraded = employee.password_hash
+    assert upgraded != old_hash and upgraded.startswith(f"$pbkdf2-sha256${PASSWORD_HASH_ROUNDS}$")
+    assert login().status_code == 200
+    db.refresh(employee)
+    assert employee.password_hash == upgraded
+    assert login("wrong-password").status_code == 401
+    print("✓ Login stores the upgraded hash once")
+
+    # The login endpoint passes the 503 through to the client
+    max_pending = password_hasher.max_pending
+    password_hasher.max_pending = 0
+    try:
+        response = login()
+    finally:
+        password_hasher.max_pending = max_pending
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+    print("✓ Login answers 503 with Retry-After while the hash queue is full")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_password_hasher()
@@ -0,0 +1,186 @@
+# test_payment_webhooks.py
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import timedelta
+
+import main
+import models
+from services.entitlement_service import EntitlementService
+from services.payment_webhook_service import GATEWAYS, SIGNATURE_HEADERS
+from services.revenue_service import RevenueService
+from test_helpers import make_test_engine, make_test_client
+
+
+def razorpay_event(event, order_id, payment_id, status, amount, user_id="asha", refund=None):
+    entity = {
+        "id": payment_id, "order_id": order_id, "status": status, "amount": amount * 100,
+        "created_at": int(time.time()),
+        "notes": {"user_id": user_id, "user_name": user_id.title(), "plan_name": "Pro"},
+    }
+    payload = {"entity": "event", "event": event, "payload": {"payment": {"entity": entity}}}
+    if refund:
+        refund_id, refund_amount = refund
+        payload["payload"]["refund"] = {"entity": {"id": refund_id, "payment_id": payment_id,
+                                                   "amount": refund_amount * 100}}
+    return payload
+
+
+def signed(payload, gateway="razorpay"):
+    body = json.dumps(payload).encode()
+    secret = os.environ[f"{gateway.upper()}_WEBHOOK_SECRET"].encode()
+    return body, {SIGNATURE_HEADERS[gateway]: hmac.new(secret, body, hashlib.sha256).hexdigest()}
+
+
+def test_payment_webhooks():
+    secrets = {f"{gateway.upper()}_WEBHOOK_SECRET": f"{gateway}-secret" for gateway in GATEWAYS}
+    os.environ.update(secrets)
+    try:
+        check_payment_webhooks()
+    finally:
+        for name in secrets:
+            os.environ.pop(name, None)
+
+
+def check_payment_webhooks():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    plan = models.SubscriptionPlan(name="Pro", courses=[7, 8], duration_months=3)
+    db.add(plan)
+    db.add(models.User(id="asha", name="Asha", email="asha@example.com"))
+    db.commit()
+
+    def send(payload, gateway="razorpay"):
+        body, headers = signed(payload, gateway)
+        return client.post(f"/api/webhooks/{gateway}", content=body, headers=headers)
+
+    def post(payload, gateway="razorpay"):
+        response = send(payload, gateway)
+        assert response.status_code == 200, response.text
+        return response.json()["status"]
+
+    # Gateway retries are acknowledged without storing the event twice
+    captured = razorpay_event("payment.captured", "order-1", "pay_1", "captured", 1200)
+    assert post(razorpay_event("payment.authorized", "order-1", "pay_1", "authorized", 1200)) == "accepted"
+    assert post(captured) == "accepted"
+    assert post(captured) == "duplicate"
+    assert client.get("/api/webhooks/stats").json()["pending"] == 2
+    assert db.query(models.Transaction).count() == 0
+    print("✓ Callbacks are stored and acknowledged before any transaction is written")
+
+    # One batch creates the transaction, grants the plan's courses and moves revenue
+    assert client.post("/api/webhooks/process").json() == {"processed": 2, "failed": 0, "batches": 1}
+    tx = db.query(models.Transaction).filter_by(order_id="order-1").one()
+    assert (tx.status, tx.amount, tx.type, tx.subscription_plan_id) == ("captured", 1200, "razorpay", plan.id)
+    assert (tx.valid_until - tx.date).days == 90
+    assert EntitlementService.can_access(db, "asha", 7)
+    db.refresh(plan)
+    assert plan.revenue == 1200
+    print("✓ Processing upserts transactions, entitlements and plan revenue")
+
+    # A late authorized event does not move the transaction back
+    post(razorpay_event("payment.authorized", "order-1", "pay_1b", "authorized", 1200))
+    # A partial refund goes through the ledger; its retry is dropped at ingest
+    refund = razorpay_event("refund.processed", "order-1", "pay_1", "refunded", 1200, refund=("rfnd_1", 200))
+    post(refund)
+    assert post(refund) == "duplicate"
+    client.post("/api/webhooks/process")
+    db.refresh(tx)
+    db.refresh(plan)
+    assert (tx.status, plan.revenue) == ("captured", 1000)
+    assert client.get(f"/api/refunds/transactions/{tx.id}").json()["refunded"] == 200
+
+    # A refund delivered before its capture waits for it instead of failing
+    post(razorpay_event("refund.processed", "order-3", "pay_3", "refunded", 300, refund=("rfnd_3", 300)))
+    assert client.post("/api/webhooks/process").json()["processed"] == 0
+    assert client.get("/api/webhooks/stats").json()["pending"] == 1
+    post(razorpay_event("payment.captured", "order-3", "pay_3", "captured", 300))
+    assert client.post("/api/webhooks/process").json()["processed"] == 2
+    assert db.query(models.Transaction.status).filter_by(order_id="order-3").scalar() == "refunded"
+    print("✓ Out-of-order events are ignored and refunds land in the ledger")
+
+    # Events that cannot apply are parked as failed and replayed once fixed
+    post({"event_type": "purchase", "order_id": "gpa-1", "payment_id": "gp-1", "status": "captured",
+          "amount": 500, "user_id": "ravi", "plan_name": "Pro"}, gateway="google")
+    assert client.post("/api/webhooks/process").json()["failed"] == 1
+    failed = client.get("/api/webhooks/events", params={"status": "failed"}).json()
+    assert len(failed) == 1 and "Unknown user ravi" in failed[0]["error"]
+    assert client.get(f"/api/webhooks/events/{failed[0]['id']}").json()["payload"]["order_id"] == "gpa-1"
+
+    db.add(models.User(id="ravi", name="Ravi", email="ravi@example.com"))
+    db.commit()
+    assert client.post("/api/webhooks/replay", json={}).json() == {"replayed": 1}
+    assert db.query(models.Transaction).filter_by(order_id="gpa-1").one().type == "google"
+    # Replaying a processed refund does not refund twice
+    refund_event = client.get("/api/webhooks/events", params={"order_id": "order-1"}).json()[0]
+    client.post("/api/webhooks/replay", json={"event_ids": [refund_event["id"]]})
+    db.refresh(plan)
+    assert plan.revenue == 1500
+    stats = client.get("/api/webhooks/stats").json()
+    assert (stats["pending"], stats["failed"], stats["processed"]) == (0, 0, 7)
+    print("✓ Failed events replay after the cause is fixed; replays are idempotent")
+
+    # Bad payloads, bad signatures and unsigned callbacks are rejected
+    assert send({"event": "payment.captured"}).status_code == 400
+    assert client.post("/api/webhooks/paypal", json={}).status_code == 404
+    body, headers = signed(razorpay_event("payment.captured", "order-2", "pay_2", "captured", 100))
+    assert client.post("/api/webhooks/razorpay", content=body,
+                       headers={"X-Razorpay-Signature": "bad"}).status_code == 401
+    assert client.post("/api/webhooks/razorpay", content=body).status_code == 401
+    assert client.post("/api/webhooks/razorpay", content=body, headers=headers).status_code == 200
+
+    # Without a configured secret nothing is accepted unless unsigned callbacks are allowed explicitly
+    secret = os.environ.pop("GOOGLE_WEBHOOK_SECRET")
+    unsigned = {"event_type": "purchase", "order_id": "gpa-2", "payment_id": "gp-2", "status": "captured",
+                "amount": 100, "user_id": "asha", "plan_name": "Pro"}
+    try:
+        assert client.post("/api/webhooks/google", json=unsigned).status_code == 401
+        os.environ["PAYMENT_WEBHOOK_ALLOW_UNSIGNED"] = "1"
+        assert client.post("/api/webhooks/google", json=unsigned).status_code == 200
+    finally:
+        os.environ["GOOGLE_WEBHOOK_SECRET"] = secret
+        os.environ.pop("PAYMENT_WEBHOOK_ALLOW_UNSIGNED", None)
+    print("✓ Malformed payloads, invalid signatures and unsigned callbacks are refused")
+
+    # A capture that arrives hours after its refund still applies: the refund is retried with
+    # backoff from when it arrived rather than on every pass, and fails only after the retry window
+    post(razorpay_event("refund.processed", "order-4", "pay_4", "refunded", 400, refund=("rfnd_4", 400)))
+    for _ in range(5):
+        client.post("/api/webhooks/process")
+    early = db.query(models.PaymentWebhookEvent).filter_by(order_id="order-4").one()
+    assert (early.status, early.attempts) == ("pending", 1)
+    early.received_at -= timedelta(hours=30)
+    db.commit()
+    client.post("/api/webhooks/process")
+    db.refresh(early)
+    assert (early.status, early.attempts) == ("pending", 2)
+    post(razorpay_event("payment.captured", "order-4", "pay_4", "captured", 400))
+    assert client.post("/api/webhooks/process").json()["processed"] == 2
+    assert db.query(models.Transaction.status).filter_by(order_id="order-4").scalar() == "refunded"
+
+    post(razorpay_event("refund.processed", "order-5", "pay_5", "refunded", 500, refund=("rfnd_5", 500)))
+    client.post("/api/webhooks/process")
+    stale = db.query(models.PaymentWebhookEvent).filter_by(order_id="order-5").one()
+    stale.received_at -= timedelta(hours=49)
+    db.commit()
+    assert client.post("/api/webhooks/process").json()["failed"] == 1
+    assert "before its capture" in client.get(f"/api/webhooks/events/{stale.id}").json()["error"]
+    print("✓ Deferred events wait for late captures and fail only after the retry window")
+
+    client.post("/api/webhooks/process")
+    db.refresh(plan)
+    incremental = plan.revenue
+    RevenueService.update_all_plans_revenue(db)
+    db.refresh(plan)
+    assert plan.revenue == incremental
+    print("✓ Incremental revenue matches a recount")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_payment_webhooks()
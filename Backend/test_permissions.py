@@ -0,0 +1,88 @@
+# test_permissions.py
+import uuid
+from datetime import timedelta
+
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import main
+import models
+from routers.auth import create_access_token, get_password_hash, require_permission
+from services.permission_engine import parse_permissions, permission_engine
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_permissions():
+    # Stored formats: list, JSON, double-encoded JSON, Python repr
+    assert parse_permissions(["a", "b"]) == ["a", "b"]
+    assert parse_permissions('["a", "b"]') == ["a", "b"]
+    assert parse_permissions('"[\\"a\\", \\"b\\"]"') == ["a", "b"]
+    assert parse_permissions("['a', 'b']") == ["a", "b"]
+    assert parse_permissions("__import__('os')") == ["__import__('os')"]
+    print("✓ parse_permissions handles stored formats without eval")
+
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+
+    # The guard lives on a throwaway app so importing this module leaves main.app alone
+    guard = APIRouter()
+
+    @guard.get("/_test/permission-guard")
+    async def permission_guard(principal=Depends(require_permission("course_edit"))):
+        return {"ok": True}
+
+    guard_app = FastAPI()
+    guard_app.include_router(guard)
+    guard_app.dependency_overrides = main.app.dependency_overrides
+    guard_client = TestClient(guard_app)
+    db = TestSession()
+    role = models.Role(id=str(uuid.uuid4()), name="Editor", level=1,
+                       permissions='["course_edit"]', is_active=True)
+    employee = models.Employee(
+        id=str(uuid.uuid4()), first_name="Perm", last_name="Test",
+        email="perm@example.com", password_hash=get_password_hash("password-123"),
+        is_active=True,
+    )
+    employee.roles.append(role)
+    db.add_all([role, employee])
+    db.commit()
+    permission_engine.load(db)
+    token = create_access_token({"sub": employee.email, "employee_id": employee.id},
+                                expires_delta=timedelta(minutes=5))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert guard_client.get("/_test/permission-guard", headers=headers).status_code == 200
+    with count_queries(engine) as statements:
+        assert guard_client.get("/_test/permission-guard", headers=headers).status_code == 200
+    assert statements == [], statements
+    print("✓ require_permission checks without DB access once warm")
+
+    # An edit takes effect when it commits; a rolled back edit never does
+    role.permissions = '["media_upload"]'
+    db.flush()
+    assert permission_engine.role_permissions("Editor") == {"course_edit"}
+    db.rollback()
+    assert permission_engine.role_permissions("Editor") == {"course_edit"}
+    assert guard_client.get("/_test/permission-guard", headers=headers).status_code == 200
+
+    # Committing the edit revokes the permission immediately
+    role.permissions = '["media_upload"]'
+    db.commit()
+    assert guard_client.get("/_test/permission-guard", headers=headers).status_code == 403
+
+    # Wildcard role grants everything
+    admin = models.Role(id=str(uuid.uuid4()), name="Root", level=10,
+                        permissions='["all"]', is_active=True)
+    employee.roles.append(admin)
+    db.commit()
+    assert guard_client.get("/_test/permission-guard", headers=headers).status_code == 200
+    me = client.get("/api/auth/me/permissions", headers=headers).json()
+    assert set(me["permissions"]) == {"media_upload", "all"}
+    print("✓ Role edits and assignments invalidate cached permissions")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_permissions()
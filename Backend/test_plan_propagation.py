@@ -0,0 +1,71 @@
+# test_plan_propagation.py
+from datetime import datetime, timedelta
+
+import main
+import models
+from services import plan_propagation_service
+from services.entitlement_service import EntitlementService
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_plan_propagation():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    now = datetime.utcnow()
+
+    plan = models.SubscriptionPlan(name="Bundle", courses=[1, 2])
+    other = models.SubscriptionPlan(name="Solo", courses=[1])
+    db.add_all([plan, other])
+    db.flush()
+    for i in range(5):
+        db.add(models.User(id=f"user-{i}", name=f"User {i}", email=f"user{i}@example.com"))
+        db.add(models.Transaction(user_id=f"user-{i}", plan_name="Bundle", subscription_plan_id=plan.id,
+                                  type="razorpay", amount=999, status="captured", order_id=f"order-{i}",
+                                  valid_until=now + timedelta(days=30)))
+    db.add(models.User(id="lapsed", name="Lapsed", email="lapsed@example.com"))
+    db.add(models.Transaction(user_id="lapsed", plan_name="Bundle", subscription_plan_id=plan.id,
+                              type="razorpay", amount=999, status="captured", order_id="order-lapsed",
+                              valid_until=now - timedelta(days=1)))
+    db.add(models.Transaction(user_id="user-0", plan_name="Solo", subscription_plan_id=other.id,
+                              type="razorpay", amount=499, status="captured", order_id="order-solo",
+                              valid_until=now + timedelta(days=30)))
+    db.commit()
+    assert EntitlementService.can_access(db, "user-3", 2)
+
+    # The edit only queues a job; the job rewrites grants in chunks afterwards
+    plan_propagation_service.PROPAGATION_CHUNK_SIZE = 2
+    with count_queries(engine) as statements:
+        response = client.put(f"/api/subscription-plans/{plan.id}", json={"courses": [2, 3]})
+    assert response.status_code == 200, response.text
+    deletes = [s for s in statements if s.lstrip().upper().startswith("DELETE FROM COURSE_ENTITLEMENTS")]
+    assert len(deletes) == 3  # 5 live subscriptions in chunks of 2
+
+    jobs = client.get("/api/entitlements/jobs", params={"plan_id": plan.id}).json()
+    assert len(jobs) == 1
+    job = client.get(f"/api/entitlements/jobs/{jobs[0]['id']}").json()
+    assert (job["status"], job["added_courses"], job["removed_courses"]) == ("completed", [3], [1])
+    assert (job["total"], job["processed"], job["progress"]) == (5, 5, 1.0)
+    print("✓ Course list edits queue a propagation job that reports progress")
+
+    for i in range(5):
+        courses = [c["course_id"] for c in client.get(f"/api/entitlements/users/user-{i}/courses").json()["courses"]]
+        assert courses == ([1, 2, 3] if i == 0 else [2, 3]), (i, courses)
+    assert db.query(models.CourseEntitlement).filter_by(user_id="lapsed", course_id=3).count() == 0
+    print("✓ Added and removed courses reach live subscribers only")
+
+    # Edits that leave the course set unchanged queue nothing; re-running is a no-op
+    client.put(f"/api/subscription-plans/{plan.id}", json={"courses": [3, 2], "slogan": "New"})
+    assert len(client.get("/api/entitlements/jobs").json()) == 1
+    before = client.get("/api/entitlements/courses/counts").json()
+    client.post("/api/entitlements/rebuild")
+    assert client.get("/api/entitlements/courses/counts").json() == before
+    print("✓ Propagated grants match a full rebuild")
+
+    plan_propagation_service.PROPAGATION_CHUNK_SIZE = 1000
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_plan_propagation()
@@ -0,0 +1,135 @@
+# test_refunds.py
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+import models
+from services.refund_service import RefundService
+from services.revenue_service import RevenueService
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_refunds():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    plan = models.SubscriptionPlan(name="Pro", courses=[])
+    db.add(plan)
+    db.add_all([
+        models.User(id="asha", name="Asha", email="asha@example.com",
+                    subscription_status="active", subscription_plan="Pro"),
+        models.User(id="ravi", name="Ravi", email="ravi@example.com"),
+    ])
+    db.commit()
+
+    response = client.post("/api/transactions", json={
+        "user_id": "asha", "user_name": "Asha", "plan_name": "Pro", "type": "razorpay", "amount": 1000,
+        "status": "captured", "date": datetime.utcnow().isoformat(), "order_id": "order-1",
+    })
+    assert response.status_code == 200, response.text
+    transaction_id = db.query(models.Transaction.id).filter_by(order_id="order-1").scalar()
+    db.refresh(plan)
+    assert (plan.revenue, plan.subscribers) == (1000, 1)
+    print("✓ Captured transactions and active users move plan aggregates")
+
+    # A partial refund request links to its transaction when created
+    request = client.post("/api/refund-requests", json={
+        "user_id": "asha", "user_name": "Asha", "plan_name": "Pro", "amount": 300, "reason": "Downgrade"
+    }).json()
+    assert request["transaction_id"] == transaction_id
+    assert client.put(f"/api/refund-requests/{request['id']}", json={"status": "approved"}).status_code == 200
+    summary = client.get(f"/api/refunds/transactions/{transaction_id}").json()
+    assert (summary["status"], summary["refunded"], summary["remaining"]) == ("captured", 300, 700)
+    assert summary["entries"][0]["refund_request_id"] == request["id"]
+    db.refresh(plan)
+    assert plan.revenue == 700
+    print("✓ Approved requests record a ledger entry and reduce revenue in the same commit")
+
+    # Refunds cannot exceed what is left; the final one marks the transaction refunded
+    over = client.post(f"/api/refunds/transactions/{transaction_id}", json={"amount": 800})
+    assert over.status_code == 400
+    rest = client.post(f"/api/refunds/transactions/{transaction_id}", json={"amount": 700, "reason": "Closed"})
+    assert rest.status_code == 200, rest.text
+    db.refresh(plan)
+    assert plan.revenue == 0
+    assert db.get(models.Transaction, transaction_id).status == "refunded"
+    assert client.post(f"/api/refunds/transactions/{transaction_id}", json={"amount": 1}).status_code == 400
+
+    # Requests without a matching transaction cannot be approved
+    orphan = client.post("/api/refund-requests", json={
+        "user_id": "ravi", "user_name": "Ravi", "plan_name": "Pro", "amount": 100, "reason": "?"
+    }).json()
+    assert orphan["transaction_id"] is None
+    assert client.put(f"/api/refund-requests/{orphan['id']}", json={"status": "approved"}).status_code == 400
+    print("✓ Partial refunds add up to a full refund and never exceed the amount")
+
+    # Refunds approved before the ledger existed are linked and recorded by the backfill
+    db.add(models.Transaction(user_id="ravi", user_name="Ravi", plan_name="Pro", type="razorpay",
+                              amount=500, status="refunded", order_id="order-2"))
+    db.add(models.RefundRequest(user_id="ravi", user_name="Ravi", plan_name="Pro", amount=500,
+                                reason="Legacy", status="approved"))
+    db.commit()
+    assert client.post("/api/refunds/backfill").json() == {"linked": 1, "ledger_entries": 1}
+    with count_queries(engine) as statements:
+        assert client.post("/api/refunds/backfill").json() == {"linked": 0, "ledger_entries": 0}
+    assert not any("FROM transactions" in s and "refund_ledger" not in s for s in statements)
+    assert len(client.get("/api/refunds", params={"user_id": "ravi"}).json()) == 1
+
+    db.refresh(plan)
+    incremental = (plan.revenue, plan.subscribers)
+    RevenueService.update_all_plans_revenue(db)
+    db.refresh(plan)
+    assert (plan.revenue, plan.subscribers) == incremental
+    print("✓ Backfill links legacy refunds; incremental aggregates match a recount")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+    # Two refunds of one transaction racing on separate connections: the
+    # second waits for the first to commit and sees what it refunded
+    path = os.path.join(tempfile.mkdtemp(), "refunds.db")
+    file_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=file_engine)
+    FileSession = sessionmaker(autocommit=False, autoflush=False, bind=file_engine)
+    with FileSession() as setup:
+        tx = models.Transaction(user_id="asha", plan_name="Pro", type="razorpay", amount=1000, status="captured")
+        setup.add(tx)
+        setup.commit()
+        transaction_id = tx.id
+
+    first = FileSession()
+    RefundService.refund(first, first.get(models.Transaction, transaction_id), 600)
+    first.flush()
+    outcome = []
+
+    def second_refund():
+        with FileSession() as second:
+            try:
+                RefundService.refund(second, second.get(models.Transaction, transaction_id), 600)
+                second.commit()
+                outcome.append("refunded")
+            except ValueError as e:
+                outcome.append(str(e))
+
+    racer = threading.Thread(target=second_refund)
+    racer.start()
+    racer.join(0.3)
+    assert racer.is_alive()
+    first.commit()
+    first.close()
+    racer.join()
+    assert outcome == [f"Refund of 600 exceeds the 400 left on transaction {transaction_id}"]
+    with FileSession() as check:
+        assert RefundService.refunded(check, transaction_id) == 600
+    file_engine.dispose()
+    os.remove(path)
+    print("✓ Concurrent refunds of one transaction cannot exceed its amount")
+
+
+if __name__ == "__main__":
+    test_refunds()
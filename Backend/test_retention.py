@@ -0,0 +1,103 @@
+# test_retention.py
+from datetime import date
+
+import numpy as np
+
+import main
+import models
+from services import retention_service
+from services.retention_service import RetentionService, retention_cache, retention_counts
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_retention():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    retention_cache.clear()
+    db = TestSession()
+    joined = {"asha": date(2026, 1, 5), "ravi": date(2026, 1, 20), "meera": date(2026, 2, 3), "dev": date(2026, 2, 10)}
+    db.add_all([models.User(id=user, name=user.title(), email=f"{user}@example.com", join_date=day)
+                for user, day in joined.items()])
+    activity = [
+        ("asha", date(2026, 1, 5)), ("asha", date(2026, 1, 6)), ("asha", date(2026, 1, 14)),
+        ("asha", date(2026, 2, 2)), ("asha", date(2026, 3, 30)),
+        ("ravi", date(2026, 1, 20)), ("ravi", date(2026, 2, 25)),
+        ("meera", date(2026, 2, 3)), ("meera", date(2026, 2, 5)), ("meera", date(2026, 1, 30)),
+    ]
+    db.add_all([models.UserActivity(user_id=user, activity_date=day, activity_type="study") for user, day in activity])
+    db.commit()
+
+    def retention(**params):
+        response = client.get("/api/analytics/retention", params={"start": "2026-01", "end": "2026-02", **params})
+        assert response.status_code == 200, response.text
+        return response.json()["cohorts"]
+
+    jan, feb = retention(periods=3)
+    assert (jan["cohort"], jan["users"], jan["active"], jan["retention"]) == ("2026-01", 2, [2, 2, 1], [100.0, 100.0, 50.0])
+    # Activity before joining is ignored; dev never came back
+    assert (feb["users"], feb["active"]) == (2, [1, 0, 0])
+    weeks = retention(granularity="week", periods=4)
+    # asha: weeks 0, 1 and 4; ravi: weeks 0 and 5
+    assert weeks[0]["active"] == [2, 1, 0, 0]
+    print("✓ Cohorts are bucketed by join month with distinct active users per period")
+
+    # Cached cohorts are served without touching user_activities until activity changes
+    with count_queries(engine) as statements:
+        retention(periods=3)
+    assert not any("user_activities" in s for s in statements)
+    db.add(models.UserActivity(user_id="dev", activity_date=date(2026, 3, 1), activity_type="test"))
+    db.commit()
+    assert retention(periods=3)[1]["active"] == [1, 1, 0]
+    db.get(models.User, "dev").join_date = date(2026, 1, 31)
+    db.commit()
+    jan, feb = retention(periods=3)
+    assert (jan["users"], jan["active"], feb["users"]) == (3, [2, 2, 2], 1)
+    print("✓ Activity and join date changes invalidate the affected cohorts")
+
+    # Flushed changes drop cached cohorts only once they are committed
+    retention(periods=3)
+    cached = retention_cache.stats()["size"]
+    db.add(models.UserActivity(user_id="meera", activity_date=date(2026, 3, 2), activity_type="study"))
+    db.flush()
+    assert db.info["retention_cohorts"] == {retention_service.month_number(date(2026, 2, 1))}
+    assert retention_cache.stats()["size"] == cached
+    db.rollback()
+    assert "retention_cohorts" not in db.info and retention_cache.stats()["size"] == cached
+    db.add(models.UserActivity(user_id="meera", activity_date=date(2026, 3, 2), activity_type="study"))
+    db.commit()
+    assert retention_cache.stats()["size"] == cached - 1
+    assert retention(periods=3)[1]["active"] == [1, 1, 0]
+    print("✓ Cached cohorts are dropped after commit and kept on rollback")
+
+    # Rows split across fetch batches are counted once
+    retention_cache.clear()
+    retention_service.FETCH_BATCH = 1
+    try:
+        assert retention(periods=3)[0]["active"] == [2, 2, 2]
+    finally:
+        retention_service.FETCH_BATCH = 100000
+
+    # Unsorted input gives the same matrix as sorted input
+    rng = np.random.default_rng(3)
+    users = rng.integers(0, 1000, 20000)
+    offsets = rng.integers(-2, 14, 20000)
+    cohorts = users % 4
+    shuffled = retention_counts(users, cohorts, offsets, 4, 12)
+    order = np.lexsort((offsets, users))
+    assert (shuffled == retention_counts(users[order], cohorts[order], offsets[order], 4, 12)).all()
+    assert shuffled[:, 0].sum() == len({u for u, o in zip(users, offsets) if o == 0})
+
+    assert client.get("/api/analytics/retention", params={"granularity": "day"}).status_code == 400
+    assert client.get("/api/analytics/retention", params={"start": "2026-03", "end": "2026-01"}).status_code == 400
+    assert client.get("/api/analytics/retention", params={"periods": 61}).status_code == 400
+    assert len(client.get("/api/analytics/retention").json()["cohorts"]) == 12
+    assert RetentionService.matrix(db, date(2026, 1, 1), date(2026, 1, 1), "month",
+                                   today=date(2026, 2, 15))["cohorts"][0]["active"] == [2, 2]
+    print("✓ Periods are limited to those that have started, and bad parameters are rejected")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_retention()
@@ -0,0 +1,133 @@
+# test_revenue_series.py
+import os
+import tempfile
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+import main
+import models
+from services.revenue_series_service import RevenueSeriesService, buckets_table
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_revenue_series():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    db.add_all([models.SubscriptionPlan(name="Pro", courses=[]), models.SubscriptionPlan(name="Basic", courses=[])])
+    db.add_all([
+        models.User(id="asha", name="Asha", email="asha@example.com", exam_type="jee"),
+        models.User(id="ravi", name="Ravi", email="ravi@example.com", exam_type="neet"),
+    ])
+    db.commit()
+
+    def buy(user, order_id, day, plan, gateway, amount, status="captured"):
+        response = client.post("/api/transactions", json={
+            "user_id": user, "user_name": user.title(), "plan_name": plan, "type": gateway, "amount": amount,
+            "status": status, "date": f"{day}T09:30:00", "order_id": order_id,
+        })
+        assert response.status_code == 200, response.text
+        return db.query(models.Transaction.id).filter_by(order_id=order_id).scalar()
+
+    pro = buy("asha", "o-1", "2026-01-05", "Pro", "razorpay", 1000)
+    buy("ravi", "o-2", "2026-01-20", "Basic", "google", 500)
+    pending = buy("asha", "o-3", "2026-03-10", "Basic", "razorpay", 300, status="pending")
+    buy("ravi", "o-4", "2026-03-11", "Pro", "apple", 800, status="failed")
+
+    def series(**params):
+        response = client.get("/api/analytics/revenue/series",
+                              params={"start": "2026-01-01", "end": "2026-04-30", **params})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    months = series(granularity="month", group_by="plan")
+    assert [m["label"] for m in months["data"]] == ["2026-01", "2026-02", "2026-03", "2026-04"]
+    assert [m["revenue"] for m in months["data"]] == [1500, 0, 0, 0]
+    assert months["data"][0]["breakdown"] == {"Basic": 500, "Pro": 1000}
+    assert series(granularity="month", group_by="exam")["data"][0]["breakdown"] == {"jee": 1000, "neet": 500}
+    weeks = series(granularity="week", end="2026-01-31")["data"]
+    assert (weeks[0]["label"], weeks[1]["revenue"], len(weeks)) == ("2026-W01", 1000, 5)
+    days = series(end="2026-01-07")["data"]
+    assert len(days) == 7 and days[4] == {"period": "2026-01-05", "label": "2026-01-05", "revenue": 1000,
+                                           "gross": 1000, "refunded": 0, "transactions": 1}
+    print("✓ Series cover any range and granularity, with breakdowns and gaps filled")
+
+    # Status changes, refunds, exam changes and deletes move the buckets in the same commit
+    assert client.put(f"/api/transactions/{pending}", json={"status": "captured"}).status_code == 200
+    assert client.post(f"/api/refunds/transactions/{pro}", json={"amount": 200}).status_code == 200
+    db.get(models.User, "ravi").exam_type = "jee"
+    db.delete(db.query(models.Transaction).filter_by(order_id="o-4").one())
+    db.commit()
+    quarter = series(granularity="quarter", group_by="exam")["data"][0]
+    assert (quarter["revenue"], quarter["gross"], quarter["refunded"], quarter["transactions"]) == (1600, 1800, 200, 3)
+    assert quarter["breakdown"] == {"jee": 1600}
+    assert RevenueSeriesService.reconcile(db) == 0
+    print("✓ Incremental buckets match a recount from transactions")
+
+    # Multi-year ranges read only the buckets
+    with count_queries(engine) as statements:
+        years = client.get("/api/analytics/revenue/series", params={
+            "start": "2020-01-01", "end": "2026-12-31", "granularity": "year", "group_by": "type"}).json()
+    assert not any("FROM transactions" in s for s in statements)
+    assert years["data"][-1]["breakdown"] == {"google": 500, "razorpay": 1100}
+    assert years["total_revenue"] == 1600
+
+    assert client.get("/api/analytics/revenue/series", params={"granularity": "hour"}).status_code == 400
+    assert client.get("/api/analytics/revenue/series", params={"start": "2000-01-01", "end": "2026-01-01"}).status_code == 400
+    assert len(client.get("/api/analytics/revenue", params={"period": "daily"}).json()["data"]) == 7
+    assert len(client.get("/api/analytics/revenue", params={"period": "monthly"}).json()["data"]) == 12
+    print("✓ Legacy revenue periods are fixed, gap-filled windows")
+
+    # The first period is counted from its own start, not from the requested day
+    buy("asha", "o-5", "2025-12-30", "Pro", "razorpay", 100)
+    weeks = series(granularity="week", end="2026-01-31")
+    first = weeks["data"][0]
+    assert (weeks["start"], first["period"], first["revenue"]) == ("2025-12-29", "2025-12-29", 100)
+    assert series(granularity="month")["data"][0]["revenue"] == 1300
+    print("✓ A series starting mid-period still counts the whole first period")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+    # Reconcile recounts under a lock, so a sale committed after its first
+    # pass is kept instead of overwritten
+    path = os.path.join(tempfile.mkdtemp(), "revenue.db")
+    file_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=file_engine)
+    FileSession = sessionmaker(autocommit=False, autoflush=False, bind=file_engine)
+
+    def sale(amount):
+        with FileSession() as writer:
+            writer.add(models.Transaction(plan_name="Pro", type="razorpay", amount=amount, status="captured",
+                                          date=datetime(2026, 2, 2, 10)))
+            writer.commit()
+
+    sale(100)
+    with FileSession() as setup:
+        setup.execute(update(buckets_table).values(gross=0))
+        setup.commit()
+    lock = RevenueSeriesService._lock_buckets
+
+    def sale_then_lock(session):
+        sale(50)
+        lock(session)
+
+    RevenueSeriesService._lock_buckets = staticmethod(sale_then_lock)
+    try:
+        with FileSession() as session:
+            assert RevenueSeriesService.reconcile(session) == 1
+    finally:
+        RevenueSeriesService._lock_buckets = staticmethod(lock)
+    with FileSession() as check:
+        data = RevenueSeriesService.series(check, date(2026, 2, 2), date(2026, 2, 2))["data"]
+        assert (data[0]["gross"], data[0]["transactions"]) == (150, 2)
+        assert RevenueSeriesService.reconcile(check) == 0
+    file_engine.dispose()
+    os.remove(path)
+    print("✓ Reconcile does not overwrite writes committed while it compares")
+
+
+if __name__ == "__main__":
+    test_revenue_series()
@@ -0,0 +1,170 @@
+# test_roles_endpoints.py
+import uuid
+import tempfile
+from datetime import datetime, timedelta
+
+import main
+import models
+from services import role_history_service
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def seed_roles(db, count, users_per_role=3):
+    for i in range(count):
+        role = models.Role(id=str(uuid.uuid4()), name=f"Role {uuid.uuid4().hex[:8]}",
+                           description="Seeded role", level=1, permissions=["user_view"],
+                           is_active=True)
+        db.add(role)
+        for _ in range(users_per_role):
+            user_id = str(uuid.uuid4())
+            db.add(models.User(id=user_id, name="Student", email=f"{user_id}@example.com"))
+            db.flush()
+            db.execute(models.user_roles.insert().values(user_id=user_id, role_id=role.id))
+    db.commit()
+
+
+def test_roles_endpoints():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+
+    query_counts = []
+    for total in (3, 30):
+        seed_roles(db, total - sum(1 for _ in db.query(models.Role.id)))
+        with count_queries(engine) as statements:
+            response = client.get("/api/roles/", params={"limit": 100})
+        assert response.status_code == 200, response.text
+        roles = response.json()
+        assert len(roles) == total
+        assert all(role["user_count"] == 3 for role in roles)
+        query_counts.append(len(statements))
+
+    assert query_counts[0] == query_counts[1], query_counts
+    print(f"✓ GET /api/roles runs {query_counts[0]} queries for 3 and 30 roles")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+def test_bulk_role_assignment():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    seed_roles(db, 1, users_per_role=0)
+    role_id = db.query(models.Role.id).scalar()
+    user_ids = [str(uuid.uuid4()) for _ in range(2000)]
+    db.add_all(models.User(id=u, name="Student", email=f"{u}@example.com") for u in user_ids)
+    db.execute(models.user_roles.insert().values(user_id=user_ids[0], role_id=role_id))
+    db.commit()
+
+    payload = {
+        "role_id": role_id,
+        "assigned_by": "admin",
+        "user_ids": user_ids + ["missing-user", user_ids[1]],
+    }
+    with count_queries(engine) as statements:
+        response = client.post("/api/roles/bulk-assign", json=payload)
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["success_count"] == 1999
+    assert f"User {user_ids[0]} already has this role" in result["errors"]
+    assert f"User {user_ids[1]} already has this role" in result["errors"]
+    assert "User missing-user not found" in result["errors"]
+    assert len(result["errors"]) == 3
+    # Statements scale with chunks, not users
+    assert len(statements) < 30, len(statements)
+    print(f"✓ Bulk assign of {len(payload['user_ids'])} ids ran {len(statements)} statements")
+
+    history = db.query(models.RoleAssignmentHistory).filter_by(action="assigned").count()
+    assert history == 1999
+
+    payload["user_ids"] = user_ids[:1000] + ["missing-user"]
+    response = client.post("/api/roles/bulk-remove", json=payload)
+    result = response.json()
+    assert result["success_count"] == 1000
+    assert result["errors"] == ["Role assignment not found for user missing-user"]
+    remaining = db.execute(models.user_roles.select()).fetchall()
+    assert len(remaining) == 1000
+    assert db.query(models.RoleAssignmentHistory).filter_by(action="removed").count() == 1000
+    print("✓ Bulk remove mirrors bulk assign")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+def test_role_history_pagination_and_archive():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    seed_roles(db, 1, users_per_role=2)
+    role_id = db.query(models.Role.id).scalar()
+    user_ids = [row[0] for row in db.query(models.User.id)]
+    now = datetime.utcnow()
+    # Three entries per day over 300 days, two sharing each timestamp
+    for day in range(300):
+        for n, user_id in enumerate(user_ids + user_ids[:1]):
+            db.add(models.RoleAssignmentHistory(
+                id=f"{day:04d}-{n}", user_id=user_id, role_id=role_id, action="assigned",
+                assigned_by="admin", timestamp=now - timedelta(days=day, hours=n // 2),
+            ))
+    db.commit()
+    expected = [row[0] for row in db.query(models.RoleAssignmentHistory.id).order_by(
+        models.RoleAssignmentHistory.timestamp.desc(), models.RoleAssignmentHistory.id.desc())]
+
+    def walk(**params):
+        seen, cursor = [], None
+        while True:
+            response = client.get("/api/roles/assignments/history",
+                                  params={**params, "limit": 70, **({"cursor": cursor} if cursor else {})})
+            assert response.status_code == 200, response.text
+            seen.extend(entry["id"] for entry in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return seen
+
+    assert walk() == expected
+    print(f"✓ Keyset pagination returns all {len(expected)} entries once, in order")
+
+    default_archive_dir = role_history_service.ARCHIVE_DIR
+    read_archive = role_history_service.RoleHistoryService._read_archive
+    with tempfile.TemporaryDirectory() as archive_dir:
+        role_history_service.ARCHIVE_DIR = archive_dir
+        try:
+            result = client.post("/api/roles/assignments/history/archive",
+                                 params={"older_than_days": 90}).json()
+            live = db.query(models.RoleAssignmentHistory).count()
+            assert result["archived"] > 0 and live + result["archived"] == len(expected)
+            assert walk() == expected
+            assert walk(include_archived="false") == expected[:live]
+            print(f"✓ {result['archived']} archived entries stay queryable")
+
+            since, until = now - timedelta(days=120), now - timedelta(days=60)
+            windowed = walk(since=since.isoformat(), until=until.isoformat(), user_id=user_ids[1])
+            assert windowed
+            for entry_id in windowed:
+                day, n = map(int, entry_id.split("-"))
+                assert 60 <= day <= 120 and n == 1, entry_id
+            print("✓ Time-range and user filters span live and archived entries")
+
+            # Pages the live table fills never open a segment
+            opened = []
+            role_history_service.RoleHistoryService._read_archive = staticmethod(
+                lambda *args: opened.append(args) or read_archive(*args))
+            first = client.get("/api/roles/assignments/history",
+                               params={"limit": 50, "user_id": user_ids[0]}).json()
+            assert len(first) == 50 and opened == []
+            client.get("/api/roles/assignments/history", params={"since": (now - timedelta(days=30)).isoformat()})
+            assert opened == []
+            print("✓ The archive is only read when live entries do not fill the page")
+        finally:
+            role_history_service.RoleHistoryService._read_archive = staticmethod(read_archive)
+            role_history_service.ARCHIVE_DIR = default_archive_dir
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_roles_endpoints()
+    test_bulk_role_assignment()
+    test_role_history_pagination_and_archive()
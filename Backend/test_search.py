@@ -0,0 +1,74 @@
+# test_search.py
+import uuid
+
+import main
+import models
+from services.search_service import SearchService
+from test_helpers import make_test_engine, make_test_client
+
+
+def test_search():
+    engine = make_test_engine()
+    SearchService.ensure_index(engine)
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+
+    user = models.User(id=str(uuid.uuid4()), name="Priya Raman", email="priya.raman@example.com",
+                       phone="+91 98450 12345")
+    ticket = models.SupportTicket(title="Video not loading", student="Priya Raman",
+                                  student_email="priya.raman@example.com", course="Physics",
+                                  category="technical", description="Lecture 4 buffers forever")
+    review = models.CourseReview(student="Arjun", student_email="arjun@example.com", course="Physics",
+                                 rating=5, comment="Priya explains optics really well")
+    feedback = models.Feedback(subject="Dark mode", message="Please add a dark theme")
+    db.add_all([user, ticket, review, feedback])
+    db.commit()
+
+    def search(q, **params):
+        response = client.get("/api/search/", params={"q": q, **params})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    result = search("priya")
+    assert result["facets"] == {"user": 1, "ticket": 0, "review": 1, "feedback": 0}
+    # Name match in the title outranks a mention in the body
+    assert result["results"][0]["entity"] == "user"
+    assert result["results"][0]["title"] == "<mark>Priya</mark> Raman"
+    assert search("priya", entity="review")["results"][0]["id"] == str(review.id)
+    assert search("98450")["results"][0]["id"] == user.id
+    assert search("prob")["total"] == 0
+    print("✓ Ranked search with facets and highlighting")
+
+    # Writes keep the index in sync, including ticket responses
+    db.add(models.TicketResponse(ticket_id=ticket.id, author="Support", type="public",
+                                 message="Cleared the CDN cache, please retry"))
+    user.name = "Priya Subramanian"
+    db.delete(feedback)
+    db.commit()
+    assert search("cdn cache")["results"][0]["id"] == str(ticket.id)
+    assert search("subramanian")["facets"]["user"] == 1
+    assert search("dark theme")["total"] == 0
+    print("✓ Index follows inserts, updates, deletes and ticket responses")
+
+    # Broad queries rank every hit, not just the most recently indexed ones
+    db.execute(models.SearchDocument.__table__.insert(), [
+        {"entity": "feedback", "entity_id": f"bulk-{i}", "title": "Session notes",
+         "body": f"Asked Priya about lecture {i} and the mock test schedule for next week"}
+        for i in range(6000)
+    ])
+    db.commit()
+    result = search("priya", limit=5)
+    assert result["total"] == 6002
+    assert result["results"][0]["id"] == user.id
+    print("✓ Ranking covers the full match set")
+
+    assert SearchService.rebuild(engine) == {"user": 1, "ticket": 1, "review": 1}
+    assert search("cdn")["total"] == 1
+    print("✓ Rebuild repopulates the index")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_search()
@@ -0,0 +1,71 @@
+# test_sentiment.py
+import main
+import models
+from services.review_stats_service import ReviewStatsService
+from services.sentiment_service import SentimentService, classify
+from test_helpers import make_test_engine, make_test_client
+
+
+def test_sentiment():
+    assert classify("Excellent course, the explanations are really clear!")[0] == "positive"
+    assert classify("Videos keep buffering and the app crashed twice")[0] == "negative"
+    assert classify("The lectures are not helpful")[0] == "negative"
+    assert classify("Great content but the player is broken and support is useless")[0] == "negative"
+    assert classify("Lecture 4 covers thermodynamics")[0] == "neutral"
+    print("✓ Lexicon handles negation, contrast and neutral text")
+
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+
+    # Rows written without the ORM are the unscored backlog
+    comments = ["Amazing teacher, loved it", "Terrible audio, very disappointing", "Covers chapter 3"] * 10
+    with engine.begin() as conn:
+        conn.execute(models.CourseReview.__table__.insert(), [
+            {"student": "S", "student_email": "s@example.com", "course": "Physics", "rating": 4,
+             "comment": comment, "sentiment": "neutral"}
+            for comment in comments
+        ])
+        conn.execute(models.Feedback.__table__.insert(), [
+            {"subject": "Payments", "message": "Refund still not processed, this is frustrating"},
+            {"subject": "Dark mode", "message": "Would be nice to have"},
+        ])
+    assert client.get("/api/sentiment/stats").json()["pending"] == {"review": 30, "feedback": 2}
+
+    assert SentimentService.score_backlog(db, batch_size=4, workers=2) == {"review": 30, "feedback": 2}
+    stats = client.get("/api/sentiment/stats").json()
+    assert stats["labels"]["review"] == {"positive": 10, "negative": 10, "neutral": 10}
+    assert stats["labels"]["feedback"] == {"negative": 1, "positive": 1}
+    assert stats["pending"] == {"review": 0, "feedback": 0}
+    assert ReviewStatsService.totals(db)["sentiment"] == {"positive": 10, "neutral": 10, "negative": 10}
+    assert SentimentService.score_backlog(db) == {"review": 0, "feedback": 0}
+    print("✓ Backlog scored in batches across the process pool")
+
+    # New and edited entries are scored inline unless the client set a label
+    response = client.post("/api/course-reviews", json={
+        "student": "Asha", "student_email": "asha@example.com", "course": "Physics",
+        "rating": 5, "comment": "Best mock tests I have taken",
+    })
+    review = db.get(models.CourseReview, response.json()["id"])
+    assert review.sentiment == "positive"
+    labelled = client.post("/api/course-reviews", json={
+        "student": "Ravi", "student_email": "ravi@example.com", "course": "Physics",
+        "rating": 5, "comment": "Best mock tests I have taken", "sentiment": "negative",
+    }).json()
+    assert labelled["sentiment"] == "negative"
+    assert client.delete(f"/api/course-reviews/{labelled['id']}").status_code == 200
+    review.comment = "Quiz timer is broken"
+    db.commit()
+    assert review.sentiment == "negative"
+    assert db.get(models.SentimentScore, ("review", review.id)).label == "negative"
+    assert ReviewStatsService.totals(db)["sentiment"]["negative"] == 11
+    assert client.post("/api/sentiment/classify", json={"text": "so helpful"}).json()["label"] == "positive"
+    print("✓ New and edited entries scored on write")
+
+    SentimentService.shutdown()
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_sentiment()
@@ -0,0 +1,90 @@
+# test_sla_monitor.py
+from datetime import datetime, timedelta
+
+import main
+import models
+from services.sla_service import SlaMonitor, sla_monitor, BREACH_ACTION
+from test_helpers import make_test_engine, make_test_client
+
+
+def make_ticket(title, priority, deadline, status="open"):
+    return models.SupportTicket(title=title, student="Asha", student_email="asha@example.com",
+                                course="Physics", category="technical", description="...",
+                                priority=priority, status=status, sla_deadline=deadline)
+
+
+def test_sla_monitor():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    now = datetime.utcnow()
+
+    overdue = make_ticket("Overdue", "medium", now - timedelta(hours=2))
+    due_soon = make_ticket("Due soon", "low", now + timedelta(hours=1))
+    later = make_ticket("Later", "high", now + timedelta(days=2))
+    resolved = make_ticket("Resolved", "low", now - timedelta(days=1), status="resolved")
+    db.add_all([overdue, due_soon, later, resolved])
+    db.commit()
+
+    sla_monitor.load(db)
+    summary = client.get("/api/support-tickets/sla").json()
+    assert (summary["breached"], summary["at_risk"], summary["on_track"]) == (1, 1, 1)
+    print("✓ Summary counts breached, at-risk and on-track open tickets")
+
+    monitor = SlaMonitor()
+    assert monitor.tick(db, now) == 1
+    db.refresh(overdue)
+    assert overdue.priority == "high"
+    assert [a.type for a in overdue.actions] == [BREACH_ACTION]
+    assert db.query(models.Notification).filter(
+        models.Notification.title == f"SLA breached: ticket #{overdue.id}"
+    ).count() == 1
+
+    # Later ticks only pick up newly crossed deadlines
+    assert monitor.tick(db, now + timedelta(minutes=1)) == 0
+    assert monitor.tick(db, now + timedelta(hours=2)) == 1
+    db.refresh(due_soon)
+    assert due_soon.priority == "medium"
+    # A restarted monitor catches up without repeating recorded breaches
+    assert SlaMonitor().tick(db, now + timedelta(hours=2)) == 0
+    assert db.query(models.TicketAction).filter(models.TicketAction.type == BREACH_ACTION).count() == 2
+    print("✓ Ticks escalate, record and notify each breach once")
+
+    # Committed status changes update the summary without a reload
+    later.status = "resolved"
+    due_soon.sla_deadline = now + timedelta(days=3)
+    db.commit()
+    summary = sla_monitor.summary(now)
+    assert (summary["breached"], summary["at_risk"], summary["on_track"]) == (1, 0, 1)
+    db.delete(overdue)
+    db.commit()
+    assert sla_monitor.summary(now)["open_with_sla"] == 1
+    print("✓ Summary follows committed ticket writes")
+
+    # Deadlines moved before the last tick and tickets reopened after their deadline are still caught
+    tick_at = now + timedelta(hours=2, minutes=1)
+    moved = make_ticket("Moved", "low", now + timedelta(days=2))
+    reopened = make_ticket("Reopened", "low", now + timedelta(minutes=30), status="resolved")
+    db.add_all([moved, reopened])
+    db.commit()
+    moved.sla_deadline = now + timedelta(hours=1)
+    reopened.status = "open"
+    db.commit()
+    assert monitor.tick(db, tick_at) == 2
+    assert {moved.priority, reopened.priority} == {"medium"}
+    # Reopening a breached ticket does not record it again; missing an extended deadline does
+    reopened.status = "resolved"
+    db.commit()
+    reopened.status = "open"
+    db.commit()
+    assert monitor.tick(db, tick_at + timedelta(minutes=1)) == 0
+    assert monitor.tick(db, now + timedelta(days=3, minutes=1)) == 1
+    assert len(due_soon.actions) == 2
+    print("✓ Breaches are found from recorded actions, not the time since the last tick")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_sla_monitor()
@@ -0,0 +1,96 @@
+# test_subscription_expiry.py
+from datetime import datetime, timedelta
+
+import main
+import models
+from services import subscription_expiry_service
+from services.revenue_service import RevenueService
+from services.subscription_expiry_service import SubscriptionExpiryService
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def test_subscription_expiry():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+    now = datetime.utcnow()
+    db.add_all([models.SubscriptionPlan(name="Pro", courses=[]), models.SubscriptionPlan(name="Basic", courses=[])])
+    db.commit()
+
+    def user(i, status, end_offset):
+        return models.User(id=f"user-{i}", name=f"User {i}", email=f"user{i}@example.com",
+                           subscription_status=status, subscription_plan="Pro",
+                           subscription_end_date=now + end_offset if end_offset is not None else None)
+
+    users = [user(i, "active", timedelta(days=-1, minutes=-i)) for i in range(12)]   # due
+    users += [user(100, "active", timedelta(hours=12)),                                 # 1-day reminder
+              user(101, "active", timedelta(days=5)),                                  # 7-day reminder
+              user(102, "active", timedelta(days=20)),
+              user(103, "expired", timedelta(days=-30)),
+              user(104, "active", None)]
+    db.add_all(users)
+    db.add(models.Transaction(user_id="user-104", plan_name="Pro", type="razorpay", amount=999,
+                              status="captured", order_id="order-104",
+                              valid_until=now - timedelta(days=2)))
+    db.commit()
+    assert SubscriptionExpiryService.backfill_end_dates(db) == 1
+
+    subscription_expiry_service.EXPIRY_BATCH_SIZE = 5
+    with count_queries(engine) as statements:
+        result = SubscriptionExpiryService.run_once(db, now)
+    assert result == {"expired": 13, "reminders": {1: 1, 7: 1}}
+    # 13 due users in batches of 5
+    assert sum(1 for s in statements if s.lstrip().upper().startswith("UPDATE USERS")) == 3
+    assert db.query(models.User).filter(models.User.subscription_status == "active").count() == 3
+    assert db.query(models.SubscriptionEvent).filter_by(event_type="expired").count() == 13
+    assert db.query(models.Notification).filter_by(tag="personalized").count() == 2
+    print("✓ Due subscriptions expired in batches with events and reminders")
+
+    # A second run finds nothing new and sends no repeat reminders
+    assert SubscriptionExpiryService.run_once(db, now + timedelta(minutes=5)) == {
+        "expired": 0, "reminders": {1: 0, 7: 0}
+    }
+
+    upcoming = client.get("/api/subscriptions/expirations/upcoming", params={"days": 30}).json()
+    assert upcoming["total"] == 3
+    assert [d["expiring"] for d in upcoming["daily"]] == [1, 1, 1]
+    assert client.get("/api/subscriptions/expirations/history").json()["total"] == 13
+    print("✓ Upcoming expirations and expiry history per day")
+
+    # A captured renewal extends the subscription again
+    db.add(models.Transaction(user_id="user-0", plan_name="Pro", type="razorpay", amount=999,
+                              status="captured", order_id="order-renewal",
+                              valid_until=now + timedelta(days=30)))
+    db.commit()
+    renewed = db.get(models.User, "user-0")
+    db.refresh(renewed)
+    assert renewed.subscription_status == "active"
+    print("✓ Captured transactions extend subscription_end_date")
+
+    # Buying another plan moves the subscriber from the old plan to the new one
+    def subscribers():
+        db.expire_all()
+        return {plan.name: plan.subscribers for plan in db.query(models.SubscriptionPlan)}
+
+    before = subscribers()
+    db.add(models.Transaction(user_id="user-101", plan_name="Basic", type="razorpay", amount=499,
+                              status="captured", order_id="order-switch", valid_until=now + timedelta(days=60)))
+    db.commit()
+    assert db.get(models.User, "user-101").subscription_plan == "Basic"
+    assert subscribers() == {"Pro": before["Pro"] - 1, "Basic": before["Basic"] + 1}
+    db.add(models.Transaction(user_id="user-103", plan_name="Basic", type="razorpay", amount=499,
+                              status="captured", order_id="order-return", valid_until=now + timedelta(days=60)))
+    db.commit()
+    assert subscribers() == {"Pro": before["Pro"] - 1, "Basic": before["Basic"] + 2}
+    incremental = subscribers()
+    RevenueService.update_all_plans_revenue(db)
+    assert subscribers() == incremental
+    print("✓ Switching plans moves the subscriber count and matches a recount")
+
+    subscription_expiry_service.EXPIRY_BATCH_SIZE = 500
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_subscription_expiry()
@@ -0,0 +1,66 @@
+# test_support_tickets.py
+import main
+import models
+from services.ticket_service import TicketService
+from test_helpers import make_test_engine, make_test_client, count_queries
+
+
+def add_tickets(db, start, stop):
+    for i in range(start, stop):
+        ticket = models.SupportTicket(
+            title=f"Ticket {i}", student="Student", student_email="s@example.com",
+            course="Physics", category="technical", description="Something broke",
+        )
+        TicketService.set_tags(ticket, ["video", "urgent"] if i % 2 else ["billing"])
+        ticket.responses.append(models.TicketResponse(author="Agent", type="public", message="On it"))
+        ticket.internal_notes.append(models.InternalNote(author="Agent", message="Checked logs"))
+        ticket.actions.append(models.TicketAction(type="status_change", user="Agent",
+                                                  from_status="open", to_status="in_progress"))
+        db.add(ticket)
+    db.commit()
+
+
+def test_support_tickets():
+    engine = make_test_engine()
+    client, TestSession = make_test_client(engine)
+    db = TestSession()
+
+    query_counts = []
+    for total in (5, 50):
+        add_tickets(db, db.query(models.SupportTicket).count(), total)
+        with count_queries(engine) as statements:
+            response = client.get("/api/support-tickets")
+        assert response.status_code == 200, response.text
+        tickets = response.json()
+        assert len(tickets) == total
+        assert all(len(t["responses"]) == len(t["internal_notes"]) == len(t["actions"]) == 1 for t in tickets)
+        query_counts.append(len(statements))
+    assert query_counts[0] == query_counts[1], query_counts
+    print(f"✓ Ticket listing runs {query_counts[0]} queries for 5 and 50 tickets")
+
+    urgent = client.get("/api/support-tickets", params={"tag": ["video", "urgent"]}).json()
+    assert len(urgent) == 25 and all(t["tags"] == ["video", "urgent"] for t in urgent)
+    assert client.get("/api/support-tickets", params={"tag": ["video", "billing"]}).json() == []
+
+    ticket_id = urgent[0]["id"]
+    response = client.put(f"/api/support-tickets/{ticket_id}", json={"tags": ["urgent", "refund"]})
+    assert response.status_code == 200, response.text
+    assert response.json()["tags"] == ["urgent", "refund"]
+    refund = client.get("/api/support-tickets", params={"tag": "refund"}).json()
+    assert [t["id"] for t in refund] == [ticket_id]
+    print("✓ Tags are filtered server-side and kept in sync on update")
+
+    # Tickets written with only the JSON column are picked up by the backfill
+    db.add(models.SupportTicket(title="Legacy", student="S", student_email="s@example.com",
+                                course="C", category="billing", description="Old", tags='["legacy"]'))
+    db.commit()
+    assert TicketService.backfill_tags(db) == 1
+    assert len(client.get("/api/support-tickets", params={"tag": "legacy"}).json()) == 1
+    print("✓ JSON tags are backfilled into the tag table")
+
+    db.close()
+    main.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    test_support_tickets()